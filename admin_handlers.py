@@ -1,25 +1,68 @@
+import asyncio
+import os
 import logging
 from datetime import datetime
-from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+from aiogram import Router
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, BufferedInputFile
+from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.filters import Command
 from aiogram.exceptions import TelegramBadRequest
 
-from config import Config, CATEGORIES
+from bot_context import PerBot
+from config import Config, SERVICES_KIND
 from database import db
+from catalog import catalog
+from callbacks import (
+    CallbackRouter,
+    IsAdmin,
+    ADMIN_MENU,
+    ADMIN_SERVICES,
+    ADMIN_LIST,
+    ADMIN_ADD_SERVICE,
+    ADMIN_ADD_CATEGORY,
+    ADMIN_DELETE_SERVICE,
+    ADMIN_DELETE_ASK,
+    ADMIN_DELETE_CONFIRM,
+    ADMIN_EDIT_SERVICE,
+    ADMIN_EDIT_ASK,
+    ADMIN_EDIT_FIELD,
+    ADMIN_EDIT_CATEGORY,
+    ADMIN_SETTINGS,
+    ADMIN_SET_MANAGER,
+    ADMIN_SET_CHANNEL,
+    ADMIN_SET_GIVEAWAY,
+    ADMIN_STATS,
+    ADMIN_FUNNEL,
+    ADMIN_ALERTS,
+    ADMIN_ALERTS_CLEAR,
+    ADMIN_POST,
+    ADMIN_SCHEDULED,
+    ADMIN_SCHEDULED_NEW,
+    ADMIN_SCHEDULED_CANCEL,
+    ADMIN_CLOSE,
+    ADMIN_GIVEAWAY,
+    ADMIN_GIVEAWAY_NEW,
+    ADMIN_GIVEAWAY_DRAW,
+    ADMIN_GIVEAWAY_ANNOUNCE
+)
+from giveaway import giveaway_manager, format_results
+from analytics import analytics, format_funnel
+from alerts import alert_manager, format_alerts
+from bot_session import format_api_stats
+from api_retry import format_breaker_state
+from metrics import registry
 from keyboards import get_channel_post_keyboard
+from scheduled_posts import post_scheduler, send_channel_post, parse_publish_time, is_past, format_publish_time, format_scheduled_posts
+from outbound import send_class, ADMIN as ADMIN_SEND
+from media import media_cache, album_collector, album_input_media, read_file
+from utils import truncate_text
 
 logger = logging.getLogger(__name__)
 
 # Состояния для админа
-admin_states = {}
-
-def safe_callback_answer(callback):
-    """Безопасный ответ на callback"""
-    try:
-        return callback.answer()
-    except Exception:
-        pass
+admin_states = PerBot(lambda name: {})
 
 def register_admin_handlers(dp, config: Config):
     """Регистрация админских хендлеров с красивым интерфейсом"""
@@ -28,6 +71,86 @@ def register_admin_handlers(dp, config: Config):
         """Проверка на права администратора"""
         return user_id == config.ADMIN_ID
     
+    callback_router = CallbackRouter.for_dispatcher(dp, config)
+    # Поля услуги, которые можно изменить, в тексте ответа админу
+    EDIT_FIELD_NAMES = {
+        'name': "название",
+        'description': "описание",
+        'price': "цена",
+        'category_id': "категория"
+    }
+    
+    # Часовой пояс времени публикации в командах отложенных постов
+    post_timezone = ZoneInfo(config.POST_TIMEZONE)
+    
+    def alerts_button_text() -> str:
+        """Кнопка оповещений с количеством сбоев за сутки"""
+        count = len(alert_manager.active())
+        return f"🚨 Оповещения ({count})" if count else "🚨 Оповещения"
+    
+    def scheduled_button_text() -> str:
+        """Кнопка отложенных постов с размером очереди"""
+        count = post_scheduler.pending_count
+        return f"🕒 Отложенные посты ({count})" if count else "🕒 Отложенные посты"
+    
+    async def schedule_post(message: Message, args: str) -> str:
+        """Постановка поста в очередь из "ДД.ММ ЧЧ:ММ|текст" (текст команды или подпись к фото);
+        ValueError с текстом ошибки для админа"""
+        when, separator, text = args.partition("|")
+        text = text.strip()
+        photo = message.photo[-1].file_id if message.photo else None
+        if not separator or not (text or photo):
+            raise ValueError("❌ Формат: ДД.ММ ЧЧ:ММ|текст (или фото с такой подписью)")
+        
+        publish_at = parse_publish_time(when, post_timezone)
+        if not publish_at:
+            raise ValueError("❌ Не удалось разобрать время. Формат: ДД.ММ ЧЧ:ММ или ДД.ММ.ГГГГ ЧЧ:ММ")
+        if is_past(publish_at):
+            raise ValueError("❌ Это время уже прошло.")
+        
+        post_id = await post_scheduler.schedule(config.CHANNEL_ID, text or None, photo, publish_at)
+        return f"✅ Пост #{post_id} будет опубликован в {config.CHANNEL_ID} {format_publish_time(publish_at, post_timezone)}."
+    
+    async def edit_service(service_id: int, version: int, field: str, value) -> str:
+        """Изменение одного поля услуги (name, description, price, category_id); текст ответа админу.
+        version - версия услуги на начало изменения: если услугу успели изменить, правка не проходит"""
+        if not await catalog.update_service_field(service_id, field, value, expected_version=version):
+            return "❌ Услугу успели изменить или удалить. Откройте ее заново и повторите."
+        return f"✅ Услуга {service_id} изменена: {EDIT_FIELD_NAMES[field]}."
+    
+    async def publish_post(bot, text: Optional[str], photo: Optional[str] = None):
+        """Публикация поста в канал (текст или фото с подписью) с кнопкой меню"""
+        with send_class(ADMIN_SEND):
+            await send_channel_post(bot, config.CHANNEL_ID, text, photo)
+    
+    async def publish_album(messages: List[Message]):
+        """Публикация альбома в канал"""
+        first = messages[0]
+        bot = first.bot
+        
+        keyboard = InlineKeyboardBuilder()
+        keyboard.row(InlineKeyboardButton(text="🔙 В админ-панель", callback_data=ADMIN_MENU.pack()))
+        
+        try:
+            with send_class(ADMIN_SEND):
+                await bot.send_media_group(config.CHANNEL_ID, album_input_media(messages))
+                # У альбома не может быть inline-кнопок, поэтому кнопка меню отправляется отдельно
+                await bot.send_message(
+                    config.CHANNEL_ID,
+                    "👇 Подробнее и заказ — в нашем боте",
+                    reply_markup=get_channel_post_keyboard()
+                )
+            await first.answer(
+                f"✅ Альбом ({len(messages)} шт.) опубликован в канале {config.CHANNEL_ID}!",
+                reply_markup=keyboard.as_markup()
+            )
+        except Exception as e:
+            logger.error(f"Ошибка публикации альбома: {e}")
+            await first.answer(f"❌ Ошибка публикации: {str(e)}")
+        
+        if first.from_user:
+            admin_states.pop(first.from_user.id, None)
+    
     @dp.message(Command("admin"))
     async def cmd_admin(message: Message):
         """Главная админ-панель"""
@@ -36,16 +159,16 @@ def register_admin_handlers(dp, config: Config):
             await message.answer("❌ Доступ запрещен.")
             return
         
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        from aiogram.types import InlineKeyboardButton
-        
         keyboard = InlineKeyboardBuilder()
-        keyboard.row(InlineKeyboardButton(text="📦 Управление услугами", callback_data="admin_services"))
-        keyboard.row(InlineKeyboardButton(text="➕ Добавить услугу", callback_data="admin_add_service"))
-        keyboard.row(InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats"))
-        keyboard.row(InlineKeyboardButton(text="📝 Пост в канал", callback_data="admin_post"))
-        keyboard.row(InlineKeyboardButton(text="⚙️ Настройки", callback_data="admin_settings"))
-        keyboard.row(InlineKeyboardButton(text="❌ Закрыть", callback_data="admin_close"))
+        keyboard.row(InlineKeyboardButton(text="📦 Управление услугами", callback_data=ADMIN_SERVICES.pack()))
+        keyboard.row(InlineKeyboardButton(text="➕ Добавить услугу", callback_data=ADMIN_ADD_SERVICE.pack()))
+        keyboard.row(InlineKeyboardButton(text="📊 Статистика", callback_data=ADMIN_STATS.pack()))
+        keyboard.row(InlineKeyboardButton(text="📝 Пост в канал", callback_data=ADMIN_POST.pack()))
+        keyboard.row(InlineKeyboardButton(text=scheduled_button_text(), callback_data=ADMIN_SCHEDULED.pack()))
+        keyboard.row(InlineKeyboardButton(text="🎁 Розыгрыши", callback_data=ADMIN_GIVEAWAY.pack()))
+        keyboard.row(InlineKeyboardButton(text="⚙️ Настройки", callback_data=ADMIN_SETTINGS.pack()))
+        keyboard.row(InlineKeyboardButton(text=alerts_button_text(), callback_data=ADMIN_ALERTS.pack()))
+        keyboard.row(InlineKeyboardButton(text="❌ Закрыть", callback_data=ADMIN_CLOSE.pack()))
         
         admin_text = f"""🔧 **Админ-панель Phoenix PS Bot**
 
@@ -60,23 +183,17 @@ def register_admin_handlers(dp, config: Config):
             parse_mode="Markdown"
         )
     
-    @dp.callback_query(F.data == "admin_services")
+    @callback_router.handler(ADMIN_SERVICES)
     async def show_services_menu(callback: CallbackQuery):
         """Меню управления услугами"""
-        user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
-            return
         
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        from aiogram.types import InlineKeyboardButton
-        
-        services_count = len(await db.get_all_services())
+        services_count = len(await catalog.get_all_services())
         
         keyboard = InlineKeyboardBuilder()
-        keyboard.row(InlineKeyboardButton(text="📋 Список услуг", callback_data="admin_list"))
-        keyboard.row(InlineKeyboardButton(text="🗑️ Удалить услугу", callback_data="admin_delete_service"))
-        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data="admin_menu"))
+        keyboard.row(InlineKeyboardButton(text="📋 Список услуг", callback_data=ADMIN_LIST.pack()))
+        keyboard.row(InlineKeyboardButton(text="✏️ Изменить услугу", callback_data=ADMIN_EDIT_SERVICE.pack()))
+        keyboard.row(InlineKeyboardButton(text="🗑️ Удалить услугу", callback_data=ADMIN_DELETE_SERVICE.pack()))
+        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data=ADMIN_MENU.pack()))
         
         services_text = f"""📦 **Управление услугами**
 
@@ -90,29 +207,21 @@ def register_admin_handlers(dp, config: Config):
                 reply_markup=keyboard.as_markup(),
                 parse_mode="Markdown"
             )
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data == "admin_add_service")
+    @callback_router.handler(ADMIN_ADD_SERVICE)
     async def start_add_service(callback: CallbackQuery):
         """Начало добавления услуги"""
         user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
-            return
         
         admin_states[user.id] = "waiting_category"
         
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        from aiogram.types import InlineKeyboardButton
-        
         keyboard = InlineKeyboardBuilder()
         
-        # Добавляем кнопки для каждой категории
-        for key, name in CATEGORIES.items():
-            if key not in ['about', 'contacts', 'giveaway']:  # Исключаем служебные категории
-                keyboard.row(InlineKeyboardButton(text=name, callback_data=f"add_cat_{key}"))
+        # Добавляем кнопки для каждой категории услуг (без служебных разделов меню)
+        for category in await catalog.get_service_categories():
+            keyboard.row(InlineKeyboardButton(text=category['name'], callback_data=ADMIN_ADD_CATEGORY.pack(category['id'])))
         
-        keyboard.row(InlineKeyboardButton(text="🔙 Отмена", callback_data="admin_menu"))
+        keyboard.row(InlineKeyboardButton(text="🔙 Отмена", callback_data=ADMIN_MENU.pack()))
         
         add_text = """➕ **Добавление новой услуги**
 
@@ -124,46 +233,32 @@ def register_admin_handlers(dp, config: Config):
                 reply_markup=keyboard.as_markup(),
                 parse_mode="Markdown"
             )
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data.startswith("add_cat_"))
-    async def select_category_for_add(callback: CallbackQuery):
+    @callback_router.handler(ADMIN_ADD_CATEGORY)
+    async def select_category_for_add(callback: CallbackQuery, category_id: int):
         """Выбор категории для добавления услуги"""
         user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
-            return
         
-        category_key = callback.data.split("_")[2]
-        category_name = CATEGORIES.get(category_key, "Неизвестная категория")
+        category = await catalog.get_category(category_id)
+        category_name = category['name'] if category else "Неизвестная категория"
         
-        admin_states[user.id] = f"waiting_name_{category_key}"
+        admin_states[user.id] = f"waiting_name_{category_id}"
         
         await callback.message.answer(
             f"📝 **Добавление услуги в категорию: {category_name}**\n\n"
             "Введите название услуги (например: '⚡ Базовая оптимизация Windows'):",
             parse_mode="Markdown"
         )
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data == "admin_delete_service")
+    @callback_router.handler(ADMIN_DELETE_SERVICE)
     async def start_delete_service(callback: CallbackQuery):
         """Начало удаления услуги"""
-        user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
-            return
-        
-        services = await db.get_all_services()
+        services = await catalog.get_all_services()
         
         if not services:
             await callback.message.answer("📭 Услуг для удаления нет.")
-            await safe_callback_answer(callback)
             return
         
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        from aiogram.types import InlineKeyboardButton
-        
         keyboard = InlineKeyboardBuilder()
         
         # Показываем первые 10 услуг для удаления
@@ -171,10 +266,10 @@ def register_admin_handlers(dp, config: Config):
             service_name = service['name'][:30] + "..." if len(service['name']) > 30 else service['name']
             keyboard.row(InlineKeyboardButton(
                 text=f"🗑️ {service_name}",
-                callback_data=f"del_service_{service['id']}"
+                callback_data=ADMIN_DELETE_ASK.pack(service['id'])
             ))
         
-        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data="admin_services"))
+        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data=ADMIN_SERVICES.pack()))
         
         delete_text = f"""🗑️ **Удаление услуги**
 
@@ -186,30 +281,127 @@ def register_admin_handlers(dp, config: Config):
                 reply_markup=keyboard.as_markup(),
                 parse_mode="Markdown"
             )
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data.startswith("del_service_"))
-    async def confirm_delete_service(callback: CallbackQuery):
-        """Подтверждение удаления услуги"""
-        user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
+    @callback_router.handler(ADMIN_EDIT_SERVICE)
+    async def start_edit_service(callback: CallbackQuery):
+        """Выбор услуги для изменения"""
+        services = await catalog.get_all_services()
+        
+        if not services:
+            await callback.message.answer("📭 Услуг для изменения нет.")
             return
         
-        service_id = int(callback.data.split("_")[2])
-        service = await db.get_service_by_id(service_id)
+        keyboard = InlineKeyboardBuilder()
+        
+        # Показываем первые 10 услуг, остальные меняются командой /edit_service
+        for service in services[:10]:
+            service_name = service['name'][:30] + "..." if len(service['name']) > 30 else service['name']
+            keyboard.row(InlineKeyboardButton(
+                text=f"✏️ {service_name}",
+                callback_data=ADMIN_EDIT_ASK.pack(service['id'])
+            ))
+        
+        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data=ADMIN_SERVICES.pack()))
+        
+        edit_text = f"""✏️ **Изменение услуги**
+
+📋 Выберите услугу (показано {min(len(services), 10)} из {len(services)}, любую можно изменить командой /edit\\_service):"""
+        
+        if callback.message and hasattr(callback.message, 'edit_text'):
+            await callback.message.edit_text(
+                edit_text,
+                reply_markup=keyboard.as_markup(),
+                parse_mode="Markdown"
+            )
+    
+    @callback_router.handler(ADMIN_EDIT_ASK)
+    async def show_edit_service(callback: CallbackQuery, service_id: int):
+        """Карточка услуги с выбором поля для изменения"""
+        service = await catalog.get_service(service_id)
         
         if not service:
             await callback.message.answer("❌ Услуга не найдена.")
-            await safe_callback_answer(callback)
             return
         
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        from aiogram.types import InlineKeyboardButton
+        # В снимке каталога старого формата версии нет: она читается из базы
+        version = service.get('version')
+        if not version:
+            stored = await db.get_service_by_id(service_id)
+            version = stored['version'] if stored else 0
+        
+        keyboard = InlineKeyboardBuilder()
+        keyboard.row(
+            InlineKeyboardButton(text="📋 Название", callback_data=ADMIN_EDIT_FIELD.pack(service_id, version, "name")),
+            InlineKeyboardButton(text="💰 Цена", callback_data=ADMIN_EDIT_FIELD.pack(service_id, version, "price"))
+        )
+        keyboard.row(
+            InlineKeyboardButton(text="📝 Описание", callback_data=ADMIN_EDIT_FIELD.pack(service_id, version, "description")),
+            InlineKeyboardButton(text="📂 Категория", callback_data=ADMIN_EDIT_FIELD.pack(service_id, version, "category_id"))
+        )
+        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data=ADMIN_EDIT_SERVICE.pack()))
+        
+        edit_text = f"""✏️ Услуга #{service_id}
+
+📋 Название: {service['name']}
+💰 Цена: {service['price']}
+📂 Категория: {service['category']}
+📝 Описание: {service['description']}
+
+Что изменить? ID услуги и кнопки в отправленных сообщениях сохранятся."""
+        
+        if callback.message and hasattr(callback.message, 'edit_text'):
+            try:
+                await callback.message.edit_text(truncate_text(edit_text), reply_markup=keyboard.as_markup())
+            except TelegramBadRequest:
+                pass
+    
+    @callback_router.handler(ADMIN_EDIT_FIELD)
+    async def request_edit_field(callback: CallbackQuery, service_id: int, version: int, field: str):
+        """Запрос нового значения поля услуги"""
+        user = callback.from_user
+        
+        if field not in EDIT_FIELD_NAMES:
+            return
+        
+        if field == 'category_id':
+            keyboard = InlineKeyboardBuilder()
+            for category in await catalog.get_service_categories():
+                keyboard.row(InlineKeyboardButton(
+                    text=category['name'],
+                    callback_data=ADMIN_EDIT_CATEGORY.pack(service_id, version, category['id'])
+                ))
+            keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data=ADMIN_EDIT_ASK.pack(service_id)))
+            if callback.message and hasattr(callback.message, 'edit_text'):
+                await callback.message.edit_text("📂 Выберите новую категорию услуги:", reply_markup=keyboard.as_markup())
+            return
+        
+        admin_states[user.id] = f"waiting_edit_{field}_{service_id}_{version}"
+        
+        await callback.message.answer(f"✏️ Введите новое значение поля «{EDIT_FIELD_NAMES[field]}» для услуги #{service_id}:")
+    
+    @callback_router.handler(ADMIN_EDIT_CATEGORY)
+    async def set_edit_category(callback: CallbackQuery, service_id: int, version: int, category_id: int):
+        """Перенос услуги в другую категорию"""
+        if not await catalog.get_category(category_id):
+            result = "❌ Категория не найдена."
+        else:
+            result = await edit_service(service_id, version, 'category_id', category_id)
+        
+        await callback.message.answer(result)
+        await show_edit_service(callback, service_id)
+    
+    @callback_router.handler(ADMIN_DELETE_ASK)
+    async def confirm_delete_service(callback: CallbackQuery, service_id: int):
+        """Подтверждение удаления услуги"""
+        service = await catalog.get_service(service_id)
+        
+        if not service:
+            await callback.message.answer("❌ Услуга не найдена.")
+            return
         
         keyboard = InlineKeyboardBuilder()
-        keyboard.row(InlineKeyboardButton(text="✅ Да, удалить", callback_data=f"confirm_del_{service_id}"))
-        keyboard.row(InlineKeyboardButton(text="❌ Отмена", callback_data="admin_delete_service"))
+        keyboard.row(InlineKeyboardButton(text="✅ Да, удалить", callback_data=ADMIN_DELETE_CONFIRM.pack(service_id)))
+        keyboard.row(InlineKeyboardButton(text="❌ Отмена", callback_data=ADMIN_DELETE_SERVICE.pack()))
         
         confirm_text = f"""🗑️ **Подтверждение удаления**
 
@@ -225,48 +417,31 @@ def register_admin_handlers(dp, config: Config):
                 reply_markup=keyboard.as_markup(),
                 parse_mode="Markdown"
             )
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data.startswith("confirm_del_"))
-    async def delete_service_confirmed(callback: CallbackQuery):
+    @callback_router.handler(ADMIN_DELETE_CONFIRM)
+    async def delete_service_confirmed(callback: CallbackQuery, service_id: int):
         """Удаление услуги после подтверждения"""
-        user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
-            return
-        
-        service_id = int(callback.data.split("_")[2])
-        service = await db.get_service_by_id(service_id)
+        service = await catalog.get_service(service_id)
         
         if not service:
             await callback.message.answer("❌ Услуга не найдена.")
-            await safe_callback_answer(callback)
             return
         
-        success = await db.delete_service(service_id)
+        success = await catalog.delete_service(service_id)
         
         if success:
             await callback.message.answer(f"✅ Услуга '{service['name']}' успешно удалена!")
         else:
             await callback.message.answer("❌ Ошибка при удалении услуги.")
-        
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data == "admin_settings")
+    @callback_router.handler(ADMIN_SETTINGS)
     async def show_settings(callback: CallbackQuery):
         """Настройки бота"""
-        user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
-            return
-        
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        from aiogram.types import InlineKeyboardButton
         
         keyboard = InlineKeyboardBuilder()
-        keyboard.row(InlineKeyboardButton(text="📢 Изменить канал для заявок", callback_data="admin_set_channel"))
-        keyboard.row(InlineKeyboardButton(text="🎁 Текст кнопки Розыгрыш", callback_data="admin_set_giveaway"))
-        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data="admin_menu"))
+        keyboard.row(InlineKeyboardButton(text="📢 Изменить канал для заявок", callback_data=ADMIN_SET_CHANNEL.pack()))
+        keyboard.row(InlineKeyboardButton(text="🎁 Текст кнопки Розыгрыш", callback_data=ADMIN_SET_GIVEAWAY.pack()))
+        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data=ADMIN_MENU.pack()))
         
         settings_text = f"""⚙️ **Настройки бота**
 
@@ -281,15 +456,11 @@ def register_admin_handlers(dp, config: Config):
                 reply_markup=keyboard.as_markup(),
                 parse_mode="Markdown"
             )
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data == "admin_set_manager")
+    @callback_router.handler(ADMIN_SET_MANAGER)
     async def set_manager_ui(callback: CallbackQuery):
         """Установка менеджера через UI"""
         user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
-            return
         
         admin_states[user.id] = "waiting_manager"
         
@@ -298,15 +469,11 @@ def register_admin_handlers(dp, config: Config):
             "Введите username менеджера (например: phoen1xPC):",
             parse_mode="Markdown"
         )
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data == "admin_set_channel")
+    @callback_router.handler(ADMIN_SET_CHANNEL)
     async def set_channel_ui(callback: CallbackQuery):
         """Установка канала через UI"""
         user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
-            return
         
         admin_states[user.id] = "waiting_channel"
         
@@ -315,15 +482,11 @@ def register_admin_handlers(dp, config: Config):
             "Введите ID канала, куда будут публиковаться заявки (например: @helprepairpc или -1001234567890):",
             parse_mode="Markdown"
         )
-        await safe_callback_answer(callback)
 
-    @dp.callback_query(F.data == "admin_set_giveaway")
+    @callback_router.handler(ADMIN_SET_GIVEAWAY)
     async def set_giveaway_ui(callback: CallbackQuery):
         """Установка описания розыгрыша через UI"""
         user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
-            return
         
         admin_states[user.id] = "waiting_giveaway"
         
@@ -333,23 +496,15 @@ def register_admin_handlers(dp, config: Config):
             "Текущий текст:\n\n" + (config.GIVEAWAY_DESCRIPTION or "—"),
             parse_mode="Markdown"
         )
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data == "admin_list")
+    @callback_router.handler(ADMIN_LIST)
     async def list_services(callback: CallbackQuery):
         """Список всех услуг"""
-        user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
-            return
-        
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        from aiogram.types import InlineKeyboardButton
         
-        services = await db.get_all_services()
+        services = await catalog.get_all_services()
         
         keyboard = InlineKeyboardBuilder()
-        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data="admin_services"))
+        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data=ADMIN_SERVICES.pack()))
         
         if not services:
             list_text = """📭 **Список услуг пуст**
@@ -369,24 +524,17 @@ def register_admin_handlers(dp, config: Config):
                 reply_markup=keyboard.as_markup(),
                 parse_mode="Markdown"
             )
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data == "admin_stats")
+    @callback_router.handler(ADMIN_STATS)
     async def show_stats(callback: CallbackQuery):
         """Статистика бота"""
-        user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
-            return
         
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        from aiogram.types import InlineKeyboardButton
-        
-        services_count = len(await db.get_all_services())
-        orders_count = len(await db.get_all_orders())
+        services_count = len(await catalog.get_all_services())
+        orders_count = await db.count_orders()
         
         keyboard = InlineKeyboardBuilder()
-        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data="admin_menu"))
+        keyboard.row(InlineKeyboardButton(text="📈 Воронка услуг", callback_data=ADMIN_FUNNEL.pack()))
+        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data=ADMIN_MENU.pack()))
         
         stats_text = f"""📊 **Статистика бота**
 
@@ -397,10 +545,9 @@ def register_admin_handlers(dp, config: Config):
 📈 **По категориям:**"""
         
         # Статистика по категориям
-        for category_key, category_name in CATEGORIES.items():
-            if category_key not in ['about', 'contacts']:
-                cat_services = await db.get_services_by_category(category_name)
-                stats_text += f"\n• {category_name}: {len(cat_services)} услуг"
+        for category in await catalog.get_service_categories():
+            cat_services = await catalog.get_services_by_category(category['id'])
+            stats_text += f"\n• {category['name']}: {len(cat_services)} услуг"
         
         if callback.message and hasattr(callback.message, 'edit_text'):
             await callback.message.edit_text(
@@ -408,56 +555,214 @@ def register_admin_handlers(dp, config: Config):
                 reply_markup=keyboard.as_markup(),
                 parse_mode="Markdown"
             )
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data == "admin_post")
+    @callback_router.handler(ADMIN_FUNNEL)
+    async def show_funnel(callback: CallbackQuery):
+        """Воронка просмотр → подробности → заказ по услугам"""
+        
+        days = 7
+        report = await analytics.funnel(days)
+        service_names = {service['id']: service['name'] for service in await catalog.get_all_services()}
+        
+        keyboard = InlineKeyboardBuilder()
+        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data=ADMIN_STATS.pack()))
+        
+        if callback.message and hasattr(callback.message, 'edit_text'):
+            await callback.message.edit_text(
+                truncate_text(format_funnel(report, service_names, days)),
+                reply_markup=keyboard.as_markup()
+            )
+    
+    @callback_router.handler(ADMIN_ALERTS)
+    async def show_alerts(callback: CallbackQuery):
+        """Сбои за сутки"""
+        
+        alerts = alert_manager.active()
+        
+        keyboard = InlineKeyboardBuilder()
+        if alerts:
+            keyboard.row(InlineKeyboardButton(text="✅ Сбросить", callback_data=ADMIN_ALERTS_CLEAR.pack()))
+        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data=ADMIN_MENU.pack()))
+        
+        if callback.message and hasattr(callback.message, 'edit_text'):
+            try:
+                await callback.message.edit_text(
+                    truncate_text(format_alerts(alerts)),
+                    reply_markup=keyboard.as_markup()
+                )
+            except TelegramBadRequest:
+                pass
+    
+    @callback_router.handler(ADMIN_ALERTS_CLEAR)
+    async def clear_alerts(callback: CallbackQuery):
+        """Сброс оповещений"""
+        alert_manager.clear()
+        await show_alerts(callback)
+    
+    @callback_router.handler(ADMIN_POST)
     async def request_post(callback: CallbackQuery):
         """Запрос текста для поста"""
         user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
-            return
         
         if not config.CHANNEL_ID:
             await callback.message.answer("❌ Канал не настроен! Используйте /set_channel")
-            await safe_callback_answer(callback)
             return
         
         admin_states[user.id] = "waiting_post"
         
         await callback.message.answer(
-            f"📝 **Отправьте текст для публикации в канал {config.CHANNEL_ID}:**\n\nБот автоматически добавит кнопку '🔥 Открыть меню'."
+            f"📝 **Отправьте текст, фото или альбом для публикации в канал {config.CHANNEL_ID}:**\n\nБот автоматически добавит кнопку '🔥 Открыть меню'."
         )
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data == "admin_close")
-    async def close_admin(callback: CallbackQuery):
-        """Закрыть админ-панель"""
+    @callback_router.handler(ADMIN_SCHEDULED)
+    async def show_scheduled(callback: CallbackQuery):
+        """Очередь отложенных постов"""
+        
+        posts = await db.get_pending_posts()
+        
+        keyboard = InlineKeyboardBuilder()
+        for post in posts[:10]:
+            keyboard.row(InlineKeyboardButton(
+                text=f"❌ Отменить #{post['id']} ({format_publish_time(post['publish_at'], post_timezone)})",
+                callback_data=ADMIN_SCHEDULED_CANCEL.pack(post['id'])
+            ))
+        keyboard.row(InlineKeyboardButton(text="➕ Запланировать пост", callback_data=ADMIN_SCHEDULED_NEW.pack()))
+        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data=ADMIN_MENU.pack()))
+        
+        text = format_scheduled_posts(posts, post_timezone)
+        if posts:
+            text += "\n\nИзменить: /edit_post ID|текст, /move_post ID|ДД.ММ ЧЧ:ММ"
+        
+        if callback.message and hasattr(callback.message, 'edit_text'):
+            try:
+                await callback.message.edit_text(truncate_text(text), reply_markup=keyboard.as_markup())
+            except TelegramBadRequest:
+                pass
+    
+    @callback_router.handler(ADMIN_SCHEDULED_NEW)
+    async def request_scheduled_post(callback: CallbackQuery):
+        """Запрос времени и текста отложенного поста"""
         user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
+        
+        if not config.CHANNEL_ID:
+            await callback.message.answer("❌ Канал не настроен! Используйте /set_channel")
             return
         
+        admin_states[user.id] = "waiting_scheduled_post"
+        
+        await callback.message.answer(
+            "🕒 Отложенный пост\n\n"
+            f"Отправьте время ({config.POST_TIMEZONE}) и текст в формате ДД.ММ ЧЧ:ММ|текст "
+            "или фото с такой подписью. Например: 25.12 19:00|🎁 Новогодний розыгрыш!"
+        )
+    
+    @callback_router.handler(ADMIN_SCHEDULED_CANCEL)
+    async def cancel_scheduled_post(callback: CallbackQuery, post_id: int):
+        """Отмена отложенного поста"""
+        if not await post_scheduler.cancel(post_id):
+            await callback.message.answer(f"❌ Пост #{post_id} уже опубликован или отменен.")
+        await show_scheduled(callback)
+    
+    @callback_router.handler(ADMIN_CLOSE)
+    async def close_admin(callback: CallbackQuery):
+        """Закрыть админ-панель"""
         if callback.message:
             await callback.message.delete()
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data == "admin_menu")
-    async def show_admin_menu(callback: CallbackQuery):
-        """Показать админ-меню"""
+    @callback_router.handler(ADMIN_GIVEAWAY)
+    async def show_giveaway_menu(callback: CallbackQuery):
+        """Управление розыгрышами"""
+        
+        giveaway = await giveaway_manager.get_active()
+        
+        keyboard = InlineKeyboardBuilder()
+        if giveaway:
+            participants = await giveaway_manager.count(giveaway['id'])
+            giveaway_text = f"""🎁 **Розыгрыши**
+
+🎉 Активный розыгрыш: {giveaway['title']}
+🆔 ID: {giveaway['id']}
+👥 Участников: {participants}
+⏳ В очереди на запись: {giveaway_manager.pending_count}"""
+            keyboard.row(InlineKeyboardButton(text="🎲 Подвести итоги", callback_data=ADMIN_GIVEAWAY_DRAW.pack(giveaway['id'])))
+        else:
+            giveaway_text = """🎁 **Розыгрыши**
+
+📭 Активного розыгрыша нет."""
+            keyboard.row(InlineKeyboardButton(text="➕ Новый розыгрыш", callback_data=ADMIN_GIVEAWAY_NEW.pack()))
+        keyboard.row(InlineKeyboardButton(text="🔙 Назад", callback_data=ADMIN_MENU.pack()))
+        
+        if callback.message and hasattr(callback.message, 'edit_text'):
+            await callback.message.edit_text(
+                giveaway_text,
+                reply_markup=keyboard.as_markup(),
+                parse_mode="Markdown"
+            )
+    
+    @callback_router.handler(ADMIN_GIVEAWAY_NEW)
+    async def start_new_giveaway(callback: CallbackQuery):
+        """Создание нового розыгрыша"""
         user = callback.from_user
-        if not user or not is_admin(user.id):
-            await safe_callback_answer(callback)
+        
+        if await giveaway_manager.get_active():
+            await callback.message.answer("❌ Сначала подведите итоги текущего розыгрыша.")
             return
         
-        from aiogram.utils.keyboard import InlineKeyboardBuilder
-        from aiogram.types import InlineKeyboardButton
+        admin_states[user.id] = "waiting_giveaway_title"
+        
+        await callback.message.answer(
+            "🎁 **Новый розыгрыш**\n\n"
+            "Введите название розыгрыша (например: 'Игровая мышь за подписку'):",
+            parse_mode="Markdown"
+        )
+    
+    @callback_router.handler(ADMIN_GIVEAWAY_DRAW)
+    async def request_giveaway_draw(callback: CallbackQuery, giveaway_id: int):
+        """Запрос количества победителей"""
+        user = callback.from_user
+        
+        admin_states[user.id] = f"waiting_winners_{giveaway_id}"
+        
+        await callback.message.answer(
+            "🎲 **Подведение итогов**\n\n"
+            "Введите количество победителей. Можно указать seed через пробел "
+            "(например: '3 phoenix2025'), иначе он будет сгенерирован автоматически.",
+            parse_mode="Markdown"
+        )
+    
+    @callback_router.handler(ADMIN_GIVEAWAY_ANNOUNCE)
+    async def announce_giveaway(callback: CallbackQuery, giveaway_id: int):
+        """Публикация итогов розыгрыша в канал"""
+        giveaway = await db.get_giveaway(giveaway_id)
+        
+        if not giveaway or giveaway['status'] != 'finished':
+            await callback.message.answer("❌ Итоги розыгрыша не найдены.")
+            return
+        
+        if not config.CHANNEL_ID:
+            await callback.message.answer("❌ Канал не настроен! Используйте /set_channel")
+            return
+        
+        try:
+            with send_class(ADMIN_SEND):
+                await callback.bot.send_message(config.CHANNEL_ID, format_results(giveaway))
+            await callback.message.answer(f"✅ Итоги опубликованы в канале {config.CHANNEL_ID}!")
+        except Exception as e:
+            logger.error(f"Ошибка публикации итогов розыгрыша: {e}")
+            await callback.message.answer(f"❌ Ошибка публикации: {str(e)}")
+    
+    @callback_router.handler(ADMIN_MENU)
+    async def show_admin_menu(callback: CallbackQuery):
+        """Показать админ-меню"""
         
         keyboard = InlineKeyboardBuilder()
-        keyboard.row(InlineKeyboardButton(text="📦 Управление услугами", callback_data="admin_services"))
-        keyboard.row(InlineKeyboardButton(text="📊 Статистика", callback_data="admin_stats"))
-        keyboard.row(InlineKeyboardButton(text="📝 Пост в канал", callback_data="admin_post"))
-        keyboard.row(InlineKeyboardButton(text="❌ Закрыть", callback_data="admin_close"))
+        keyboard.row(InlineKeyboardButton(text="📦 Управление услугами", callback_data=ADMIN_SERVICES.pack()))
+        keyboard.row(InlineKeyboardButton(text="📊 Статистика", callback_data=ADMIN_STATS.pack()))
+        keyboard.row(InlineKeyboardButton(text="📝 Пост в канал", callback_data=ADMIN_POST.pack()))
+        keyboard.row(InlineKeyboardButton(text=scheduled_button_text(), callback_data=ADMIN_SCHEDULED.pack()))
+        keyboard.row(InlineKeyboardButton(text="🎁 Розыгрыши", callback_data=ADMIN_GIVEAWAY.pack()))
+        keyboard.row(InlineKeyboardButton(text=alerts_button_text(), callback_data=ADMIN_ALERTS.pack()))
+        keyboard.row(InlineKeyboardButton(text="❌ Закрыть", callback_data=ADMIN_CLOSE.pack()))
         
         admin_text = f"""🔧 **Админ-панель Phoenix PS Bot**
 
@@ -472,26 +777,26 @@ def register_admin_handlers(dp, config: Config):
                 reply_markup=keyboard.as_markup(),
                 parse_mode="Markdown"
             )
-        await safe_callback_answer(callback)
     
-    # Обработка текстовых сообщений от админа
-    @dp.message()
+    # Обработка текстовых сообщений от админа (только при активном состоянии)
+    @dp.message(IsAdmin(config), lambda message: message.from_user.id in admin_states)
     async def handle_admin_text(message: Message):
         """Обработка текстовых сообщений админа"""
         user = message.from_user
-        if not user or not is_admin(user.id):
-            return
-        
         user_state = admin_states.get(user.id)
         
-        # Если нет активного состояния, игнорируем сообщение
         if not user_state:
             return
         
         if user_state == "waiting_post":
+            # Альбом приходит несколькими сообщениями и публикуется одной группой
+            if message.media_group_id and (message.photo or message.video):
+                album_collector.add(message, publish_album)
+                return
+            
             # Публикация поста с кнопкой
-            if not message.text:
-                await message.answer("❌ Отправьте текстовое сообщение.")
+            if not message.text and not message.photo:
+                await message.answer("❌ Отправьте текст, фото или альбом.")
                 return
             
             try:
@@ -499,18 +804,13 @@ def register_admin_handlers(dp, config: Config):
                 bot = message.bot
                 
                 # Отправка поста в канал
-                await bot.send_message(
-                    config.CHANNEL_ID,
-                    message.text,
-                    reply_markup=get_channel_post_keyboard(),
-                    parse_mode="Markdown"
-                )
-                
-                from aiogram.utils.keyboard import InlineKeyboardBuilder
-                from aiogram.types import InlineKeyboardButton
+                if message.photo:
+                    await publish_post(bot, message.caption, message.photo[-1].file_id)
+                else:
+                    await publish_post(bot, message.text)
                 
                 keyboard = InlineKeyboardBuilder()
-                keyboard.row(InlineKeyboardButton(text="🔙 В админ-панель", callback_data="admin_menu"))
+                keyboard.row(InlineKeyboardButton(text="🔙 В админ-панель", callback_data=ADMIN_MENU.pack()))
                 
                 await message.answer(
                     f"✅ Пост опубликован в канале {config.CHANNEL_ID}!",
@@ -524,6 +824,14 @@ def register_admin_handlers(dp, config: Config):
                 await message.answer(f"❌ Ошибка публикации: {str(e)}")
                 admin_states.pop(user.id, None)
         
+        elif user_state == "waiting_scheduled_post":
+            # Время и текст одним сообщением: "ДД.ММ ЧЧ:ММ|текст" или фото с такой подписью
+            try:
+                await message.answer(await schedule_post(message, message.text or message.caption or ""))
+                admin_states.pop(user.id, None)
+            except ValueError as e:
+                await message.answer(str(e))
+        
         elif user_state == "waiting_channel":
             # Установка канала для заявок
             if not message.text:
@@ -533,11 +841,8 @@ def register_admin_handlers(dp, config: Config):
             channel_id = message.text.strip()
             config.set_channel(channel_id)
             
-            from aiogram.utils.keyboard import InlineKeyboardBuilder
-            from aiogram.types import InlineKeyboardButton
-            
             keyboard = InlineKeyboardBuilder()
-            keyboard.row(InlineKeyboardButton(text="🔙 В настройки", callback_data="admin_settings"))
+            keyboard.row(InlineKeyboardButton(text="🔙 В настройки", callback_data=ADMIN_SETTINGS.pack()))
             
             await message.answer(
                 f"✅ Канал для заявок установлен: {channel_id}",
@@ -553,11 +858,8 @@ def register_admin_handlers(dp, config: Config):
             
             config.set_giveaway_description(message.text.strip())
             
-            from aiogram.utils.keyboard import InlineKeyboardBuilder
-            from aiogram.types import InlineKeyboardButton
-            
             keyboard = InlineKeyboardBuilder()
-            keyboard.row(InlineKeyboardButton(text="🔙 В настройки", callback_data="admin_settings"))
+            keyboard.row(InlineKeyboardButton(text="🔙 В настройки", callback_data=ADMIN_SETTINGS.pack()))
             
             await message.answer(
                 "✅ Текст раздела 'Розыгрыш' обновлен!",
@@ -565,18 +867,97 @@ def register_admin_handlers(dp, config: Config):
             )
             admin_states.pop(user.id, None)
         
+        elif user_state == "waiting_giveaway_title":
+            # Создание розыгрыша
+            if not message.text:
+                await message.answer("❌ Отправьте название розыгрыша.")
+                return
+            
+            giveaway_id = await giveaway_manager.create(message.text.strip())
+            
+            keyboard = InlineKeyboardBuilder()
+            keyboard.row(InlineKeyboardButton(text="🔙 К розыгрышам", callback_data=ADMIN_GIVEAWAY.pack()))
+            
+            await message.answer(
+                f"✅ Розыгрыш создан (ID {giveaway_id})! Кнопка '🎉 Участвовать' появилась в разделе 'Розыгрыш'.",
+                reply_markup=keyboard.as_markup()
+            )
+            admin_states.pop(user.id, None)
+        
+        elif user_state.startswith("waiting_winners_"):
+            # Подведение итогов розыгрыша
+            if not message.text:
+                await message.answer("❌ Отправьте количество победителей.")
+                return
+            
+            giveaway_id = int(user_state.split("_")[2])
+            args = message.text.split(maxsplit=1)
+            try:
+                winners_count = int(args[0])
+                if winners_count < 1:
+                    raise ValueError
+            except ValueError:
+                await message.answer("❌ Количество победителей должно быть положительным числом.")
+                return
+            seed = args[1].strip() if len(args) > 1 else None
+            
+            giveaway = await db.get_giveaway(giveaway_id)
+            if not giveaway or giveaway['status'] != 'active':
+                await message.answer("❌ Розыгрыш не найден или уже завершен.")
+                admin_states.pop(user.id, None)
+                return
+            
+            await giveaway_manager.draw(giveaway_id, winners_count, seed)
+            giveaway = await db.get_giveaway(giveaway_id)
+            
+            keyboard = InlineKeyboardBuilder()
+            keyboard.row(InlineKeyboardButton(text="📢 Опубликовать итоги", callback_data=ADMIN_GIVEAWAY_ANNOUNCE.pack(giveaway_id)))
+            keyboard.row(InlineKeyboardButton(text="🔙 К розыгрышам", callback_data=ADMIN_GIVEAWAY.pack()))
+            
+            await message.answer(format_results(giveaway), reply_markup=keyboard.as_markup())
+            admin_states.pop(user.id, None)
+        
+        elif user_state.startswith("waiting_image_"):
+            # Изображение услуги
+            if not message.photo:
+                await message.answer("❌ Отправьте фото для услуги.")
+                return
+            
+            service_id = int(user_state.split("_")[2])
+            file_id = await media_cache.remember_photo(message)
+            
+            if await catalog.set_service_image(service_id, file_id):
+                await message.answer(f"✅ Изображение услуги {service_id} обновлено!")
+            else:
+                await message.answer("❌ Услуга не найдена.")
+            admin_states.pop(user.id, None)
+        
+        elif user_state.startswith("waiting_edit_"):
+            # Новое значение поля услуги: waiting_edit_поле_id_версия
+            if not message.text or not message.text.strip():
+                await message.answer("❌ Отправьте новое значение текстом.")
+                return
+            
+            field, service_id, version = user_state[len("waiting_edit_"):].rsplit("_", 2)
+            result = await edit_service(int(service_id), int(version), field, message.text.strip())
+            admin_states.pop(user.id, None)
+            
+            keyboard = InlineKeyboardBuilder()
+            keyboard.row(InlineKeyboardButton(text="✏️ К услуге", callback_data=ADMIN_EDIT_ASK.pack(int(service_id))))
+            keyboard.row(InlineKeyboardButton(text="🔙 В админ-панель", callback_data=ADMIN_MENU.pack()))
+            await message.answer(result, reply_markup=keyboard.as_markup())
+        
         elif user_state.startswith("waiting_name_"):
             # Добавление названия услуги
             if not message.text:
                 await message.answer("❌ Отправьте название услуги.")
                 return
             
-            category_key = user_state.split("_")[2]
-            category_name = CATEGORIES.get(category_key, "Неизвестная категория")
+            category_id = user_state.split("_")[2]
             service_name = message.text.strip()
             
             # Сохраняем название и переходим к описанию
-            admin_states[user.id] = f"waiting_description_{category_key}_{service_name}"
+            admin_states[user.id] = f"waiting_description_{category_id}_{service_name}"
             
             await message.answer(
                 f"📝 **Добавление услуги: {service_name}**\n\n"
@@ -590,19 +971,19 @@ def register_admin_handlers(dp, config: Config):
                 await message.answer("❌ Отправьте описание услуги.")
                 return
             
-            # Разбираем состояние: waiting_description_category_key_service_name
+            # Разбираем состояние: waiting_description_category_id_service_name
             parts = user_state.split("_", 3)  # Разделяем максимум на 3 части
             if len(parts) < 4:
                 await message.answer("❌ Ошибка состояния. Начните заново.")
                 admin_states.pop(user.id, None)
                 return
             
-            category_key = parts[2]
+            category_id = parts[2]
             service_name = parts[3]
             description = message.text.strip()
             
             # Сохраняем описание и переходим к цене
-            admin_states[user.id] = f"waiting_price_{category_key}_{service_name}_{description}"
+            admin_states[user.id] = f"waiting_price_{category_id}_{service_name}_{description}"
             
             await message.answer(
                 f"💰 **Добавление услуги: {service_name}**\n\n"
@@ -616,29 +997,31 @@ def register_admin_handlers(dp, config: Config):
                 await message.answer("❌ Отправьте цену услуги.")
                 return
             
-            # Разбираем состояние: waiting_price_category_key_service_name_description
+            # Разбираем состояние: waiting_price_category_id_service_name_description
             parts = user_state.split("_", 4)  # Разделяем максимум на 4 части
             if len(parts) < 5:
                 await message.answer("❌ Ошибка состояния. Начните заново.")
                 admin_states.pop(user.id, None)
                 return
             
-            category_key = parts[2]
+            category_id = int(parts[2])
             service_name = parts[3]
             description = parts[4]
             price = message.text.strip()
             
             try:
                 # Добавляем услугу в базу данных
-                category_name = CATEGORIES.get(category_key, "Неизвестная категория")
-                service_id = await db.add_service(service_name, description, price, category_name)
-                
-                from aiogram.utils.keyboard import InlineKeyboardBuilder
-                from aiogram.types import InlineKeyboardButton
+                category = await catalog.get_category(category_id)
+                if not category:
+                    await message.answer("❌ Категория не найдена. Начните заново.")
+                    admin_states.pop(user.id, None)
+                    return
+                category_name = category['name']
+                service_id = await catalog.add_service(service_name, description, price, category_id)
                 
                 keyboard = InlineKeyboardBuilder()
-                keyboard.row(InlineKeyboardButton(text="➕ Добавить еще", callback_data="admin_add_service"))
-                keyboard.row(InlineKeyboardButton(text="🔙 В админ-панель", callback_data="admin_menu"))
+                keyboard.row(InlineKeyboardButton(text="➕ Добавить еще", callback_data=ADMIN_ADD_SERVICE.pack()))
+                keyboard.row(InlineKeyboardButton(text="🔙 В админ-панель", callback_data=ADMIN_MENU.pack()))
                 
                 await message.answer(
                     f"✅ **Услуга успешно добавлена!**\n\n"
@@ -675,13 +1058,19 @@ def register_admin_handlers(dp, config: Config):
             if len(args) != 4:
                 await message.answer(
                     "❌ Формат: /add_service категория|название|описание|цена\n\n" +
-                    "Категории:\n" + "\n".join([f"• {cat}" for cat in CATEGORIES.values() if cat not in ["🧾 О нас", "📞 Контакты и заказ"]])
+                    "Категории (ID или название):\n" + "\n".join(
+                        [f"• {category['id']}: {category['name']}" for category in await catalog.get_service_categories()]
+                    )
                 )
                 return
             
-            category, name, description, price = [arg.strip() for arg in args]
+            category_value, name, description, price = [arg.strip() for arg in args]
+            category = await catalog.find_category(category_value)
+            if not category:
+                await message.answer(f"❌ Категория не найдена: {category_value}\nСписок категорий: /categories")
+                return
             
-            service_id = await db.add_service(name, description, price, category)
+            service_id = await catalog.add_service(name, description, price, category['id'])
             
             await message.answer(f"✅ Услуга добавлена! ID: {service_id}")
             
@@ -701,7 +1090,7 @@ def register_admin_handlers(dp, config: Config):
             
         try:
             service_id = int(message.text.split()[1])
-            success = await db.delete_service(service_id)
+            success = await catalog.delete_service(service_id)
             
             if success:
                 await message.answer(f"✅ Услуга {service_id} удалена!")
@@ -721,7 +1110,7 @@ def register_admin_handlers(dp, config: Config):
             await message.answer("❌ Доступ запрещен.")
             return
         
-        services = await db.get_all_services()
+        services = await catalog.get_all_services()
         
         if not services:
             await message.answer("📭 Услуг пока нет.")
@@ -734,6 +1123,91 @@ def register_admin_handlers(dp, config: Config):
         
         await message.answer(text, parse_mode="Markdown")
     
+    @dp.message(Command("categories"))
+    async def cmd_categories(message: Message):
+        """Категории главного меню"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        text = "📂 Категории (в порядке меню):\n\n"
+        for category in await catalog.get_categories():
+            if category['kind'] == SERVICES_KIND:
+                count = len(await catalog.get_services_by_category(category['id']))
+                details = f"услуг: {count}"
+            else:
+                details = "служебный раздел"
+            text += f"🔹 ID {category['id']}: {category['name']}\n   кнопка: {category['button']} | {details}\n\n"
+        text += (
+            "/add_category название|кнопка\n"
+            "/rename_category ID|название|кнопка\n"
+            "/delete_category ID (только без услуг)"
+        )
+        await message.answer(text)
+    
+    @dp.message(Command("add_category"))
+    async def cmd_add_category(message: Message):
+        """Добавление категории услуг"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        args = [arg.strip() for arg in (message.text or "").partition(" ")[2].split("|")]
+        if not args[0] or len(args) > 2:
+            await message.answer("❌ Формат: /add_category название|кнопка (кнопка - короткий текст в меню, необязательно)")
+            return
+        
+        name = args[0]
+        button = args[1] if len(args) == 2 and args[1] else name
+        category_id = await catalog.add_category(name, button)
+        await message.answer(f"✅ Категория добавлена! ID: {category_id}")
+    
+    @dp.message(Command("rename_category"))
+    async def cmd_rename_category(message: Message):
+        """Переименование категории"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        args = [arg.strip() for arg in (message.text or "").partition(" ")[2].split("|")]
+        if len(args) not in (2, 3) or not args[0].isdigit() or not args[1]:
+            await message.answer("❌ Формат: /rename_category ID|название|кнопка")
+            return
+        
+        category_id, name = int(args[0]), args[1]
+        button = args[2] if len(args) == 3 and args[2] else name
+        if await catalog.update_category(category_id, name, button):
+            await message.answer(f"✅ Категория {category_id} переименована, услуги остались в ней.")
+        else:
+            await message.answer("❌ Категория не найдена.")
+    
+    @dp.message(Command("delete_category"))
+    async def cmd_delete_category(message: Message):
+        """Удаление пустой категории"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        try:
+            category_id = int((message.text or "").split()[1])
+        except (IndexError, ValueError):
+            await message.answer("❌ Укажите ID категории: /delete_category 7")
+            return
+        
+        category = await catalog.get_category(category_id)
+        if not category:
+            await message.answer("❌ Категория не найдена.")
+        elif category['kind'] != SERVICES_KIND:
+            await message.answer("❌ Служебный раздел меню удалить нельзя.")
+        elif await catalog.delete_category(category_id):
+            await message.answer(f"✅ Категория {category_id} удалена!")
+        else:
+            await message.answer("❌ В категории есть услуги: сначала удалите их.")
+    
     @dp.message(Command("set_manager"))
     async def cmd_set_manager(message: Message):
         """Установка менеджера"""
@@ -780,7 +1254,9 @@ def register_admin_handlers(dp, config: Config):
             await message.answer("❌ Доступ запрещен.")
             return
         
-        if not message.text:
+        # Команда может прийти текстом или подписью к фото
+        command_text = message.text or message.caption
+        if not command_text:
             return
             
         if not config.CHANNEL_ID:
@@ -788,24 +1264,341 @@ def register_admin_handlers(dp, config: Config):
             return
         
         try:
-            post_text = message.text.split(" ", 1)[1]
             # Используем bot из контекста сообщения
             bot = message.bot
             
-            await bot.send_message(
-                config.CHANNEL_ID,
-                post_text,
-                reply_markup=get_channel_post_keyboard(),
-                parse_mode="Markdown"
-            )
+            if message.photo:
+                parts = command_text.split(" ", 1)
+                post_text = parts[1] if len(parts) > 1 else None
+                await publish_post(bot, post_text, message.photo[-1].file_id)
+            else:
+                post_text = command_text.split(" ", 1)[1]
+                await publish_post(bot, post_text)
             
             await message.answer(f"✅ Пост опубликован в {config.CHANNEL_ID}!")
             
         except IndexError:
-            await message.answer("❌ Укажите текст: /post Ваш текст")
+            await message.answer("❌ Укажите текст: /post Ваш текст (или отправьте фото с подписью /post)")
+        except Exception as e:
+            await message.answer(f"❌ Ошибка: {str(e)}")
+    
+    @dp.message(Command("schedule"))
+    async def cmd_schedule(message: Message):
+        """Отложенная публикация в канал"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        if not config.CHANNEL_ID:
+            await message.answer("❌ Канал не установлен.")
+            return
+        
+        # Команда может прийти текстом или подписью к фото
+        args = (message.text or message.caption or "").partition(" ")[2]
+        try:
+            await message.answer(await schedule_post(message, args))
+        except ValueError as e:
+            await message.answer(str(e))
+    
+    @dp.message(Command("scheduled"))
+    async def cmd_scheduled(message: Message):
+        """Очередь отложенных постов"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        posts = await db.get_pending_posts()
+        await message.answer(truncate_text(format_scheduled_posts(posts, post_timezone)))
+    
+    @dp.message(Command("edit_post"))
+    async def cmd_edit_post(message: Message):
+        """Новый текст отложенного поста"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        post_id, separator, text = (message.text or "").partition(" ")[2].partition("|")
+        post_id, text = post_id.strip(), text.strip()
+        if not separator or not post_id.isdigit() or not text:
+            await message.answer("❌ Формат: /edit_post ID|новый текст")
+            return
+        
+        post = await db.get_scheduled_post(int(post_id))
+        if post and await post_scheduler.update(post['id'], text, post['photo'], post['publish_at']):
+            await message.answer(f"✅ Текст поста #{post['id']} изменен.")
+        else:
+            await message.answer("❌ Пост не найден или уже опубликован.")
+    
+    @dp.message(Command("move_post"))
+    async def cmd_move_post(message: Message):
+        """Перенос отложенного поста на другое время"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        post_id, separator, when = (message.text or "").partition(" ")[2].partition("|")
+        post_id = post_id.strip()
+        publish_at = parse_publish_time(when, post_timezone)
+        if not separator or not post_id.isdigit() or not publish_at:
+            await message.answer("❌ Формат: /move_post ID|ДД.ММ ЧЧ:ММ")
+            return
+        if is_past(publish_at):
+            await message.answer("❌ Это время уже прошло.")
+            return
+        
+        post = await db.get_scheduled_post(int(post_id))
+        if post and await post_scheduler.update(post['id'], post['text'], post['photo'], publish_at):
+            await message.answer(f"✅ Пост #{post['id']} перенесен на {format_publish_time(publish_at, post_timezone)}.")
+        else:
+            await message.answer("❌ Пост не найден или уже опубликован.")
+    
+    @dp.message(Command("cancel_post"))
+    async def cmd_cancel_post(message: Message):
+        """Отмена отложенного поста"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        try:
+            post_id = int((message.text or "").split()[1])
+        except (IndexError, ValueError):
+            await message.answer("❌ Укажите ID поста: /cancel_post 3")
+            return
+        
+        if await post_scheduler.cancel(post_id):
+            await message.answer(f"✅ Пост #{post_id} отменен.")
+        else:
+            await message.answer("❌ Пост не найден или уже опубликован.")
+    
+    @dp.message(Command("edit_service"))
+    async def cmd_edit_service(message: Message):
+        """Изменение поля услуги"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        fields = {
+            "название": 'name',
+            "описание": 'description',
+            "цена": 'price',
+            "категория": 'category_id'
+        }
+        args = [arg.strip() for arg in (message.text or "").partition(" ")[2].split("|", 2)]
+        if len(args) != 3 or not args[0].isdigit() or args[1].lower() not in fields or not args[2]:
+            await message.answer("❌ Формат: /edit_service ID|название, описание, цена или категория|новое значение")
+            return
+        
+        field, value = fields[args[1].lower()], args[2]
+        if field == 'category_id':
+            category = await catalog.find_category(value)
+            if not category:
+                await message.answer("❌ Категория не найдена. Список категорий: /categories")
+                return
+            value = category['id']
+        
+        # Версия читается до записи: одновременное изменение услуги не будет затерто
+        service = await db.get_service_by_id(int(args[0]))
+        if not service:
+            await message.answer("❌ Услуга не найдена.")
+            return
+        await message.answer(await edit_service(service['id'], service['version'], field, value))
+    
+    @dp.message(Command("set_image"))
+    async def cmd_set_image(message: Message):
+        """Установка изображения услуги"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        command_text = message.text or message.caption
+        if not command_text:
+            return
+        
+        args = command_text.split(maxsplit=2)[1:]
+        try:
+            service_id = int(args[0])
+        except (IndexError, ValueError):
+            await message.answer("❌ Формат: /set_image ID [путь к файлу] (или фото с подписью /set_image ID)")
+            return
+        
+        service = await catalog.get_service(service_id)
+        if not service:
+            await message.answer("❌ Услуга не найдена.")
+            return
+        
+        try:
+            if message.photo:
+                # Фото уже в Telegram: сохраняем его file_id
+                file_id = await media_cache.remember_photo(message)
+            elif len(args) > 1:
+                # Локальный файл: загружается один раз, повторно используется file_id
+                path = args[1].strip()
+                if not os.path.isfile(path):
+                    await message.answer(f"❌ Файл не найден: {path}")
+                    return
+                # Чтение файла в потоке, чтобы большой файл не останавливал цикл событий
+                data = await asyncio.to_thread(read_file, path)
+                file_id = await media_cache.upload_photo(
+                    message.bot,
+                    message.chat.id,
+                    data,
+                    filename=os.path.basename(path),
+                    caption=f"🖼 {service['name']}"
+                )
+            else:
+                admin_states[user.id] = f"waiting_image_{service_id}"
+                await message.answer(f"🖼 Отправьте фото для услуги «{service['name']}»:")
+                return
+            
+            await catalog.set_service_image(service_id, file_id)
+            await message.answer(f"✅ Изображение услуги {service_id} обновлено!")
+            
         except Exception as e:
+            logger.error(f"Ошибка установки изображения: {e}")
             await message.answer(f"❌ Ошибка: {str(e)}")
     
+    @dp.message(Command("clear_image"))
+    async def cmd_clear_image(message: Message):
+        """Удаление изображения услуги"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        if not message.text:
+            return
+        
+        try:
+            service_id = int(message.text.split()[1])
+        except (IndexError, ValueError):
+            await message.answer("❌ Укажите ID услуги: /clear_image 1")
+            return
+        
+        if await catalog.set_service_image(service_id, None):
+            await message.answer(f"✅ Изображение услуги {service_id} удалено.")
+        else:
+            await message.answer("❌ Услуга не найдена.")
+    
+    @dp.message(Command("metrics"))
+    async def cmd_metrics(message: Message):
+        """Метрики запросов к Bot API"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        text = "📡 Запросы к Bot API:\n\n" + format_api_stats()
+        breaker = getattr(message.bot.session, "breaker", None)
+        if breaker is not None:
+            text += "\n\n🔌 " + format_breaker_state(breaker)
+        outbound = getattr(message.bot.session, "outbound", None)
+        if outbound is not None:
+            text += "\n\n📤 Исходящие по классам:\n\n" + outbound.format_stats()
+        admission = dp.get("admission")
+        if admission is not None:
+            text += "\n\n🚦 Нагрузка по классам:\n\n" + admission.format_stats()
+        loop_monitor = dp.get("loop_monitor")
+        if loop_monitor is not None:
+            from loop_monitor import format_loop_stats
+            text += "\n\n🌀 Цикл событий:\n\n" + format_loop_stats(loop_monitor)
+        await message.answer(truncate_text(text))
+        await message.answer_document(
+            BufferedInputFile(registry.render_prometheus().encode("utf-8"), filename="metrics.txt"),
+            caption="📊 Все метрики (формат Prometheus)"
+        )
+    
+    @dp.message(Command("health"))
+    async def cmd_health(message: Message):
+        """Самодиагностика работающего бота"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        health_monitor = dp.get("health_monitor")
+        if health_monitor is None:
+            await message.answer("❌ Самодиагностика не настроена.")
+            return
+        
+        # Обычно показываем последний фоновый замер; до первого замера проверяем сразу
+        if not health_monitor.checks:
+            await health_monitor.sample()
+        from health import format_health
+        await message.answer(format_health(health_monitor.report()))
+    
+    @dp.message(Command("memory"))
+    async def cmd_memory(message: Message):
+        """Отчет о памяти: /memory [start|stop|dump]"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        memory_profiler = dp.get("memory_profiler")
+        if memory_profiler is None:
+            await message.answer("❌ Профилирование памяти не настроено.")
+            return
+        
+        args = message.text.split()[1:] if message.text else []
+        action = args[0].lower() if args else ""
+        if action == "start":
+            memory_profiler.start_tracing()
+            await message.answer("✅ Трассировка памяти включена. Выполните /memory, затем повторите позже для сравнения.")
+            return
+        if action == "stop":
+            memory_profiler.stop_tracing()
+            await message.answer("✅ Трассировка памяти выключена.")
+            return
+        
+        # Снимок tracemalloc большого процесса занимает время: выполняем вне цикла событий
+        loop = asyncio.get_running_loop()
+        if action == "dump":
+            path = await loop.run_in_executor(None, memory_profiler.dump_snapshot)
+            await message.answer(f"✅ Снимок сохранен: {path}" if path else "❌ Трассировка выключена: /memory start")
+            return
+        report = await loop.run_in_executor(None, memory_profiler.report)
+        from memory_report import format_memory_report
+        await message.answer(truncate_text(format_memory_report(report)))
+    
+    @dp.message(Command("backup"))
+    async def cmd_backup(message: Message):
+        """Резервная копия базы данных"""
+        user = message.from_user
+        if not user or not is_admin(user.id):
+            await message.answer("❌ Доступ запрещен.")
+            return
+        
+        if not db.db_path:
+            await message.answer(f"ℹ️ Резервные копии делаются только для SQLite, хранилище: {db.backend.name}")
+            return
+        
+        # Модуль резервного копирования нужен редко: загружаем по первому запросу
+        from backup import BackupManager, format_backup_info
+        backup_manager = dp.get("backup_manager")
+        if backup_manager is None:
+            backup_manager = BackupManager(db.db_path, config.BACKUP_DIR, config.BACKUP_KEEP, config.BACKUP_INTERVAL_HOURS)
+            dp["backup_manager"] = backup_manager
+        
+        await message.answer("⏳ Создаю резервную копию...")
+        try:
+            info = await backup_manager.create_backup()
+        except Exception as e:
+            logger.error(f"Ошибка резервного копирования: {e}")
+            await message.answer(f"❌ Ошибка резервного копирования: {e}")
+            return
+        
+        await message.answer(
+            "✅ Резервная копия создана\n\n" + format_backup_info(info) +
+            f"\n\n🗂 Хранится копий: {len(backup_manager.list_backups())}"
+        )
+    
     @dp.message(Command("admin_help"))
     async def cmd_admin_help(message: Message):
         """Помощь по админским командам"""
@@ -823,9 +1616,25 @@ def register_admin_handlers(dp, config: Config):
 • /add_service категория|название|описание|цена
 • /list_services - список услуг
 • /delete_service ID - удалить услугу
+• /edit_service ID|поле|значение - изменить название, описание, цену или категорию
+• /categories - категории меню
+• /add_category название|кнопка
+• /rename_category ID|название|кнопка
+• /delete_category ID - удалить пустую категорию
 • /set_manager username - менеджер
 • /set_channel @channel - канал
-• /post текст - пост в канал
+• /post текст - пост в канал (или фото с подписью /post текст)
+• /schedule ДД.ММ ЧЧ:ММ|текст - отложенный пост (или фото с такой подписью)
+• /scheduled - очередь отложенных постов
+• /edit_post ID|текст - изменить текст отложенного поста
+• /move_post ID|ДД.ММ ЧЧ:ММ - перенести отложенный пост
+• /cancel_post ID - отменить отложенный пост
+• /set_image ID [путь] - изображение услуги
+• /clear_image ID - убрать изображение услуги
+• /metrics - метрики запросов к Bot API, нагрузки и цикла событий
+• /health - самодиагностика (цикл событий, база, очереди, память, Bot API)
+• /memory [start|stop|dump] - память: структуры бота, крупнейшие выделения и прирост
+• /backup - резервная копия базы
 
 **Текущие настройки:**
 • Менеджер: @{manager}
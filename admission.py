@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from callbacks import codec, ORDER, ORDER_STATUS, GIVEAWAY_JOIN
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Классы нагрузки в порядке убывания приоритета
+ORDER_CLASS = "order"
+ADMIN_CLASS = "admin"
+BROWSE_CLASS = "browse"
+
+# Действия, которые пишут данные пользователя и никогда не отбрасываются
+ORDER_ACTIONS = {ORDER.prefix, ORDER_STATUS.prefix, GIVEAWAY_JOIN.prefix}
+
+DEGRADED_TEXT = "⏳ Сейчас много обращений, попробуйте через несколько секунд."
+
+# Метрики контроля нагрузки (общие для ботов процесса: счетчики суммируются по ботам)
+admission_queue_depth = registry.gauge("admission_queue_depth", "Апдейты, ожидающие обработки, по классам")
+admission_in_flight = registry.gauge("admission_in_flight", "Апдейты в обработке по классам")
+admission_admitted = registry.counter("admission_admitted_total", "Принятые апдейты по классам")
+admission_rejected = registry.counter("admission_rejected_total", "Отброшенные апдейты по классам")
+admission_wait = registry.histogram(
+    "admission_wait_seconds",
+    "Время ожидания в очереди по классам",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+
+class LoadClass:
+    """Ограничение параллельности для одного класса апдейтов"""
+
+    def __init__(self, name: str, concurrency: int, max_queue: Optional[int] = None):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        # None - апдейты класса ждут своей очереди и никогда не отбрасываются
+        self.max_queue = max_queue
+        self.waiting = 0
+        self.active = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Семафор создается внутри работающего цикла событий
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._semaphore
+
+    def should_shed(self) -> bool:
+        """Очередь переполнена и апдейт можно отбросить"""
+        return self.max_queue is not None and self.active >= self.concurrency and self.waiting >= self.max_queue
+
+class AdmissionMiddleware(BaseMiddleware):
+    """Контроль нагрузки: лимиты параллельности по классам и сброс просмотра при перегрузке"""
+
+    def __init__(self, classes: Dict[str, LoadClass], admin_id: int = 0):
+        self.classes = classes
+        self.admin_id = admin_id
+
+    @classmethod
+    def from_config(cls, config) -> "AdmissionMiddleware":
+        return cls(
+            {
+                ORDER_CLASS: LoadClass(ORDER_CLASS, config.ADMISSION_ORDER_CONCURRENCY),
+                ADMIN_CLASS: LoadClass(ADMIN_CLASS, config.ADMISSION_ADMIN_CONCURRENCY),
+                BROWSE_CLASS: LoadClass(
+                    BROWSE_CLASS,
+                    config.ADMISSION_BROWSE_CONCURRENCY,
+                    max_queue=config.ADMISSION_BROWSE_QUEUE
+                )
+            },
+            admin_id=config.ADMIN_ID
+        )
+
+    def classify(self, update: Update) -> str:
+        """Класс нагрузки апдейта"""
+        user = None
+        if update.callback_query:
+            user = update.callback_query.from_user
+            decoded = codec.decode(update.callback_query.data)
+            if decoded is not None:
+                action = decoded[0]
+                if action.prefix in ORDER_ACTIONS:
+                    return ORDER_CLASS
+                if action.admin_only:
+                    return ADMIN_CLASS
+        elif update.message:
+            user = update.message.from_user
+
+        if user and self.admin_id and user.id == self.admin_id:
+            return ADMIN_CLASS
+        return BROWSE_CLASS
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        load_class = self.classes[self.classify(event)]
+
+        if load_class.should_shed():
+            admission_rejected.inc(load_class=load_class.name)
+            await self._degraded_reply(event)
+            return None
+
+        if event.callback_query:
+            # Нажатие кнопки сначала ждет в очереди пользователя (CallbackRouter) и занимает
+            # место класса, только когда подойдет его очередь: частые нажатия одного
+            # пользователя не вытесняют остальных
+            data["load_class"] = load_class
+            return await handler(event, data)
+        return await self.run(load_class, lambda: handler(event, data))
+
+    async def run(self, load_class: LoadClass, job: Callable[[], Awaitable[Any]]) -> Any:
+        """Выполнение job на месте класса нагрузки (с ожиданием свободного места)"""
+        load_class.waiting += 1
+        admission_queue_depth.inc(load_class=load_class.name)
+        started = time.perf_counter()
+        try:
+            await load_class.semaphore.acquire()
+        finally:
+            load_class.waiting -= 1
+            admission_queue_depth.dec(load_class=load_class.name)
+        admission_wait.observe(time.perf_counter() - started, load_class=load_class.name)
+        admission_admitted.inc(load_class=load_class.name)
+
+        load_class.active += 1
+        admission_in_flight.inc(load_class=load_class.name)
+        try:
+            return await job()
+        finally:
+            load_class.active -= 1
+            admission_in_flight.dec(load_class=load_class.name)
+            load_class.semaphore.release()
+
+    async def _degraded_reply(self, update: Update):
+        """Короткий ответ вместо полной обработки"""
+        try:
+            if update.callback_query:
+                await update.callback_query.answer(DEGRADED_TEXT)
+            elif update.message and update.message.chat.type == "private":
+                await update.message.answer(DEGRADED_TEXT)
+        except Exception as e:
+            logger.debug(f"Не удалось отправить ответ о перегрузке: {e}")
+
+    def format_stats(self) -> str:
+        """Сводка по очередям для админ-панели"""
+        lines = []
+        for name, load_class in self.classes.items():
+            admitted = admission_admitted.value(load_class=name)
+            rejected = admission_rejected.value(load_class=name)
+            total = admitted + rejected
+            rejection_rate = rejected / total * 100 if total else 0.0
+            wait = admission_wait.stats(load_class=name)
+            lines.append(
+                f"• {name}: в работе {load_class.active}/{load_class.concurrency}, "
+                f"в очереди {load_class.waiting}, отброшено {int(rejected)} ({rejection_rate:.1f}%), "
+                f"ожидание p95 {wait['p95'] * 1000:.0f} мс"
+            )
+        return "\n".join(lines)
+
+def setup_admission(dp, config) -> AdmissionMiddleware:
+    """Подключение контроля нагрузки к диспетчеру"""
+    middleware = AdmissionMiddleware.from_config(config)
+    dp.update.outer_middleware(middleware)
+    dp["admission"] = middleware
+    return middleware
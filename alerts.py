@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bot_context import PerBot
+from metrics import registry
+from outbound import send_class, ADMIN
+
+logger = logging.getLogger(__name__)
+
+# Дайджест не чаще раза в DIGEST_INTERVAL; новая проблема ускоряет отправку,
+# но не чаще MIN_SEND_INTERVAL между сообщениями админу
+DIGEST_INTERVAL = 300.0
+MIN_SEND_INTERVAL = 60.0
+# Сколько хранить сработавшие оповещения для админ-панели
+ALERT_RETENTION = 24 * 3600
+MAX_DIGEST_ITEMS = 10
+
+alerts_reported = registry.counter("alerts_reported_total", "Зарегистрированные сбои по сигнатурам")
+alerts_digests = registry.counter("alerts_digests_total", "Отправленные админу дайджесты")
+
+_NUMBERS = re.compile(r"\d+")
+
+def error_signature(source: str, error: Exception) -> str:
+    """Сигнатура ошибки: источник, тип и текст без чисел (id, таймауты)"""
+    return f"{source}:{type(error).__name__}:{_NUMBERS.sub('N', str(error))[:120]}"
+
+class Alert:
+    """Состояние одной сигнатуры сбоя"""
+
+    def __init__(self, signature: str, title: str):
+        self.signature = signature
+        self.title = title
+        self.detail = ""
+        self.count = 0
+        # Сколько раз сработало с прошлого дайджеста
+        self.unsent = 0
+        self.first_seen = time.time()
+        self.last_seen = self.first_seen
+
+class AlertManager:
+    """Оповещения админа: дедупликация по сигнатуре и периодические дайджесты"""
+
+    def __init__(self, digest_interval: float = DIGEST_INTERVAL, min_send_interval: float = MIN_SEND_INTERVAL):
+        self.digest_interval = digest_interval
+        self.min_send_interval = min_send_interval
+        self.alerts: Dict[str, Alert] = {}
+        self.last_sent = 0.0
+        self._bot = None
+        self._admin_id = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def report(self, signature: str, title: str, detail: str = ""):
+        """Регистрация сбоя (без запросов к API)"""
+        alert = self.alerts.get(signature)
+        is_new = alert is None or not alert.unsent and time.time() - alert.last_seen > self.digest_interval
+        if alert is None:
+            alert = Alert(signature, title)
+            self.alerts[signature] = alert
+        alert.title = title
+        alert.detail = detail[:200]
+        alert.count += 1
+        alert.unsent += 1
+        alert.last_seen = time.time()
+        alerts_reported.inc(signature=signature.split(":", 1)[0])
+        logger.warning(f"Оповещение [{signature}]: {title} {detail}".rstrip())
+
+        # О новой проблеме сообщаем без ожидания полного интервала
+        if is_new and self._wakeup is not None:
+            self._wakeup.set()
+
+    def active(self) -> List[Alert]:
+        """Оповещения за период хранения, от последних к ранним"""
+        threshold = time.time() - ALERT_RETENTION
+        for signature in [key for key, alert in self.alerts.items() if alert.last_seen < threshold]:
+            del self.alerts[signature]
+        return sorted(self.alerts.values(), key=lambda alert: alert.last_seen, reverse=True)
+
+    def clear(self):
+        """Сброс всех оповещений"""
+        self.alerts.clear()
+
+    def start(self, bot, admin_id: int):
+        """Запуск отправки дайджестов"""
+        self._bot = bot
+        self._admin_id = admin_id
+        if self._task is None and admin_id:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._digest_loop())
+
+    async def stop(self):
+        """Остановка с отправкой неотправленного"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            await self.send_digest()
+
+    async def _digest_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.digest_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            # Ограничение частоты: ранний дайджест ждет конца минимального интервала
+            delay = self.last_sent + self.min_send_interval - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self.send_digest()
+            except Exception as e:
+                logger.error(f"Не удалось отправить дайджест оповещений: {e}")
+
+    async def send_digest(self) -> bool:
+        """Отправка дайджеста по сработавшим с прошлого раза сигнатурам"""
+        pending = [alert for alert in self.alerts.values() if alert.unsent]
+        if not pending or self._bot is None or not self._admin_id:
+            return False
+
+        text = format_alerts(pending, digest=True)
+        with send_class(ADMIN):
+            await self._bot.send_message(self._admin_id, text)
+        for alert in pending:
+            alert.unsent = 0
+        self.last_sent = time.time()
+        alerts_digests.inc()
+        return True
+
+def _format_time(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp).strftime("%d.%m %H:%M:%S")
+
+def format_alerts(alerts: List[Alert], digest: bool = False) -> str:
+    """Текст со списком оповещений"""
+    if not alerts:
+        return "🚨 Оповещения\n\n✅ Сбоев нет."
+
+    lines = ["⚠️ Сводка сбоев" if digest else "🚨 Оповещения за сутки", ""]
+    for alert in alerts[:MAX_DIGEST_ITEMS]:
+        count = f"{alert.unsent} (всего {alert.count})" if digest else str(alert.count)
+        lines.append(
+            f"• {alert.title}\n"
+            f"  Повторов: {count}\n"
+            f"  Впервые: {_format_time(alert.first_seen)}, последний: {_format_time(alert.last_seen)}"
+            + (f"\n  {alert.detail}" if alert.detail else "")
+        )
+    if len(alerts) > MAX_DIGEST_ITEMS:
+        lines.append(f"\n…и еще {len(alerts) - MAX_DIGEST_ITEMS}")
+    return "\n".join(lines)
+
+# Глобальный экземпляр оповещений
+alert_manager = PerBot(lambda name: AlertManager())
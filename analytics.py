@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import logging
+import math
+import zlib
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from bot_context import PerBot
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# События воронки услуги в порядке прохождения
+VIEW = "view"
+DETAILS = "details"
+ORDER = "order"
+FUNNEL_EVENTS = (VIEW, DETAILS, ORDER)
+
+FLUSH_INTERVAL = 60.0
+
+# Точность HyperLogLog: 2^10 регистров, стандартная ошибка ~3%
+HLL_PRECISION = 10
+
+class HyperLogLog:
+    """Приближенный подсчет уникальных значений в фиксированной памяти"""
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[bytearray] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.size)
+
+    @staticmethod
+    def _hash(value) -> int:
+        # Стабильный между перезапусками хэш (встроенный hash() для строк рандомизирован)
+        return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+    def add(self, value):
+        x = self._hash(value)
+        index = x & (self.size - 1)
+        w = x >> self.precision
+        rank = (64 - self.precision) - w.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: "HyperLogLog"):
+        """Объединение с другим счетчиком той же точности"""
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self) -> int:
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Поправка для малых множеств (linear counting)
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        # Регистры малых множеств почти пустые и хорошо сжимаются
+        return zlib.compress(bytes(self.registers))
+
+    @classmethod
+    def from_bytes(cls, data: Optional[bytes], precision: int = HLL_PRECISION) -> "HyperLogLog":
+        if not data:
+            return cls(precision)
+        registers = bytearray(zlib.decompress(data))
+        return cls(precision, registers if len(registers) == 1 << precision else None)
+
+def merge_sketches(stored: Optional[bytes], new: bytes) -> bytes:
+    """Объединение сохраненного счетчика уникальных с новым (вызывается хранилищем)"""
+    if not stored:
+        return new
+    sketch = HyperLogLog.from_bytes(new)
+    sketch.merge(HyperLogLog.from_bytes(stored))
+    return sketch.to_bytes()
+
+StatsKey = Tuple[str, int, str]
+
+class ServiceAnalytics:
+    """Счетчики воронки по услугам и дням: O(1) в обработчике, периодическая запись в базу"""
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        # (день, service_id, событие) -> [прирост счетчика, уникальные пользователи]
+        self._pending: Dict[StatsKey, list] = {}
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending_count(self) -> int:
+        """Количество еще не записанных счетчиков"""
+        return len(self._pending)
+
+    def track(self, event: str, service_id: int, user_id: int):
+        """Учет события воронки"""
+        key = (date.today().isoformat(), service_id, event)
+        entry = self._pending.get(key)
+        if entry is None:
+            entry = [0, HyperLogLog()]
+            self._pending[key] = entry
+        entry[0] += 1
+        entry[1].add(user_id)
+
+    def start(self):
+        """Запуск периодической записи счетчиков"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Остановка с записью накопленных счетчиков"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи аналитики: {e}")
+
+    async def flush(self):
+        """Запись накопленных счетчиков: суммирование и объединение уникальных"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                rows = [(key[0], key[1], key[2], count, sketch.to_bytes()) for key, (count, sketch) in batch.items()]
+                await db.upsert_service_stats(rows, merge_sketches)
+            except Exception:
+                # Возвращаем счетчики в буфер, чтобы не потерять события
+                for key, (count, sketch) in batch.items():
+                    entry = self._pending.setdefault(key, [0, HyperLogLog()])
+                    entry[0] += count
+                    entry[1].merge(sketch)
+                raise
+
+    async def funnel(self, days: int = 7) -> List[Dict]:
+        """Воронка по услугам за последние дни (с учетом еще не записанных событий)"""
+        await self.flush()
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+
+        totals: Dict[int, Dict] = {}
+        for day, service_id, event, count, uniques in await db.get_service_stats(since):
+            entry = totals.get(service_id)
+            if entry is None:
+                entry = {'service_id': service_id}
+                for name in FUNNEL_EVENTS:
+                    entry[name] = 0
+                    entry[f"{name}_sketch"] = HyperLogLog()
+                totals[service_id] = entry
+            if event in FUNNEL_EVENTS:
+                entry[event] += count
+                entry[f"{event}_sketch"].merge(HyperLogLog.from_bytes(uniques))
+
+        report = []
+        for entry in totals.values():
+            for name in FUNNEL_EVENTS:
+                entry[f"{name}_users"] = entry.pop(f"{name}_sketch").count()
+            report.append(entry)
+        report.sort(key=lambda item: (item[VIEW], item[ORDER]), reverse=True)
+        return report
+
+def format_funnel(report: List[Dict], service_names: Dict[int, str], days: int) -> str:
+    """Текст отчета по воронке для админ-панели"""
+    if not report:
+        return f"📈 Воронка за {days} дн.\n\nДанных пока нет."
+
+    def rate(part: int, whole: int) -> str:
+        return f"{part / whole * 100:.1f}%" if whole else "—"
+
+    total = {name: sum(item[name] for item in report) for name in FUNNEL_EVENTS}
+    lines = [
+        f"📈 Воронка за {days} дн.",
+        "",
+        f"Всего: 👁 {total[VIEW]} → 📄 {total[DETAILS]} → ✅ {total[ORDER]} "
+        f"(конверсия {rate(total[ORDER], total[VIEW])})",
+        ""
+    ]
+    for item in report:
+        name = service_names.get(item['service_id'], f"Услуга #{item['service_id']}")
+        lines.append(
+            f"• {name}\n"
+            f"  👁 {item[VIEW]} ({item['view_users']} чел.) → 📄 {item[DETAILS]} ({item['details_users']}) → "
+            f"✅ {item[ORDER]} ({item['order_users']}), конверсия {rate(item['order_users'], item['view_users'])}"
+        )
+    return "\n".join(lines)
+
+# Глобальный экземпляр аналитики
+analytics = PerBot(lambda name: ServiceAnalytics())
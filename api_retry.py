@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from aiohttp import ClientConnectorError
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+
+from alerts import alert_manager
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Попыток на вызов по методам (включая первую). Ответ на callback через несколько
+# секунд уже бесполезен, а getUpdates повторяет сам поллинг aiogram
+DEFAULT_ATTEMPTS = 3
+METHOD_ATTEMPTS = {
+    "answerCallbackQuery": 1,
+    "getUpdates": 1,
+    "sendMediaGroup": 2
+}
+# Методы вне предохранителя: поллинг должен продолжать проверять доступность API
+BREAKER_EXEMPT = {"getUpdates"}
+# Отправка сообщения не идемпотентна: после таймаута, разрыва соединения или 5xx
+# Telegram мог его уже доставить, и повтор опубликует дубль
+NON_IDEMPOTENT_PREFIXES = ("send", "copy", "forward")
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 5.0
+
+# Состояния предохранителя (значение метрики telegram_circuit_state)
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+STATE_NAMES = {CLOSED: "закрыт", HALF_OPEN: "пробный запрос", OPEN: "открыт"}
+
+api_retries = registry.counter("telegram_api_retries_total", "Повторы запросов к Bot API по методам и причинам")
+circuit_state = registry.gauge("telegram_circuit_state", "Состояние предохранителя Bot API: 0 - закрыт, 1 - пробный запрос, 2 - открыт")
+circuit_rejections = registry.counter("telegram_circuit_rejections_total", "Запросы, отклоненные открытым предохранителем")
+circuit_transitions = registry.counter("telegram_circuit_transitions_total", "Переключения предохранителя по состояниям")
+
+class CircuitOpenError(TelegramNetworkError):
+    """Запрос не отправлен: предохранитель открыт после серии сбоев Bot API"""
+
+def request_not_sent(error: Exception) -> bool:
+    """Запрос точно не дошел до Bot API: соединение не установлено или запрос отклонен предохранителем"""
+    return isinstance(error, CircuitOpenError) or isinstance(error.__cause__, ClientConnectorError)
+
+def can_retry(api_method: str, error: Exception) -> bool:
+    """Можно ли повторить запрос после сетевой ошибки или 5xx без риска дубля"""
+    return not api_method.startswith(NON_IDEMPOTENT_PREFIXES) or request_not_sent(error)
+
+class CircuitBreaker:
+    """Предохранитель: размыкается при высокой доле сбоев в скользящем окне"""
+
+    def __init__(self, failure_threshold: int = 10, failure_rate: float = 0.5, window: float = 30.0, cooldown: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.failure_rate = failure_rate
+        self.window = window
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        # (время, успех) за последние window секунд
+        self._results: Deque[Tuple[float, bool]] = deque()
+        self._failures = 0
+
+    def _set_state(self, state: int):
+        if state != self.state:
+            self.state = state
+            circuit_state.set(state)
+            circuit_transitions.inc(state=STATE_NAMES[state])
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def release_probe(self):
+        """Пробный запрос отменен без результата"""
+        self._probe_in_flight = False
+
+    def _trim(self, now: float):
+        while self._results and now - self._results[0][0] > self.window:
+            if not self._results.popleft()[1]:
+                self._failures -= 1
+
+    def record(self, success: bool):
+        """Учет результата запроса"""
+        now = time.monotonic()
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+            if success:
+                self._results.clear()
+                self._failures = 0
+                self._set_state(CLOSED)
+                logger.info("Предохранитель Bot API закрыт: API снова отвечает")
+            else:
+                self._open(now)
+            return
+
+        self._results.append((now, success))
+        if not success:
+            self._failures += 1
+        self._trim(now)
+        if (
+            self.state == CLOSED
+            and self._failures >= self.failure_threshold
+            and self._failures / len(self._results) >= self.failure_rate
+        ):
+            self._open(now)
+
+    def _open(self, now: float):
+        self.opened_at = now
+        self._set_state(OPEN)
+        logger.error(f"Предохранитель Bot API открыт на {self.cooldown:.0f} с: {self._failures} сбоев за {self.window:.0f} с")
+        alert_manager.report(
+            "telegram_circuit_open",
+            "Bot API недоступен: запросы временно не отправляются",
+            f"{self._failures} сбоев за {self.window:.0f} с"
+        )
+
+class RetryMiddleware(BaseRequestMiddleware):
+    """Повторы запросов к Bot API с учетом retry_after, backoff с джиттером и предохранитель"""
+
+    def __init__(
+        self,
+        breaker: Optional[CircuitBreaker] = None,
+        attempts: int = DEFAULT_ATTEMPTS,
+        method_attempts: Optional[Dict[str, int]] = None,
+        max_retry_after: float = 30.0
+    ):
+        self.breaker = breaker or CircuitBreaker()
+        self.attempts = attempts
+        self.method_attempts = dict(METHOD_ATTEMPTS, **(method_attempts or {}))
+        self.max_retry_after = max_retry_after
+
+    def attempts_for(self, api_method: str) -> int:
+        return max(1, self.method_attempts.get(api_method, self.attempts))
+
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        guarded = api_method not in BREAKER_EXEMPT
+        attempts = self.attempts_for(api_method)
+
+        for attempt in range(1, attempts + 1):
+            if guarded and not self.breaker.allow():
+                circuit_rejections.inc(method=api_method)
+                raise CircuitOpenError(method=method, message="Bot API временно недоступен (предохранитель открыт)")
+
+            try:
+                response = await make_request(bot, method)
+            except asyncio.CancelledError:
+                if guarded:
+                    self.breaker.release_probe()
+                raise
+            except TelegramRetryAfter as e:
+                # Ограничение частоты - не сбой API: предохранитель не трогаем
+                if guarded:
+                    self.breaker.record(True)
+                if attempt >= attempts or e.retry_after > self.max_retry_after:
+                    raise
+                api_retries.inc(method=api_method, reason="retry_after")
+                logger.warning(f"{api_method}: flood control, повтор через {e.retry_after} с")
+                await asyncio.sleep(e.retry_after)
+                continue
+            except (TelegramNetworkError, TelegramServerError) as e:
+                if guarded:
+                    self.breaker.record(False)
+                if attempt >= attempts:
+                    raise
+                if not can_retry(api_method, e):
+                    logger.warning(f"{api_method}: {e}, без повтора: сообщение могло быть доставлено")
+                    raise
+                reason = "network" if isinstance(e, TelegramNetworkError) else "server"
+                api_retries.inc(method=api_method, reason=reason)
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+                logger.warning(f"{api_method}: {e}, попытка {attempt + 1}/{attempts} через {delay:.2f} с")
+                await asyncio.sleep(delay)
+                continue
+            except Exception:
+                # Ошибки запроса (400, 403...) говорят о работающем API
+                if guarded:
+                    self.breaker.record(True)
+                raise
+
+            if guarded:
+                self.breaker.record(True)
+            return response
+
+def format_breaker_state(breaker: CircuitBreaker) -> str:
+    """Строка состояния предохранителя для админ-панели"""
+    text = f"Предохранитель: {STATE_NAMES[breaker.state]}"
+    if breaker.state == OPEN:
+        remaining = max(0.0, breaker.cooldown - (time.monotonic() - breaker.opened_at))
+        text += f" (еще {remaining:.0f} с)"
+    rejected = sum(circuit_rejections.values().values())
+    retried = sum(api_retries.values().values())
+    return text + f", повторов {int(retried)}, отклонено {int(rejected)}"
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Резервные копии базы данных Phoenix PS Bot: создание, проверка и восстановление
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import aiosqlite
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+BACKUP_PREFIX = "phoenix_bot-"
+BACKUP_SUFFIX = ".db.gz"
+CHECKSUM_SUFFIX = ".sha256"
+
+# Копирование порциями страниц с паузой между ними, чтобы запись в базу не ждала конца копии
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.01
+CHUNK_SIZE = 1024 * 1024
+
+backups_total = registry.counter("backups_total", "Резервные копии по результату")
+backup_duration = registry.histogram(
+    "backup_seconds",
+    "Время создания резервной копии",
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+
+def _compress_with_checksum(source_path: str, target_path: str) -> str:
+    """Сжатие файла gzip с подсчетом SHA-256 сжатых данных"""
+    digest = hashlib.sha256()
+
+    class _HashingWriter:
+        def __init__(self, raw):
+            self.raw = raw
+
+        def write(self, data):
+            digest.update(data)
+            return self.raw.write(data)
+
+        def flush(self):
+            self.raw.flush()
+
+    with open(source_path, 'rb') as source, open(target_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=_HashingWriter(raw), mode='wb', mtime=0) as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+        raw.flush()
+        os.fsync(raw.fileno())
+    return digest.hexdigest()
+
+def file_checksum(path: str) -> str:
+    """SHA-256 файла"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def read_checksum(backup_path: str) -> Optional[str]:
+    """Контрольная сумма из файла рядом с копией (формат sha256sum)"""
+    try:
+        with open(backup_path + CHECKSUM_SUFFIX, 'r', encoding='utf-8') as f:
+            return f.read().split()[0]
+    except (OSError, IndexError):
+        return None
+
+def integrity_check(db_path: str) -> str:
+    """Результат PRAGMA integrity_check ("ok" для целой базы)"""
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("PRAGMA integrity_check").fetchall()
+    finally:
+        conn.close()
+    return "; ".join(row[0] for row in rows)
+
+def verify_backup(backup_path: str) -> Optional[str]:
+    """Проверка копии: контрольная сумма, распаковка и целостность; None, если все в порядке"""
+    expected = read_checksum(backup_path)
+    if expected is None:
+        return "нет файла контрольной суммы"
+    if file_checksum(backup_path) != expected:
+        return "контрольная сумма не совпадает"
+
+    fd, temp_path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        try:
+            with gzip.open(backup_path, 'rb') as source, open(temp_path, 'wb') as target:
+                shutil.copyfileobj(source, target, CHUNK_SIZE)
+        except (OSError, EOFError) as e:
+            return f"архив поврежден: {e}"
+        result = integrity_check(temp_path)
+        return None if result == "ok" else f"integrity_check: {result}"
+    finally:
+        os.remove(temp_path)
+
+def restore_backup(backup_path: str, db_path: str) -> str:
+    """Восстановление базы из копии; текущая база сохраняется рядом. Бот должен быть остановлен."""
+    error = verify_backup(backup_path)
+    if error:
+        raise ValueError(f"Копия {backup_path} не прошла проверку: {error}")
+
+    target_dir = os.path.dirname(os.path.abspath(db_path))
+    fd, temp_path = tempfile.mkstemp(suffix=".db", dir=target_dir)
+    os.close(fd)
+    try:
+        with gzip.open(backup_path, 'rb') as source, open(temp_path, 'wb') as target:
+            shutil.copyfileobj(source, target, CHUNK_SIZE)
+            target.flush()
+            os.fsync(target.fileno())
+
+        previous_path = ""
+        if os.path.exists(db_path):
+            previous_path = f"{db_path}.before-restore-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+            os.replace(db_path, previous_path)
+        # Журналы WAL от прежней базы не должны примениться к восстановленной
+        for suffix in ("-wal", "-shm", "-journal"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        os.replace(temp_path, db_path)
+        return previous_path
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+class BackupManager:
+    """Онлайн-копии базы по расписанию с ротацией"""
+
+    def __init__(self, db_path: str, backup_dir: str = "backups", keep: int = 7, interval_hours: float = 24.0):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.keep = keep
+        self.interval_hours = interval_hours
+        self.last_backup: Optional[Dict] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def list_backups(self) -> List[str]:
+        """Копии от новых к старым"""
+        if not os.path.isdir(self.backup_dir):
+            return []
+        names = [
+            name for name in os.listdir(self.backup_dir)
+            if name.startswith(BACKUP_PREFIX) and name.endswith(BACKUP_SUFFIX)
+        ]
+        return [os.path.join(self.backup_dir, name) for name in sorted(names, reverse=True)]
+
+    async def create_backup(self) -> Dict:
+        """Создание копии: онлайн-копирование, проверка, сжатие, контрольная сумма, ротация"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            try:
+                info = await self._create_backup()
+            except Exception:
+                backups_total.inc(status="error")
+                raise
+            backups_total.inc(status="ok")
+            backup_duration.observe(info['duration'])
+            self.last_backup = info
+            logger.info(
+                f"Резервная копия {info['path']}: {info['size'] / 1024:.0f} КБ "
+                f"(база {info['db_size'] / 1024:.0f} КБ) за {info['duration']:.2f} с"
+            )
+            return info
+
+    async def _create_backup(self) -> Dict:
+        os.makedirs(self.backup_dir, exist_ok=True)
+        started = time.perf_counter()
+        now = datetime.now()
+        name = f"{BACKUP_PREFIX}{now.strftime('%Y%m%d-%H%M%S')}-{now.microsecond // 1000:03d}"
+        snapshot_path = os.path.join(self.backup_dir, name + ".db.tmp")
+        backup_path = os.path.join(self.backup_dir, name + BACKUP_SUFFIX)
+        loop = asyncio.get_running_loop()
+
+        try:
+            # Копирование идет в потоке aiosqlite порциями страниц; между порциями
+            # база свободна для записи, а цикл событий не блокируется вовсе
+            target = sqlite3.connect(snapshot_path, check_same_thread=False)
+            try:
+                async with aiosqlite.connect(self.db_path) as source:
+                    await source.backup(target, pages=BACKUP_PAGES_PER_STEP, sleep=BACKUP_STEP_SLEEP)
+            finally:
+                target.close()
+
+            check = await loop.run_in_executor(None, integrity_check, snapshot_path)
+            if check != "ok":
+                raise RuntimeError(f"Копия не прошла integrity_check: {check}")
+
+            db_size = os.path.getsize(snapshot_path)
+            checksum = await loop.run_in_executor(None, _compress_with_checksum, snapshot_path, backup_path)
+            with open(backup_path + CHECKSUM_SUFFIX, 'w', encoding='utf-8') as f:
+                f.write(f"{checksum}  {os.path.basename(backup_path)}\n")
+        finally:
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+
+        self.rotate()
+        return {
+            'path': backup_path,
+            'size': os.path.getsize(backup_path),
+            'db_size': db_size,
+            'checksum': checksum,
+            'duration': time.perf_counter() - started,
+            'time': datetime.now()
+        }
+
+    def rotate(self):
+        """Удаление копий сверх лимита"""
+        for path in self.list_backups()[self.keep:]:
+            for file_path in (path, path + CHECKSUM_SUFFIX):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            logger.info(f"Удалена старая резервная копия {path}")
+
+    def start(self):
+        """Запуск копирования по расписанию"""
+        if self._task is None and self.interval_hours > 0:
+            self._task = asyncio.create_task(self._schedule_loop())
+
+    async def stop(self):
+        """Остановка расписания (начатая копия дописывается)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._lock is not None:
+            async with self._lock:
+                pass
+
+    def _seconds_until_next(self) -> float:
+        interval = self.interval_hours * 3600
+        backups = self.list_backups()
+        if not backups:
+            return 0.0
+        age = time.time() - os.path.getmtime(backups[0])
+        return max(0.0, interval - age)
+
+    async def _schedule_loop(self):
+        while True:
+            await asyncio.sleep(self._seconds_until_next())
+            try:
+                await asyncio.shield(self.create_backup())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка резервного копирования: {e}")
+                # Оповещения тянут aiogram: импорт только в работающем боте, не в CLI восстановления
+                from alerts import alert_manager, error_signature
+                alert_manager.report(error_signature("backup", e), "Ошибка резервного копирования", str(e))
+                await asyncio.sleep(min(3600, self.interval_hours * 3600))
+
+def format_backup_info(info: Dict) -> str:
+    """Описание копии для админ-панели"""
+    return (
+        f"📁 {os.path.basename(info['path'])}\n"
+        f"💾 {info['size'] / 1024:.0f} КБ (база {info['db_size'] / 1024:.0f} КБ)\n"
+        f"⏱ {info['duration']:.2f} с\n"
+        f"🔐 sha256: {info['checksum'][:16]}…"
+    )
+
+def main():
+    """Командная строка: создание, список, проверка и восстановление копий"""
+    from config import Config
+
+    if len(sys.argv) < 2:
+        print("📋 Команды:")
+        print("  create            - Создать копию")
+        print("  list              - Список копий")
+        print("  verify FILE       - Проверить копию")
+        print("  restore FILE      - Восстановить базу из копии (бот должен быть остановлен)")
+        print("\n💡 Пример: python backup.py create")
+        return 1
+
+    config = Config()
+    if config.STORAGE_BACKEND != "sqlite":
+        print(f"❌ Резервные копии делаются только для SQLite, хранилище: {config.STORAGE_BACKEND}")
+        return 1
+    manager = BackupManager(config.DATABASE_PATH, config.BACKUP_DIR, config.BACKUP_KEEP, config.BACKUP_INTERVAL_HOURS)
+    command = sys.argv[1].lower()
+
+    if command == "create":
+        info = asyncio.run(manager.create_backup())
+        print("✅ Копия создана")
+        print(format_backup_info(info))
+        return 0
+
+    if command == "list":
+        for path in manager.list_backups():
+            print(f"{os.path.basename(path)}  {os.path.getsize(path) / 1024:.0f} КБ")
+        return 0
+
+    if command in ("verify", "restore") and len(sys.argv) >= 3:
+        path = sys.argv[2]
+        if command == "verify":
+            error = verify_backup(path)
+            print(f"❌ {error}" if error else "✅ Копия в порядке")
+            return 1 if error else 0
+        try:
+            previous = restore_backup(path, config.DATABASE_PATH)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return 1
+        print(f"✅ База восстановлена из {path}")
+        if previous:
+            print(f"📦 Прежняя база сохранена как {previous}")
+        return 0
+
+    print(f"❌ Неизвестная команда: {' '.join(sys.argv[1:])}")
+    return 1
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,631 @@
+#!/usr/bin/env python3
+"""
+Бенчмарки Phoenix PS Bot
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+def measure(func, iterations: int) -> float:
+    """Среднее время одного вызова в микросекундах"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+def bench_routing():
+    """Стоимость маршрутизации callback-запросов в зависимости от числа хендлеров"""
+    from magic_filter import F
+    from callbacks import CallbackCodec, CallbackRouter
+
+    print("\n🔀 Маршрутизация callback-запросов")
+    print("=" * 60)
+    print(f"{'Хендлеров':>10} | {'F.data.startswith, мкс':>22} | {'CallbackRouter, мкс':>20}")
+    print("-" * 60)
+
+    iterations = 20000
+    for handlers_count in (5, 20, 50, 100, 200):
+        # Цепочка фильтров: как aiogram перебирает хендлеры по порядку
+        filters = [F.data.startswith(f"action{i}_") for i in range(handlers_count)]
+        legacy_event = SimpleNamespace(data=f"action{handlers_count - 1}_12345")
+
+        def chain_lookup():
+            for flt in filters:
+                if flt.resolve(legacy_event):
+                    return flt
+            return None
+
+        # Единый роутер: префикс-символ и словарь обработчиков
+        codec = CallbackCodec()
+        router = CallbackRouter(lambda user_id: False, codec=codec)
+        actions = [codec.action(chr(0x100 + i), f"action{i}", int) for i in range(handlers_count)]
+        for action in actions:
+            router.handler(action)(lambda callback, value: None)
+        packed = actions[-1].pack(12345)
+
+        def router_lookup():
+            return router.resolve(packed)
+
+        chain_time = measure(chain_lookup, iterations)
+        router_time = measure(router_lookup, iterations)
+        print(f"{handlers_count:>10} | {chain_time:>22.2f} | {router_time:>20.2f}")
+
+    print("\n💡 Измерен худший случай: нужный хендлер зарегистрирован последним")
+    return True
+
+# Модули в порядке зависимостей: время импорта каждого замеряется в новом процессе
+STARTUP_MODULES = ("aiogram", "config", "database", "catalog", "keyboards", "handlers", "admin_handlers", "backup")
+
+def _import_time(module: str) -> float:
+    """Время холодного импорта модуля в отдельном интерпретаторе, мс"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return float(result.stdout.strip()) * 1000
+
+async def _time_to_first_update(workdir: str) -> dict:
+    """Запуск диспетчера с заглушкой Bot API и обработка первого /start"""
+    timings = {}
+    start = time.perf_counter()
+    from datetime import datetime
+    from aiogram import Bot, Dispatcher
+    from aiogram.client.session.base import BaseSession
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from aiogram.types import Chat, Message, Update, User
+
+    class StubSession(BaseSession):
+        """Сессия без сети: все запросы успешны"""
+
+        async def close(self):
+            pass
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+        async def make_request(self, bot, method, timeout=None):
+            return True
+
+    timings["импорт aiogram"] = time.perf_counter() - start
+
+    os.environ.setdefault("BOT_TOKEN", "123456:benchmark")
+    os.environ.setdefault("ADMIN_ID", "1")
+    from config import Config
+    from database import db, init_db
+    from catalog import catalog
+    from handlers import register_user_handlers
+    from admin_handlers import register_admin_handlers
+    timings["импорт модулей бота"] = time.perf_counter() - start
+    db.db_path = os.path.join(workdir, "benchmark.db")
+    catalog.snapshot_path = os.path.join(workdir, "catalog_snapshot.json")
+
+    config = Config()
+    bot = Bot(token=config.BOT_TOKEN, session=StubSession())
+    dp = Dispatcher(storage=MemoryStorage())
+    register_user_handlers(dp, config)
+    register_admin_handlers(dp, config)
+    timings["регистрация хендлеров"] = time.perf_counter() - start
+
+    await init_db()
+    catalog.load_snapshot()
+    timings["схема базы и снимок каталога"] = time.perf_counter() - start
+
+    update = Update(update_id=1, message=Message(
+        message_id=1, date=datetime.now(),
+        chat=Chat(id=1, type="private"),
+        from_user=User(id=1, is_bot=False, first_name="benchmark"),
+        text="/start"
+    ))
+    await dp.feed_update(bot, update)
+    timings["первый апдейт обработан"] = time.perf_counter() - start
+    return timings
+
+def bench_startup():
+    """Время импорта модулей и время до первого апдейта"""
+    print("\n🚀 Холодный импорт модулей (отдельный процесс на модуль)")
+    print("=" * 60)
+    print(f"{'Модуль':<20} | {'Импорт с зависимостями, мс':>28}")
+    print("-" * 60)
+    for module in STARTUP_MODULES:
+        try:
+            print(f"{module:<20} | {_import_time(module):>28.1f}")
+        except RuntimeError as e:
+            print(f"{module:<20} | ошибка: {e}")
+
+    print("\n⏱ Время до первого апдейта (заглушка Bot API, временная база)")
+    print("=" * 60)
+    print(f"{'Этап':<36} {'С начала, мс':>12}")
+    print("-" * 60)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        timings = asyncio.run(_time_to_first_update(tmpdir))
+    for name, elapsed in timings.items():
+        print(f"{name:<36} {elapsed * 1000:>12.1f}")
+
+    print("\n💡 Основную часть запуска занимает импорт aiogram; модули бота добавляют единицы мс")
+    return True
+
+# Поля времени различаются между запусками и не сравниваются
+_TIME_FIELDS = {"created_at", "order_time", "status_updated_at", "finished_at", "timestamp"}
+
+def _without_time(value):
+    if isinstance(value, dict):
+        return {key: _without_time(item) for key, item in value.items() if key not in _TIME_FIELDS}
+    if isinstance(value, (list, tuple)):
+        return [_without_time(item) for item in value]
+    return value
+
+async def _storage_scenario(backend) -> list:
+    """Одинаковый сценарий для всех хранилищ: список (шаг, результат) для сравнения"""
+    results = []
+
+    def step(name, value):
+        results.append((name, _without_time(value)))
+
+    step("get_categories", await backend.get_categories())
+    rent = await backend.add_category("🎮 Аренда приставок", "🎮 Аренда")
+    games = await backend.add_category("🕹 Игры", "🕹 Игры")
+    step("add_category", [rent, games, await backend.get_categories()])
+    step("update_category", [await backend.update_category(games, "🕹 Игры и подписки", "🕹 Игры"), await backend.update_category(999, "x", "x")])
+
+    # Имена с разным регистром и кириллицей проверяют одинаковый порядок сортировки
+    first = await backend.add_service("PS5 аренда", "Описание", "1000 ₽", rent)
+    second = await backend.add_service("Ps4 аренда", "Описание", "700 ₽", rent)
+    third = await backend.add_service("Игры", "Описание", "500 ₽", games)
+    step("add_service", [first, second, third])
+    step("get_services_by_category", await backend.get_services_by_category(rent))
+    step("delete_category с услугами", await backend.delete_category(games))
+    step("get_all_services", await backend.get_all_services())
+    step("set_service_image", [await backend.set_service_image(first, "file1"), await backend.set_service_image(999, "x")])
+    step("get_service_by_id", [await backend.get_service_by_id(first), await backend.get_service_by_id(999)])
+    step("update_service", [
+        await backend.update_service(second, "Ps4 аренда", "Новое описание", "800 ₽", games),
+        await backend.update_service(second, "Устарело", "x", "x", rent, expected_version=1),
+        await backend.update_service(second, "PS4 аренда", "Новое описание", "800 ₽", rent, expected_version=2),
+        await backend.update_service(999, "x", "x", "x", rent)
+    ])
+    step("get_service_by_id после изменения", await backend.get_service_by_id(second))
+    step("update_service_field", [
+        await backend.update_service_field(second, "price", "900 ₽", expected_version=3),
+        await backend.update_service_field(second, "name", "Устарело", expected_version=3),
+        await backend.update_service_field(second, "category_id", games),
+        await backend.update_service_field(999, "name", "x")
+    ])
+    step("get_service_by_id после изменения поля", await backend.get_service_by_id(second))
+    step("delete_service", [await backend.delete_service(third), await backend.delete_service(third)])
+    step("get_all_services после удаления", await backend.get_all_services())
+    step("delete_category", [await backend.delete_category(games), await backend.get_categories()])
+
+    await backend.save_media_file_id("hash1", "file1")
+    await backend.save_media_file_id("hash1", "file2")
+    step("media_file_id", [await backend.get_media_file_id("hash1"), await backend.get_media_file_id("hash2")])
+
+    orders = [await backend.add_order(100 + i % 2, f"user{i % 2}", first, "PS5 аренда") for i in range(7)]
+    step("add_order", orders)
+    page = await backend.get_user_orders(100, limit=2)
+    step("get_user_orders", page)
+    step("get_user_orders: следующая страница", await backend.get_user_orders(100, before_id=page[-1]["id"], limit=2))
+    step("update_order_status", [
+        await backend.update_order_status(orders[0], "done"),
+        await backend.update_order_status(999, "done"),
+        await backend.update_order_status(orders[0], "cancelled", expected_status="new"),
+        await backend.update_order_status(orders[0], "cancelled", expected_status="done")
+    ])
+    step("get_order", [await backend.get_order(orders[0]), await backend.get_order(999)])
+    step("count_orders", await backend.count_orders())
+
+    giveaway_id = await backend.create_giveaway("Розыгрыш")
+    step("get_active_giveaway", await backend.get_active_giveaway())
+    added = await backend.add_giveaway_participants([(giveaway_id, user_id, f"u{user_id}") for user_id in (5, 3, 5, 9)])
+    added_again = await backend.add_giveaway_participants([(giveaway_id, 3, "u3"), (giveaway_id, 7, "u7")])
+    step("add_giveaway_participants", [added, added_again])
+    step("is_giveaway_participant", [await backend.is_giveaway_participant(giveaway_id, 9), await backend.is_giveaway_participant(giveaway_id, 1)])
+    step("count_giveaway_participants", await backend.count_giveaway_participants(giveaway_id))
+    step("iter_giveaway_participants", [row async for row in backend.iter_giveaway_participants(giveaway_id, batch_size=2)])
+    await backend.finish_giveaway(giveaway_id, "seed", 4, [{"user_id": 9, "username": "u9"}])
+    step("finish_giveaway", [await backend.get_giveaway(giveaway_id), await backend.get_active_giveaway()])
+
+    later = await backend.add_scheduled_post("@channel", "Пост", None, "2030-01-02 10:00:00")
+    earlier = await backend.add_scheduled_post("@channel", None, "photo1", "2030-01-01 10:00:00")
+    cancelled = await backend.add_scheduled_post("@channel", "Отмена", None, "2030-01-01 09:00:00")
+    step("add_scheduled_post", [later, earlier, cancelled])
+    step("update_scheduled_post", [
+        await backend.update_scheduled_post(later, "Пост 2", None, "2029-12-31 10:00:00"),
+        await backend.update_scheduled_post(999, "x", None, "2030-01-01 10:00:00")
+    ])
+    step("cancel_scheduled_post", [await backend.cancel_scheduled_post(cancelled), await backend.cancel_scheduled_post(cancelled)])
+    step("finish_scheduled_post", [
+        await backend.finish_scheduled_post(earlier, "failed", 2, "ошибка"),
+        await backend.finish_scheduled_post(cancelled, "sent", 1)
+    ])
+    step("get_scheduled_post", [await backend.get_scheduled_post(earlier), await backend.get_scheduled_post(999)])
+    claimed = await backend.add_scheduled_post("@channel", "Захват", None, "2029-12-30 10:00:00")
+    step("claim_scheduled_post", [
+        await backend.claim_scheduled_post(claimed, "2029-12-30 09:00:00"),
+        await backend.claim_scheduled_post(claimed, "2029-12-30 10:00:00"),
+        await backend.claim_scheduled_post(claimed, "2029-12-30 10:00:00"),
+        await backend.cancel_scheduled_post(claimed),
+        await backend.release_scheduled_post(claimed),
+        await backend.release_scheduled_post(claimed)
+    ])
+    step("get_pending_posts", await backend.get_pending_posts())
+
+    # Уникальные объединяются с сохраненными: здесь склейкой байтов
+    merge = lambda stored, new: (stored or b"") + new
+    await backend.upsert_service_stats([("2024-01-01", first, "view", 2, b"a"), ("2024-01-02", first, "view", 1, b"b")], merge)
+    await backend.upsert_service_stats([("2024-01-01", first, "view", 3, b"c")], merge)
+    step("get_service_stats", sorted(await backend.get_service_stats("2024-01-01")))
+
+    # Журнал действий: удаленная услуга и неизвестное действие расшифровываются пустыми
+    await backend.log_user_action(100, "user0", "start_command")
+    await backend.log_user_action(100, "user0", "category_viewed", rent)
+    await backend.log_user_action(101, "user1", "service_details_viewed", first)
+    await backend.log_user_action(100, "user0", "order_created", first)
+    await backend.log_user_action(101, "user1", "service_viewed", third)
+    await backend.log_user_action(101, "user1", "deprecated_action")
+    step("get_user_actions", [await backend.get_user_actions(), await backend.get_user_actions(2, user_id=100)])
+    await backend.probe_read()
+    await backend.probe_write()
+    return results
+
+async def _storage_throughput(backend, operations: int) -> float:
+    """Смешанная нагрузка (чтение каталога, заказы, история, участники): операций в секунду"""
+    category_id = (await backend.get_categories())[0]["id"]
+    service_id = await backend.add_service("Услуга", "Описание", "100 ₽", category_id)
+    giveaway_id = await backend.create_giveaway("Нагрузка")
+    start = time.perf_counter()
+    for i in range(operations // 4):
+        await backend.get_service_by_id(service_id)
+        await backend.add_order(i % 50, "user", service_id, "Услуга")
+        await backend.get_user_orders(i % 50)
+        await backend.add_giveaway_participants([(giveaway_id, i, "user")])
+    return operations // 4 * 4 / (time.perf_counter() - start)
+
+def _storage_backends(workdir: str) -> list:
+    """Хранилища для сравнения: память, SQLite и PostgreSQL (если задан DATABASE_URL и установлен asyncpg)"""
+    from database import SQLiteBackend
+    from database_memory import MemoryBackend
+
+    backends = [("memory", MemoryBackend), ("sqlite", lambda: SQLiteBackend(os.path.join(workdir, f"storage-{time.monotonic_ns()}.db")))]
+    dsn = os.getenv("DATABASE_URL", "")
+    if dsn:
+        from database_postgres import PostgresBackend, asyncpg
+        if asyncpg is None:
+            print("⚠️ PostgreSQL пропущен: не установлен asyncpg")
+        else:
+            backends.append(("postgres", lambda: PostgresBackend(dsn)))
+    else:
+        print("ℹ️ PostgreSQL пропущен: задайте DATABASE_URL пустой тестовой базы (таблицы будут очищены)")
+    return backends
+
+async def _reset_postgres(backend):
+    """Пустые таблицы (и категории по умолчанию) перед сценарием, чтобы id совпадали с другими хранилищами"""
+    pool = await backend._get_pool()
+    await pool.execute(
+        "TRUNCATE categories, services, orders, user_actions, usernames, media_files, giveaways, giveaway_participants, "
+        "service_stats, scheduled_posts, health_probe RESTART IDENTITY"
+    )
+    await backend.init_db()
+
+async def _run_storage(factory, operations: int):
+    backend = factory()
+    try:
+        await backend.init_db()
+        if backend.name == "postgres":
+            await _reset_postgres(backend)
+        results = await _storage_scenario(backend)
+        if backend.name == "postgres":
+            await _reset_postgres(backend)
+        return results, await _storage_throughput(backend, operations)
+    finally:
+        await backend.close()
+
+def bench_storage():
+    """Одинаковость результатов и пропускная способность хранилищ данных"""
+    from config import load_env
+    load_env()
+    operations = 2000
+
+    print("\n🗄 Хранилища данных: один сценарий и смешанная нагрузка")
+    print("=" * 60)
+    results = {}
+    throughput = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, factory in _storage_backends(tmpdir):
+            try:
+                results[name], throughput[name] = asyncio.run(_run_storage(factory, operations))
+            except Exception as e:
+                print(f"❌ {name}: {type(e).__name__}: {e}")
+
+    if "memory" not in results:
+        return False
+    reference = results["memory"]
+    ok = True
+    print(f"\n{'Хранилище':<12} | {'Шагов совпало':>14} | {'Операций/с':>12}")
+    print("-" * 60)
+    for name, steps in results.items():
+        mismatches = [
+            (expected[0], expected[1], actual[1])
+            for expected, actual in zip(reference, steps) if expected != actual
+        ]
+        print(f"{name:<12} | {len(reference) - len(mismatches):>6} из {len(reference):<5} | {throughput[name]:>12.0f}")
+        for step_name, expected, actual in mismatches:
+            ok = False
+            print(f"   ❌ {step_name}:\n      memory: {expected}\n      {name}: {actual}")
+
+    print(f"\n💡 Нагрузка: {operations} операций поочередно (чтение услуги, заказ, история, участник розыгрыша)")
+    return ok
+
+# Журнал действий до перехода на коды: имя, название действия и описание объекта текстом
+_LEGACY_USER_ACTIONS = """
+    CREATE TABLE user_actions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        action TEXT NOT NULL,
+        details TEXT,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+def _legacy_actions(rows: int, category: str, services: list) -> list:
+    """Строки журнала старого формата с распределением действий, как в handlers.py"""
+    result = []
+    for i in range(rows):
+        user_id = 1000 + i % 2000
+        name, price = services[i % len(services)]
+        action, details = [
+            ("start_command", ""),
+            ("main_menu_accessed", ""),
+            ("category_viewed", category),
+            ("service_viewed", name),
+            ("service_details_viewed", name),
+            ("order_created", f"Service: {name}, Price: {price}")
+        ][i % 6]
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(1_700_000_000 + i * 7))
+        result.append((user_id, f"user_{user_id}", action, details, timestamp))
+    return result
+
+def _vacuumed_size(path: str) -> int:
+    import sqlite3
+    with sqlite3.connect(path) as conn:
+        conn.execute("VACUUM")
+    return os.path.getsize(path)
+
+async def _legacy_insert_rate(path: str, count: int) -> float:
+    """Запись старого формата тем же способом, что был в log_user_action"""
+    import aiosqlite
+    start = time.perf_counter()
+    for i in range(count):
+        async with aiosqlite.connect(path) as conn:
+            await conn.execute(
+                "INSERT INTO user_actions (user_id, username, action, details) VALUES (?, ?, ?, ?)",
+                (1000 + i % 50, f"user_{1000 + i % 50}", "service_details_viewed", "🎮 PS5 + 2 геймпада")
+            )
+            await conn.commit()
+    return count / (time.perf_counter() - start)
+
+async def _compact_insert_rate(backend, service_id: int, count: int) -> float:
+    """Постановка в очередь и фоновая запись пачками в базу аналитики"""
+    start = time.perf_counter()
+    for i in range(count):
+        await backend.log_user_action(1000 + i % 50, f"user_{1000 + i % 50}", "service_details_viewed", service_id)
+    await backend.analytics.flush()
+    return count / (time.perf_counter() - start)
+
+async def _order_delay_during_report(backend, service_id: int, report) -> float:
+    """Наибольшая задержка записи заказа, пока выполняется отчет по журналу действий"""
+    task = asyncio.ensure_future(report())
+    delays = []
+    while not task.done():
+        start = time.perf_counter()
+        await backend.add_order(1, "user", service_id, "Услуга")
+        delays.append(time.perf_counter() - start)
+    await task
+    return max(delays)
+
+async def _legacy_report(path: str):
+    import aiosqlite
+    async with aiosqlite.connect(path) as conn:
+        cursor = await conn.execute(
+            "SELECT action, details, COUNT(*), COUNT(DISTINCT username) FROM user_actions GROUP BY action, details"
+        )
+        await cursor.fetchall()
+
+async def _analytics_report(backend):
+    async with backend.analytics._connection() as conn:
+        await backend.analytics._refresh_catalog(conn)
+        cursor = await conn.execute(
+            "SELECT action, details, COUNT(*), COUNT(DISTINCT username) FROM user_actions_log GROUP BY action, details"
+        )
+        await cursor.fetchall()
+
+async def _run_actions(workdir: str, rows: int, inserts: int) -> dict:
+    import sqlite3
+    from database import SQLiteBackend
+
+    main_path = os.path.join(workdir, "legacy.db")
+    backend = SQLiteBackend(main_path)
+    await backend.init_db()
+    category_id = (await backend.get_categories())[0]["id"]
+    category = (await backend.get_categories())[0]["name"]
+    services = [(f"🎮 PS5 + {n} геймпада", f"{1000 + n * 100} ₽") for n in range(20)]
+    service_ids = [await backend.add_service(name, "Описание", price, category_id) for name, price in services]
+    # Журнал прежнего вида в основной базе, как до выделения базы аналитики
+    with sqlite3.connect(main_path) as conn:
+        conn.execute(_LEGACY_USER_ACTIONS)
+        conn.executemany(
+            "INSERT INTO user_actions (user_id, username, action, details, timestamp) VALUES (?, ?, ?, ?, ?)",
+            _legacy_actions(rows, category, services)
+        )
+    result = {"legacy_size": _vacuumed_size(main_path)}
+    result["legacy_rate"] = await _legacy_insert_rate(main_path, inserts)
+    result["legacy_delay"] = await _order_delay_during_report(backend, service_ids[0], lambda: _legacy_report(main_path))
+
+    # Миграция выполняется в init_db при первом запуске новой версии
+    with sqlite3.connect(main_path) as conn:
+        conn.execute("DELETE FROM user_actions WHERE id > ?", (rows,))
+    start = time.perf_counter()
+    await backend.init_db()
+    result["migration"] = time.perf_counter() - start
+    result["main_size"] = _vacuumed_size(main_path)
+    result["analytics_size"] = _vacuumed_size(backend.analytics.path)
+    with sqlite3.connect(backend.analytics.path) as conn:
+        result["unresolved"] = conn.execute(
+            "SELECT COUNT(*) FROM user_actions WHERE action >= 3 AND target_id IS NULL"
+        ).fetchone()[0]
+    try:
+        result["compact_rate"] = await _compact_insert_rate(backend, service_ids[0], inserts)
+        result["compact_delay"] = await _order_delay_during_report(backend, service_ids[0], lambda: _analytics_report(backend))
+        result["sample"] = (await backend.get_user_actions(1, user_id=1000 + (rows - 1) % 2000))[0]
+    finally:
+        await backend.close()
+    return result
+
+def bench_actions():
+    """Журнал действий: размер, скорость записи и задержка заказов во время отчета до и после выделения"""
+    rows = 200_000
+    inserts = 500
+
+    print("\n📒 Журнал действий: текст в основной базе и коды в базе аналитики")
+    print("=" * 78)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        result = asyncio.run(_run_actions(tmpdir, rows, inserts))
+
+    def mb(size: int) -> str:
+        return f"{size / 1024 / 1024:.2f}"
+
+    print(f"{'Формат':<10} | {'Основная, МБ':>12} | {'Аналитика, МБ':>13} | {'Записей/с':>10} | {'Заказ при отчете':>16}")
+    print("-" * 78)
+    print(f"{'текст':<10} | {mb(result['legacy_size']):>12} | {'—':>13} | {result['legacy_rate']:>10.0f} | "
+          f"{result['legacy_delay'] * 1000:>13.1f} мс")
+    print(f"{'коды':<10} | {mb(result['main_size']):>12} | {mb(result['analytics_size']):>13} | {result['compact_rate']:>10.0f} | "
+          f"{result['compact_delay'] * 1000:>13.1f} мс")
+    print(f"\n🔁 Миграция {rows} записей: {result['migration']:.2f} с, объект не найден: {result['unresolved']}")
+    print(f"📄 Читаемый вид (user_actions_log): {result['sample']}")
+    print(f"\n💡 Размер после VACUUM; запись - {inserts} вызовов log_user_action (коды - очередь и фоновая запись пачками);")
+    print("   заказ при отчете - наибольшая задержка add_order, пока идет группировка всего журнала")
+    return result["unresolved"] == 0
+
+async def _outbound_burst(prioritized: bool) -> dict:
+    """Всплеск отправок разных классов через OutboundScheduler с заглушкой вместо Bot API"""
+    from aiogram.methods import EditMessageText, SendMessage
+    from outbound import OutboundScheduler, SEND_CLASSES, INTERACTIVE, ORDER, ADMIN, BULK, send_class
+
+    scheduler = OutboundScheduler(global_rate=30, chat_rate=1, group_rate=20 / 60, chat_burst=3)
+    bot = SimpleNamespace(id=1)
+    sent = []
+
+    async def make_request(bot, method):
+        sent.append((time.monotonic(), method.chat_id))
+        await asyncio.sleep(0.01)
+        return True
+
+    waits = {name: [] for name in SEND_CLASSES}
+
+    async def send(name: str, method, delay: float = 0.0):
+        await asyncio.sleep(delay)
+        start = time.monotonic()
+        # Без приоритетов все запросы идут одной очередью в порядке поступления
+        with send_class(name if prioritized else BULK):
+            result = await scheduler(make_request, bot, method)
+        waits[name].append(time.monotonic() - start)
+        return result
+
+    channel = -1001234567890
+    tasks = []
+    # Рассылка по 90 пользователям, поставленная раньше всех
+    tasks += [send(BULK, SendMessage(chat_id=100_000 + n, text="Новости")) for n in range(90)]
+    # Уведомления о заказах и 10 быстрых смен статуса одной заявки в канале
+    tasks += [send(ORDER, SendMessage(chat_id=200_000 + n, text="Заказ"), 0.05) for n in range(20)]
+    tasks += [send(ORDER, EditMessageText(chat_id=channel, message_id=7, text=f"Статус {n}"), 0.05 + n * 0.02) for n in range(10)]
+    tasks += [send(ADMIN, SendMessage(chat_id=300_000, text="Дайджест"), 0.1)]
+    # Пользователи нажимают кнопки, пока рассылка в очереди
+    tasks += [send(INTERACTIVE, SendMessage(chat_id=400_000 + n % 30, text="Меню"), 0.2 + n * 0.05) for n in range(60)]
+    results = await asyncio.gather(*tasks)
+    scheduler._task.cancel()
+
+    def percentile(values, q):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+    # Проверка лимитов: в любом окне не больше запаса корзины плюс скорость на длину окна
+    times = [moment for moment, _ in sent]
+    global_ok = all(
+        sum(1 for moment in times if start <= moment <= start + 1.0) <= 30 + 30 * 1.0 + 1
+        for start in times
+    )
+    by_chat = {}
+    for moment, chat_id in sent:
+        by_chat.setdefault(chat_id, []).append(moment)
+    chat_ok = True
+    for chat_id, moments in by_chat.items():
+        rate = 1.0 if chat_id > 0 else 20 / 60
+        for start in moments:
+            chat_ok &= sum(1 for moment in moments if start <= moment <= start + 3.0) <= 3 + rate * 3.0 + 1
+    return {
+        "waits": {name: (percentile(values, 0.5), percentile(values, 0.95)) for name, values in waits.items()},
+        "requested": len(tasks),
+        "sent": len(sent),
+        "edits": sum(1 for _, chat_id in sent if chat_id == channel),
+        "answered": all(result is True for result in results),
+        "limits": global_ok and chat_ok
+    }
+
+def bench_outbound():
+    """Очередь исходящих: ожидание по классам при всплеске, объединение изменений и лимиты"""
+    from outbound import SEND_CLASSES
+
+    print("\n📤 Очередь исходящих: рассылка 90 сообщений, заказы, админ и 60 ответов пользователям")
+    print("=" * 78)
+    fifo = asyncio.run(_outbound_burst(prioritized=False))
+    prioritized = asyncio.run(_outbound_burst(prioritized=True))
+
+    print(f"{'Класс':<12} | {'FIFO p50, мс':>12} | {'FIFO p95, мс':>12} | {'Классы p50, мс':>14} | {'Классы p95, мс':>14}")
+    print("-" * 78)
+    for name in SEND_CLASSES:
+        before, after = fifo["waits"][name], prioritized["waits"][name]
+        print(f"{name:<12} | {before[0] * 1000:>12.0f} | {before[1] * 1000:>12.0f} | "
+              f"{after[0] * 1000:>14.0f} | {after[1] * 1000:>14.0f}")
+    print(f"\n✏️ Запросов {prioritized['requested']}, отправлено {prioritized['sent']}; "
+          f"из 10 изменений заявки отправлено {prioritized['edits']}")
+    print(f"{'✅' if prioritized['limits'] and fifo['limits'] else '❌'} Общий лимит 30/с и лимиты чатов соблюдены; "
+          f"{'✅' if prioritized['answered'] else '❌'} все вызовы получили результат")
+    return prioritized["limits"] and fifo["limits"] and prioritized["answered"] and prioritized["edits"] < 10
+
+BENCHMARKS = {
+    "routing": bench_routing,
+    "startup": bench_startup,
+    "storage": bench_storage,
+    "actions": bench_actions,
+    "outbound": bench_outbound,
+}
+
+def main():
+    """Главная функция"""
+    print("⏱ Бенчмарки Phoenix PS Bot")
+    print("=" * 50)
+
+    if len(sys.argv) < 2:
+        print("📋 Доступные бенчмарки:")
+        for name, func in BENCHMARKS.items():
+            print(f"  {name:<10} - {func.__doc__}")
+        print("\n💡 Пример: python benchmark.py routing")
+        return 1
+
+    name = sys.argv[1].lower()
+    if name not in BENCHMARKS:
+        print(f"❌ Неизвестный бенчмарк: {name}")
+        return 1
+
+    return 0 if BENCHMARKS[name]() else 1
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,65 @@
+import os
+from contextvars import ContextVar
+from typing import Any, Callable, Dict
+
+# Имя бота, чей апдейт или фоновая задача сейчас выполняется. Задачи asyncio
+# копируют контекст при создании, поэтому все запущенное из задачи бота видит его объекты.
+# Пустое имя - единственный бот процесса (запуск без BOT_CONFIGS)
+current_bot: ContextVar[str] = ContextVar("current_bot", default="")
+
+def bot_file(path: str, name: str) -> str:
+    """Путь к файлу или каталогу бота: имя бота добавляется перед расширением ("settings.shop.json")"""
+    if not name:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{name}{ext}"
+
+class PerBot:
+    """Глобальный объект с отдельным экземпляром на каждого бота процесса.
+    Обращения передаются экземпляру текущего бота; экземпляр создается при первом обращении"""
+
+    __slots__ = ("_factory", "_instances")
+
+    def __init__(self, factory: Callable[[str], Any]):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instances", {})
+
+    def for_bot(self, name: str) -> Any:
+        """Экземпляр конкретного бота (для кода вне его контекста: потоки, общие мониторы)"""
+        instances: Dict[str, Any] = self._instances
+        if name not in instances:
+            instances[name] = self._factory(name)
+        return instances[name]
+
+    def _current(self) -> Any:
+        return self.for_bot(current_bot.get())
+
+    def __getattr__(self, name: str):
+        return getattr(self._current(), name)
+
+    def __setattr__(self, name: str, value):
+        setattr(self._current(), name, value)
+
+    def __len__(self) -> int:
+        return len(self._current())
+
+    def __bool__(self) -> bool:
+        return bool(self._current())
+
+    def __iter__(self):
+        return iter(self._current())
+
+    def __contains__(self, key) -> bool:
+        return key in self._current()
+
+    def __getitem__(self, key):
+        return self._current()[key]
+
+    def __setitem__(self, key, value):
+        self._current()[key] = value
+
+    def __delitem__(self, key):
+        del self._current()[key]
+
+    def __repr__(self) -> str:
+        return f"PerBot({self._current()!r})"
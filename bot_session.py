@@ -0,0 +1,111 @@
+import logging
+import time
+from typing import Dict, Optional
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError
+
+from api_retry import CircuitBreaker, RetryMiddleware
+from metrics import registry
+from outbound import OutboundScheduler
+
+logger = logging.getLogger(__name__)
+
+# Метрики исходящих запросов к Bot API
+api_requests = registry.counter("telegram_api_requests_total", "Запросы к Bot API по методам и результату")
+api_latency = registry.histogram("telegram_api_request_seconds", "Время выполнения запросов к Bot API")
+api_in_flight = registry.gauge("telegram_api_in_flight", "Запросы к Bot API, ожидающие ответа")
+
+class TunedAiohttpSession(AiohttpSession):
+    """Сессия aiohttp с настраиваемым пулом соединений, таймаутами и метриками"""
+
+    def __init__(
+        self,
+        pool_limit: int = 100,
+        pool_limit_per_host: int = 0,
+        keepalive_timeout: float = 30.0,
+        dns_cache_ttl: int = 3600,
+        timeout: float = 60.0,
+        method_timeouts: Optional[Dict[str, float]] = None,
+        api_url: Optional[str] = None,
+        api_is_local: bool = False,
+        **kwargs
+    ):
+        api = TelegramAPIServer.from_base(api_url, is_local=api_is_local) if api_url else PRODUCTION
+        super().__init__(limit=pool_limit, api=api, timeout=timeout, **kwargs)
+
+        self._connector_init.update({
+            "limit_per_host": pool_limit_per_host,
+            "keepalive_timeout": keepalive_timeout,
+            "ttl_dns_cache": dns_cache_ttl
+        })
+
+        self.method_timeouts = method_timeouts or {}
+
+    async def make_request(self, bot, method, timeout: Optional[int] = None):
+        api_method = method.__api_method__
+        if timeout is None:
+            timeout = self.method_timeouts.get(api_method)
+
+        api_in_flight.inc(method=api_method)
+        started = time.perf_counter()
+        status = "ok"
+        try:
+            return await super().make_request(bot, method, timeout=timeout)
+        except TelegramNetworkError:
+            status = "network_error"
+            raise
+        except TelegramAPIError as e:
+            status = type(e).__name__
+            raise
+        finally:
+            api_in_flight.dec(method=api_method)
+            api_latency.observe(time.perf_counter() - started, method=api_method)
+            api_requests.inc(method=api_method, status=status)
+
+def create_session(config) -> TunedAiohttpSession:
+    """Создание сессии бота по настройкам из Config"""
+    session = TunedAiohttpSession(
+        pool_limit=config.HTTP_POOL_LIMIT,
+        pool_limit_per_host=config.HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=config.HTTP_KEEPALIVE_TIMEOUT,
+        dns_cache_ttl=config.HTTP_DNS_CACHE_TTL,
+        timeout=config.HTTP_TIMEOUT,
+        method_timeouts=config.HTTP_METHOD_TIMEOUTS,
+        api_url=config.BOT_API_URL or None,
+        api_is_local=config.BOT_API_LOCAL
+    )
+    # Повторы и предохранитель оборачивают каждую попытку, поэтому метрики выше видят все попытки
+    session.breaker = CircuitBreaker(
+        failure_threshold=config.API_BREAKER_THRESHOLD,
+        cooldown=config.API_BREAKER_COOLDOWN
+    )
+    session.middleware(RetryMiddleware(
+        session.breaker,
+        attempts=config.API_RETRY_ATTEMPTS,
+        max_retry_after=config.API_MAX_RETRY_AFTER
+    ))
+    # Очередь исходящих внутри повторов: каждая попытка получает токены лимитов заново
+    session.outbound = OutboundScheduler.from_config(config)
+    session.middleware(session.outbound)
+    if config.BOT_API_URL:
+        logger.info(f"Bot API: {config.BOT_API_URL}{' (локальный режим)' if config.BOT_API_LOCAL else ''}")
+    return session
+
+def format_api_stats() -> str:
+    """Сводка по запросам к Bot API для админ-панели"""
+    lines = []
+    for key, stats in sorted(api_latency.all_stats().items()):
+        labels = dict(key)
+        method = labels.get("method", "?")
+        errors = sum(
+            value for error_key, value in api_requests.values().items()
+            if dict(error_key).get("method") == method and dict(error_key).get("status") != "ok"
+        )
+        lines.append(
+            f"• {method}: {stats['count']} шт., ср. {stats['avg'] * 1000:.0f} мс, "
+            f"p95 {stats['p95'] * 1000:.0f} мс, макс. {stats['max'] * 1000:.0f} мс, "
+            f"ошибок {int(errors)}, в полете {int(api_in_flight.value(method=method))}"
+        )
+    return "\n".join(lines) if lines else "Запросов пока не было"
@@ -0,0 +1,92 @@
+import time
+from typing import Any, Dict, Hashable, Optional, Set
+
+# Маркер отсутствующего значения (None может быть закэширован)
+MISSING = object()
+
+class TTLCache:
+    """Кэш с ограниченным временем жизни записей и групповой инвалидацией"""
+
+    def __init__(self, ttl: float, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        # ключ -> (момент истечения, значение, группа)
+        self._data: Dict[Hashable, tuple] = {}
+        self._groups: Dict[Hashable, Set[Hashable]] = {}
+        # Поколения групп: меняются при сбросе группы, чтобы не сохранить значение,
+        # прочитанное из базы до сброса. Эпоха растет, когда поколения забываются целиком
+        self._generations: Dict[Hashable, int] = {}
+        self._invalidations = 0
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Значение по ключу или default, если записи нет или она устарела"""
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if entry[0] < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry[1]
+
+    def generation(self, group: Hashable) -> tuple:
+        """Поколение группы: берется до чтения из базы и передается в set"""
+        return (self._epoch, self._generations.get(group, 0))
+
+    def set(self, key: Hashable, value: Any, group: Optional[Hashable] = None, generation: Optional[tuple] = None):
+        """Сохранение значения; group позволяет сбросить связанные записи разом.
+        С generation значение не сохраняется, если группу сбросили после чтения"""
+        if generation is not None and generation != self.generation(group):
+            return
+        if key in self._data:
+            self._remove(key)
+        elif len(self._data) >= self.max_size:
+            # Вытесняем самую старую запись
+            self._remove(next(iter(self._data)))
+
+        self._data[key] = (time.monotonic() + self.ttl, value, group)
+        if group is not None:
+            self._groups.setdefault(group, set()).add(key)
+
+    def invalidate(self, key: Hashable):
+        """Удаление одной записи"""
+        if key in self._data:
+            self._remove(key)
+
+    def invalidate_group(self, group: Hashable):
+        """Удаление всех записей группы"""
+        for key in self._groups.pop(group, set()):
+            self._data.pop(key, None)
+        if len(self._generations) >= self.max_size:
+            self._forget_generations()
+        self._invalidations += 1
+        self._generations[group] = self._invalidations
+
+    def clear(self):
+        """Полная очистка кэша"""
+        self._data.clear()
+        self._groups.clear()
+        self._forget_generations()
+
+    def _forget_generations(self):
+        # Новая эпоха: все поколения, взятые до этого, считаются устаревшими
+        self._generations.clear()
+        self._epoch += 1
+
+    def _remove(self, key: Hashable):
+        entry = self._data.pop(key)
+        group = entry[2]
+        if group is not None:
+            keys = self._groups.get(group)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[group]
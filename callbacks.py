@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from aiogram.exceptions import TelegramAPIError
+from aiogram.filters import Filter
+from aiogram.types import CallbackQuery, Message
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Разделитель полей в callback_data и алфавит для целых чисел
+SEPARATOR = ":"
+BASE36_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+# Ограничение Telegram на размер callback_data
+MAX_CALLBACK_DATA_BYTES = 64
+
+def encode_int(value: int) -> str:
+    """Кодирование целого числа в base36"""
+    if value == 0:
+        return "0"
+    sign = "-" if value < 0 else ""
+    value = abs(value)
+    digits = []
+    while value:
+        value, rest = divmod(value, 36)
+        digits.append(BASE36_ALPHABET[rest])
+    return sign + "".join(reversed(digits))
+
+class CallbackAction:
+    """Тип callback-данных: префикс, типы полей и права доступа"""
+
+    def __init__(
+        self,
+        prefix: str,
+        name: str,
+        fields: Tuple[type, ...] = (),
+        admin_only: bool = False,
+        legacy: Tuple[str, ...] = (),
+        answers: bool = False
+    ):
+        self.prefix = prefix
+        self.name = name
+        self.fields = fields
+        self.admin_only = admin_only
+        self.legacy = legacy
+        # Обработчик сам отвечает на callback (текст или всплывающее окно), иначе ответ отправляется сразу
+        self.answers = answers
+
+    def pack(self, *values: Any) -> str:
+        """Упаковка значений в callback_data"""
+        if len(values) != len(self.fields):
+            raise ValueError(f"{self.name}: ожидается {len(self.fields)} полей, передано {len(values)}")
+
+        parts = [self.prefix]
+        for field_type, value in zip(self.fields, values):
+            if field_type is int:
+                parts.append(encode_int(int(value)))
+            else:
+                value = str(value)
+                if SEPARATOR in value:
+                    raise ValueError(f"{self.name}: значение '{value}' содержит '{SEPARATOR}'")
+                parts.append(value)
+
+        data = SEPARATOR.join(parts)
+        if len(data.encode("utf-8")) > MAX_CALLBACK_DATA_BYTES:
+            raise ValueError(f"{self.name}: callback_data длиннее {MAX_CALLBACK_DATA_BYTES} байт")
+        return data
+
+    def unpack(self, raw_values: list, base: int = 36) -> Optional[tuple]:
+        """Разбор строковых значений полей по схеме действия"""
+        if len(raw_values) != len(self.fields):
+            return None
+        try:
+            return tuple(
+                int(raw, base) if field_type is int else raw
+                for field_type, raw in zip(self.fields, raw_values)
+            )
+        except ValueError:
+            return None
+
+    def __repr__(self) -> str:
+        return f"CallbackAction({self.prefix!r}, {self.name!r})"
+
+class CallbackCodec:
+    """Реестр callback-действий и разбор callback_data за O(1)"""
+
+    def __init__(self):
+        self.actions: Dict[str, CallbackAction] = {}
+        # Старый формат ("main_menu", "category_components") для кнопок,
+        # которые уже отправлены пользователям
+        self._legacy_static: Dict[str, CallbackAction] = {}
+        self._legacy_prefixed: Dict[str, CallbackAction] = {}
+
+    def action(
+        self, prefix: str, name: str, *fields: type,
+        admin_only: bool = False, legacy: Tuple[str, ...] = (), answers: bool = False
+    ) -> CallbackAction:
+        """Регистрация нового типа действия"""
+        if len(prefix) != 1 or prefix == SEPARATOR:
+            raise ValueError(f"Префикс действия должен быть одним символом: {prefix!r}")
+        if prefix in self.actions:
+            raise ValueError(f"Префикс {prefix!r} уже занят действием {self.actions[prefix].name}")
+
+        action = CallbackAction(prefix, name, fields, admin_only, legacy, answers)
+        self.actions[prefix] = action
+        for legacy_name in legacy:
+            if fields:
+                self._legacy_prefixed[legacy_name] = action
+            else:
+                self._legacy_static[legacy_name] = action
+        return action
+
+    def decode(self, data: Optional[str]) -> Optional[Tuple[CallbackAction, tuple]]:
+        """Разбор callback_data в действие и значения полей"""
+        if not data:
+            return None
+
+        # Новый формат: один символ префикса, затем поля через разделитель
+        if len(data) == 1 or data[1] == SEPARATOR:
+            action = self.actions.get(data[0])
+            if action is not None:
+                values = action.unpack(data.split(SEPARATOR)[1:]) if len(data) > 1 else action.unpack([])
+                if values is not None:
+                    return action, values
+
+        # Старый формат
+        action = self._legacy_static.get(data)
+        if action is not None:
+            return action, ()
+
+        prefix, _, raw_value = data.rpartition("_")
+        action = self._legacy_prefixed.get(prefix)
+        if action is not None:
+            values = action.unpack([raw_value], base=10)
+            if values is not None:
+                return action, values
+
+        return None
+
+# Реестр действий бота
+codec = CallbackCodec()
+
+# Пользовательские действия
+MAIN_MENU = codec.action("m", "main_menu", legacy=("main_menu", "back_to_main"))
+CATEGORY = codec.action("g", "category", int)
+# Кнопки категорий с текстовым ключом, отправленные до перехода на ID категорий
+CATEGORY_KEY = codec.action("c", "category_key", str, legacy=("category",))
+SERVICE = codec.action("s", "service", int, legacy=("service",))
+DETAILS = codec.action("d", "details", int, legacy=("details",))
+ORDER = codec.action("o", "order", int, legacy=("order",))
+# Результат вступления и смены статуса показывается во всплывающем окне ответа на callback
+GIVEAWAY_JOIN = codec.action("j", "giveaway_join", int, answers=True)
+MY_ORDERS = codec.action("h", "my_orders", int)
+# Права на смену статуса проверяет обработчик (админ бота или админ канала)
+ORDER_STATUS = codec.action("z", "order_status", int, str, answers=True)
+
+# Админские действия
+ADMIN_MENU = codec.action("A", "admin_menu", admin_only=True, legacy=("admin_menu",))
+ADMIN_SERVICES = codec.action("S", "admin_services", admin_only=True, legacy=("admin_services",))
+ADMIN_LIST = codec.action("L", "admin_list", admin_only=True, legacy=("admin_list",))
+ADMIN_ADD_SERVICE = codec.action("N", "admin_add_service", admin_only=True, legacy=("admin_add_service",))
+ADMIN_ADD_CATEGORY = codec.action("C", "admin_add_category", int, admin_only=True)
+ADMIN_DELETE_SERVICE = codec.action("X", "admin_delete_service", admin_only=True, legacy=("admin_delete_service",))
+ADMIN_DELETE_ASK = codec.action("D", "admin_delete_ask", int, admin_only=True, legacy=("del_service",))
+ADMIN_DELETE_CONFIRM = codec.action("Y", "admin_delete_confirm", int, admin_only=True, legacy=("confirm_del",))
+ADMIN_EDIT_SERVICE = codec.action("Z", "admin_edit_service", admin_only=True)
+# Прописные префиксы заняты, поэтому следующие админские действия используют строчные
+ADMIN_EDIT_ASK = codec.action("e", "admin_edit_ask", int, admin_only=True)
+# Версия услуги, показанная админу: изменение не затрет правку, сделанную после открытия карточки
+ADMIN_EDIT_FIELD = codec.action("f", "admin_edit_field", int, int, str, admin_only=True)
+ADMIN_EDIT_CATEGORY = codec.action("k", "admin_edit_category", int, int, int, admin_only=True)
+ADMIN_SETTINGS = codec.action("G", "admin_settings", admin_only=True, legacy=("admin_settings",))
+ADMIN_SET_MANAGER = codec.action("U", "admin_set_manager", admin_only=True, legacy=("admin_set_manager",))
+ADMIN_SET_CHANNEL = codec.action("H", "admin_set_channel", admin_only=True, legacy=("admin_set_channel",))
+ADMIN_SET_GIVEAWAY = codec.action("W", "admin_set_giveaway", admin_only=True, legacy=("admin_set_giveaway",))
+ADMIN_STATS = codec.action("T", "admin_stats", admin_only=True, legacy=("admin_stats",))
+ADMIN_FUNNEL = codec.action("F", "admin_funnel", admin_only=True)
+ADMIN_ALERTS = codec.action("I", "admin_alerts", admin_only=True)
+ADMIN_ALERTS_CLEAR = codec.action("J", "admin_alerts_clear", admin_only=True)
+ADMIN_POST = codec.action("P", "admin_post", admin_only=True, legacy=("admin_post",))
+ADMIN_SCHEDULED = codec.action("B", "admin_scheduled", admin_only=True)
+ADMIN_SCHEDULED_NEW = codec.action("M", "admin_scheduled_new", admin_only=True)
+ADMIN_SCHEDULED_CANCEL = codec.action("O", "admin_scheduled_cancel", int, admin_only=True)
+ADMIN_CLOSE = codec.action("Q", "admin_close", admin_only=True, legacy=("admin_close",))
+ADMIN_GIVEAWAY = codec.action("R", "admin_giveaway", admin_only=True)
+ADMIN_GIVEAWAY_NEW = codec.action("E", "admin_giveaway_new", admin_only=True)
+ADMIN_GIVEAWAY_DRAW = codec.action("V", "admin_giveaway_draw", int, admin_only=True)
+ADMIN_GIVEAWAY_ANNOUNCE = codec.action("K", "admin_giveaway_announce", int, admin_only=True)
+
+CallbackHandler = Callable[..., Awaitable[Any]]
+
+callback_ack_seconds = registry.histogram(
+    "callback_ack_seconds", "Время от получения callback до ответа на него (остановка часиков на кнопке)"
+)
+callback_queue_wait_seconds = registry.histogram(
+    "callback_queue_wait_seconds", "Ожидание обработки callback за предыдущими действиями того же пользователя"
+)
+
+async def safe_callback_answer(callback: CallbackQuery, text: Optional[str] = None, show_alert: bool = False):
+    """Ответ на callback без исключений: запрос мог устареть или уже получить ответ"""
+    try:
+        await callback.answer(text, show_alert=show_alert)
+    except TelegramAPIError as e:
+        logger.debug(f"Не удалось ответить на callback: {e}")
+
+class UserQueues:
+    """Очереди обработки по пользователям: действия одного пользователя выполняются по порядку
+    нажатий, разных пользователей - параллельно. Очередь - цепочка задач: каждая ждет предыдущую"""
+
+    def __init__(self):
+        # user_id -> последняя задача пользователя; удаляется, когда очередь пустеет
+        self._tails: Dict[int, asyncio.Task] = {}
+
+    @property
+    def active_users(self) -> int:
+        """Пользователи с действиями в обработке"""
+        return len(self._tails)
+
+    def submit(self, user_id: int, job: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Постановка действия в очередь пользователя"""
+        task = asyncio.create_task(self._run(self._tails.get(user_id), job))
+        self._tails[user_id] = task
+        task.add_done_callback(lambda done: self._release(user_id, done))
+        return task
+
+    def _release(self, user_id: int, task: asyncio.Task):
+        if self._tails.get(user_id) is task:
+            del self._tails[user_id]
+
+    async def _run(self, previous: Optional[asyncio.Task], job: Callable[[], Awaitable[Any]]):
+        if previous is not None:
+            started = time.perf_counter()
+            # Результат и ошибки предыдущего действия не важны, только порядок
+            await asyncio.wait((previous,))
+            callback_queue_wait_seconds.observe(time.perf_counter() - started)
+        return await job()
+
+class CallbackRouter:
+    """Единая точка диспетчеризации callback-запросов"""
+
+    def __init__(self, is_admin: Callable[[int], bool], codec: CallbackCodec = codec):
+        self.codec = codec
+        self.is_admin = is_admin
+        self.queues = UserQueues()
+        self._handlers: Dict[str, CallbackHandler] = {}
+
+    @classmethod
+    def for_dispatcher(cls, dp, config) -> "CallbackRouter":
+        """Роутер диспетчера (создается и подключается при первом обращении)"""
+        router = dp.get("callback_router")
+        if router is None:
+            router = cls(lambda user_id: user_id == config.ADMIN_ID)
+            dp["callback_router"] = router
+            dp.callback_query.register(router.dispatch)
+        return router
+
+    def handler(self, action: CallbackAction):
+        """Декоратор регистрации обработчика действия"""
+        def decorator(func: CallbackHandler) -> CallbackHandler:
+            if action.prefix in self._handlers:
+                raise ValueError(f"Обработчик для {action.name} уже зарегистрирован")
+            self._handlers[action.prefix] = func
+            return func
+        return decorator
+
+    def resolve(self, data: Optional[str]) -> Optional[Tuple[CallbackAction, CallbackHandler, tuple]]:
+        """Поиск обработчика для callback_data"""
+        decoded = self.codec.decode(data)
+        if decoded is None:
+            return None
+        action, values = decoded
+        handler = self._handlers.get(action.prefix)
+        if handler is None:
+            return None
+        return action, handler, values
+
+    async def dispatch(self, callback: CallbackQuery, admission=None, load_class=None):
+        """Обработка callback-запроса: ответ сразу, обработчик - в очереди пользователя.
+        admission и load_class передает контроль нагрузки: место класса занимается в очереди"""
+        started = time.perf_counter()
+        resolved = self.resolve(callback.data)
+        if resolved is None:
+            logger.debug(f"Неизвестный callback: {callback.data!r}")
+            await safe_callback_answer(callback)
+            return
+
+        action, handler, values = resolved
+        user = callback.from_user
+        if action.admin_only and (not user or not self.is_admin(user.id)):
+            await safe_callback_answer(callback)
+            return
+
+        job = lambda: handler(callback, *values)
+        if admission is not None and load_class is not None:
+            job = lambda: admission.run(load_class, lambda: handler(callback, *values))
+        task = self.queues.submit(user.id if user else 0, job)
+        if not action.answers:
+            # Часики на кнопке гаснут через один запрос к API, а не после записи в базу
+            # и редактирования сообщения; обработчик уже запущен и не ждет этого ответа
+            await safe_callback_answer(callback)
+            callback_ack_seconds.observe(time.perf_counter() - started)
+        # Апдейт остается в обработке до конца обработчика: его учитывают остановка бота
+        # и контроль нагрузки, а ошибки попадают в лог диспетчера
+        try:
+            await task
+        except Exception:
+            if action.answers:
+                # Обработчик упал, не успев ответить: часики на кнопке не должны висеть
+                await safe_callback_answer(callback)
+            raise
+
+class IsAdmin(Filter):
+    """Фильтр сообщений от администратора"""
+
+    def __init__(self, config):
+        self.config = config
+
+    async def __call__(self, message: Message) -> bool:
+        user = message.from_user
+        return bool(user and self.config.ADMIN_ID and user.id == self.config.ADMIN_ID)
@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional
+
+from bot_context import PerBot, bot_file
+from config import SERVICES_KIND
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Снимок каталога на диске: бот отвечает по нему сразу после запуска,
+# пока каталог загружается из базы
+CATALOG_SNAPSHOT = "catalog_snapshot.json"
+
+# Как часто сверяется версия каталога в общей базе (правки с других узлов)
+VERSION_CHECK_INTERVAL = 5.0
+
+class Catalog:
+    """Каталог услуг и категорий в памяти: чтение без обращения к базе, перезагрузка после изменений"""
+
+    def __init__(self, snapshot_path: str = CATALOG_SNAPSHOT, version_check_interval: float = VERSION_CHECK_INTERVAL):
+        self.snapshot_path = snapshot_path
+        self.version_check_interval = version_check_interval
+        self.source: Optional[str] = None
+        # Версия каталога в общей базе, с которой загружен каталог (None - база не общая)
+        self.version: Optional[int] = None
+        self._checked_at = 0.0
+        self._categories: List[Dict] = []
+        self._categories_by_id: Dict[int, Dict] = {}
+        self._categories_by_key: Dict[str, Dict] = {}
+        self._services: List[Dict] = []
+        self._by_id: Dict[int, Dict] = {}
+        self._by_category: Dict[int, List[Dict]] = {}
+
+    @property
+    def loaded(self) -> bool:
+        """Каталог загружен (из снимка или из базы)"""
+        return self.source is not None
+
+    def _set(self, categories: List[Dict], services: List[Dict], source: str):
+        self._categories = categories
+        self._categories_by_id = {category['id']: category for category in categories}
+        self._categories_by_key = {category['key']: category for category in categories if category['key']}
+        self._services = services
+        self._by_id = {service['id']: service for service in services}
+        by_category: Dict[int, List[Dict]] = {}
+        for service in services:
+            by_category.setdefault(service['category_id'], []).append(service)
+        for items in by_category.values():
+            items.sort(key=lambda service: service['name'])
+        self._by_category = by_category
+        self.source = source
+
+    def load_snapshot(self) -> bool:
+        """Загрузка снимка с диска (синхронно, до старта поллинга)"""
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось прочитать снимок каталога: {e}")
+            return False
+        # Снимок старого формата (только услуги с текстовой категорией) не используется
+        if not isinstance(snapshot, dict):
+            return False
+        self._set(snapshot["categories"], snapshot["services"], "snapshot")
+        self.version = snapshot.get("version")
+        logger.info(f"Каталог из снимка: {len(snapshot['categories'])} категорий, {len(snapshot['services'])} услуг")
+        return True
+
+    async def reload(self):
+        """Загрузка каталога из базы и обновление снимка"""
+        # Версия читается до каталога: правка, прошедшая во время чтения, вызовет еще одну перезагрузку
+        version = await db.get_catalog_version()
+        categories = await db.get_categories()
+        services = await db.get_all_services()
+        self._set(categories, services, "database")
+        self.version = version
+        self._checked_at = time.monotonic()
+        self._write_snapshot()
+
+    async def _check_version(self):
+        """Перезагрузка, если каталог изменили на другом узле с общей базой
+        (версия сверяется не чаще version_check_interval)"""
+        now = time.monotonic()
+        if not self.loaded or now - self._checked_at < self.version_check_interval:
+            return
+        self._checked_at = now
+        try:
+            version = await db.get_catalog_version()
+            if version is not None and version != self.version:
+                logger.info(f"Каталог изменен в базе (версия {self.version} -> {version}), перезагрузка")
+                await self.reload()
+        except Exception as e:
+            # Каталог в памяти продолжает отвечать, версия сверится при следующем чтении
+            logger.error(f"Не удалось проверить версию каталога: {e}")
+
+    def _write_snapshot(self):
+        temp_path = self.snapshot_path + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(
+                    {"categories": self._categories, "services": self._services, "version": self.version},
+                    f, ensure_ascii=False
+                )
+            os.replace(temp_path, self.snapshot_path)
+        except OSError as e:
+            logger.error(f"Не удалось сохранить снимок каталога: {e}")
+
+    async def get_categories(self) -> List[Dict]:
+        """Категории в порядке главного меню"""
+        await self._check_version()
+        if not self.loaded:
+            return await db.get_categories()
+        return list(self._categories)
+
+    async def get_service_categories(self) -> List[Dict]:
+        """Категории со списком услуг (без служебных разделов меню)"""
+        return [category for category in await self.get_categories() if category['kind'] == SERVICES_KIND]
+
+    async def get_category(self, category_id: int) -> Optional[Dict]:
+        """Категория по ID"""
+        await self._check_version()
+        if not self.loaded:
+            return next((category for category in await db.get_categories() if category['id'] == category_id), None)
+        return self._categories_by_id.get(category_id)
+
+    async def get_category_by_key(self, key: str) -> Optional[Dict]:
+        """Категория по постоянному ключу (кнопки, отправленные до перехода на ID)"""
+        await self._check_version()
+        if not self.loaded:
+            return next((category for category in await db.get_categories() if category['key'] == key), None)
+        return self._categories_by_key.get(key)
+
+    async def find_category(self, value: str) -> Optional[Dict]:
+        """Категория услуг по ID, ключу или названию (для текстовых команд админа)"""
+        value = value.strip()
+        for category in await self.get_service_categories():
+            if value in (str(category['id']), category['key'], category['name'], category['button']):
+                return category
+        return None
+
+    async def add_category(self, name: str, button: str) -> int:
+        """Добавление категории услуг"""
+        category_id = await db.add_category(name, button)
+        await self.reload()
+        return category_id
+
+    async def update_category(self, category_id: int, name: str, button: str) -> bool:
+        """Переименование категории (услуги ссылаются на ID и не теряются)"""
+        updated = await db.update_category(category_id, name, button)
+        if updated:
+            await self.reload()
+        return updated
+
+    async def delete_category(self, category_id: int) -> bool:
+        """Удаление пустой категории"""
+        deleted = await db.delete_category(category_id)
+        if deleted:
+            await self.reload()
+        return deleted
+
+    async def get_service(self, service_id: int) -> Optional[Dict]:
+        """Услуга по ID"""
+        await self._check_version()
+        if not self.loaded:
+            return await db.get_service_by_id(service_id)
+        return self._by_id.get(service_id)
+
+    async def get_services_by_category(self, category_id: int) -> List[Dict]:
+        """Услуги категории, отсортированные по названию"""
+        await self._check_version()
+        if not self.loaded:
+            return await db.get_services_by_category(category_id)
+        return list(self._by_category.get(category_id, ()))
+
+    async def get_all_services(self) -> List[Dict]:
+        """Все услуги"""
+        await self._check_version()
+        if not self.loaded:
+            return await db.get_all_services()
+        return list(self._services)
+
+    async def add_service(self, name: str, description: str, price: str, category_id: int) -> int:
+        """Добавление услуги"""
+        service_id = await db.add_service(name, description, price, category_id)
+        await self._refresh_service(service_id)
+        return service_id
+
+    async def update_service(
+        self, service_id: int, name: str, description: str, price: str, category_id: int,
+        expected_version: Optional[int] = None
+    ) -> bool:
+        """Изменение услуги на месте: id и кнопки в отправленных сообщениях сохраняются.
+        С expected_version запись не проходит, если услугу успели изменить"""
+        updated = await db.update_service(service_id, name, description, price, category_id, expected_version)
+        if updated:
+            await self._refresh_service(service_id)
+        return updated
+
+    async def update_service_field(self, service_id: int, field: str, value, expected_version: Optional[int] = None) -> bool:
+        """Изменение одного поля услуги; с expected_version запись не проходит, если услугу успели изменить"""
+        updated = await db.update_service_field(service_id, field, value, expected_version)
+        if updated:
+            await self._refresh_service(service_id)
+        return updated
+    
+    async def delete_service(self, service_id: int) -> bool:
+        """Удаление услуги"""
+        deleted = await db.delete_service(service_id)
+        if deleted and self.loaded:
+            self._apply_service(service_id, None)
+            self._write_snapshot()
+        return deleted
+
+    async def set_service_image(self, service_id: int, file_id: Optional[str]) -> bool:
+        """Установка или удаление изображения услуги"""
+        updated = await db.set_service_image(service_id, file_id)
+        if updated:
+            await self._refresh_service(service_id)
+        return updated
+
+    async def _refresh_service(self, service_id: int):
+        """Перечитывание одной услуги после записи вместо перезагрузки всего каталога"""
+        if not self.loaded:
+            return
+        service = await db.get_service_by_id(service_id)
+        self._apply_service(service_id, service)
+        self._write_snapshot()
+
+    def _service_order(self, service: Dict) -> tuple:
+        # Порядок get_all_services в базе: позиция категории, id категории, название
+        category = self._categories_by_id.get(service['category_id'])
+        return (category['position'] if category else -1, service['category_id'], service['name'])
+
+    def _apply_service(self, service_id: int, service: Optional[Dict]):
+        """Замена услуги в индексах (None - удаление). Затрагиваются только ее категории;
+        изменение выполняется без await, поэтому обработчики видят каталог целиком до или после записи"""
+        old = self._by_id.pop(service_id, None)
+        if service is not None:
+            self._by_id[service_id] = service
+        for category_id in {item['category_id'] for item in (old, service) if item is not None}:
+            items = [item for item in self._by_category.get(category_id, ()) if item['id'] != service_id]
+            if service is not None and service['category_id'] == category_id:
+                items.append(service)
+                items.sort(key=lambda item: item['name'])
+            if items:
+                self._by_category[category_id] = items
+            else:
+                self._by_category.pop(category_id, None)
+        self._services = sorted(self._by_id.values(), key=self._service_order)
+
+# Глобальный каталог услуг (у каждого бота процесса свой снимок)
+catalog = PerBot(lambda name: Catalog(bot_file(CATALOG_SNAPSHOT, name)))
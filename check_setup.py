@@ -100,6 +100,49 @@ def check_files():
     
     return True
 
+def check_runtime():
+    """Проверки работающего окружения: база, цикл событий, память и Bot API"""
+    print("\n🩺 Самодиагностика окружения...")
+    import asyncio
+    from config import Config
+    from database import db, create_backend
+    from health import FAIL, format_health, overall_status, run_checks
+
+    try:
+        config = Config()
+    except ValueError as e:
+        # Без настроек проверяется база SQLite по умолчанию
+        print(f"⚠️ Bot API не проверяется: {e}")
+        config = None
+    if config is not None:
+        try:
+            db.use(create_backend(config))
+        except (ValueError, RuntimeError) as e:
+            print(f"❌ Хранилище недоступно: {e}")
+            return False
+
+    if db.db_path and not os.path.exists(db.db_path):
+        print("❌ База данных не найдена, проверки пропущены")
+        return False
+
+    async def run():
+        bot = None
+        if config is not None:
+            from aiogram import Bot
+            bot = Bot(token=config.BOT_TOKEN)
+        try:
+            await db.init_db()
+            return await run_checks(db, bot)
+        finally:
+            await db.close()
+            if bot is not None:
+                await bot.session.close()
+
+    checks = asyncio.run(run())
+    status = overall_status(checks)
+    print(format_health({"status": status, "sampled_at": None, "checks": checks}))
+    return status != FAIL
+
 def main():
     """Главная функция проверки"""
     print("🔍 Проверка готовности Phoenix PS Bot к запуску")
@@ -112,6 +155,9 @@ def main():
         check_database,
         check_files
     ]
+    # Перед деплоем: python check_setup.py --runtime
+    if "--runtime" in sys.argv:
+        checks.append(check_runtime)
     
     all_passed = True
     for check in checks:
@@ -1,28 +1,146 @@
 import os
 import json
-from typing import Optional
-from dotenv import load_dotenv
+from typing import Dict, List, Optional
 
-# Загружаем переменные окружения из .env файла
-load_dotenv()
+from bot_context import bot_file
+
+_env_loaded = False
+
+def load_env():
+    """Загрузка переменных окружения из .env (один раз, при первом создании Config)"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+def parse_method_timeouts(value: str) -> Dict[str, float]:
+    """Разбор таймаутов по методам: "sendPhoto=120,sendMediaGroup=120" """
+    timeouts = {}
+    for item in value.split(","):
+        if "=" not in item:
+            continue
+        method, timeout = item.split("=", 1)
+        try:
+            timeouts[method.strip()] = float(timeout)
+        except ValueError:
+            print(f"⚠️ Некорректный таймаут для {method.strip()}: {timeout}")
+    return timeouts
+
+# Настройки, которые у каждого бота из BOT_CONFIGS свои: из общего окружения не наследуются
+BOT_OWN_KEYS = (
+    "BOT_TOKEN", "ADMIN_ID", "DATABASE_PATH", "ANALYTICS_DATABASE_PATH", "DATABASE_URL", "SETTINGS_FILE", "BACKUP_DIR", "RECORD_DIR"
+)
 
 class Config:
     """Класс конфигурации бота"""
     
-    def __init__(self):
+    def __init__(self, env_file: Optional[str] = None, name: str = ""):
+        load_env()
+        
+        # Бот из BOT_CONFIGS: его env-файл поверх общего окружения процесса,
+        # файлы бота (база, настройки, снимок каталога) по умолчанию помечаются именем
+        self.NAME = name
+        env = dict(os.environ)
+        if env_file:
+            from dotenv import dotenv_values
+            for key in BOT_OWN_KEYS:
+                env.pop(key, None)
+            env.update({key: value for key, value in dotenv_values(env_file).items() if value is not None})
+        getenv = env.get
+        
         # Основные настройки
-        self.BOT_TOKEN = os.getenv("BOT_TOKEN", "")
-        self.ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
+        self.BOT_TOKEN = getenv("BOT_TOKEN", "")
+        self.ADMIN_ID = int(getenv("ADMIN_ID", "0"))
         
         # Проверка обязательных настроек
         if not self.BOT_TOKEN:
+            if env_file:
+                raise ValueError(f"BOT_TOKEN не установлен в {env_file} (бот {name})!")
             raise ValueError("BOT_TOKEN не установлен! Создайте .env файл или установите переменную окружения.")
         
         if not self.ADMIN_ID:
             print("⚠️ ВНИМАНИЕ: ADMIN_ID не установлен! Админские функции будут недоступны.")
         
+        # Сетевые настройки Bot API (пул соединений, таймауты, свой сервер API)
+        self.BOT_API_URL = getenv("BOT_API_URL", "")
+        self.BOT_API_LOCAL = getenv("BOT_API_LOCAL", "0").lower() in ("1", "true", "yes")
+        self.HTTP_POOL_LIMIT = int(getenv("HTTP_POOL_LIMIT", "100"))
+        self.HTTP_POOL_LIMIT_PER_HOST = int(getenv("HTTP_POOL_LIMIT_PER_HOST", "0"))
+        self.HTTP_KEEPALIVE_TIMEOUT = float(getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+        self.HTTP_DNS_CACHE_TTL = int(getenv("HTTP_DNS_CACHE_TTL", "3600"))
+        self.HTTP_TIMEOUT = float(getenv("HTTP_TIMEOUT", "60"))
+        self.HTTP_METHOD_TIMEOUTS = parse_method_timeouts(
+            getenv("HTTP_METHOD_TIMEOUTS", "sendPhoto=120,sendMediaGroup=120,editMessageMedia=120")
+        )
+        
+        # Повторы запросов к Bot API и предохранитель при массовых сбоях
+        self.API_RETRY_ATTEMPTS = int(getenv("API_RETRY_ATTEMPTS", "3"))
+        self.API_MAX_RETRY_AFTER = float(getenv("API_MAX_RETRY_AFTER", "30"))
+        self.API_BREAKER_THRESHOLD = int(getenv("API_BREAKER_THRESHOLD", "10"))
+        self.API_BREAKER_COOLDOWN = float(getenv("API_BREAKER_COOLDOWN", "30"))
+        
+        # Очередь исходящих сообщений: общий лимит бота и лимиты чатов
+        self.OUTBOUND_GLOBAL_RATE = float(getenv("OUTBOUND_GLOBAL_RATE", "30"))
+        self.OUTBOUND_CHAT_RATE = float(getenv("OUTBOUND_CHAT_RATE", "1"))
+        self.OUTBOUND_CHAT_BURST = float(getenv("OUTBOUND_CHAT_BURST", "3"))
+        self.OUTBOUND_GROUP_RATE = float(getenv("OUTBOUND_GROUP_RATE", "20"))
+        
+        # Контроль нагрузки: параллельность по классам апдейтов и очередь просмотра
+        self.ADMISSION_ORDER_CONCURRENCY = int(getenv("ADMISSION_ORDER_CONCURRENCY", "20"))
+        self.ADMISSION_ADMIN_CONCURRENCY = int(getenv("ADMISSION_ADMIN_CONCURRENCY", "4"))
+        self.ADMISSION_BROWSE_CONCURRENCY = int(getenv("ADMISSION_BROWSE_CONCURRENCY", "30"))
+        self.ADMISSION_BROWSE_QUEUE = int(getenv("ADMISSION_BROWSE_QUEUE", "100"))
+        
+        # Срок ожидания апдейтов в обработке при остановке, секунды
+        self.SHUTDOWN_TIMEOUT = float(getenv("SHUTDOWN_TIMEOUT", "20"))
+        
+        # Хранилище данных: sqlite (файл DATABASE_PATH), memory (в памяти процесса)
+        # или postgres (DATABASE_URL, пул соединений для нескольких узлов бота)
+        self.STORAGE_BACKEND = getenv("STORAGE_BACKEND", "sqlite").lower()
+        self.DATABASE_PATH = getenv("DATABASE_PATH", bot_file("phoenix_bot.db", name))
+        self.DATABASE_URL = getenv("DATABASE_URL", "")
+        self.DATABASE_POOL_MIN = int(getenv("DATABASE_POOL_MIN", "1"))
+        self.DATABASE_POOL_MAX = int(getenv("DATABASE_POOL_MAX", "10"))
+        
+        # База аналитики SQLite (журнал действий, воронка): пусто - рядом с DATABASE_PATH
+        # (phoenix_bot.analytics.db); контрольная точка WAL не реже чем раз в столько секунд
+        self.ANALYTICS_DATABASE_PATH = getenv("ANALYTICS_DATABASE_PATH", "")
+        self.ANALYTICS_CHECKPOINT_INTERVAL = float(getenv("ANALYTICS_CHECKPOINT_INTERVAL", "300"))
+        
+        # Резервные копии базы: каталог, сколько хранить, период (0 - только вручную)
+        self.BACKUP_DIR = getenv("BACKUP_DIR", bot_file("backups", name))
+        self.BACKUP_KEEP = int(getenv("BACKUP_KEEP", "7"))
+        self.BACKUP_INTERVAL_HOURS = float(getenv("BACKUP_INTERVAL_HOURS", "24"))
+        
+        # Самодиагностика: период фоновых проверок и HTTP-эндпоинт /health (порт 0 - выключен)
+        self.HEALTH_INTERVAL = float(getenv("HEALTH_INTERVAL", "30"))
+        self.HEALTH_HOST = getenv("HEALTH_HOST", "127.0.0.1")
+        self.HEALTH_PORT = int(getenv("HEALTH_PORT", "0"))
+        
+        # Сторож цикла событий: период замера задержки, порог блокировки (с), режим отладки asyncio
+        self.LOOP_LAG_INTERVAL = float(getenv("LOOP_LAG_INTERVAL", "0.5"))
+        self.LOOP_SLOW_THRESHOLD = float(getenv("LOOP_SLOW_THRESHOLD", "0.1"))
+        self.LOOP_DEBUG = getenv("LOOP_DEBUG", "0").lower() in ("1", "true", "yes")
+        
+        # Профилирование памяти: трассировка с запуска и периодические снимки на диск (0 - выключены)
+        self.MEMORY_TRACE = getenv("MEMORY_TRACE", "0").lower() in ("1", "true", "yes")
+        self.MEMORY_SNAPSHOT_DIR = getenv("MEMORY_SNAPSHOT_DIR", "memory_snapshots")
+        self.MEMORY_SNAPSHOT_KEEP = int(getenv("MEMORY_SNAPSHOT_KEEP", "10"))
+        self.MEMORY_SNAPSHOT_MINUTES = float(getenv("MEMORY_SNAPSHOT_MINUTES", "0"))
+        
+        # Запись входящих апдейтов (обезличенных) для python replay.py
+        self.RECORD_UPDATES = getenv("RECORD_UPDATES", "0").lower() in ("1", "true", "yes")
+        self.RECORD_DIR = getenv("RECORD_DIR", bot_file("recordings", name))
+        
+        # Отложенные посты: часовой пояс времени в командах, интервал между публикациями (с), повторы при сбое
+        self.POST_TIMEZONE = getenv("POST_TIMEZONE", "Europe/Moscow")
+        self.POST_MIN_INTERVAL = float(getenv("POST_MIN_INTERVAL", "3"))
+        self.POST_RETRY_ATTEMPTS = int(getenv("POST_RETRY_ATTEMPTS", "5"))
+        self.POST_RETRY_DELAY = float(getenv("POST_RETRY_DELAY", "30"))
+        
         # Загрузка динамических настроек из файла
-        self.settings_file = "settings.json"
+        self.settings_file = getenv("SETTINGS_FILE", bot_file("settings.json", name))
         self.load_settings()
         
     def load_settings(self):
@@ -80,15 +198,41 @@ class Config:
         self.GIVEAWAY_DESCRIPTION = description
         self.save_settings()
 
-# Категории услуг
-CATEGORIES = {
-    "optimization": "📦 Услуги по оптимизации и разгону ПК",
-    "components": "💻 Комплектующие", 
-    "devices": "🖱 Девайсы",
-    "giveaway": "🎁 Розыгрыш",
-    "about": "🧾 О нас",
-    "contacts": "📞 Контакты и заказ"
-}
+def load_bot_configs() -> List[Config]:
+    """Конфигурации ботов процесса: BOT_CONFIGS - env-файлы ботов через запятую, без него - один бот из .env"""
+    load_env()
+    files = [path.strip() for path in os.getenv("BOT_CONFIGS", "").split(",") if path.strip()]
+    if not files:
+        return [Config()]
+    
+    configs = []
+    for path in files:
+        if not os.path.exists(path):
+            raise ValueError(f"Файл настроек бота {path} из BOT_CONFIGS не найден")
+        # Имя бота - имя файла без расширения: bots/shop.env -> shop
+        name = os.path.splitext(os.path.basename(path))[0].lstrip(".")
+        if any(config.NAME == name for config in configs):
+            raise ValueError(f"Имя бота {name} в BOT_CONFIGS повторяется")
+        config = Config(path, name)
+        if any(other.BOT_TOKEN == config.BOT_TOKEN for other in configs):
+            raise ValueError(f"Токен бота {name} совпадает с токеном другого бота из BOT_CONFIGS")
+        configs.append(config)
+    return configs
+
+# Категории по умолчанию: записываются в пустую таблицу categories при инициализации базы,
+# дальше категории редактируются из админки. key - постоянный ключ для старых кнопок,
+# kind - тип раздела (services - список услуг), wide - кнопка на всю ширину главного меню
+DEFAULT_CATEGORIES = [
+    {"key": "optimization", "name": "📦 Услуги по оптимизации и разгону ПК", "button": "📦 Оптимизация ПК", "kind": "services", "wide": True},
+    {"key": "components", "name": "💻 Комплектующие", "button": "💻 Комплектующие", "kind": "services", "wide": False},
+    {"key": "devices", "name": "🖱 Девайсы", "button": "🖱 Девайсы", "kind": "services", "wide": False},
+    {"key": "giveaway", "name": "🎁 Розыгрыш", "button": "🎁 Розыгрыш", "kind": "giveaway", "wide": False},
+    {"key": "about", "name": "🧾 О нас", "button": "🧾 О нас", "kind": "about", "wide": False},
+    {"key": "contacts", "name": "📞 Контакты и заказ", "button": "📞 Контакты", "kind": "contacts", "wide": False}
+]
+
+# Тип раздела со списком услуг (остальные типы - служебные разделы меню)
+SERVICES_KIND = "services"
 
 # Сообщения
 MESSAGES = {
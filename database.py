@@ -1,31 +1,340 @@
+import json
 import sqlite3
 import aiosqlite
 import logging
-from typing import List, Dict, Optional
+from typing import AsyncIterator, Callable, List, Dict, Optional, Tuple
 from datetime import datetime
 
+from bot_context import PerBot
+from config import DEFAULT_CATEGORIES, SERVICES_KIND
+
 logger = logging.getLogger(__name__)
 
-class Database:
-    """Класс для работы с базой данных"""
+# Схема services: категория - целочисленный внешний ключ
+SERVICES_TABLE_COLUMNS = """
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    description TEXT NOT NULL,
+    price TEXT NOT NULL,
+    category_id INTEGER NOT NULL REFERENCES categories (id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    image TEXT,
+    version INTEGER NOT NULL DEFAULT 1
+"""
+
+# Журнал действий: код действия - небольшое целое, объект - id категории или услуги,
+# имя пользователя - ссылка на таблицу usernames. Коды не меняются, новые добавляются в конец
+ACTION_CODES = {
+    "start_command": 1,
+    "main_menu_accessed": 2,
+    "category_viewed": 3,
+    "service_viewed": 4,
+    "service_details_viewed": 5,
+    "order_created": 6
+}
+CATEGORY_ACTIONS = ("category_viewed",)
+SERVICE_ACTIONS = ("service_viewed", "service_details_viewed", "order_created")
+
+USERNAMES_TABLE_COLUMNS = "id INTEGER PRIMARY KEY, username TEXT NOT NULL UNIQUE"
+USER_ACTIONS_TABLE_COLUMNS = """
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    username_id INTEGER REFERENCES usernames (id),
+    action INTEGER NOT NULL,
+    target_id INTEGER,
+    timestamp INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+"""
+
+def action_name_sql(column: str) -> str:
+    """Выражение SQL, расшифровывающее код действия в название"""
+    cases = " ".join(f"WHEN {code} THEN '{action}'" for action, code in ACTION_CODES.items())
+    return f"CASE {column} {cases} ELSE 'unknown' END"
+
+def action_codes_sql(actions: tuple) -> str:
+    """Список кодов действий для условия IN (...)"""
+    return ", ".join(str(ACTION_CODES[action]) for action in actions)
+
+# Колонки таблиц в порядке, ожидаемом методами SQLiteBackend._row_to_*
+# (название категории берется из categories, у услуги хранится только category_id)
+SERVICE_COLUMNS = "s.id, s.name, s.description, s.price, c.name, s.created_at, s.image, s.category_id, s.version"
+SERVICE_FROM = "services s LEFT JOIN categories c ON c.id = s.category_id"
+# Поля услуги, которые можно изменить по одному (update_service_field)
+SERVICE_EDIT_FIELDS = ("name", "description", "price", "category_id")
+CATEGORY_COLUMNS = "id, key, name, button, kind, position, wide"
+ORDER_COLUMNS = "id, user_id, username, service_id, service_name, order_time, status, status_updated_at"
+GIVEAWAY_COLUMNS = "id, title, status, seed, participants_count, winners, created_at, finished_at"
+SCHEDULED_POST_COLUMNS = "id, channel_id, text, photo, publish_at, status, attempts, error, created_at, finished_at"
+USER_ACTION_COLUMNS = "id, user_id, username, action, details, timestamp"
+
+class StorageBackend:
+    """Интерфейс хранилища данных бота: SQLite, память процесса или PostgreSQL"""
+    
+    name = "base"
+    
+    async def init_db(self):
+        """Инициализация базы данных"""
+        raise NotImplementedError
+    
+    async def get_categories(self) -> List[Dict]:
+        """Категории в порядке главного меню"""
+        raise NotImplementedError
+    
+    async def add_category(self, name: str, button: str) -> int:
+        """Добавление категории услуг (после остальных категорий услуг в меню)"""
+        raise NotImplementedError
+    
+    async def update_category(self, category_id: int, name: str, button: str) -> bool:
+        """Переименование категории"""
+        raise NotImplementedError
+    
+    async def delete_category(self, category_id: int) -> bool:
+        """Удаление категории (только без услуг)"""
+        raise NotImplementedError
+    
+    async def add_service(self, name: str, description: str, price: str, category_id: int) -> int:
+        """Добавление новой услуги"""
+        raise NotImplementedError
+    
+    async def get_services_by_category(self, category_id: int) -> List[Dict]:
+        """Получение услуг по категории"""
+        raise NotImplementedError
+    
+    async def get_service_by_id(self, service_id: int) -> Optional[Dict]:
+        """Получение услуги по ID"""
+        raise NotImplementedError
+    
+    async def get_all_services(self) -> List[Dict]:
+        """Получение всех услуг"""
+        raise NotImplementedError
+    
+    async def get_catalog_version(self) -> Optional[int]:
+        """Версия каталога в общей базе; None - базу не меняют другие процессы,
+        и каталог в памяти всегда актуален"""
+        raise NotImplementedError
+    
+    async def update_service(
+        self, service_id: int, name: str, description: str, price: str, category_id: int,
+        expected_version: Optional[int] = None
+    ) -> bool:
+        """Изменение услуги с увеличением версии; при expected_version - только если версия не изменилась"""
+        raise NotImplementedError
+    
+    async def update_service_field(self, service_id: int, field: str, value, expected_version: Optional[int] = None) -> bool:
+        """Изменение одного поля услуги (SERVICE_EDIT_FIELDS) с увеличением версии;
+        при expected_version - только если версия не изменилась"""
+        raise NotImplementedError
+    
+    async def delete_service(self, service_id: int) -> bool:
+        """Удаление услуги"""
+        raise NotImplementedError
+    
+    async def set_service_image(self, service_id: int, file_id: Optional[str]) -> bool:
+        """Установка изображения услуги (None - удалить изображение)"""
+        raise NotImplementedError
+    
+    async def get_media_file_id(self, content_hash: str) -> Optional[str]:
+        """Получение file_id по хешу содержимого файла"""
+        raise NotImplementedError
+    
+    async def save_media_file_id(self, content_hash: str, file_id: str):
+        """Сохранение file_id загруженного файла"""
+        raise NotImplementedError
+    
+    async def create_giveaway(self, title: str) -> int:
+        """Создание розыгрыша"""
+        raise NotImplementedError
+    
+    async def get_giveaway(self, giveaway_id: int) -> Optional[Dict]:
+        """Получение розыгрыша по ID"""
+        raise NotImplementedError
+    
+    async def get_active_giveaway(self) -> Optional[Dict]:
+        """Получение текущего активного розыгрыша"""
+        raise NotImplementedError
     
-    def __init__(self, db_path: str = "phoenix_bot.db"):
+    async def finish_giveaway(self, giveaway_id: int, seed: str, participants_count: int, winners: List[Dict]):
+        """Сохранение итогов розыгрыша"""
+        raise NotImplementedError
+    
+    async def add_giveaway_participants(self, participants: List[tuple]) -> int:
+        """Пакетное добавление участников (giveaway_id, user_id, username); повторы игнорируются"""
+        raise NotImplementedError
+    
+    async def is_giveaway_participant(self, giveaway_id: int, user_id: int) -> bool:
+        """Проверка участия пользователя в розыгрыше"""
+        raise NotImplementedError
+    
+    async def count_giveaway_participants(self, giveaway_id: int) -> int:
+        """Количество участников розыгрыша"""
+        raise NotImplementedError
+    
+    def iter_giveaway_participants(self, giveaway_id: int, batch_size: int = 1000) -> AsyncIterator[tuple]:
+        """Потоковое чтение участников (user_id, username) в порядке вступления"""
+        raise NotImplementedError
+    
+    async def add_scheduled_post(self, channel_id: str, text: Optional[str], photo: Optional[str], publish_at: str) -> int:
+        """Добавление отложенного поста (publish_at - UTC, "%Y-%m-%d %H:%M:%S")"""
+        raise NotImplementedError
+    
+    async def get_scheduled_post(self, post_id: int) -> Optional[Dict]:
+        """Отложенный пост по ID"""
+        raise NotImplementedError
+    
+    async def get_pending_posts(self) -> List[Dict]:
+        """Неопубликованные посты по времени публикации"""
+        raise NotImplementedError
+    
+    async def update_scheduled_post(self, post_id: int, text: Optional[str], photo: Optional[str], publish_at: str) -> bool:
+        """Изменение неопубликованного поста"""
+        raise NotImplementedError
+    
+    async def cancel_scheduled_post(self, post_id: int) -> bool:
+        """Отмена неопубликованного поста"""
+        raise NotImplementedError
+    
+    async def claim_scheduled_post(self, post_id: int, now: str) -> Optional[Dict]:
+        """Захват поста для публикации: pending -> sending, если время наступило (now - UTC).
+        None - пост отменен, перенесен или его уже публикует другой узел"""
+        raise NotImplementedError
+    
+    async def release_scheduled_post(self, post_id: int) -> bool:
+        """Возврат захваченного поста в очередь (sending -> pending) после ошибки до отправки"""
+        raise NotImplementedError
+    
+    async def finish_scheduled_post(self, post_id: int, status: str, attempts: int, error: Optional[str] = None) -> bool:
+        """Итог публикации: sent или failed (только для неопубликованного поста)"""
+        raise NotImplementedError
+    
+    async def add_order(self, user_id: int, username: str, service_id: int, service_name: str) -> int:
+        """Добавление заказа"""
+        raise NotImplementedError
+    
+    async def get_order(self, order_id: int) -> Optional[Dict]:
+        """Получение заказа по ID"""
+        raise NotImplementedError
+    
+    async def get_user_orders(self, user_id: int, before_id: Optional[int] = None, limit: int = 5) -> List[Dict]:
+        """Заказы пользователя от новых к старым; before_id - последний заказ предыдущей страницы"""
+        raise NotImplementedError
+    
+    async def update_order_status(self, order_id: int, status: str, expected_status: Optional[str] = None) -> bool:
+        """Изменение статуса заказа. С expected_status запись не проходит, если статус успели изменить"""
+        raise NotImplementedError
+    
+    async def count_orders(self) -> int:
+        """Общее количество заказов"""
+        raise NotImplementedError
+    
+    async def upsert_service_stats(self, rows: List[Tuple[str, int, str, int, bytes]], merge: Callable[[Optional[bytes], bytes], bytes]):
+        """Прибавление счетчиков одной транзакцией; уникальные объединяются с сохраненными
+        функцией merge(сохраненные или None, новые) под блокировкой строки"""
+        raise NotImplementedError
+    
+    async def get_service_stats(self, since_day: str) -> List[Tuple]:
+        """Агрегаты воронки начиная с дня since_day (YYYY-MM-DD)"""
+        raise NotImplementedError
+    
+    async def log_user_action(self, user_id: int, username: str, action: str, target_id: Optional[int] = None):
+        """Логирование действия пользователя (target_id - категория или услуга действия)"""
+        raise NotImplementedError
+    
+    async def get_user_actions(self, limit: int = 50, user_id: Optional[int] = None) -> List[Dict]:
+        """Последние действия в читаемом виде (новые первыми)"""
+        raise NotImplementedError
+    
+    async def probe_read(self):
+        """Проверочное чтение (/health)"""
+        raise NotImplementedError
+    
+    async def probe_write(self):
+        """Проверочная запись с фиксацией транзакции (/health)"""
+        raise NotImplementedError
+    
+    async def close(self):
+        """Закрытие соединений с хранилищем"""
+
+class SQLiteBackend(StorageBackend):
+    """Хранилище в файле SQLite (aiosqlite)"""
+    
+    name = "sqlite"
+    
+    def __init__(self, db_path: str = "phoenix_bot.db", analytics_path: Optional[str] = None, checkpoint_interval: Optional[float] = None):
         self.db_path = db_path
+        # По умолчанию файл аналитики лежит рядом с основной базой (phoenix_bot.analytics.db)
+        self.analytics_path = analytics_path
+        self.checkpoint_interval = checkpoint_interval
+        self._analytics = None
+    
+    @property
+    def analytics(self):
+        """База аналитики (создается при первом обращении, когда путь к основной базе уже задан)"""
+        if self._analytics is None:
+            from database_analytics import CHECKPOINT_INTERVAL, AnalyticsDatabase, analytics_path
+            self._analytics = AnalyticsDatabase(
+                self.analytics_path or analytics_path(self.db_path),
+                self.db_path,
+                self.checkpoint_interval or CHECKPOINT_INTERVAL
+            )
+        return self._analytics
+    
+    @staticmethod
+    def _row_to_service(row) -> Dict:
+        """Преобразование строки таблицы services в словарь"""
+        return {
+            'id': row[0],
+            'name': row[1],
+            'description': row[2],
+            'price': row[3],
+            'category': row[4],
+            'created_at': row[5],
+            'image': row[6],
+            'category_id': row[7],
+            'version': row[8]
+        }
+    
+    @staticmethod
+    def _row_to_category(row) -> Dict:
+        """Преобразование строки таблицы categories в словарь"""
+        return {
+            'id': row[0],
+            'key': row[1],
+            'name': row[2],
+            'button': row[3],
+            'kind': row[4],
+            'position': row[5],
+            'wide': bool(row[6])
+        }
     
     async def init_db(self):
         """Инициализация базы данных"""
         async with aiosqlite.connect(self.db_path) as db:
+            # Категории: ключ нужен только категориям по умолчанию (старые кнопки с ключом)
             await db.execute("""
-                CREATE TABLE IF NOT EXISTS services (
+                CREATE TABLE IF NOT EXISTS categories (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    key TEXT UNIQUE,
                     name TEXT NOT NULL,
-                    description TEXT NOT NULL,
-                    price TEXT NOT NULL,
-                    category TEXT NOT NULL,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    button TEXT NOT NULL,
+                    kind TEXT NOT NULL DEFAULT 'services',
+                    position INTEGER NOT NULL DEFAULT 0,
+                    wide INTEGER NOT NULL DEFAULT 0
                 )
             """)
             
+            cursor = await db.execute("SELECT COUNT(*) FROM categories")
+            if (await cursor.fetchone())[0] == 0:
+                await db.executemany(
+                    "INSERT INTO categories (key, name, button, kind, position, wide) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (category["key"], category["name"], category["button"], category["kind"], position, int(category["wide"]))
+                        for position, category in enumerate(DEFAULT_CATEGORIES)
+                    ]
+                )
+            
+            await db.execute(f"""
+                CREATE TABLE IF NOT EXISTS services ({SERVICES_TABLE_COLUMNS})
+            """)
+            
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS orders (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -39,89 +348,320 @@ class Database:
             """)
             
             await db.execute("""
-                CREATE TABLE IF NOT EXISTS user_actions (
+                CREATE TABLE IF NOT EXISTS media_files (
+                    content_hash TEXT PRIMARY KEY,
+                    file_id TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS giveaways (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    title TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'active',
+                    seed TEXT,
+                    participants_count INTEGER,
+                    winners TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            """)
+            
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS giveaway_participants (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    giveaway_id INTEGER NOT NULL,
                     user_id INTEGER NOT NULL,
                     username TEXT,
-                    action TEXT NOT NULL,
-                    details TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (giveaway_id) REFERENCES giveaways (id)
                 )
             """)
             
+            await db.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_giveaway_participants_unique
+                ON giveaway_participants (giveaway_id, user_id)
+            """)
+            
+            # Отложенные посты в канал (время публикации в UTC)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS scheduled_posts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    channel_id TEXT NOT NULL,
+                    text TEXT,
+                    photo TEXT,
+                    publish_at TIMESTAMP NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TIMESTAMP
+                )
+            """)
+            
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_scheduled_posts_pending
+                ON scheduled_posts (status, publish_at)
+            """)
+            
+            # Одна строка для проверки записи в базу (/health)
+            await db.execute("""
+                CREATE TABLE IF NOT EXISTS health_probe (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    checked_at TIMESTAMP
+                )
+            """)
+            
+            # Миграция: изображение услуги (file_id Telegram)
+            cursor = await db.execute("PRAGMA table_info(services)")
+            columns = [row[1] for row in await cursor.fetchall()]
+            if "image" not in columns:
+                await db.execute("ALTER TABLE services ADD COLUMN image TEXT")
+            # Миграция: версия строки услуги для изменения без потерянных записей
+            if "version" not in columns:
+                await db.execute("ALTER TABLE services ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+            
+            # Миграция: статус заказа
+            cursor = await db.execute("PRAGMA table_info(orders)")
+            columns = [row[1] for row in await cursor.fetchall()]
+            if "status" not in columns:
+                await db.execute("ALTER TABLE orders ADD COLUMN status TEXT NOT NULL DEFAULT 'new'")
+            if "status_updated_at" not in columns:
+                await db.execute("ALTER TABLE orders ADD COLUMN status_updated_at TIMESTAMP")
+            
+            # История заказов пользователя (keyset-пагинация по времени заказа)
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_orders_user_time
+                ON orders (user_id, order_time)
+            """)
+            await db.commit()
+            
+            # Миграция: текстовая категория услуги -> categories.id
+            cursor = await db.execute("PRAGMA table_info(services)")
+            columns = [row[1] for row in await cursor.fetchall()]
+            if "category" in columns:
+                await self._migrate_service_categories(db)
+            
+            # Услуги категории по названию читаются по индексу
+            await db.execute("""
+                CREATE INDEX IF NOT EXISTS idx_services_category
+                ON services (category_id, name)
+            """)
+            
+            # Миграция: текстовый журнал действий -> коды и ссылки (до переноса в базу аналитики)
+            cursor = await db.execute("PRAGMA table_info(user_actions)")
+            columns = [row[1] for row in await cursor.fetchall()]
+            if "details" in columns:
+                await self._migrate_user_actions(db)
+            # Читаемый вид журнала теперь создается в соединении базы аналитики
+            await db.execute("DROP VIEW IF EXISTS user_actions_log")
+            
+            await db.commit()
+        
+        # Журнал действий и агрегаты воронки - в отдельном файле со своим соединением
+        await self.analytics.init_db()
+        logger.info("База данных инициализирована")
+    
+    @staticmethod
+    async def _migrate_service_categories(db):
+        """Перенос услуг на category_id одной транзакцией (повторный запуск ничего не делает)"""
+        await db.execute("BEGIN")
+        try:
+            # Подписи, которых нет среди категорий, становятся новыми категориями услуг
+            cursor = await db.execute("""
+                SELECT DISTINCT category FROM services
+                WHERE category NOT IN (SELECT name FROM categories)
+                ORDER BY category
+            """)
+            for (label,) in await cursor.fetchall():
+                await SQLiteBackend._insert_category(db, label, label)
+            
+            # SQLite не меняет тип колонки: таблица пересоздается, id и счетчик AUTOINCREMENT сохраняются
+            cursor = await db.execute("SELECT seq FROM sqlite_sequence WHERE name = 'services'")
+            row = await cursor.fetchone()
+            sequence = row[0] if row else 0
+            await db.execute(f"CREATE TABLE services_new ({SERVICES_TABLE_COLUMNS})")
+            await db.execute("""
+                INSERT INTO services_new (id, name, description, price, category_id, created_at, image)
+                SELECT s.id, s.name, s.description, s.price, c.id, s.created_at, s.image
+                FROM services s JOIN categories c ON c.name = s.category
+            """)
+            await db.execute("DROP TABLE services")
+            await db.execute("ALTER TABLE services_new RENAME TO services")
+            await db.execute(
+                "UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'services'",
+                (sequence,)
+            )
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        logger.info("Миграция: категории услуг перенесены в таблицу categories")
+    
+    @staticmethod
+    async def _migrate_user_actions(db):
+        """Перезапись журнала действий в компактный формат одной транзакцией.
+        Категории и услуги ищутся по названию; для удаленных объект остается пустым"""
+        codes = " ".join(f"WHEN '{action}' THEN {code}" for action, code in ACTION_CODES.items())
+        categories = ", ".join(f"'{action}'" for action in CATEGORY_ACTIONS)
+        services = ", ".join(f"'{action}'" for action in SERVICE_ACTIONS if action != "order_created")
+        await db.execute("BEGIN")
+        try:
+            await db.execute(f"CREATE TABLE IF NOT EXISTS usernames ({USERNAMES_TABLE_COLUMNS})")
+            await db.execute("""
+                INSERT OR IGNORE INTO usernames (username)
+                SELECT DISTINCT username FROM user_actions WHERE username IS NOT NULL
+            """)
+            await db.execute(f"CREATE TABLE user_actions_new ({USER_ACTIONS_TABLE_COLUMNS})")
+            # details заказа - "Service: <название>, Price: <цена>"
+            cursor = await db.execute(f"""
+                INSERT INTO user_actions_new (id, user_id, username_id, action, target_id, timestamp)
+                SELECT a.id, a.user_id, n.id, CASE a.action {codes} ELSE 0 END,
+                    CASE
+                        WHEN a.action IN ({categories}) THEN
+                            (SELECT id FROM categories WHERE name = a.details ORDER BY id LIMIT 1)
+                        WHEN a.action IN ({services}) THEN
+                            (SELECT id FROM services WHERE name = a.details ORDER BY id LIMIT 1)
+                        WHEN a.action = 'order_created' THEN
+                            (SELECT id FROM services
+                             WHERE substr(a.details, 1, length(name) + 18) = 'Service: ' || name || ', Price: '
+                             ORDER BY id LIMIT 1)
+                    END,
+                    COALESCE(CAST(strftime('%s', a.timestamp) AS INTEGER), 0)
+                FROM user_actions a LEFT JOIN usernames n ON n.username = a.username
+            """)
+            migrated = cursor.rowcount
+            await db.execute("DROP TABLE user_actions")
+            await db.execute("ALTER TABLE user_actions_new RENAME TO user_actions")
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+        logger.info(f"Миграция: журнал действий переведен на коды и ссылки ({migrated} записей)")
+    
+    @staticmethod
+    async def _insert_category(db, name: str, button: str) -> int:
+        """Новая категория услуг встает после остальных категорий услуг в меню"""
+        cursor = await db.execute(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM categories WHERE kind = ?",
+            (SERVICES_KIND,)
+        )
+        position = (await cursor.fetchone())[0]
+        await db.execute("UPDATE categories SET position = position + 1 WHERE position >= ?", (position,))
+        cursor = await db.execute(
+            "INSERT INTO categories (name, button, kind, position) VALUES (?, ?, ?, ?)",
+            (name, button, SERVICES_KIND, position)
+        )
+        return cursor.lastrowid or 0
+    
+    async def get_categories(self) -> List[Dict]:
+        """Категории в порядке главного меню"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(f"SELECT {CATEGORY_COLUMNS} FROM categories ORDER BY position, id")
+            return [self._row_to_category(row) for row in await cursor.fetchall()]
+    
+    async def add_category(self, name: str, button: str) -> int:
+        """Добавление категории услуг (после остальных категорий услуг в меню)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            category_id = await self._insert_category(db, name, button)
             await db.commit()
-            logger.info("База данных инициализирована")
+            return category_id
     
-    async def add_service(self, name: str, description: str, price: str, category: str) -> int:
+    async def update_category(self, category_id: int, name: str, button: str) -> bool:
+        """Переименование категории"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "UPDATE categories SET name = ?, button = ? WHERE id = ?",
+                (name, button, category_id)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+    
+    async def delete_category(self, category_id: int) -> bool:
+        """Удаление категории (только без услуг)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "DELETE FROM categories WHERE id = ? AND NOT EXISTS (SELECT 1 FROM services WHERE category_id = ?)",
+                (category_id, category_id)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+    
+    async def add_service(self, name: str, description: str, price: str, category_id: int) -> int:
         """Добавление новой услуги"""
         async with aiosqlite.connect(self.db_path) as db:
             cursor = await db.execute(
-                "INSERT INTO services (name, description, price, category) VALUES (?, ?, ?, ?)",
-                (name, description, price, category)
+                "INSERT INTO services (name, description, price, category_id) VALUES (?, ?, ?, ?)",
+                (name, description, price, category_id)
             )
             await db.commit()
             return cursor.lastrowid or 0
     
-    async def get_services_by_category(self, category: str) -> List[Dict]:
+    async def get_services_by_category(self, category_id: int) -> List[Dict]:
         """Получение услуг по категории"""
         async with aiosqlite.connect(self.db_path) as db:
             cursor = await db.execute(
-                "SELECT * FROM services WHERE category = ? ORDER BY name",
-                (category,)
+                f"SELECT {SERVICE_COLUMNS} FROM {SERVICE_FROM} WHERE s.category_id = ? ORDER BY s.name",
+                (category_id,)
             )
             rows = await cursor.fetchall()
             
-            services = []
-            for row in rows:
-                services.append({
-                    'id': row[0],
-                    'name': row[1],
-                    'description': row[2],
-                    'price': row[3],
-                    'category': row[4],
-                    'created_at': row[5]
-                })
-            return services
+            return [self._row_to_service(row) for row in rows]
     
     async def get_service_by_id(self, service_id: int) -> Optional[Dict]:
         """Получение услуги по ID"""
         async with aiosqlite.connect(self.db_path) as db:
             cursor = await db.execute(
-                "SELECT * FROM services WHERE id = ?",
+                f"SELECT {SERVICE_COLUMNS} FROM {SERVICE_FROM} WHERE s.id = ?",
                 (service_id,)
             )
             row = await cursor.fetchone()
             
             if row:
-                return {
-                    'id': row[0],
-                    'name': row[1],
-                    'description': row[2],
-                    'price': row[3],
-                    'category': row[4],
-                    'created_at': row[5]
-                }
+                return self._row_to_service(row)
             return None
     
     async def get_all_services(self) -> List[Dict]:
         """Получение всех услуг"""
         async with aiosqlite.connect(self.db_path) as db:
             cursor = await db.execute(
-                "SELECT * FROM services ORDER BY category, name"
+                f"SELECT {SERVICE_COLUMNS} FROM {SERVICE_FROM} ORDER BY c.position, s.category_id, s.name"
             )
             rows = await cursor.fetchall()
             
-            services = []
-            for row in rows:
-                services.append({
-                    'id': row[0],
-                    'name': row[1],
-                    'description': row[2],
-                    'price': row[3],
-                    'category': row[4],
-                    'created_at': row[5]
-                })
-            return services
+            return [self._row_to_service(row) for row in rows]
+    
+    async def get_catalog_version(self) -> Optional[int]:
+        """Файл базы принадлежит одному процессу: каталог меняется только через него"""
+        return None
+    
+    async def update_service(
+        self, service_id: int, name: str, description: str, price: str, category_id: int,
+        expected_version: Optional[int] = None
+    ) -> bool:
+        """Изменение услуги одной строкой: id сохраняется, версия увеличивается"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                """UPDATE services
+                   SET name = ?, description = ?, price = ?, category_id = ?, version = version + 1
+                   WHERE id = ? AND (? IS NULL OR version = ?)""",
+                (name, description, price, category_id, service_id, expected_version, expected_version)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+    
+    async def update_service_field(self, service_id: int, field: str, value, expected_version: Optional[int] = None) -> bool:
+        """Изменение одного поля услуги: одновременная правка другого поля не затирается"""
+        if field not in SERVICE_EDIT_FIELDS:
+            raise ValueError(f"Неизвестное поле услуги: {field}")
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                f"UPDATE services SET {field} = ?, version = version + 1 WHERE id = ? AND (? IS NULL OR version = ?)",
+                (value, service_id, expected_version, expected_version)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
     
     async def delete_service(self, service_id: int) -> bool:
         """Удаление услуги"""
@@ -133,26 +673,383 @@ class Database:
             await db.commit()
             return cursor.rowcount > 0
     
-    async def add_order(self, user_id: int, username: str, service_id: int, service_name: str):
-        """Добавление заказа"""
+    async def set_service_image(self, service_id: int, file_id: Optional[str]) -> bool:
+        """Установка изображения услуги (None - удалить изображение)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "UPDATE services SET image = ? WHERE id = ?",
+                (file_id, service_id)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+    
+    async def get_media_file_id(self, content_hash: str) -> Optional[str]:
+        """Получение file_id по хешу содержимого файла"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "SELECT file_id FROM media_files WHERE content_hash = ?",
+                (content_hash,)
+            )
+            row = await cursor.fetchone()
+            return row[0] if row else None
+    
+    async def save_media_file_id(self, content_hash: str, file_id: str):
+        """Сохранение file_id загруженного файла"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute(
+                "INSERT OR REPLACE INTO media_files (content_hash, file_id) VALUES (?, ?)",
+                (content_hash, file_id)
+            )
+            await db.commit()
+    
+    @staticmethod
+    def _row_to_giveaway(row) -> Dict:
+        """Преобразование строки таблицы giveaways в словарь"""
+        return {
+            'id': row[0],
+            'title': row[1],
+            'status': row[2],
+            'seed': row[3],
+            'participants_count': row[4],
+            'winners': json.loads(row[5]) if row[5] else [],
+            'created_at': row[6],
+            'finished_at': row[7]
+        }
+    
+    async def create_giveaway(self, title: str) -> int:
+        """Создание розыгрыша"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "INSERT INTO giveaways (title) VALUES (?)",
+                (title,)
+            )
+            await db.commit()
+            return cursor.lastrowid or 0
+    
+    async def get_giveaway(self, giveaway_id: int) -> Optional[Dict]:
+        """Получение розыгрыша по ID"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                f"SELECT {GIVEAWAY_COLUMNS} FROM giveaways WHERE id = ?",
+                (giveaway_id,)
+            )
+            row = await cursor.fetchone()
+            return self._row_to_giveaway(row) if row else None
+    
+    async def get_active_giveaway(self) -> Optional[Dict]:
+        """Получение текущего активного розыгрыша"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                f"SELECT {GIVEAWAY_COLUMNS} FROM giveaways WHERE status = 'active' ORDER BY id DESC LIMIT 1"
+            )
+            row = await cursor.fetchone()
+            return self._row_to_giveaway(row) if row else None
+    
+    async def finish_giveaway(self, giveaway_id: int, seed: str, participants_count: int, winners: List[Dict]):
+        """Сохранение итогов розыгрыша"""
         async with aiosqlite.connect(self.db_path) as db:
             await db.execute(
+                """UPDATE giveaways
+                   SET status = 'finished', seed = ?, participants_count = ?, winners = ?,
+                       finished_at = CURRENT_TIMESTAMP
+                   WHERE id = ?""",
+                (seed, participants_count, json.dumps(winners, ensure_ascii=False), giveaway_id)
+            )
+            await db.commit()
+    
+    async def add_giveaway_participants(self, participants: List[tuple]) -> int:
+        """Пакетное добавление участников (giveaway_id, user_id, username); повторы игнорируются"""
+        async with aiosqlite.connect(self.db_path) as db:
+            before = db.total_changes
+            await db.executemany(
+                "INSERT OR IGNORE INTO giveaway_participants (giveaway_id, user_id, username) VALUES (?, ?, ?)",
+                participants
+            )
+            await db.commit()
+            return db.total_changes - before
+    
+    async def is_giveaway_participant(self, giveaway_id: int, user_id: int) -> bool:
+        """Проверка участия пользователя в розыгрыше"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "SELECT 1 FROM giveaway_participants WHERE giveaway_id = ? AND user_id = ?",
+                (giveaway_id, user_id)
+            )
+            return await cursor.fetchone() is not None
+    
+    async def count_giveaway_participants(self, giveaway_id: int) -> int:
+        """Количество участников розыгрыша"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "SELECT COUNT(*) FROM giveaway_participants WHERE giveaway_id = ?",
+                (giveaway_id,)
+            )
+            row = await cursor.fetchone()
+            return row[0] if row else 0
+    
+    async def iter_giveaway_participants(self, giveaway_id: int, batch_size: int = 1000) -> AsyncIterator[tuple]:
+        """Потоковое чтение участников (user_id, username) в порядке вступления"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "SELECT user_id, username FROM giveaway_participants WHERE giveaway_id = ? ORDER BY id",
+                (giveaway_id,)
+            )
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+    
+    @staticmethod
+    def _row_to_scheduled_post(row) -> Dict:
+        """Преобразование строки таблицы scheduled_posts в словарь"""
+        return {
+            'id': row[0],
+            'channel_id': row[1],
+            'text': row[2],
+            'photo': row[3],
+            'publish_at': row[4],
+            'status': row[5],
+            'attempts': row[6],
+            'error': row[7],
+            'created_at': row[8],
+            'finished_at': row[9]
+        }
+    
+    async def add_scheduled_post(self, channel_id: str, text: Optional[str], photo: Optional[str], publish_at: str) -> int:
+        """Добавление отложенного поста"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "INSERT INTO scheduled_posts (channel_id, text, photo, publish_at) VALUES (?, ?, ?, ?)",
+                (channel_id, text, photo, publish_at)
+            )
+            await db.commit()
+            return cursor.lastrowid or 0
+    
+    async def get_scheduled_post(self, post_id: int) -> Optional[Dict]:
+        """Отложенный пост по ID"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                f"SELECT {SCHEDULED_POST_COLUMNS} FROM scheduled_posts WHERE id = ?",
+                (post_id,)
+            )
+            row = await cursor.fetchone()
+            return self._row_to_scheduled_post(row) if row else None
+    
+    async def get_pending_posts(self) -> List[Dict]:
+        """Неопубликованные посты по времени публикации"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                f"SELECT {SCHEDULED_POST_COLUMNS} FROM scheduled_posts WHERE status = 'pending' ORDER BY publish_at, id"
+            )
+            return [self._row_to_scheduled_post(row) for row in await cursor.fetchall()]
+    
+    async def update_scheduled_post(self, post_id: int, text: Optional[str], photo: Optional[str], publish_at: str) -> bool:
+        """Изменение неопубликованного поста"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "UPDATE scheduled_posts SET text = ?, photo = ?, publish_at = ? WHERE id = ? AND status = 'pending'",
+                (text, photo, publish_at, post_id)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+    
+    async def cancel_scheduled_post(self, post_id: int) -> bool:
+        """Отмена неопубликованного поста"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                """UPDATE scheduled_posts SET status = 'cancelled', finished_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND status = 'pending'""",
+                (post_id,)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+    
+    async def claim_scheduled_post(self, post_id: int, now: str) -> Optional[Dict]:
+        """Захват поста для публикации: pending -> sending, если время наступило"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "UPDATE scheduled_posts SET status = 'sending' WHERE id = ? AND status = 'pending' AND publish_at <= ?",
+                (post_id, now)
+            )
+            await db.commit()
+            if cursor.rowcount == 0:
+                return None
+            cursor = await db.execute(
+                f"SELECT {SCHEDULED_POST_COLUMNS} FROM scheduled_posts WHERE id = ?",
+                (post_id,)
+            )
+            row = await cursor.fetchone()
+            return self._row_to_scheduled_post(row) if row else None
+    
+    async def release_scheduled_post(self, post_id: int) -> bool:
+        """Возврат захваченного поста в очередь"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "UPDATE scheduled_posts SET status = 'pending' WHERE id = ? AND status = 'sending'",
+                (post_id,)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+    
+    async def finish_scheduled_post(self, post_id: int, status: str, attempts: int, error: Optional[str] = None) -> bool:
+        """Итог публикации (пост, отмененный во время отправки, не меняется)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                """UPDATE scheduled_posts
+                   SET status = ?, attempts = ?, error = ?, finished_at = CURRENT_TIMESTAMP
+                   WHERE id = ? AND status IN ('pending', 'sending')""",
+                (status, attempts, error, post_id)
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+    
+    async def add_order(self, user_id: int, username: str, service_id: int, service_name: str) -> int:
+        """Добавление заказа"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
                 "INSERT INTO orders (user_id, username, service_id, service_name) VALUES (?, ?, ?, ?)",
                 (user_id, username, service_id, service_name)
             )
             await db.commit()
+            return cursor.lastrowid or 0
+    
+    @staticmethod
+    def _row_to_order(row) -> Dict:
+        """Преобразование строки таблицы orders в словарь"""
+        return {
+            'id': row[0],
+            'user_id': row[1],
+            'username': row[2],
+            'service_id': row[3],
+            'service_name': row[4],
+            'order_time': row[5],
+            'status': row[6],
+            'status_updated_at': row[7]
+        }
     
-    async def log_user_action(self, user_id: int, username: str, action: str, details: str = ""):
-        """Логирование действий пользователя"""
+    async def get_order(self, order_id: int) -> Optional[Dict]:
+        """Получение заказа по ID"""
         async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT INTO user_actions (user_id, username, action, details) VALUES (?, ?, ?, ?)",
-                (user_id, username, action, details)
+            cursor = await db.execute(
+                f"SELECT {ORDER_COLUMNS} FROM orders WHERE id = ?",
+                (order_id,)
+            )
+            row = await cursor.fetchone()
+            return self._row_to_order(row) if row else None
+    
+    async def get_user_orders(self, user_id: int, before_id: Optional[int] = None, limit: int = 5) -> List[Dict]:
+        """Заказы пользователя от новых к старым; before_id - последний заказ предыдущей страницы"""
+        async with aiosqlite.connect(self.db_path) as db:
+            if before_id:
+                cursor = await db.execute(
+                    f"""SELECT {ORDER_COLUMNS} FROM orders
+                        WHERE user_id = ?
+                          AND (order_time, id) < (SELECT order_time, id FROM orders WHERE id = ?)
+                        ORDER BY order_time DESC, id DESC
+                        LIMIT ?""",
+                    (user_id, before_id, limit)
+                )
+            else:
+                cursor = await db.execute(
+                    f"""SELECT {ORDER_COLUMNS} FROM orders
+                        WHERE user_id = ?
+                        ORDER BY order_time DESC, id DESC
+                        LIMIT ?""",
+                    (user_id, limit)
+                )
+            rows = await cursor.fetchall()
+            return [self._row_to_order(row) for row in rows]
+    
+    async def update_order_status(self, order_id: int, status: str, expected_status: Optional[str] = None) -> bool:
+        """Изменение статуса заказа. С expected_status запись не проходит, если статус успели изменить"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute(
+                "UPDATE orders SET status = ?, status_updated_at = CURRENT_TIMESTAMP "
+                "WHERE id = ? AND (? IS NULL OR status = ?)",
+                (status, order_id, expected_status, expected_status)
             )
             await db.commit()
+            return cursor.rowcount > 0
+    
+    async def count_orders(self) -> int:
+        """Общее количество заказов"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("SELECT COUNT(*) FROM orders")
+            row = await cursor.fetchone()
+            return row[0] if row else 0
+    
+    async def upsert_service_stats(self, rows: List[Tuple[str, int, str, int, bytes]], merge: Callable[[Optional[bytes], bytes], bytes]):
+        """Прибавление счетчиков и объединение уникальных одной транзакцией"""
+        await self.analytics.upsert_service_stats(rows, merge)
+    
+    async def get_service_stats(self, since_day: str) -> List[Tuple]:
+        """Агрегаты воронки начиная с дня since_day (YYYY-MM-DD)"""
+        return await self.analytics.get_service_stats(since_day)
+    
+    async def log_user_action(self, user_id: int, username: str, action: str, target_id: Optional[int] = None):
+        """Логирование действия пользователя: запись в базу аналитики в фоне"""
+        self.analytics.log_user_action(user_id, username, action, target_id)
+    
+    async def get_user_actions(self, limit: int = 50, user_id: Optional[int] = None) -> List[Dict]:
+        """Последние действия в читаемом виде (новые первыми)"""
+        return await self.analytics.get_user_actions(limit, user_id)
+    
+    async def probe_read(self):
+        """Проверочное чтение (/health)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            cursor = await db.execute("SELECT id FROM services LIMIT 1")
+            await cursor.fetchone()
+    
+    async def probe_write(self):
+        """Проверочная запись с фиксацией транзакции (/health)"""
+        async with aiosqlite.connect(self.db_path) as db:
+            await db.execute("INSERT OR REPLACE INTO health_probe (id, checked_at) VALUES (1, CURRENT_TIMESTAMP)")
+            await db.commit()
+    
+    async def close(self):
+        """Запись очереди аналитики и закрытие ее соединения"""
+        if self._analytics is not None:
+            await self._analytics.close()
+
+class Database:
+    """Доступ к данным бота: все вызовы передаются выбранному хранилищу"""
+    
+    def __init__(self, backend: Optional[StorageBackend] = None):
+        self.backend = backend or SQLiteBackend()
+    
+    def use(self, backend: StorageBackend):
+        """Смена хранилища (до инициализации базы при запуске)"""
+        self.backend = backend
+        logger.info(f"Хранилище данных: {backend.name}")
+    
+    @property
+    def db_path(self) -> Optional[str]:
+        """Путь к файлу базы (только для SQLite)"""
+        return getattr(self.backend, "db_path", None)
+    
+    @db_path.setter
+    def db_path(self, value: str):
+        self.backend.db_path = value
+    
+    def __getattr__(self, name: str):
+        return getattr(self.backend, name)
+
+def create_backend(config) -> StorageBackend:
+    """Хранилище по настройке STORAGE_BACKEND"""
+    if config.STORAGE_BACKEND == "sqlite":
+        return SQLiteBackend(config.DATABASE_PATH, config.ANALYTICS_DATABASE_PATH or None, config.ANALYTICS_CHECKPOINT_INTERVAL)
+    if config.STORAGE_BACKEND == "memory":
+        from database_memory import MemoryBackend
+        return MemoryBackend()
+    if config.STORAGE_BACKEND == "postgres":
+        from database_postgres import PostgresBackend
+        return PostgresBackend(config.DATABASE_URL, config.DATABASE_POOL_MIN, config.DATABASE_POOL_MAX)
+    raise ValueError(f"Неизвестное хранилище STORAGE_BACKEND={config.STORAGE_BACKEND}")
 
-# Глобальный экземпляр базы данных
-db = Database()
+# Глобальный экземпляр базы данных (у каждого бота процесса свой)
+db = PerBot(lambda name: Database())
 
 async def init_db():
     """Инициализация базы данных"""
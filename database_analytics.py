@@ -0,0 +1,314 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import aiosqlite
+
+from database import (
+    ACTION_CODES, CATEGORY_ACTIONS, SERVICE_ACTIONS, USER_ACTION_COLUMNS, USER_ACTIONS_TABLE_COLUMNS,
+    USERNAMES_TABLE_COLUMNS, action_codes_sql, action_name_sql
+)
+
+logger = logging.getLogger(__name__)
+
+# Таблицы аналитики и их колонки: при первом запуске переносятся из основной базы
+ANALYTICS_TABLES = {
+    "usernames": "id, username",
+    "user_actions": "id, user_id, username_id, action, target_id, timestamp",
+    "service_stats": "day, service_id, event, count, uniques"
+}
+
+# Фоновая запись: действия копятся в памяти и пишутся пачками раз в FLUSH_INTERVAL секунд
+FLUSH_INTERVAL = 1.0
+BATCH_SIZE = 500
+# Если база аналитики недоступна, очередь не растет бесконечно: старые действия отбрасываются
+QUEUE_LIMIT = 100_000
+
+CHECKPOINT_INTERVAL = 300.0
+# Страховка на случай остановки фоновой записи: автоматическая контрольная точка после ~40 МБ WAL
+AUTOCHECKPOINT_PAGES = 10_000
+
+def analytics_path(db_path: str) -> str:
+    """Файл аналитики рядом с основной базой: phoenix_bot.db -> phoenix_bot.analytics.db"""
+    root, ext = os.path.splitext(db_path)
+    return f"{root}.analytics{ext}"
+
+def _uri(path: str, read_only: bool = False) -> str:
+    uri = Path(path).absolute().as_uri()
+    return f"{uri}?mode=ro" if read_only else uri
+
+class AnalyticsDatabase:
+    """Отдельная база SQLite для журнала действий и агрегатов воронки.
+    Обработчики не ждут записи: действия пишет фоновая задача пачками через свое соединение,
+    контрольные точки WAL выполняются по расписанию. Основная база подключается
+    только на чтение (ATTACH как catalog) для отчетов с названиями категорий и услуг"""
+
+    def __init__(self, path: str, catalog_path: str, checkpoint_interval: float = CHECKPOINT_INTERVAL):
+        self.path = path
+        self.catalog_path = catalog_path
+        self.flush_interval = FLUSH_INTERVAL
+        self.checkpoint_interval = checkpoint_interval
+        self.dropped = 0
+        # (user_id, username, код действия, target_id, unix-время)
+        self._pending: List[tuple] = []
+        self._conn: Optional[aiosqlite.Connection] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._writing: Optional[asyncio.Future] = None
+        self._last_checkpoint = time.monotonic()
+        self._unchecked_writes = 0
+
+    @property
+    def pending_count(self) -> int:
+        """Действия, еще не записанные в базу"""
+        return len(self._pending)
+
+    async def init_db(self):
+        """Схема базы аналитики и перенос таблиц аналитики из основной базы"""
+        async with aiosqlite.connect(self.path) as conn:
+            # Режим WAL сохраняется в файле: чтение отчетов не блокирует запись
+            await conn.execute("PRAGMA journal_mode = WAL")
+            await conn.execute(f"CREATE TABLE IF NOT EXISTS usernames ({USERNAMES_TABLE_COLUMNS})")
+            await conn.execute(f"CREATE TABLE IF NOT EXISTS user_actions ({USER_ACTIONS_TABLE_COLUMNS})")
+            # Агрегаты воронки по услугам и дням (уникальные - сжатый HyperLogLog)
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS service_stats (
+                    day TEXT NOT NULL,
+                    service_id INTEGER NOT NULL,
+                    event TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    uniques BLOB,
+                    PRIMARY KEY (day, service_id, event)
+                ) WITHOUT ROWID
+            """)
+            await conn.commit()
+            await self._move_from_catalog(conn)
+
+    async def _move_from_catalog(self, conn):
+        """Перенос таблиц аналитики из основной базы (повторный запуск ничего не делает).
+        Строки копируются с теми же ключами, поэтому прерванный перенос можно повторить"""
+        await conn.execute("ATTACH DATABASE ? AS catalog", (self.catalog_path,))
+        try:
+            cursor = await conn.execute("SELECT name FROM catalog.sqlite_master WHERE type = 'table'")
+            existing = {row[0] for row in await cursor.fetchall()}
+            tables = [table for table in ANALYTICS_TABLES if table in existing]
+            if not tables:
+                return
+            await conn.execute("BEGIN")
+            try:
+                for table in tables:
+                    columns = ANALYTICS_TABLES[table]
+                    await conn.execute(
+                        f"INSERT OR IGNORE INTO main.{table} ({columns}) SELECT {columns} FROM catalog.{table}"
+                    )
+                    await conn.execute(f"DROP TABLE catalog.{table}")
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                raise
+            logger.info(f"Миграция: таблицы аналитики ({', '.join(tables)}) перенесены в {self.path}")
+        finally:
+            await conn.execute("DETACH DATABASE catalog")
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(_uri(self.path), uri=True)
+        try:
+            # Потеря последних пачек при сбое питания допустима, fsync на каждую транзакцию - нет
+            await conn.execute("PRAGMA synchronous = NORMAL")
+            await conn.execute(f"PRAGMA wal_autocheckpoint = {AUTOCHECKPOINT_PAGES}")
+            await conn.execute("ATTACH DATABASE ? AS catalog", (_uri(self.catalog_path, read_only=True),))
+            # Названия категорий и услуг для отчетов копируются из основной базы перед отчетом:
+            # долгий отчет не держит блокировку основной базы, в которую пишутся заказы
+            await conn.execute("CREATE TEMP TABLE report_categories (id INTEGER PRIMARY KEY, name TEXT)")
+            await conn.execute("CREATE TEMP TABLE report_services (id INTEGER PRIMARY KEY, name TEXT, price TEXT)")
+            # Читаемый вид журнала живет в соединении: постоянное представление не может ссылаться на другую базу
+            await conn.execute(f"""
+                CREATE TEMP VIEW user_actions_log AS
+                SELECT a.id, a.user_id, n.username, {action_name_sql("a.action")} AS action,
+                    COALESCE(CASE
+                        WHEN a.action = {ACTION_CODES["order_created"]} THEN 'Service: ' || s.name || ', Price: ' || s.price
+                        ELSE COALESCE(c.name, s.name)
+                    END, '') AS details,
+                    datetime(a.timestamp, 'unixepoch') AS timestamp
+                FROM main.user_actions a
+                LEFT JOIN main.usernames n ON n.id = a.username_id
+                LEFT JOIN report_categories c ON a.action IN ({action_codes_sql(CATEGORY_ACTIONS)}) AND c.id = a.target_id
+                LEFT JOIN report_services s ON a.action IN ({action_codes_sql(SERVICE_ACTIONS)}) AND s.id = a.target_id
+            """)
+        except Exception:
+            await conn.close()
+            raise
+        return conn
+
+    @staticmethod
+    async def _refresh_catalog(conn):
+        """Копия названий категорий и услуг из основной базы (короткое чтение через ATTACH)"""
+        await conn.execute("DELETE FROM report_categories")
+        await conn.execute("DELETE FROM report_services")
+        await conn.execute("INSERT INTO report_categories (id, name) SELECT id, name FROM catalog.categories")
+        await conn.execute("INSERT INTO report_services (id, name, price) SELECT id, name, price FROM catalog.services")
+        await conn.commit()
+
+    @asynccontextmanager
+    async def _connection(self) -> AsyncIterator[aiosqlite.Connection]:
+        """Единственное соединение базы аналитики; транзакции не перемежаются"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._conn is None:
+                self._conn = await self._connect()
+            yield self._conn
+
+    def log_user_action(self, user_id: int, username: str, action: str, target_id: Optional[int] = None):
+        """Постановка действия в очередь фоновой записи (без ожидания базы)"""
+        if len(self._pending) >= QUEUE_LIMIT:
+            del self._pending[:BATCH_SIZE]
+            self.dropped += BATCH_SIZE
+            logger.warning(f"Очередь аналитики переполнена: отброшено {self.dropped} действий")
+        self._pending.append((user_id, username, ACTION_CODES.get(action, 0), target_id, int(time.time())))
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._writer())
+        self._wakeup.set()
+
+    async def _writer(self):
+        while True:
+            await self._wakeup.wait()
+            # Пауза собирает действия за интервал в одну транзакцию
+            await asyncio.sleep(self.flush_interval)
+            self._wakeup.clear()
+            # Остановка не прерывает начатую транзакцию: close дождется ее завершения
+            self._writing = asyncio.ensure_future(self._write_pending())
+            await asyncio.shield(self._writing)
+
+    async def _write_pending(self):
+        try:
+            await self.flush()
+            await self._checkpoint_if_due()
+        except Exception as e:
+            logger.error(f"Ошибка записи аналитики: {e}")
+
+    async def flush(self):
+        """Запись очереди действий транзакциями по BATCH_SIZE"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        written = 0
+        try:
+            async with self._connection() as conn:
+                while written < len(batch):
+                    chunk = batch[written:written + BATCH_SIZE]
+                    # Имя пользователя записывается один раз, дальше только находится по индексу
+                    await conn.executemany(
+                        "INSERT OR IGNORE INTO usernames (username) VALUES (?)",
+                        [(username,) for username in dict.fromkeys(row[1] for row in chunk)]
+                    )
+                    await conn.executemany(
+                        """INSERT INTO user_actions (user_id, username_id, action, target_id, timestamp)
+                           VALUES (?, (SELECT id FROM usernames WHERE username = ?), ?, ?, ?)""",
+                        chunk
+                    )
+                    await conn.commit()
+                    written += len(chunk)
+                    self._unchecked_writes += len(chunk)
+        except Exception:
+            # Незаписанные действия возвращаются в начало очереди
+            self._pending[:0] = batch[written:]
+            raise
+
+    async def _checkpoint_if_due(self):
+        if not self._unchecked_writes or time.monotonic() - self._last_checkpoint < self.checkpoint_interval:
+            return
+        await self.checkpoint()
+
+    async def checkpoint(self):
+        """Перенос WAL в файл базы и усечение журнала"""
+        async with self._connection() as conn:
+            await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._last_checkpoint = time.monotonic()
+        self._unchecked_writes = 0
+
+    async def get_user_actions(self, limit: int = 50, user_id: Optional[int] = None) -> List[Dict]:
+        """Последние действия в читаемом виде (новые первыми), включая еще не записанные"""
+        await self.flush()
+        query = f"SELECT {USER_ACTION_COLUMNS} FROM user_actions_log"
+        params: tuple = ()
+        if user_id is not None:
+            query += " WHERE user_id = ?"
+            params = (user_id,)
+        async with self._connection() as conn:
+            await self._refresh_catalog(conn)
+            cursor = await conn.execute(query + " ORDER BY id DESC LIMIT ?", params + (limit,))
+            return [self._row_to_user_action(row) for row in await cursor.fetchall()]
+
+    @staticmethod
+    def _row_to_user_action(row) -> Dict:
+        """Преобразование строки представления user_actions_log в словарь"""
+        return {
+            'id': row[0],
+            'user_id': row[1],
+            'username': row[2],
+            'action': row[3],
+            'details': row[4],
+            'timestamp': row[5]
+        }
+
+    async def upsert_service_stats(self, rows: List[Tuple[str, int, str, int, bytes]], merge: Callable[[Optional[bytes], bytes], bytes]):
+        """Прибавление счетчиков и объединение уникальных одной транзакцией"""
+        async with self._connection() as conn:
+            # Чтение и запись идут под блокировкой единственного соединения
+            stored = {}
+            for day in {row[0] for row in rows}:
+                cursor = await conn.execute(
+                    "SELECT service_id, event, uniques FROM service_stats WHERE day = ?",
+                    (day,)
+                )
+                for service_id, event, uniques in await cursor.fetchall():
+                    stored[(day, service_id, event)] = uniques
+            await conn.executemany(
+                """INSERT INTO service_stats (day, service_id, event, count, uniques)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (day, service_id, event)
+                   DO UPDATE SET count = count + excluded.count, uniques = excluded.uniques""",
+                [
+                    (day, service_id, event, count, merge(stored.get((day, service_id, event)), uniques))
+                    for day, service_id, event, count, uniques in rows
+                ]
+            )
+            await conn.commit()
+        self._unchecked_writes += len(rows)
+
+    async def get_service_stats(self, since_day: str) -> List[Tuple]:
+        """Агрегаты воронки начиная с дня since_day (YYYY-MM-DD)"""
+        async with self._connection() as conn:
+            cursor = await conn.execute(
+                "SELECT day, service_id, event, count, uniques FROM service_stats WHERE day >= ?",
+                (since_day,)
+            )
+            return await cursor.fetchall()
+
+    async def close(self):
+        """Остановка фоновой записи с записью очереди, контрольная точка и закрытие соединения"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._writing is not None:
+            await self._writing
+            self._writing = None
+        try:
+            await self.flush()
+            if self._unchecked_writes:
+                await self.checkpoint()
+        finally:
+            if self._conn is not None:
+                await self._conn.close()
+                self._conn = None
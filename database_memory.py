@@ -0,0 +1,361 @@
+from datetime import datetime, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from config import DEFAULT_CATEGORIES, SERVICES_KIND
+from database import ACTION_CODES, CATEGORY_ACTIONS, SERVICE_ACTIONS, SERVICE_EDIT_FIELDS, StorageBackend
+
+def _now() -> str:
+    # Тот же формат, что у CURRENT_TIMESTAMP в SQLite (UTC)
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+class MemoryBackend(StorageBackend):
+    """Хранилище в памяти процесса: для тестов, бенчмарков и воспроизведения"""
+
+    name = "memory"
+
+    def __init__(self):
+        self.categories: Dict[int, Dict] = {}
+        self.services: Dict[int, Dict] = {}
+        self.orders: Dict[int, Dict] = {}
+        self.giveaways: Dict[int, Dict] = {}
+        # giveaway_id -> {user_id: username} в порядке вступления
+        self.participants: Dict[int, Dict[int, str]] = {}
+        self.media_files: Dict[str, str] = {}
+        self.scheduled_posts: Dict[int, Dict] = {}
+        self.service_stats: Dict[Tuple[str, int, str], list] = {}
+        # (id, user_id, username_id, код действия, target_id, unix-время), как в SQLite
+        self.user_actions: List[tuple] = []
+        self.usernames: Dict[str, int] = {}
+        self._ids: Dict[str, int] = {}
+
+    def _next_id(self, table: str) -> int:
+        # Как AUTOINCREMENT: id не переиспользуются после удаления
+        self._ids[table] = self._ids.get(table, 0) + 1
+        return self._ids[table]
+
+    async def init_db(self):
+        if not self.categories:
+            for position, category in enumerate(DEFAULT_CATEGORIES):
+                category_id = self._next_id("categories")
+                self.categories[category_id] = dict(category, id=category_id, position=position)
+
+    def _ordered_categories(self) -> List[Dict]:
+        return sorted(self.categories.values(), key=lambda category: (category['position'], category['id']))
+
+    def _service(self, service: Dict) -> Dict:
+        # Название категории подставляется при чтении, как JOIN в SQLite
+        category = self.categories.get(service['category_id'])
+        return dict(service, category=category['name'] if category else None)
+
+    def _category_position(self, service: Dict) -> tuple:
+        category = self.categories.get(service['category_id'])
+        return (category['position'] if category else -1, service['category_id'], service['name'])
+
+    async def get_categories(self) -> List[Dict]:
+        return [dict(category) for category in self._ordered_categories()]
+
+    async def add_category(self, name: str, button: str) -> int:
+        positions = [category['position'] for category in self.categories.values() if category['kind'] == SERVICES_KIND]
+        position = max(positions) + 1 if positions else 0
+        for category in self.categories.values():
+            if category['position'] >= position:
+                category['position'] += 1
+        category_id = self._next_id("categories")
+        self.categories[category_id] = {
+            'id': category_id,
+            'key': None,
+            'name': name,
+            'button': button,
+            'kind': SERVICES_KIND,
+            'position': position,
+            'wide': False
+        }
+        return category_id
+
+    async def update_category(self, category_id: int, name: str, button: str) -> bool:
+        category = self.categories.get(category_id)
+        if category is None:
+            return False
+        category.update(name=name, button=button)
+        return True
+
+    async def delete_category(self, category_id: int) -> bool:
+        if any(service['category_id'] == category_id for service in self.services.values()):
+            return False
+        return self.categories.pop(category_id, None) is not None
+
+    async def add_service(self, name: str, description: str, price: str, category_id: int) -> int:
+        service_id = self._next_id("services")
+        self.services[service_id] = {
+            'id': service_id,
+            'name': name,
+            'description': description,
+            'price': price,
+            'category_id': category_id,
+            'created_at': _now(),
+            'image': None,
+            'version': 1
+        }
+        return service_id
+
+    async def get_services_by_category(self, category_id: int) -> List[Dict]:
+        services = [self._service(service) for service in self.services.values() if service['category_id'] == category_id]
+        return sorted(services, key=lambda service: service['name'])
+
+    async def get_service_by_id(self, service_id: int) -> Optional[Dict]:
+        service = self.services.get(service_id)
+        return self._service(service) if service else None
+
+    async def get_all_services(self) -> List[Dict]:
+        services = sorted(self.services.values(), key=self._category_position)
+        return [self._service(service) for service in services]
+
+    async def get_catalog_version(self) -> Optional[int]:
+        return None
+
+    async def update_service(
+        self, service_id: int, name: str, description: str, price: str, category_id: int,
+        expected_version: Optional[int] = None
+    ) -> bool:
+        service = self.services.get(service_id)
+        if service is None or (expected_version is not None and service['version'] != expected_version):
+            return False
+        service.update(name=name, description=description, price=price, category_id=category_id, version=service['version'] + 1)
+        return True
+
+    async def update_service_field(self, service_id: int, field: str, value, expected_version: Optional[int] = None) -> bool:
+        if field not in SERVICE_EDIT_FIELDS:
+            raise ValueError(f"Неизвестное поле услуги: {field}")
+        service = self.services.get(service_id)
+        if service is None or (expected_version is not None and service['version'] != expected_version):
+            return False
+        service[field] = value
+        service['version'] += 1
+        return True
+
+    async def delete_service(self, service_id: int) -> bool:
+        return self.services.pop(service_id, None) is not None
+
+    async def set_service_image(self, service_id: int, file_id: Optional[str]) -> bool:
+        service = self.services.get(service_id)
+        if service is None:
+            return False
+        service['image'] = file_id
+        return True
+
+    async def get_media_file_id(self, content_hash: str) -> Optional[str]:
+        return self.media_files.get(content_hash)
+
+    async def save_media_file_id(self, content_hash: str, file_id: str):
+        self.media_files[content_hash] = file_id
+
+    async def create_giveaway(self, title: str) -> int:
+        giveaway_id = self._next_id("giveaways")
+        self.giveaways[giveaway_id] = {
+            'id': giveaway_id,
+            'title': title,
+            'status': 'active',
+            'seed': None,
+            'participants_count': None,
+            'winners': [],
+            'created_at': _now(),
+            'finished_at': None
+        }
+        return giveaway_id
+
+    async def get_giveaway(self, giveaway_id: int) -> Optional[Dict]:
+        giveaway = self.giveaways.get(giveaway_id)
+        return dict(giveaway, winners=list(giveaway['winners'])) if giveaway else None
+
+    async def get_active_giveaway(self) -> Optional[Dict]:
+        active = [giveaway_id for giveaway_id, giveaway in self.giveaways.items() if giveaway['status'] == 'active']
+        return await self.get_giveaway(max(active)) if active else None
+
+    async def finish_giveaway(self, giveaway_id: int, seed: str, participants_count: int, winners: List[Dict]):
+        giveaway = self.giveaways.get(giveaway_id)
+        if giveaway is not None:
+            giveaway.update({
+                'status': 'finished',
+                'seed': seed,
+                'participants_count': participants_count,
+                'winners': [dict(winner) for winner in winners],
+                'finished_at': _now()
+            })
+
+    async def add_giveaway_participants(self, participants: List[tuple]) -> int:
+        added = 0
+        for giveaway_id, user_id, username in participants:
+            joined = self.participants.setdefault(giveaway_id, {})
+            if user_id not in joined:
+                joined[user_id] = username
+                added += 1
+        return added
+
+    async def is_giveaway_participant(self, giveaway_id: int, user_id: int) -> bool:
+        return user_id in self.participants.get(giveaway_id, {})
+
+    async def count_giveaway_participants(self, giveaway_id: int) -> int:
+        return len(self.participants.get(giveaway_id, {}))
+
+    async def iter_giveaway_participants(self, giveaway_id: int, batch_size: int = 1000) -> AsyncIterator[tuple]:
+        for user_id, username in list(self.participants.get(giveaway_id, {}).items()):
+            yield (user_id, username)
+
+    async def add_scheduled_post(self, channel_id: str, text: Optional[str], photo: Optional[str], publish_at: str) -> int:
+        post_id = self._next_id("scheduled_posts")
+        self.scheduled_posts[post_id] = {
+            'id': post_id,
+            'channel_id': channel_id,
+            'text': text,
+            'photo': photo,
+            'publish_at': publish_at,
+            'status': 'pending',
+            'attempts': 0,
+            'error': None,
+            'created_at': _now(),
+            'finished_at': None
+        }
+        return post_id
+
+    async def get_scheduled_post(self, post_id: int) -> Optional[Dict]:
+        post = self.scheduled_posts.get(post_id)
+        return dict(post) if post else None
+
+    async def get_pending_posts(self) -> List[Dict]:
+        posts = [post for post in self.scheduled_posts.values() if post['status'] == 'pending']
+        posts.sort(key=lambda post: (post['publish_at'], post['id']))
+        return [dict(post) for post in posts]
+
+    def _pending_post(self, post_id: int) -> Optional[Dict]:
+        post = self.scheduled_posts.get(post_id)
+        return post if post is not None and post['status'] == 'pending' else None
+
+    async def update_scheduled_post(self, post_id: int, text: Optional[str], photo: Optional[str], publish_at: str) -> bool:
+        post = self._pending_post(post_id)
+        if post is None:
+            return False
+        post.update(text=text, photo=photo, publish_at=publish_at)
+        return True
+
+    async def cancel_scheduled_post(self, post_id: int) -> bool:
+        post = self._pending_post(post_id)
+        if post is None:
+            return False
+        post.update(status='cancelled', finished_at=_now())
+        return True
+
+    async def claim_scheduled_post(self, post_id: int, now: str) -> Optional[Dict]:
+        post = self._pending_post(post_id)
+        if post is None or post['publish_at'] > now:
+            return None
+        post['status'] = 'sending'
+        return dict(post)
+
+    async def release_scheduled_post(self, post_id: int) -> bool:
+        post = self.scheduled_posts.get(post_id)
+        if post is None or post['status'] != 'sending':
+            return False
+        post['status'] = 'pending'
+        return True
+
+    async def finish_scheduled_post(self, post_id: int, status: str, attempts: int, error: Optional[str] = None) -> bool:
+        post = self.scheduled_posts.get(post_id)
+        if post is None or post['status'] not in ('pending', 'sending'):
+            return False
+        post.update(status=status, attempts=attempts, error=error, finished_at=_now())
+        return True
+
+    async def add_order(self, user_id: int, username: str, service_id: int, service_name: str) -> int:
+        order_id = self._next_id("orders")
+        self.orders[order_id] = {
+            'id': order_id,
+            'user_id': user_id,
+            'username': username,
+            'service_id': service_id,
+            'service_name': service_name,
+            'order_time': _now(),
+            'status': 'new',
+            'status_updated_at': None
+        }
+        return order_id
+
+    async def get_order(self, order_id: int) -> Optional[Dict]:
+        order = self.orders.get(order_id)
+        return dict(order) if order else None
+
+    async def get_user_orders(self, user_id: int, before_id: Optional[int] = None, limit: int = 5) -> List[Dict]:
+        orders = [order for order in self.orders.values() if order['user_id'] == user_id]
+        if before_id:
+            cursor = self.orders.get(before_id)
+            if cursor is None:
+                return []
+            position = (cursor['order_time'], cursor['id'])
+            orders = [order for order in orders if (order['order_time'], order['id']) < position]
+        orders.sort(key=lambda order: (order['order_time'], order['id']), reverse=True)
+        return [dict(order) for order in orders[:limit]]
+
+    async def update_order_status(self, order_id: int, status: str, expected_status: Optional[str] = None) -> bool:
+        order = self.orders.get(order_id)
+        if order is None or (expected_status is not None and order['status'] != expected_status):
+            return False
+        order['status'] = status
+        order['status_updated_at'] = _now()
+        return True
+
+    async def count_orders(self) -> int:
+        return len(self.orders)
+
+    async def upsert_service_stats(self, rows: List[Tuple[str, int, str, int, bytes]], merge: Callable[[Optional[bytes], bytes], bytes]):
+        for day, service_id, event, count, uniques in rows:
+            entry = self.service_stats.setdefault((day, service_id, event), [0, None])
+            entry[0] += count
+            entry[1] = merge(entry[1], uniques)
+
+    async def get_service_stats(self, since_day: str) -> List[Tuple]:
+        return [
+            (day, service_id, event, count, uniques)
+            for (day, service_id, event), (count, uniques) in sorted(self.service_stats.items())
+            if day >= since_day
+        ]
+
+    async def log_user_action(self, user_id: int, username: str, action: str, target_id: Optional[int] = None):
+        username_id = self.usernames.get(username)
+        if username_id is None:
+            username_id = self.usernames[username] = len(self.usernames) + 1
+        self.user_actions.append((
+            self._next_id("user_actions"), user_id, username_id, ACTION_CODES.get(action, 0), target_id,
+            int(datetime.now(timezone.utc).timestamp())
+        ))
+    
+    async def get_user_actions(self, limit: int = 50, user_id: Optional[int] = None) -> List[Dict]:
+        # Расшифровка как в представлении user_actions_log
+        names = {username_id: username for username, username_id in self.usernames.items()}
+        actions = {code: action for action, code in ACTION_CODES.items()}
+        result = []
+        for action_id, action_user_id, username_id, code, target_id, timestamp in reversed(self.user_actions):
+            if user_id is not None and action_user_id != user_id:
+                continue
+            action = actions.get(code, "unknown")
+            category = self.categories.get(target_id) if action in CATEGORY_ACTIONS else None
+            service = self.services.get(target_id) if action in SERVICE_ACTIONS else None
+            if action == "order_created" and service is not None:
+                details = f"Service: {service['name']}, Price: {service['price']}"
+            else:
+                details = (category or service or {}).get('name', '')
+            result.append({
+                'id': action_id,
+                'user_id': action_user_id,
+                'username': names.get(username_id),
+                'action': action,
+                'details': details,
+                'timestamp': datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            })
+            if len(result) >= limit:
+                break
+        return result
+
+    async def probe_read(self):
+        pass
+
+    async def probe_write(self):
+        pass
@@ -0,0 +1,848 @@
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+from config import DEFAULT_CATEGORIES, SERVICES_KIND
+from database import ACTION_CODES, CATEGORY_ACTIONS, SERVICE_ACTIONS, SERVICE_EDIT_FIELDS, StorageBackend, action_codes_sql, action_name_sql
+
+logger = logging.getLogger(__name__)
+
+# Время в UTC без часового пояса с точностью до секунды, как CURRENT_TIMESTAMP в SQLite
+NOW = "(date_trunc('second', now() AT TIME ZONE 'utc'))"
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+SERVICE_COLUMNS = "s.id, s.name, s.description, s.price, c.name AS category, s.created_at, s.image, s.category_id, s.version"
+SERVICE_FROM = "services s LEFT JOIN categories c ON c.id = s.category_id"
+CATEGORY_COLUMNS = "id, key, name, button, kind, position, wide"
+GIVEAWAY_COLUMNS = "id, title, status, seed, participants_count, winners, created_at, finished_at"
+ORDER_COLUMNS = "id, user_id, username, service_id, service_name, order_time, status, status_updated_at"
+SCHEDULED_POST_COLUMNS = "id, channel_id, text, photo, publish_at, status, attempts, error, created_at, finished_at"
+USER_ACTION_COLUMNS = "id, user_id, username, action, details, timestamp"
+USER_ACTIONS_TABLE_COLUMNS = f"""
+    id BIGSERIAL PRIMARY KEY,
+    user_id BIGINT NOT NULL,
+    username_id INTEGER REFERENCES usernames (id),
+    action SMALLINT NOT NULL,
+    target_id BIGINT,
+    timestamp TIMESTAMP NOT NULL DEFAULT {NOW}
+"""
+
+# Пулы соединений процесса по DSN: боты из BOT_CONFIGS с одной базой делят пул и его лимит
+# соединений (размер задает бот, открывший пул первым); пул закрывается последним ботом
+_pools: Dict[str, "asyncio.Future"] = {}
+_pool_users: Dict[str, int] = {}
+
+async def _acquire_pool(dsn: str, min_size: int, max_size: int):
+    future = _pools.get(dsn)
+    if future is None:
+        future = _pools[dsn] = asyncio.ensure_future(asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size))
+    try:
+        pool = await asyncio.shield(future)
+    except Exception:
+        if _pools.get(dsn) is future:
+            del _pools[dsn]
+        raise
+    _pool_users[dsn] = _pool_users.get(dsn, 0) + 1
+    return pool
+
+async def _release_pool(dsn: str):
+    _pool_users[dsn] -= 1
+    if _pool_users[dsn] == 0:
+        del _pool_users[dsn]
+        pool = await _pools.pop(dsn)
+        await pool.close()
+
+def _time(value) -> Optional[str]:
+    """Время в текстовом формате SQLite, чтобы хранилища возвращали одинаковые данные"""
+    return value.strftime(TIME_FORMAT) if value is not None else None
+
+def _parse_time(value: str) -> datetime:
+    """Время из текстового формата SQLite для параметра TIMESTAMP"""
+    return datetime.strptime(value, TIME_FORMAT)
+
+class PostgresBackend(StorageBackend):
+    """Хранилище в PostgreSQL (пул соединений asyncpg) для нескольких узлов бота"""
+
+    name = "postgres"
+
+    def __init__(self, dsn: str, min_size: int = 1, max_size: int = 10):
+        if asyncpg is None:
+            raise RuntimeError("Для STORAGE_BACKEND=postgres установите asyncpg: pip install asyncpg")
+        if not dsn:
+            raise RuntimeError("Для STORAGE_BACKEND=postgres укажите DATABASE_URL")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+
+    async def _get_pool(self):
+        if self._pool is None:
+            pool = await _acquire_pool(self.dsn, self.min_size, self.max_size)
+            if self._pool is None:
+                self._pool = pool
+            else:
+                await _release_pool(self.dsn)
+        return self._pool
+
+    @staticmethod
+    def _row_to_service(row) -> Dict:
+        """Преобразование строки таблицы services в словарь"""
+        return {
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'price': row['price'],
+            'category': row['category'],
+            'created_at': _time(row['created_at']),
+            'image': row['image'],
+            'category_id': row['category_id'],
+            'version': row['version']
+        }
+
+    @staticmethod
+    def _row_to_category(row) -> Dict:
+        """Преобразование строки таблицы categories в словарь"""
+        return {
+            'id': row['id'],
+            'key': row['key'],
+            'name': row['name'],
+            'button': row['button'],
+            'kind': row['kind'],
+            'position': row['position'],
+            'wide': row['wide']
+        }
+
+    async def init_db(self):
+        """Инициализация базы данных"""
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                # Категории: ключ нужен только категориям по умолчанию (старые кнопки с ключом)
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS categories (
+                        id BIGSERIAL PRIMARY KEY,
+                        key TEXT UNIQUE,
+                        name TEXT NOT NULL,
+                        button TEXT NOT NULL,
+                        kind TEXT NOT NULL DEFAULT 'services',
+                        position INTEGER NOT NULL DEFAULT 0,
+                        wide BOOLEAN NOT NULL DEFAULT FALSE
+                    )
+                """)
+                if not await conn.fetchval("SELECT COUNT(*) FROM categories"):
+                    await conn.executemany(
+                        "INSERT INTO categories (key, name, button, kind, position, wide) VALUES ($1, $2, $3, $4, $5, $6)",
+                        [
+                            (category["key"], category["name"], category["button"], category["kind"], position, category["wide"])
+                            for position, category in enumerate(DEFAULT_CATEGORIES)
+                        ]
+                    )
+
+                await conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS services (
+                        id BIGSERIAL PRIMARY KEY,
+                        name TEXT NOT NULL,
+                        description TEXT NOT NULL,
+                        price TEXT NOT NULL,
+                        category_id BIGINT NOT NULL REFERENCES categories (id),
+                        created_at TIMESTAMP DEFAULT {NOW},
+                        image TEXT,
+                        version INTEGER NOT NULL DEFAULT 1
+                    )
+                """)
+
+                # Миграция: текстовая категория услуги -> categories.id
+                if await conn.fetchval(
+                    """SELECT 1 FROM information_schema.columns
+                       WHERE table_schema = current_schema() AND table_name = 'services' AND column_name = 'category'"""
+                ):
+                    labels = await conn.fetch(
+                        """SELECT DISTINCT category FROM services
+                           WHERE category NOT IN (SELECT name FROM categories)
+                           ORDER BY category"""
+                    )
+                    for row in labels:
+                        await self._insert_category(conn, row['category'], row['category'])
+                    await conn.execute("ALTER TABLE services ADD COLUMN category_id BIGINT REFERENCES categories (id)")
+                    await conn.execute(
+                        "UPDATE services s SET category_id = c.id FROM categories c WHERE c.name = s.category"
+                    )
+                    await conn.execute("ALTER TABLE services ALTER COLUMN category_id SET NOT NULL")
+                    await conn.execute("ALTER TABLE services DROP COLUMN category")
+                    logger.info("Миграция: категории услуг перенесены в таблицу categories")
+
+                # Миграция: версия строки услуги для изменения без потерянных записей
+                await conn.execute("ALTER TABLE services ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+
+                # Услуги категории по названию читаются по индексу
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_services_category
+                    ON services (category_id, name)
+                """)
+
+                # Без внешнего ключа на services, как в SQLite: заказ переживает удаление услуги
+                await conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS orders (
+                        id BIGSERIAL PRIMARY KEY,
+                        user_id BIGINT NOT NULL,
+                        username TEXT,
+                        service_id BIGINT NOT NULL,
+                        service_name TEXT NOT NULL,
+                        order_time TIMESTAMP DEFAULT {NOW},
+                        status TEXT NOT NULL DEFAULT 'new',
+                        status_updated_at TIMESTAMP
+                    )
+                """)
+
+                # Журнал действий в компактном виде: имена пользователей хранятся один раз
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS usernames (
+                        id SERIAL PRIMARY KEY,
+                        username TEXT NOT NULL UNIQUE
+                    )
+                """)
+
+                await conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS user_actions ({USER_ACTIONS_TABLE_COLUMNS})
+                """)
+
+                # Миграция: текстовый журнал действий -> коды и ссылки
+                if await conn.fetchval(
+                    """SELECT 1 FROM information_schema.columns
+                       WHERE table_schema = current_schema() AND table_name = 'user_actions' AND column_name = 'details'"""
+                ):
+                    await self._migrate_user_actions(conn)
+
+                # Читаемый вид журнала пересоздается при запуске: коды берутся из ACTION_CODES
+                await conn.execute("DROP VIEW IF EXISTS user_actions_log")
+                await conn.execute(f"""
+                    CREATE VIEW user_actions_log AS
+                    SELECT a.id, a.user_id, n.username, {action_name_sql("a.action")} AS action,
+                        COALESCE(CASE
+                            WHEN a.action = {ACTION_CODES["order_created"]} THEN 'Service: ' || s.name || ', Price: ' || s.price
+                            ELSE COALESCE(c.name, s.name)
+                        END, '') AS details,
+                        a.timestamp
+                    FROM user_actions a
+                    LEFT JOIN usernames n ON n.id = a.username_id
+                    LEFT JOIN categories c ON a.action IN ({action_codes_sql(CATEGORY_ACTIONS)}) AND c.id = a.target_id
+                    LEFT JOIN services s ON a.action IN ({action_codes_sql(SERVICE_ACTIONS)}) AND s.id = a.target_id
+                """)
+
+                await conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS media_files (
+                        content_hash TEXT PRIMARY KEY,
+                        file_id TEXT NOT NULL,
+                        created_at TIMESTAMP DEFAULT {NOW}
+                    )
+                """)
+
+                await conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS giveaways (
+                        id BIGSERIAL PRIMARY KEY,
+                        title TEXT NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'active',
+                        seed TEXT,
+                        participants_count INTEGER,
+                        winners TEXT,
+                        created_at TIMESTAMP DEFAULT {NOW},
+                        finished_at TIMESTAMP
+                    )
+                """)
+
+                await conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS giveaway_participants (
+                        id BIGSERIAL PRIMARY KEY,
+                        giveaway_id BIGINT NOT NULL REFERENCES giveaways (id),
+                        user_id BIGINT NOT NULL,
+                        username TEXT,
+                        joined_at TIMESTAMP DEFAULT {NOW},
+                        UNIQUE (giveaway_id, user_id)
+                    )
+                """)
+
+                # Отложенные посты в канал (время публикации в UTC)
+                await conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS scheduled_posts (
+                        id BIGSERIAL PRIMARY KEY,
+                        channel_id TEXT NOT NULL,
+                        text TEXT,
+                        photo TEXT,
+                        publish_at TIMESTAMP NOT NULL,
+                        status TEXT NOT NULL DEFAULT 'pending',
+                        attempts INTEGER NOT NULL DEFAULT 0,
+                        error TEXT,
+                        created_at TIMESTAMP DEFAULT {NOW},
+                        finished_at TIMESTAMP
+                    )
+                """)
+
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_scheduled_posts_pending
+                    ON scheduled_posts (status, publish_at)
+                """)
+
+                # Агрегаты воронки по услугам и дням (уникальные - сжатый HyperLogLog)
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS service_stats (
+                        day TEXT NOT NULL,
+                        service_id BIGINT NOT NULL,
+                        event TEXT NOT NULL,
+                        count BIGINT NOT NULL DEFAULT 0,
+                        uniques BYTEA,
+                        PRIMARY KEY (day, service_id, event)
+                    )
+                """)
+
+                # Одна строка для проверки записи в базу (/health)
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS health_probe (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        checked_at TIMESTAMP
+                    )
+                """)
+
+                # Версия каталога: растет при любом изменении категорий и услуг, по ней
+                # узлы с общей базой узнают о чужих правках каталога
+                await conn.execute("""
+                    CREATE TABLE IF NOT EXISTS catalog_version (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        version BIGINT NOT NULL
+                    )
+                """)
+                await conn.execute("INSERT INTO catalog_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING")
+                await conn.execute("""
+                    CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+                    BEGIN
+                        UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+                        RETURN NULL;
+                    END
+                    $$ LANGUAGE plpgsql
+                """)
+                for table in ("categories", "services"):
+                    if not await conn.fetchval("SELECT 1 FROM pg_trigger WHERE tgname = $1", f"{table}_catalog_version"):
+                        await conn.execute(f"""
+                            CREATE TRIGGER {table}_catalog_version
+                            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                            FOR EACH STATEMENT EXECUTE PROCEDURE bump_catalog_version()
+                        """)
+
+                # История заказов пользователя (keyset-пагинация по времени заказа)
+                await conn.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_orders_user_time
+                    ON orders (user_id, order_time)
+                """)
+        logger.info("База данных PostgreSQL инициализирована")
+
+    @staticmethod
+    async def _migrate_user_actions(conn):
+        """Перезапись журнала действий в компактный формат (внутри транзакции init_db).
+        Категории и услуги ищутся по названию; для удаленных объект остается пустым"""
+        codes = " ".join(f"WHEN '{action}' THEN {code}" for action, code in ACTION_CODES.items())
+        categories = ", ".join(f"'{action}'" for action in CATEGORY_ACTIONS)
+        services = ", ".join(f"'{action}'" for action in SERVICE_ACTIONS if action != "order_created")
+        await conn.execute("""
+            INSERT INTO usernames (username)
+            SELECT DISTINCT username FROM user_actions WHERE username IS NOT NULL
+            ON CONFLICT (username) DO NOTHING
+        """)
+        await conn.execute(f"CREATE TABLE user_actions_new ({USER_ACTIONS_TABLE_COLUMNS})")
+        # details заказа - "Service: <название>, Price: <цена>"
+        migrated = await conn.execute(f"""
+            INSERT INTO user_actions_new (id, user_id, username_id, action, target_id, timestamp)
+            SELECT a.id, a.user_id, n.id, CASE a.action {codes} ELSE 0 END,
+                CASE
+                    WHEN a.action IN ({categories}) THEN
+                        (SELECT id FROM categories WHERE name = a.details ORDER BY id LIMIT 1)
+                    WHEN a.action IN ({services}) THEN
+                        (SELECT id FROM services WHERE name = a.details ORDER BY id LIMIT 1)
+                    WHEN a.action = 'order_created' THEN
+                        (SELECT id FROM services
+                         WHERE left(a.details, length(name) + 18) = 'Service: ' || name || ', Price: '
+                         ORDER BY id LIMIT 1)
+                END,
+                COALESCE(a.timestamp, {NOW})
+            FROM user_actions a LEFT JOIN usernames n ON n.username = a.username
+        """)
+        await conn.execute("DROP TABLE user_actions")
+        await conn.execute("ALTER TABLE user_actions_new RENAME TO user_actions")
+        # Счетчик id новой таблицы продолжает нумерацию старой
+        await conn.execute(
+            "SELECT setval(pg_get_serial_sequence('user_actions', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM user_actions"
+        )
+        logger.info(f"Миграция: журнал действий переведен на коды и ссылки ({migrated.split()[-1]} записей)")
+
+    @staticmethod
+    async def _insert_category(conn, name: str, button: str) -> int:
+        """Новая категория услуг встает после остальных категорий услуг в меню"""
+        position = await conn.fetchval(
+            "SELECT COALESCE(MAX(position) + 1, 0) FROM categories WHERE kind = $1", SERVICES_KIND
+        )
+        await conn.execute("UPDATE categories SET position = position + 1 WHERE position >= $1", position)
+        return await conn.fetchval(
+            "INSERT INTO categories (name, button, kind, position) VALUES ($1, $2, $3, $4) RETURNING id",
+            name, button, SERVICES_KIND, position
+        )
+
+    async def get_categories(self) -> List[Dict]:
+        """Категории в порядке главного меню"""
+        pool = await self._get_pool()
+        rows = await pool.fetch(f"SELECT {CATEGORY_COLUMNS} FROM categories ORDER BY position, id")
+        return [self._row_to_category(row) for row in rows]
+
+    async def add_category(self, name: str, button: str) -> int:
+        """Добавление категории услуг (после остальных категорий услуг в меню)"""
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                return await self._insert_category(conn, name, button)
+
+    async def update_category(self, category_id: int, name: str, button: str) -> bool:
+        """Переименование категории"""
+        pool = await self._get_pool()
+        status = await pool.execute(
+            "UPDATE categories SET name = $1, button = $2 WHERE id = $3", name, button, category_id
+        )
+        return status != "UPDATE 0"
+
+    async def delete_category(self, category_id: int) -> bool:
+        """Удаление категории (только без услуг)"""
+        pool = await self._get_pool()
+        status = await pool.execute(
+            "DELETE FROM categories WHERE id = $1 AND NOT EXISTS (SELECT 1 FROM services WHERE category_id = $1)",
+            category_id
+        )
+        return status != "DELETE 0"
+
+    async def add_service(self, name: str, description: str, price: str, category_id: int) -> int:
+        """Добавление новой услуги"""
+        pool = await self._get_pool()
+        return await pool.fetchval(
+            "INSERT INTO services (name, description, price, category_id) VALUES ($1, $2, $3, $4) RETURNING id",
+            name, description, price, category_id
+        )
+
+    async def get_services_by_category(self, category_id: int) -> List[Dict]:
+        """Получение услуг по категории"""
+        pool = await self._get_pool()
+        # COLLATE "C" - побайтовый порядок, как у SQLite
+        rows = await pool.fetch(
+            f'SELECT {SERVICE_COLUMNS} FROM {SERVICE_FROM} WHERE s.category_id = $1 ORDER BY s.name COLLATE "C"',
+            category_id
+        )
+        return [self._row_to_service(row) for row in rows]
+
+    async def get_service_by_id(self, service_id: int) -> Optional[Dict]:
+        """Получение услуги по ID"""
+        pool = await self._get_pool()
+        row = await pool.fetchrow(f"SELECT {SERVICE_COLUMNS} FROM {SERVICE_FROM} WHERE s.id = $1", service_id)
+        return self._row_to_service(row) if row else None
+
+    async def get_all_services(self) -> List[Dict]:
+        """Получение всех услуг"""
+        pool = await self._get_pool()
+        # Услуги без категории первыми, как NULL при сортировке в SQLite
+        rows = await pool.fetch(
+            f'SELECT {SERVICE_COLUMNS} FROM {SERVICE_FROM} '
+            f'ORDER BY c.position NULLS FIRST, s.category_id, s.name COLLATE "C"'
+        )
+        return [self._row_to_service(row) for row in rows]
+
+    async def get_catalog_version(self) -> Optional[int]:
+        """Версия каталога в общей базе (меняется при любом изменении категорий и услуг)"""
+        pool = await self._get_pool()
+        return await pool.fetchval("SELECT version FROM catalog_version WHERE id = 1")
+
+    async def update_service(
+        self, service_id: int, name: str, description: str, price: str, category_id: int,
+        expected_version: Optional[int] = None
+    ) -> bool:
+        """Изменение услуги одной строкой: id сохраняется, версия увеличивается"""
+        pool = await self._get_pool()
+        status = await pool.execute(
+            """UPDATE services
+               SET name = $1, description = $2, price = $3, category_id = $4, version = version + 1
+               WHERE id = $5 AND ($6::integer IS NULL OR version = $6)""",
+            name, description, price, category_id, service_id, expected_version
+        )
+        return status != "UPDATE 0"
+
+    async def update_service_field(self, service_id: int, field: str, value, expected_version: Optional[int] = None) -> bool:
+        """Изменение одного поля услуги: одновременная правка другого поля не затирается"""
+        if field not in SERVICE_EDIT_FIELDS:
+            raise ValueError(f"Неизвестное поле услуги: {field}")
+        pool = await self._get_pool()
+        status = await pool.execute(
+            f"UPDATE services SET {field} = $1, version = version + 1 WHERE id = $2 AND ($3::integer IS NULL OR version = $3)",
+            value, service_id, expected_version
+        )
+        return status != "UPDATE 0"
+
+    async def delete_service(self, service_id: int) -> bool:
+        """Удаление услуги"""
+        pool = await self._get_pool()
+        status = await pool.execute("DELETE FROM services WHERE id = $1", service_id)
+        return status != "DELETE 0"
+
+    async def set_service_image(self, service_id: int, file_id: Optional[str]) -> bool:
+        """Установка изображения услуги (None - удалить изображение)"""
+        pool = await self._get_pool()
+        status = await pool.execute("UPDATE services SET image = $1 WHERE id = $2", file_id, service_id)
+        return status != "UPDATE 0"
+
+    async def get_media_file_id(self, content_hash: str) -> Optional[str]:
+        """Получение file_id по хешу содержимого файла"""
+        pool = await self._get_pool()
+        return await pool.fetchval("SELECT file_id FROM media_files WHERE content_hash = $1", content_hash)
+
+    async def save_media_file_id(self, content_hash: str, file_id: str):
+        """Сохранение file_id загруженного файла"""
+        pool = await self._get_pool()
+        await pool.execute(
+            f"""INSERT INTO media_files (content_hash, file_id) VALUES ($1, $2)
+                ON CONFLICT (content_hash) DO UPDATE SET file_id = excluded.file_id, created_at = {NOW}""",
+            content_hash, file_id
+        )
+
+    @staticmethod
+    def _row_to_giveaway(row) -> Dict:
+        """Преобразование строки таблицы giveaways в словарь"""
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'status': row['status'],
+            'seed': row['seed'],
+            'participants_count': row['participants_count'],
+            'winners': json.loads(row['winners']) if row['winners'] else [],
+            'created_at': _time(row['created_at']),
+            'finished_at': _time(row['finished_at'])
+        }
+
+    async def create_giveaway(self, title: str) -> int:
+        """Создание розыгрыша"""
+        pool = await self._get_pool()
+        return await pool.fetchval("INSERT INTO giveaways (title) VALUES ($1) RETURNING id", title)
+
+    async def get_giveaway(self, giveaway_id: int) -> Optional[Dict]:
+        """Получение розыгрыша по ID"""
+        pool = await self._get_pool()
+        row = await pool.fetchrow(f"SELECT {GIVEAWAY_COLUMNS} FROM giveaways WHERE id = $1", giveaway_id)
+        return self._row_to_giveaway(row) if row else None
+
+    async def get_active_giveaway(self) -> Optional[Dict]:
+        """Получение текущего активного розыгрыша"""
+        pool = await self._get_pool()
+        row = await pool.fetchrow(
+            f"SELECT {GIVEAWAY_COLUMNS} FROM giveaways WHERE status = 'active' ORDER BY id DESC LIMIT 1"
+        )
+        return self._row_to_giveaway(row) if row else None
+
+    async def finish_giveaway(self, giveaway_id: int, seed: str, participants_count: int, winners: List[Dict]):
+        """Сохранение итогов розыгрыша"""
+        pool = await self._get_pool()
+        await pool.execute(
+            f"""UPDATE giveaways
+                SET status = 'finished', seed = $1, participants_count = $2, winners = $3,
+                    finished_at = {NOW}
+                WHERE id = $4""",
+            seed, participants_count, json.dumps(winners, ensure_ascii=False), giveaway_id
+        )
+
+    async def add_giveaway_participants(self, participants: List[tuple]) -> int:
+        """Пакетное добавление участников (giveaway_id, user_id, username); повторы игнорируются"""
+        if not participants:
+            return 0
+        pool = await self._get_pool()
+        giveaway_ids, user_ids, usernames = zip(*participants)
+        # Одна команда на весь пакет; WITH ORDINALITY сохраняет порядок вступления
+        status = await pool.execute(
+            """INSERT INTO giveaway_participants (giveaway_id, user_id, username)
+               SELECT giveaway_id, user_id, username
+               FROM unnest($1::bigint[], $2::bigint[], $3::text[]) WITH ORDINALITY
+                    AS batch (giveaway_id, user_id, username, position)
+               ORDER BY position
+               ON CONFLICT (giveaway_id, user_id) DO NOTHING""",
+            list(giveaway_ids), list(user_ids), list(usernames)
+        )
+        # Статус команды: "INSERT 0 <добавлено строк>"
+        return int(status.split()[-1])
+
+    async def is_giveaway_participant(self, giveaway_id: int, user_id: int) -> bool:
+        """Проверка участия пользователя в розыгрыше"""
+        pool = await self._get_pool()
+        return await pool.fetchval(
+            "SELECT 1 FROM giveaway_participants WHERE giveaway_id = $1 AND user_id = $2",
+            giveaway_id, user_id
+        ) is not None
+
+    async def count_giveaway_participants(self, giveaway_id: int) -> int:
+        """Количество участников розыгрыша"""
+        pool = await self._get_pool()
+        return await pool.fetchval(
+            "SELECT COUNT(*) FROM giveaway_participants WHERE giveaway_id = $1", giveaway_id
+        ) or 0
+
+    async def iter_giveaway_participants(self, giveaway_id: int, batch_size: int = 1000) -> AsyncIterator[tuple]:
+        """Потоковое чтение участников (user_id, username) в порядке вступления"""
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            # Серверный курсор asyncpg работает только внутри транзакции
+            async with conn.transaction():
+                async for row in conn.cursor(
+                    "SELECT user_id, username FROM giveaway_participants WHERE giveaway_id = $1 ORDER BY id",
+                    giveaway_id, prefetch=batch_size
+                ):
+                    yield (row['user_id'], row['username'])
+
+    @staticmethod
+    def _row_to_scheduled_post(row) -> Dict:
+        """Преобразование строки таблицы scheduled_posts в словарь"""
+        return {
+            'id': row['id'],
+            'channel_id': row['channel_id'],
+            'text': row['text'],
+            'photo': row['photo'],
+            'publish_at': _time(row['publish_at']),
+            'status': row['status'],
+            'attempts': row['attempts'],
+            'error': row['error'],
+            'created_at': _time(row['created_at']),
+            'finished_at': _time(row['finished_at'])
+        }
+
+    async def add_scheduled_post(self, channel_id: str, text: Optional[str], photo: Optional[str], publish_at: str) -> int:
+        """Добавление отложенного поста"""
+        pool = await self._get_pool()
+        return await pool.fetchval(
+            "INSERT INTO scheduled_posts (channel_id, text, photo, publish_at) VALUES ($1, $2, $3, $4) RETURNING id",
+            channel_id, text, photo, _parse_time(publish_at)
+        )
+
+    async def get_scheduled_post(self, post_id: int) -> Optional[Dict]:
+        """Отложенный пост по ID"""
+        pool = await self._get_pool()
+        row = await pool.fetchrow(f"SELECT {SCHEDULED_POST_COLUMNS} FROM scheduled_posts WHERE id = $1", post_id)
+        return self._row_to_scheduled_post(row) if row else None
+
+    async def get_pending_posts(self) -> List[Dict]:
+        """Неопубликованные посты по времени публикации"""
+        pool = await self._get_pool()
+        rows = await pool.fetch(
+            f"SELECT {SCHEDULED_POST_COLUMNS} FROM scheduled_posts WHERE status = 'pending' ORDER BY publish_at, id"
+        )
+        return [self._row_to_scheduled_post(row) for row in rows]
+
+    async def update_scheduled_post(self, post_id: int, text: Optional[str], photo: Optional[str], publish_at: str) -> bool:
+        """Изменение неопубликованного поста"""
+        pool = await self._get_pool()
+        result = await pool.execute(
+            "UPDATE scheduled_posts SET text = $1, photo = $2, publish_at = $3 WHERE id = $4 AND status = 'pending'",
+            text, photo, _parse_time(publish_at), post_id
+        )
+        return result != "UPDATE 0"
+
+    async def cancel_scheduled_post(self, post_id: int) -> bool:
+        """Отмена неопубликованного поста"""
+        pool = await self._get_pool()
+        result = await pool.execute(
+            f"""UPDATE scheduled_posts SET status = 'cancelled', finished_at = {NOW}
+                WHERE id = $1 AND status = 'pending'""",
+            post_id
+        )
+        return result != "UPDATE 0"
+
+    async def claim_scheduled_post(self, post_id: int, now: str) -> Optional[Dict]:
+        """Захват поста для публикации: из нескольких узлов строку получит только один"""
+        pool = await self._get_pool()
+        row = await pool.fetchrow(
+            f"""UPDATE scheduled_posts SET status = 'sending'
+                WHERE id = $1 AND status = 'pending' AND publish_at <= $2
+                RETURNING {SCHEDULED_POST_COLUMNS}""",
+            post_id, _parse_time(now)
+        )
+        return self._row_to_scheduled_post(row) if row else None
+
+    async def release_scheduled_post(self, post_id: int) -> bool:
+        """Возврат захваченного поста в очередь"""
+        pool = await self._get_pool()
+        result = await pool.execute(
+            "UPDATE scheduled_posts SET status = 'pending' WHERE id = $1 AND status = 'sending'",
+            post_id
+        )
+        return result != "UPDATE 0"
+
+    async def finish_scheduled_post(self, post_id: int, status: str, attempts: int, error: Optional[str] = None) -> bool:
+        """Итог публикации (пост, отмененный во время отправки, не меняется)"""
+        pool = await self._get_pool()
+        result = await pool.execute(
+            f"""UPDATE scheduled_posts
+                SET status = $1, attempts = $2, error = $3, finished_at = {NOW}
+                WHERE id = $4 AND status IN ('pending', 'sending')""",
+            status, attempts, error, post_id
+        )
+        return result != "UPDATE 0"
+
+    async def add_order(self, user_id: int, username: str, service_id: int, service_name: str) -> int:
+        """Добавление заказа"""
+        pool = await self._get_pool()
+        return await pool.fetchval(
+            "INSERT INTO orders (user_id, username, service_id, service_name) VALUES ($1, $2, $3, $4) RETURNING id",
+            user_id, username, service_id, service_name
+        )
+
+    @staticmethod
+    def _row_to_order(row) -> Dict:
+        """Преобразование строки таблицы orders в словарь"""
+        return {
+            'id': row['id'],
+            'user_id': row['user_id'],
+            'username': row['username'],
+            'service_id': row['service_id'],
+            'service_name': row['service_name'],
+            'order_time': _time(row['order_time']),
+            'status': row['status'],
+            'status_updated_at': _time(row['status_updated_at'])
+        }
+
+    async def get_order(self, order_id: int) -> Optional[Dict]:
+        """Получение заказа по ID"""
+        pool = await self._get_pool()
+        row = await pool.fetchrow(f"SELECT {ORDER_COLUMNS} FROM orders WHERE id = $1", order_id)
+        return self._row_to_order(row) if row else None
+
+    async def get_user_orders(self, user_id: int, before_id: Optional[int] = None, limit: int = 5) -> List[Dict]:
+        """Заказы пользователя от новых к старым; before_id - последний заказ предыдущей страницы"""
+        pool = await self._get_pool()
+        if before_id:
+            rows = await pool.fetch(
+                f"""SELECT {ORDER_COLUMNS} FROM orders
+                    WHERE user_id = $1
+                      AND (order_time, id) < (SELECT order_time, id FROM orders WHERE id = $2)
+                    ORDER BY order_time DESC, id DESC
+                    LIMIT $3""",
+                user_id, before_id, limit
+            )
+        else:
+            rows = await pool.fetch(
+                f"""SELECT {ORDER_COLUMNS} FROM orders
+                    WHERE user_id = $1
+                    ORDER BY order_time DESC, id DESC
+                    LIMIT $2""",
+                user_id, limit
+            )
+        return [self._row_to_order(row) for row in rows]
+
+    async def update_order_status(self, order_id: int, status: str, expected_status: Optional[str] = None) -> bool:
+        """Изменение статуса заказа. С expected_status запись не проходит, если статус успели изменить"""
+        pool = await self._get_pool()
+        result = await pool.execute(
+            f"UPDATE orders SET status = $1, status_updated_at = {NOW} "
+            "WHERE id = $2 AND ($3::text IS NULL OR status = $3)",
+            status, order_id, expected_status
+        )
+        return result != "UPDATE 0"
+
+    async def count_orders(self) -> int:
+        """Общее количество заказов"""
+        pool = await self._get_pool()
+        return await pool.fetchval("SELECT COUNT(*) FROM orders") or 0
+
+    async def upsert_service_stats(self, rows: List[Tuple[str, int, str, int, bytes]], merge: Callable[[Optional[bytes], bytes], bytes]):
+        """Прибавление счетчиков и объединение уникальных одной транзакцией.
+        Строки блокируются до чтения уникальных, поэтому записи узлов не затирают друг друга"""
+        if not rows:
+            return
+        # Единый порядок блокировок у всех узлов
+        rows = sorted(rows, key=lambda row: row[:3])
+        pool = await self._get_pool()
+        async with pool.acquire() as conn:
+            async with conn.transaction():
+                # Новые ключи создаются пустыми, чтобы их тоже можно было заблокировать
+                await conn.executemany(
+                    """INSERT INTO service_stats (day, service_id, event, count, uniques)
+                       VALUES ($1, $2, $3, 0, NULL)
+                       ON CONFLICT (day, service_id, event) DO NOTHING""",
+                    [row[:3] for row in rows]
+                )
+                stored = await conn.fetch(
+                    """SELECT s.day, s.service_id, s.event, s.uniques
+                       FROM service_stats s
+                       JOIN unnest($1::text[], $2::bigint[], $3::text[]) AS k(day, service_id, event)
+                         ON s.day = k.day AND s.service_id = k.service_id AND s.event = k.event
+                       ORDER BY s.day, s.service_id, s.event
+                       FOR UPDATE OF s""",
+                    [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows]
+                )
+                uniques = {(row['day'], row['service_id'], row['event']): row['uniques'] for row in stored}
+                await conn.executemany(
+                    """UPDATE service_stats SET count = count + $4, uniques = $5
+                       WHERE day = $1 AND service_id = $2 AND event = $3""",
+                    [
+                        (day, service_id, event, count, merge(uniques.get((day, service_id, event)), sketch))
+                        for day, service_id, event, count, sketch in rows
+                    ]
+                )
+
+    async def get_service_stats(self, since_day: str) -> List[Tuple]:
+        """Агрегаты воронки начиная с дня since_day (YYYY-MM-DD)"""
+        pool = await self._get_pool()
+        rows = await pool.fetch(
+            "SELECT day, service_id, event, count, uniques FROM service_stats WHERE day >= $1",
+            since_day
+        )
+        return [tuple(row) for row in rows]
+
+    async def log_user_action(self, user_id: int, username: str, action: str, target_id: Optional[int] = None):
+        """Логирование действия пользователя (target_id - категория или услуга действия)"""
+        pool = await self._get_pool()
+        # Имя пользователя записывается один раз; WHERE NOT EXISTS не тратит значения
+        # последовательности на уже известные имена
+        await pool.execute(
+            """WITH added AS (
+                   INSERT INTO usernames (username)
+                   SELECT $2 WHERE NOT EXISTS (SELECT 1 FROM usernames WHERE username = $2)
+                   ON CONFLICT (username) DO NOTHING
+                   RETURNING id
+               )
+               INSERT INTO user_actions (user_id, username_id, action, target_id)
+               VALUES ($1, COALESCE((SELECT id FROM added), (SELECT id FROM usernames WHERE username = $2)), $3, $4)""",
+            user_id, username, ACTION_CODES.get(action, 0), target_id
+        )
+
+    async def get_user_actions(self, limit: int = 50, user_id: Optional[int] = None) -> List[Dict]:
+        """Последние действия в читаемом виде (новые первыми)"""
+        pool = await self._get_pool()
+        if user_id is None:
+            rows = await pool.fetch(f"SELECT {USER_ACTION_COLUMNS} FROM user_actions_log ORDER BY id DESC LIMIT $1", limit)
+        else:
+            rows = await pool.fetch(
+                f"SELECT {USER_ACTION_COLUMNS} FROM user_actions_log WHERE user_id = $1 ORDER BY id DESC LIMIT $2",
+                user_id, limit
+            )
+        return [dict(row, timestamp=_time(row['timestamp'])) for row in rows]
+
+    async def probe_read(self):
+        """Проверочное чтение (/health)"""
+        pool = await self._get_pool()
+        await pool.fetchval("SELECT id FROM services LIMIT 1")
+
+    async def probe_write(self):
+        """Проверочная запись с фиксацией транзакции (/health)"""
+        pool = await self._get_pool()
+        await pool.execute(
+            f"""INSERT INTO health_probe (id, checked_at) VALUES (1, {NOW})
+                ON CONFLICT (id) DO UPDATE SET checked_at = excluded.checked_at"""
+        )
+
+    async def close(self):
+        """Освобождение пула соединений (закрывается, когда его не использует ни один бот)"""
+        if self._pool is not None:
+            self._pool = None
+            await _release_pool(self.dsn)
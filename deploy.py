@@ -125,6 +125,7 @@ def deploy_railway():
     print("3. В Variables добавьте:")
     print("   - BOT_TOKEN: ваш токен бота")
     print("   - ADMIN_ID: ваш Telegram ID")
+    print("   - RAILWAY_DEPLOYMENT_DRAINING_SECONDS: 30 (время на завершение заказов при передеплое)")
     print("4. Railway автоматически развернет бота")
     
     return True
@@ -184,6 +185,7 @@ def deploy_heroku():
     print("   git commit -m 'Deploy to Heroku'")
     print("   git push heroku main")
     print("   heroku ps:scale worker=1")
+    print("\n⚠️ Heroku ждет остановки 30 секунд: SHUTDOWN_TIMEOUT должен быть меньше")
     
     return True
 
@@ -205,6 +207,9 @@ Environment=PATH=/root/phoenix-ps-bot/venv/bin
 ExecStart=/root/phoenix-ps-bot/venv/bin/python main.py
 Restart=always
 RestartSec=10
+# Бот дожидается начатых заказов (SHUTDOWN_TIMEOUT) до остановки
+KillSignal=SIGTERM
+TimeoutStopSec=40
 
 [Install]
 WantedBy=multi-user.target
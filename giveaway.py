@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import random
+import secrets
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from bot_context import PerBot
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Параметры буфера вступлений: сброс по таймеру или при заполнении
+FLUSH_INTERVAL = 1.0
+MAX_BUFFER_SIZE = 500
+# Сколько недавних вступлений помнится для ответа на повторные нажатия без базы
+RECENT_JOINS_LIMIT = 10_000
+
+class GiveawayManager:
+    """Участие в розыгрышах: буферизованная запись и выбор победителей"""
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL, max_buffer_size: int = MAX_BUFFER_SIZE):
+        self.flush_interval = flush_interval
+        self.max_buffer_size = max_buffer_size
+        # (giveaway_id, user_id) -> username, еще не записанные в базу
+        self._pending: Dict[Tuple[int, int], str] = {}
+        # Кэш количества участников по розыгрышам
+        self._counts: Dict[int, int] = {}
+        # Недавно вступившие (giveaway_id, user_id) в порядке вступления; источник истины -
+        # уникальный индекс участников в базе
+        self._recent: "OrderedDict[Tuple[int, int], None]" = OrderedDict()
+        # Розыгрыши, в которых идет или прошел выбор победителей: вступления не принимаются
+        self._closed: Set[int] = set()
+        # Кэш активного розыгрыша (None - не загружен)
+        self._active: Optional[Dict] = None
+        self._active_loaded = False
+        # Примитивы asyncio создаются внутри работающего цикла событий
+        self._flush_event: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending_count(self) -> int:
+        """Количество вступлений в буфере"""
+        return len(self._pending)
+
+    def start(self):
+        """Запуск фоновой записи буфера"""
+        if self._task is None:
+            self._flush_event = asyncio.Event()
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Остановка фоновой записи с сохранением буфера"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_event.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_event.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи участников розыгрыша: {e}")
+
+    async def flush(self):
+        """Запись накопленных вступлений одной транзакцией"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                inserted = await db.add_giveaway_participants(
+                    [(giveaway_id, user_id, username) for (giveaway_id, user_id), username in batch.items()]
+                )
+            except Exception:
+                # Возвращаем пакет в буфер, чтобы не потерять вступления
+                batch.update(self._pending)
+                self._pending = batch
+                raise
+            logger.debug(f"Записано участников розыгрыша: {inserted} из {len(batch)}")
+
+    async def get_active(self) -> Optional[Dict]:
+        """Текущий активный розыгрыш (кэшируется до создания/завершения)"""
+        if not self._active_loaded:
+            self._active = await db.get_active_giveaway()
+            self._active_loaded = True
+        return self._active
+
+    async def create(self, title: str) -> int:
+        """Создание нового розыгрыша"""
+        giveaway_id = await db.create_giveaway(title)
+        self._active_loaded = False
+        self._counts[giveaway_id] = 0
+        return giveaway_id
+
+    async def count(self, giveaway_id: int) -> int:
+        """Количество участников (включая еще не записанных)"""
+        if giveaway_id not in self._counts:
+            count = await db.count_giveaway_participants(giveaway_id)
+            count += sum(1 for key in self._pending if key[0] == giveaway_id)
+            self._counts[giveaway_id] = count
+        return self._counts[giveaway_id]
+
+    async def join(self, giveaway_id: int, user_id: int, username: str) -> Optional[bool]:
+        """Вступление в розыгрыш; False, если пользователь уже участвует,
+        None, если розыгрыш уже подводит итоги"""
+        if giveaway_id in self._closed:
+            return None
+        key = (giveaway_id, user_id)
+        if key in self._pending or key in self._recent:
+            return False
+        if await db.is_giveaway_participant(giveaway_id, user_id):
+            return False
+        # Повторная проверка: пока шел запрос к базе, мог начаться выбор победителей
+        # или пройти параллельное вступление того же пользователя
+        if giveaway_id in self._closed:
+            return None
+        if key in self._pending or key in self._recent:
+            return False
+
+        self._pending[key] = username
+        self._recent[key] = None
+        if len(self._recent) > RECENT_JOINS_LIMIT:
+            self._recent.popitem(last=False)
+        if giveaway_id in self._counts:
+            self._counts[giveaway_id] += 1
+        if len(self._pending) >= self.max_buffer_size and self._flush_event is not None:
+            self._flush_event.set()
+        return True
+
+    async def draw(self, giveaway_id: int, winners_count: int, seed: Optional[str] = None) -> Dict:
+        """Выбор победителей reservoir sampling по курсору, с воспроизводимым seed"""
+        # Вступления закрываются до последней записи буфера: каждый, кому ответили
+        # «вы участвуете», попадает в выборку
+        self._closed.add(giveaway_id)
+        try:
+            return await self._draw(giveaway_id, winners_count, seed)
+        except Exception:
+            self._closed.discard(giveaway_id)
+            raise
+
+    async def _draw(self, giveaway_id: int, winners_count: int, seed: Optional[str]) -> Dict:
+        await self.flush()
+
+        if seed is None:
+            seed = secrets.token_hex(8)
+        rng = random.Random(seed)
+
+        reservoir: List[tuple] = []
+        total = 0
+        async for participant in db.iter_giveaway_participants(giveaway_id):
+            if total < winners_count:
+                reservoir.append(participant)
+            else:
+                index = rng.randrange(total + 1)
+                if index < winners_count:
+                    reservoir[index] = participant
+            total += 1
+
+        winners = [{'user_id': user_id, 'username': username} for user_id, username in reservoir]
+        await db.finish_giveaway(giveaway_id, seed, total, winners)
+        self._counts[giveaway_id] = total
+        self._active_loaded = False
+        logger.info(f"Розыгрыш {giveaway_id}: {len(winners)} победителей из {total}, seed={seed}")
+
+        return {
+            'giveaway_id': giveaway_id,
+            'seed': seed,
+            'participants_count': total,
+            'winners': winners
+        }
+
+def format_results(giveaway: Dict) -> str:
+    """Текст итогов розыгрыша (без разметки)"""
+    lines = [f"🎉 Итоги розыгрыша «{giveaway['title']}»", ""]
+    if giveaway['winners']:
+        lines.append("🏆 Победители:")
+        for number, winner in enumerate(giveaway['winners'], 1):
+            username = winner.get('username')
+            name = f"@{username}" if username and username != "unknown" else f"ID {winner['user_id']}"
+            lines.append(f"{number}. {name}")
+    else:
+        lines.append("😔 Участников не было.")
+    lines.append("")
+    lines.append(f"👥 Участников: {giveaway['participants_count'] or 0}")
+    lines.append(f"🔐 Seed для проверки: {giveaway['seed']}")
+    return "\n".join(lines)
+
+# Глобальный менеджер розыгрышей
+giveaway_manager = PerBot(lambda name: GiveawayManager())
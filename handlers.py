@@ -1,31 +1,50 @@
 import logging
 from datetime import datetime
-from aiogram import Router, F
+from aiogram import Router
 from aiogram.types import Message, CallbackQuery
 from aiogram.filters import Command
 from aiogram.exceptions import TelegramBadRequest
 
-from config import Config, CATEGORIES, MESSAGES
+from bot_context import PerBot
+from config import Config, MESSAGES, SERVICES_KIND
 from database import db
+from catalog import catalog
+from alerts import alert_manager, error_signature
+from analytics import analytics, VIEW, DETAILS as DETAILS_EVENT, ORDER as ORDER_EVENT
+from cache import TTLCache, MISSING
+from callbacks import CallbackRouter, safe_callback_answer, MAIN_MENU, CATEGORY, CATEGORY_KEY, SERVICE, DETAILS, ORDER, GIVEAWAY_JOIN, MY_ORDERS, ORDER_STATUS
+from giveaway import giveaway_manager
 from keyboards import (
     get_main_menu_keyboard, 
     get_category_keyboard, 
     get_service_keyboard,
     get_details_keyboard,
     get_back_to_main_keyboard,
+    get_giveaway_keyboard,
+    get_order_history_keyboard,
+    get_order_status_keyboard,
     get_contact_keyboard
 )
-from utils import get_category_by_name, format_service_message, format_detailed_service_message
+from media import show_screen
+from outbound import send_class, ORDER as ORDER_SEND
+from orders import (
+    ORDER_STATUSES,
+    create_order,
+    format_order_time,
+    format_status,
+    get_order_history_page,
+    set_order_status
+)
+from utils import format_service_message, format_detailed_service_message
 
 logger = logging.getLogger(__name__)
 router = Router()
 
-def safe_callback_answer(callback):
-    """Безопасный ответ на callback"""
-    try:
-        return callback.answer()
-    except Exception:
-        pass
+# Строка статуса в заявке, опубликованной в канале
+STATUS_LINE_PREFIX = "\n\n📌 Статус: "
+
+# Права на смену статуса заявок: user_id -> является ли админом канала
+channel_admin_cache = PerBot(lambda name: TTLCache(ttl=300))
 
 def escape_username_for_markdown(username: str) -> str:
     """Экранирует символы подчеркивания в юзернейме для Markdown"""
@@ -36,6 +55,8 @@ def escape_username_for_markdown(username: str) -> str:
 def register_user_handlers(dp, config: Config):
     """Регистрация пользовательских хендлеров"""
     
+    callback_router = CallbackRouter.for_dispatcher(dp, config)
+    
     @dp.message(Command("start"))
     async def cmd_start(message: Message):
         """Обработчик команды /start"""
@@ -51,11 +72,11 @@ def register_user_handlers(dp, config: Config):
         
         await message.answer(
             MESSAGES["welcome"],
-            reply_markup=get_main_menu_keyboard(),
+            reply_markup=get_main_menu_keyboard(await catalog.get_categories()),
             parse_mode="Markdown"
         )
     
-    @dp.callback_query(F.data == "main_menu")
+    @callback_router.handler(MAIN_MENU)
     async def show_main_menu(callback: CallbackQuery):
         """Показать главное меню"""
         user = callback.from_user
@@ -68,36 +89,39 @@ def register_user_handlers(dp, config: Config):
             )
         
         try:
-            if callback.message and hasattr(callback.message, 'edit_text'):
-                await callback.message.edit_text(
-                    MESSAGES["welcome"],
-                    reply_markup=get_main_menu_keyboard(),
-                    parse_mode="Markdown"
-                )
+            await show_screen(
+                callback,
+                MESSAGES["welcome"],
+                reply_markup=get_main_menu_keyboard(await catalog.get_categories()),
+                parse_mode="Markdown"
+            )
         except TelegramBadRequest:
             if callback.message:
                 await callback.message.answer(
                     MESSAGES["welcome"],
-                    reply_markup=get_main_menu_keyboard(),
+                    reply_markup=get_main_menu_keyboard(await catalog.get_categories()),
                     parse_mode="Markdown"
                 )
-        
-        await safe_callback_answer(callback)
     
-    @dp.callback_query(F.data.startswith("category_"))
-    async def show_category(callback: CallbackQuery):
+    @callback_router.handler(CATEGORY_KEY)
+    async def show_category_by_key(callback: CallbackQuery, category_key: str):
+        """Кнопка категории со старым текстовым ключом"""
+        category = await catalog.get_category_by_key(category_key)
+        if not category:
+            return
+        await show_category(callback, category['id'])
+    
+    @callback_router.handler(CATEGORY)
+    async def show_category(callback: CallbackQuery, category_id: int):
         """Показать услуги категории"""
         user = callback.from_user
-        if not callback.data:
-            return
-            
-        category_key = callback.data.split("_")[1]
         
-        if category_key not in CATEGORIES:
-            await safe_callback_answer(callback)
+        category = await catalog.get_category(category_id)
+        if not category:
             return
         
-        category_name = CATEGORIES[category_key]
+        category_name = category['name']
+        kind = category['kind']
         
         # Логирование
         if user:
@@ -105,11 +129,11 @@ def register_user_handlers(dp, config: Config):
                 user.id,
                 user.username or "unknown",
                 "category_viewed",
-                category_name
+                category['id']
             )
         
         # Обработка специальных категорий
-        if category_key == "about":
+        if kind == "about":
             about_text = """🧾 **О нас**
 
 Phoenix Group - профессиональная команда специалистов по оптимизации Windows и разгону компьютеров.
@@ -126,28 +150,31 @@ Phoenix Group - профессиональная команда специали
 • Настроить систему под ваши задачи
 • Разогнать комплектующие безопасно"""
 
-            if callback.message and hasattr(callback.message, 'edit_text'):
-                await callback.message.edit_text(
-                    about_text,
-                    reply_markup=get_back_to_main_keyboard(),
-                    parse_mode="Markdown"
-                )
-            await safe_callback_answer(callback)
+            await show_screen(
+                callback,
+                about_text,
+                reply_markup=get_back_to_main_keyboard(),
+                parse_mode="Markdown"
+            )
             return
         
-        elif category_key == "giveaway":
+        elif kind == "giveaway":
             giveaway_text = config.GIVEAWAY_DESCRIPTION
+            giveaway = await giveaway_manager.get_active()
+            
+            if giveaway:
+                participants = await giveaway_manager.count(giveaway['id'])
+                giveaway_text += f"\n\n🎉 **{giveaway['title']}**\n👥 Участников: {participants}"
 
-            if callback.message and hasattr(callback.message, 'edit_text'):
-                await callback.message.edit_text(
-                    giveaway_text,
-                    reply_markup=get_back_to_main_keyboard(),
-                    parse_mode="Markdown"
-                )
-            await safe_callback_answer(callback)
+            await show_screen(
+                callback,
+                giveaway_text,
+                reply_markup=get_giveaway_keyboard(giveaway['id'] if giveaway else None),
+                parse_mode="Markdown"
+            )
             return
 
-        elif category_key == "contacts":
+        elif kind == "contacts":
             contacts_text = """📞 **Контакты и заказ**
 
 📱 **Канал:** @helprepairpc
@@ -164,146 +191,246 @@ Phoenix Group - профессиональная команда специали
 • СБП
 • Криптовалюта"""
 
-            if callback.message and hasattr(callback.message, 'edit_text'):
-                await callback.message.edit_text(
-                    contacts_text,
-                    reply_markup=get_contact_keyboard(),
-                    parse_mode="Markdown"
-                )
-            await safe_callback_answer(callback)
+            await show_screen(
+                callback,
+                contacts_text,
+                reply_markup=get_contact_keyboard(),
+                parse_mode="Markdown"
+            )
+            return
+        
+        elif kind != SERVICES_KIND:
             return
         
         # Получение услуг категории
-        services = await db.get_services_by_category(category_name)
+        services = await catalog.get_services_by_category(category_id)
         
         if not services:
             no_services_text = f"📭 В категории **{category_name}** пока нет услуг.\n\nСкоро здесь появятся новые предложения!"
-            if callback.message and hasattr(callback.message, 'edit_text'):
-                await callback.message.edit_text(
-                    no_services_text,
-                    reply_markup=get_back_to_main_keyboard(),
-                    parse_mode="Markdown"
-                )
+            await show_screen(
+                callback,
+                no_services_text,
+                reply_markup=get_back_to_main_keyboard(),
+                parse_mode="Markdown"
+            )
         else:
             services_text = f"📋 **{category_name}**\n\nВыберите интересующую вас услугу:"
-            if callback.message and hasattr(callback.message, 'edit_text'):
-                await callback.message.edit_text(
-                    services_text,
-                    reply_markup=get_category_keyboard(category_key, services),
-                    parse_mode="Markdown"
-                )
-        
-        await safe_callback_answer(callback)
+            await show_screen(
+                callback,
+                services_text,
+                reply_markup=get_category_keyboard(category_id, services),
+                parse_mode="Markdown"
+            )
     
-    @dp.callback_query(F.data.startswith("service_"))
-    async def show_service(callback: CallbackQuery):
+    @callback_router.handler(SERVICE)
+    async def show_service(callback: CallbackQuery, service_id: int):
         """Показать информацию об услуге"""
         user = callback.from_user
-        if not callback.data:
-            return
-            
-        service_id = int(callback.data.split("_")[1])
         
-        service = await db.get_service_by_id(service_id)
+        service = await catalog.get_service(service_id)
         if not service:
-            await safe_callback_answer(callback)
             return
         
         # Логирование
         if user:
+            analytics.track(VIEW, service_id, user.id)
             await db.log_user_action(
                 user.id,
                 user.username or "unknown",
                 "service_viewed",
-                service['name']
+                service_id
             )
         
-        # Определение категории для навигации
-        category_key = get_category_by_name(service['category'])
-        
         service_text = format_service_message(service)
         
-        if callback.message and hasattr(callback.message, 'edit_text'):
-            await callback.message.edit_text(
-                service_text,
-                reply_markup=get_service_keyboard(service_id, category_key),
-                parse_mode="Markdown"
-            )
-        await safe_callback_answer(callback)
+        await show_screen(
+            callback,
+            service_text,
+            reply_markup=get_service_keyboard(service_id, service['category_id']),
+            photo=service.get('image'),
+            parse_mode="Markdown"
+        )
     
-    @dp.callback_query(F.data.startswith("details_"))
-    async def show_service_details(callback: CallbackQuery):
+    @callback_router.handler(DETAILS)
+    async def show_service_details(callback: CallbackQuery, service_id: int):
         """Показать подробную информацию об услуге"""
         user = callback.from_user
-        if not callback.data:
-            return
-            
-        service_id = int(callback.data.split("_")[1])
         
-        service = await db.get_service_by_id(service_id)
+        service = await catalog.get_service(service_id)
         if not service:
-            await safe_callback_answer(callback)
             return
         
         # Логирование
         if user:
+            analytics.track(DETAILS_EVENT, service_id, user.id)
             await db.log_user_action(
                 user.id,
                 user.username or "unknown",
                 "service_details_viewed",
-                service['name']
+                service_id
             )
         
-        category_key = get_category_by_name(service['category'])
         detailed_text = format_detailed_service_message(service)
         
-        if callback.message and hasattr(callback.message, 'edit_text'):
-            await callback.message.edit_text(
-                detailed_text,
-                reply_markup=get_details_keyboard(service_id, category_key),
-                parse_mode="Markdown"
+        await show_screen(
+            callback,
+            detailed_text,
+            reply_markup=get_details_keyboard(service_id),
+            photo=service.get('image'),
+            parse_mode="Markdown"
+        )
+    
+    @callback_router.handler(GIVEAWAY_JOIN)
+    async def join_giveaway(callback: CallbackQuery, giveaway_id: int):
+        """Участие в розыгрыше"""
+        user = callback.from_user
+        if not user:
+            await safe_callback_answer(callback)
+            return
+        
+        giveaway = await giveaway_manager.get_active()
+        if not giveaway or giveaway['id'] != giveaway_id:
+            await safe_callback_answer(callback, "⏳ Этот розыгрыш уже завершен.", show_alert=True)
+            return
+        
+        # Вступление буферизуется и пишется в базу пакетами (без записи в user_actions,
+        # чтобы всплеск после публикации поста не упирался в базу)
+        joined = await giveaway_manager.join(giveaway_id, user.id, user.username or "unknown")
+        
+        if joined is None:
+            await safe_callback_answer(callback, "⏳ Этот розыгрыш уже завершен.", show_alert=True)
+        elif joined:
+            await safe_callback_answer(callback, "✅ Вы участвуете в розыгрыше! Удачи!", show_alert=True)
+        else:
+            await safe_callback_answer(callback, "ℹ️ Вы уже участвуете в этом розыгрыше.", show_alert=True)
+    
+    @callback_router.handler(MY_ORDERS)
+    async def show_my_orders(callback: CallbackQuery, before_id: int):
+        """История заказов пользователя"""
+        user = callback.from_user
+        if not user:
+            return
+        
+        orders, has_more = await get_order_history_page(user.id, before_id or None)
+        
+        # Названия услуг выводятся без разметки, чтобы символы в них не ломали Markdown
+        if orders:
+            text = "📋 Мои заказы\n\n" + "\n\n".join(
+                f"#{order['id']} • {order['service_name']}\n"
+                f"🕐 {format_order_time(order['order_time'])} • {format_status(order['status'])}"
+                for order in orders
             )
-        await safe_callback_answer(callback)
+        else:
+            text = "📋 Мои заказы\n\nУ вас пока нет заказов."
+        
+        next_cursor = orders[-1]['id'] if has_more and orders else None
+        await show_screen(
+            callback,
+            text,
+            reply_markup=get_order_history_keyboard(next_cursor, is_first_page=not before_id),
+            parse_mode=None
+        )
+    
+    async def can_manage_orders(bot, user_id: int) -> bool:
+        """Может ли пользователь менять статусы заявок (админ бота или админ канала)"""
+        if user_id == config.ADMIN_ID:
+            return True
+        if not config.CHANNEL_ID:
+            return False
+        
+        allowed = channel_admin_cache.get(user_id)
+        if allowed is MISSING:
+            try:
+                member = await bot.get_chat_member(config.CHANNEL_ID, user_id)
+                allowed = member.status in ("creator", "administrator")
+            except Exception as e:
+                logger.error(f"Не удалось проверить права {user_id} в канале: {e}")
+                return False
+            channel_admin_cache.set(user_id, allowed)
+        return allowed
+    
+    @callback_router.handler(ORDER_STATUS)
+    async def change_order_status(callback: CallbackQuery, order_id: int, status: str):
+        """Смена статуса заявки кнопками под постом в канале"""
+        user = callback.from_user
+        if not user or status not in ORDER_STATUSES:
+            await safe_callback_answer(callback)
+            return
+        
+        bot = callback.bot
+        if not await can_manage_orders(bot, user.id):
+            await safe_callback_answer(callback, "⛔ Недостаточно прав", show_alert=True)
+            return
+        
+        order = await set_order_status(order_id, status)
+        if not order:
+            await safe_callback_answer(callback, "⚠️ Статус уже изменен", show_alert=True)
+            return
+        
+        status_label = format_status(status)
+        
+        # Обновление поста с заявкой
+        message = callback.message
+        if message and (message.text or message.caption):
+            text = message.html_text.split(STATUS_LINE_PREFIX)[0] + STATUS_LINE_PREFIX + status_label
+            try:
+                with send_class(ORDER_SEND):
+                    await message.edit_text(
+                        text,
+                        reply_markup=get_order_status_keyboard(order_id, status),
+                        parse_mode="HTML"
+                    )
+            except TelegramBadRequest as e:
+                logger.error(f"Не удалось обновить заявку {order_id} в канале: {e}")
+        
+        # Уведомление клиента
+        try:
+            with send_class(ORDER_SEND):
+                await bot.send_message(
+                    order['user_id'],
+                    f"📋 Заказ #{order_id} «{order['service_name']}»: {status_label}"
+                )
+        except Exception as e:
+            logger.warning(f"Не удалось уведомить клиента о заказе {order_id}: {e}")
+        
+        await safe_callback_answer(callback, f"Статус: {status_label}")
     
-    @dp.callback_query(F.data.startswith("order_"))
-    async def process_order(callback: CallbackQuery):
+    @callback_router.handler(ORDER)
+    async def process_order(callback: CallbackQuery, service_id: int):
         """Обработка заказа"""
         user = callback.from_user
-        if not callback.data or not user:
+        if not user:
             return
-            
-        service_id = int(callback.data.split("_")[1])
         
-        service = await db.get_service_by_id(service_id)
+        service = await catalog.get_service(service_id)
         if not service:
-            await safe_callback_answer(callback)
             return
         
         # Проверка настроек канала для заявок
         if not config.CHANNEL_ID:
-            await safe_callback_answer(callback)
             return
         
         try:
             # Добавление заказа в базу
-            await db.add_order(user.id, user.username or "unknown", service_id, service['name'])
+            order_id = await create_order(user.id, user.username or "unknown", service_id, service['name'])
+            analytics.track(ORDER_EVENT, service_id, user.id)
             
             # Логирование
             await db.log_user_action(
                 user.id,
                 user.username or "unknown",
                 "order_created",
-                f"Service: {service['name']}, Price: {service['price']}"
+                service_id
             )
             
             # Уведомление клиента
             client_message = MESSAGES["order_success"].format(service_name=service['name'])
-            if callback.message and hasattr(callback.message, 'edit_text'):
-                await callback.message.edit_text(
-                    client_message,
-                    reply_markup=get_back_to_main_keyboard(),
-                    parse_mode="Markdown"
-                )
+            await show_screen(
+                callback,
+                client_message,
+                reply_markup=get_back_to_main_keyboard(),
+                parse_mode="Markdown"
+            )
             
             # Публикация заявки в канал
             try:
@@ -316,47 +443,44 @@ Phoenix Group - профессиональная команда специали
                     time=datetime.now().strftime("%d.%m.%Y %H:%M"),
                     price=service['price'],
                     description=service['description']
-                )
+                ) + STATUS_LINE_PREFIX + format_status("new")
                 
                 # Публикуем заявку в канал
                 if config.CHANNEL_ID:
                     try:
-                        await bot.send_message(config.CHANNEL_ID, order_message, parse_mode="Markdown")
+                        with send_class(ORDER_SEND):
+                            await bot.send_message(
+                                config.CHANNEL_ID,
+                                order_message,
+                                reply_markup=get_order_status_keyboard(order_id, "new"),
+                                parse_mode="Markdown"
+                            )
                         logger.info(f"Заявка опубликована в канал {config.CHANNEL_ID}")
                     except Exception as channel_error:
                         logger.error(f"Не удалось опубликовать в канал {config.CHANNEL_ID}: {channel_error}")
                         
-                        # Если не удалось отправить в канал, уведомляем админа
-                        if config.ADMIN_ID:
-                            error_msg = f"⚠️ Не удалось опубликовать заявку от @{escape_username_for_markdown(user.username)} в канал. Проверьте настройки канала."
-                            try:
-                                await bot.send_message(config.ADMIN_ID, error_msg)
-                            except Exception as admin_error:
-                                logger.error(f"Не удалось уведомить админа: {admin_error}")
+                        # Админ получит сводку по однотипным сбоям, а не сообщение на каждый заказ
+                        alert_manager.report(
+                            error_signature("channel_publish", channel_error),
+                            f"Не удалось опубликовать заявку в канал {config.CHANNEL_ID}",
+                            f"Заказ #{order_id} от @{user.username or 'unknown'}: {channel_error}"
+                        )
                 else:
-                    # Если канал не настроен, уведомляем админа
-                    if config.ADMIN_ID:
-                        error_msg = f"⚠️ Канал для заявок не настроен! Заявка от @{escape_username_for_markdown(user.username)} не была опубликована."
-                        try:
-                            await bot.send_message(config.ADMIN_ID, error_msg)
-                        except Exception as admin_error:
-                            logger.error(f"Не удалось уведомить админа: {admin_error}")
+                    alert_manager.report(
+                        "channel_not_configured",
+                        "Канал для заявок не настроен",
+                        f"Заказ #{order_id} от @{user.username or 'unknown'} не опубликован"
+                    )
             
             except Exception as e:
                 logger.error(f"Ошибка при отправке уведомления: {e}")
                 
         except Exception as e:
             logger.error(f"Ошибка при обработке заказа: {e}")
-            if callback.message and hasattr(callback.message, 'edit_text'):
-                await callback.message.edit_text(
-                    "❌ Произошла ошибка при обработке заказа. Попробуйте позже.",
-                    reply_markup=get_back_to_main_keyboard()
-                )
+            await show_screen(
+                callback,
+                "❌ Произошла ошибка при обработке заказа. Попробуйте позже.",
+                reply_markup=get_back_to_main_keyboard(),
+                parse_mode=None
+            )
         
-        await safe_callback_answer(callback)
-    
-    @dp.callback_query(F.data == "back_to_main")
-    async def back_to_main(callback: CallbackQuery):
-        """Возврат в главное меню"""
-        await show_main_menu(callback)
-    
@@ -0,0 +1,259 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_INTERVAL = 30.0
+# Интервал замера задержки цикла событий
+LAG_SAMPLE = 0.05
+
+OK, WARN, FAIL = "ok", "warn", "fail"
+STATUS_ICONS = {OK: "✅", WARN: "⚠️", FAIL: "❌"}
+STATUS_LEVELS = {OK: 0, WARN: 1, FAIL: 2}
+
+MB = 1024 * 1024
+# Пороги проверок: (предупреждение, сбой)
+THRESHOLDS = {
+    "loop_lag": (0.1, 1.0),
+    "db_read": (0.1, 1.0),
+    "db_write": (0.5, 2.0),
+    "telegram_rtt": (1.0, 5.0),
+    "wal_size": (64 * MB, 512 * MB),
+    "rss": (512 * MB, 1024 * MB)
+}
+
+health_status = registry.gauge("health_check_status", "Результат проверки: 0 - норма, 1 - предупреждение, 2 - сбой")
+health_value = registry.gauge("health_check_value", "Последнее значение проверки (секунды или байты)")
+
+def _status(name: str, value: float) -> str:
+    warn, fail = THRESHOLDS[name]
+    if value >= fail:
+        return FAIL
+    if value >= warn:
+        return WARN
+    return OK
+
+def _check(name: str, title: str, value: Optional[float], text: str, status: Optional[str] = None) -> Dict:
+    if status is None:
+        status = _status(name, value) if name in THRESHOLDS and value is not None else OK
+    return {"name": name, "title": title, "value": value, "status": status, "text": text}
+
+def _error_check(name: str, title: str, error: Exception) -> Dict:
+    return _check(name, title, None, f"ошибка: {type(error).__name__}: {error}", FAIL)
+
+def _format_size(size: int) -> str:
+    return f"{size / MB:.1f} МБ" if size >= MB else f"{size / 1024:.0f} КБ"
+
+def rss_bytes() -> Optional[int]:
+    """Текущий RSS процесса (Linux), иначе пиковый по getrusage"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # В macOS значение в байтах, в Linux - в килобайтах
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+async def check_loop_lag() -> Dict:
+    """Задержка планирования цикла событий"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await asyncio.sleep(LAG_SAMPLE)
+    lag = max(0.0, loop.time() - started - LAG_SAMPLE)
+    return _check("loop_lag", "Задержка цикла событий", lag, f"{lag * 1000:.1f} мс")
+
+async def check_database(database) -> List[Dict]:
+    """Задержка чтения и записи, размер базы и WAL (для SQLite)"""
+    checks = []
+    for name, title, probe in (
+        ("db_read", "Чтение из базы", database.probe_read),
+        ("db_write", "Запись в базу", database.probe_write)
+    ):
+        started = time.perf_counter()
+        try:
+            await probe()
+        except Exception as e:
+            checks.append(_error_check(name, title, e))
+            continue
+        elapsed = time.perf_counter() - started
+        checks.append(_check(name, title, elapsed, f"{elapsed * 1000:.1f} мс"))
+
+    # Размер файла и WAL есть только у SQLite
+    if not database.db_path:
+        return checks
+    try:
+        db_size = os.path.getsize(database.db_path)
+    except OSError:
+        db_size = 0
+    wal_path = database.db_path + "-wal"
+    wal_size = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    checks.append(_check(
+        "wal_size", "Журнал WAL", wal_size,
+        f"{_format_size(wal_size)} (база {_format_size(db_size)})" if os.path.exists(wal_path)
+        else f"нет (база {_format_size(db_size)})"
+    ))
+    return checks
+
+async def check_telegram(bot) -> Dict:
+    """Время ответа Bot API на getMe"""
+    started = time.perf_counter()
+    try:
+        await bot.get_me()
+    except Exception as e:
+        return _error_check("telegram_rtt", "Ответ Bot API", e)
+    elapsed = time.perf_counter() - started
+    return _check("telegram_rtt", "Ответ Bot API", elapsed, f"{elapsed * 1000:.0f} мс")
+
+def check_memory() -> Dict:
+    """Память процесса"""
+    rss = rss_bytes()
+    if rss is None:
+        return _check("rss", "Память процесса (RSS)", None, "недоступно")
+    return _check("rss", "Память процесса (RSS)", rss, _format_size(rss))
+
+async def run_checks(database, bot=None, queues: Optional[Dict[str, Callable[[], int]]] = None) -> List[Dict]:
+    """Однократный прогон всех проверок (для фонового опроса и командной строки)"""
+    checks = [await check_loop_lag()]
+    checks.extend(await check_database(database))
+    if bot is not None:
+        checks.append(await check_telegram(bot))
+    checks.append(check_memory())
+    for name, depth in (queues or {}).items():
+        try:
+            value = int(depth())
+        except Exception as e:
+            checks.append(_error_check(f"queue:{name}", f"Очередь: {name}", e))
+            continue
+        checks.append(_check(f"queue:{name}", f"Очередь: {name}", value, str(value)))
+    return checks
+
+def overall_status(checks: List[Dict]) -> str:
+    """Худший статус среди проверок"""
+    return max((check["status"] for check in checks), key=STATUS_LEVELS.get, default=OK)
+
+class HealthMonitor:
+    """Самодиагностика работающего бота: проверки в фоне, отчет из последнего замера"""
+
+    def __init__(self, database, interval: float = SAMPLE_INTERVAL, name: str = ""):
+        self.database = database
+        self.interval = interval
+        # Имя бота из BOT_CONFIGS: метки метрик, чтобы проверки ботов процесса не смешивались
+        self.labels = {"bot": name} if name else {}
+        self.checks: List[Dict] = []
+        self.sampled_at: Optional[float] = None
+        self._queues: Dict[str, Callable[[], int]] = {}
+        # Дополнительные GET-эндпоинты: путь -> асинхронная функция, возвращающая JSON
+        self._endpoints: Dict[str, Callable[[], Awaitable[Dict]]] = {}
+        self._bot = None
+        self._task: Optional[asyncio.Task] = None
+        self._runner = None
+
+    def add_queue(self, name: str, depth: Callable[[], int]):
+        """Регистрация очереди фоновой записи (функция возвращает ее глубину)"""
+        self._queues[name] = depth
+
+    def add_endpoint(self, path: str, func: Callable[[], Awaitable[Dict]]):
+        """Регистрация дополнительного эндпоинта на HTTP-сервере самодиагностики"""
+        self._endpoints[path] = func
+
+    def start(self, bot=None):
+        """Запуск фонового опроса"""
+        self._bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._sample_loop())
+
+    async def stop(self):
+        """Остановка опроса и HTTP-сервера"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _sample_loop(self):
+        while True:
+            try:
+                await self.sample()
+            except Exception as e:
+                logger.error(f"Ошибка самодиагностики: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def sample(self) -> List[Dict]:
+        """Прогон проверок и сохранение результата"""
+        checks = await run_checks(self.database, self._bot, self._queues)
+        for check in checks:
+            health_status.set(STATUS_LEVELS[check["status"]], check=check["name"], **self.labels)
+            if check["value"] is not None:
+                health_value.set(check["value"], check=check["name"], **self.labels)
+        self.checks = checks
+        self.sampled_at = time.time()
+        failed = [check["title"] for check in checks if check["status"] == FAIL]
+        if failed:
+            logger.warning(f"Самодиагностика: сбой проверок {', '.join(failed)}")
+        return checks
+
+    def report(self) -> Dict:
+        """Последний замер (без выполнения проверок)"""
+        return {
+            "status": overall_status(self.checks) if self.checks else WARN,
+            "sampled_at": self.sampled_at,
+            "checks": self.checks
+        }
+
+    async def start_http(self, host: str, port: int):
+        """HTTP-эндпоинт GET /health (200 при норме и предупреждениях, 503 при сбое) и дополнительные"""
+        from aiohttp import web
+
+        async def handle(request):
+            report = self.report()
+            return web.json_response(
+                report,
+                status=503 if report["status"] == FAIL else 200,
+                dumps=lambda data: json.dumps(data, ensure_ascii=False)
+            )
+
+        def make_handler(func):
+            async def handle_endpoint(request):
+                return web.json_response(await func(), dumps=lambda data: json.dumps(data, ensure_ascii=False))
+            return handle_endpoint
+
+        app = web.Application()
+        app.router.add_get("/health", handle)
+        for path, func in self._endpoints.items():
+            app.router.add_get(path, make_handler(func))
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Эндпоинт самодиагностики: http://{host}:{port}/health")
+
+def format_health(report: Dict) -> str:
+    """Текст отчета для админ-панели и командной строки"""
+    if not report["checks"]:
+        return "🩺 Самодиагностика\n\nПроверки еще не выполнялись."
+
+    lines = [f"🩺 Самодиагностика: {STATUS_ICONS[report['status']]} {report['status']}"]
+    if report["sampled_at"]:
+        age = time.time() - report["sampled_at"]
+        lines.append(f"Замер: {datetime.fromtimestamp(report['sampled_at']).strftime('%H:%M:%S')} ({age:.0f} с назад)")
+    lines.append("")
+    for check in report["checks"]:
+        lines.append(f"{STATUS_ICONS[check['status']]} {check['title']}: {check['text']}")
+    return "\n".join(lines)
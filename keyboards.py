@@ -1,33 +1,43 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-def get_main_menu_keyboard():
-    """Главное меню бота"""
+from callbacks import MAIN_MENU, CATEGORY, SERVICE, DETAILS, ORDER, GIVEAWAY_JOIN, MY_ORDERS, ORDER_STATUS
+from orders import ORDER_TRANSITIONS, TRANSITION_BUTTONS
+
+def get_main_menu_keyboard(categories: list):
+    """Главное меню бота: кнопки категорий по порядку, узкие - по две в ряд"""
     keyboard = InlineKeyboardBuilder()
     
-    keyboard.row(
-        InlineKeyboardButton(text="📦 Оптимизация ПК", callback_data="category_optimization"),
-        width=1
-    )
-    keyboard.row(
-        InlineKeyboardButton(text="💻 Комплектующие", callback_data="category_components"),
-        InlineKeyboardButton(text="🖱 Девайсы", callback_data="category_devices"),
-        width=2
-    )
-    keyboard.row(
-        InlineKeyboardButton(text="🎁 Розыгрыш", callback_data="category_giveaway"),
-        width=1
-    )
-
-    keyboard.row(
-        InlineKeyboardButton(text="🧾 О нас", callback_data="category_about"),
-        InlineKeyboardButton(text="📞 Контакты", callback_data="category_contacts"),
-        width=2
-    )
+    buttons = []
+    for category in categories:
+        buttons.append((
+            InlineKeyboardButton(text=category['button'], callback_data=CATEGORY.pack(category['id'])),
+            category['wide']
+        ))
+        # «Мои заказы» - рядом с розыгрышем
+        if category['kind'] == "giveaway":
+            buttons.append((InlineKeyboardButton(text="📋 Мои заказы", callback_data=MY_ORDERS.pack(0)), False))
+    if not any(category['kind'] == "giveaway" for category in categories):
+        buttons.append((InlineKeyboardButton(text="📋 Мои заказы", callback_data=MY_ORDERS.pack(0)), False))
+    
+    row = []
+    for button, wide in buttons:
+        if wide:
+            if row:
+                keyboard.row(*row, width=2)
+                row = []
+            keyboard.row(button, width=1)
+            continue
+        row.append(button)
+        if len(row) == 2:
+            keyboard.row(*row, width=2)
+            row = []
+    if row:
+        keyboard.row(*row, width=2)
     
     return keyboard.as_markup()
 
-def get_category_keyboard(category_key: str, services: list):
+def get_category_keyboard(category_id: int, services: list):
     """Клавиатура для услуг категории"""
     keyboard = InlineKeyboardBuilder()
     
@@ -38,46 +48,46 @@ def get_category_keyboard(category_key: str, services: list):
         keyboard.row(
             InlineKeyboardButton(
                 text=service_name,
-                callback_data=f"service_{service['id']}"
+                callback_data=SERVICE.pack(service['id'])
             ),
             width=1
         )
     
     keyboard.row(
-        InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu"),
+        InlineKeyboardButton(text="🏠 Главное меню", callback_data=MAIN_MENU.pack()),
         width=1
     )
     
     return keyboard.as_markup()
 
-def get_service_keyboard(service_id: int, category_key: str):
+def get_service_keyboard(service_id: int, category_id: int):
     """Клавиатура для конкретной услуги"""
     keyboard = InlineKeyboardBuilder()
     
     keyboard.row(
-        InlineKeyboardButton(text="📄 Подробнее", callback_data=f"details_{service_id}"),
-        InlineKeyboardButton(text="✅ Заказать", callback_data=f"order_{service_id}"),
+        InlineKeyboardButton(text="📄 Подробнее", callback_data=DETAILS.pack(service_id)),
+        InlineKeyboardButton(text="✅ Заказать", callback_data=ORDER.pack(service_id)),
         width=2
     )
     keyboard.row(
-        InlineKeyboardButton(text="🔙 К категории", callback_data=f"category_{category_key}"),
-        InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu"),
+        InlineKeyboardButton(text="🔙 К категории", callback_data=CATEGORY.pack(category_id)),
+        InlineKeyboardButton(text="🏠 Главное меню", callback_data=MAIN_MENU.pack()),
         width=2
     )
     
     return keyboard.as_markup()
 
-def get_details_keyboard(service_id: int, category_key: str):
+def get_details_keyboard(service_id: int):
     """Клавиатура для подробной информации об услуге"""
     keyboard = InlineKeyboardBuilder()
     
     keyboard.row(
-        InlineKeyboardButton(text="✅ Заказать", callback_data=f"order_{service_id}"),
+        InlineKeyboardButton(text="✅ Заказать", callback_data=ORDER.pack(service_id)),
         width=1
     )
     keyboard.row(
-        InlineKeyboardButton(text="🔙 К услуге", callback_data=f"service_{service_id}"),
-        InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu"),
+        InlineKeyboardButton(text="🔙 К услуге", callback_data=SERVICE.pack(service_id)),
+        InlineKeyboardButton(text="🏠 Главное меню", callback_data=MAIN_MENU.pack()),
         width=2
     )
     
@@ -88,12 +98,63 @@ def get_back_to_main_keyboard():
     keyboard = InlineKeyboardBuilder()
     
     keyboard.row(
-        InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu"),
+        InlineKeyboardButton(text="🏠 Главное меню", callback_data=MAIN_MENU.pack()),
+        width=1
+    )
+    
+    return keyboard.as_markup()
+
+def get_giveaway_keyboard(giveaway_id=None):
+    """Клавиатура раздела Розыгрыш"""
+    keyboard = InlineKeyboardBuilder()
+    
+    if giveaway_id:
+        keyboard.row(
+            InlineKeyboardButton(text="🎉 Участвовать", callback_data=GIVEAWAY_JOIN.pack(giveaway_id)),
+            width=1
+        )
+    keyboard.row(
+        InlineKeyboardButton(text="🏠 Главное меню", callback_data=MAIN_MENU.pack()),
         width=1
     )
     
     return keyboard.as_markup()
 
+def get_order_history_keyboard(next_cursor=None, is_first_page=True):
+    """Клавиатура истории заказов"""
+    keyboard = InlineKeyboardBuilder()
+    
+    buttons = []
+    if not is_first_page:
+        buttons.append(InlineKeyboardButton(text="⏮ В начало", callback_data=MY_ORDERS.pack(0)))
+    if next_cursor:
+        buttons.append(InlineKeyboardButton(text="Ранее ▶️", callback_data=MY_ORDERS.pack(next_cursor)))
+    if buttons:
+        keyboard.row(*buttons, width=2)
+    keyboard.row(
+        InlineKeyboardButton(text="🏠 Главное меню", callback_data=MAIN_MENU.pack()),
+        width=1
+    )
+    
+    return keyboard.as_markup()
+
+def get_order_status_keyboard(order_id: int, status: str):
+    """Кнопки смены статуса заявки в канале"""
+    transitions = ORDER_TRANSITIONS.get(status, ())
+    if not transitions:
+        return None
+    
+    keyboard = InlineKeyboardBuilder()
+    keyboard.row(
+        *[
+            InlineKeyboardButton(text=TRANSITION_BUTTONS[target], callback_data=ORDER_STATUS.pack(order_id, target))
+            for target in transitions
+        ],
+        width=2
+    )
+    
+    return keyboard.as_markup()
+
 def get_contact_keyboard():
     """Клавиатура для контактов"""
     keyboard = InlineKeyboardBuilder()
@@ -107,7 +168,7 @@ def get_contact_keyboard():
         width=1
     )
     keyboard.row(
-        InlineKeyboardButton(text="🏠 Главное меню", callback_data="main_menu"),
+        InlineKeyboardButton(text="🏠 Главное меню", callback_data=MAIN_MENU.pack()),
         width=1
     )
     
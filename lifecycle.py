@@ -0,0 +1,165 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from bot_context import bot_file
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Файл-маркер корректной остановки: пишется последним шагом остановки
+# и удаляется при запуске, поэтому после падения его нет
+CLEAN_SHUTDOWN_MARKER = "clean_shutdown.json"
+
+DEFAULT_SHUTDOWN_TIMEOUT = 20.0
+
+# Общая для ботов процесса: каждый бот прибавляет и вычитает свои апдейты
+updates_in_flight = registry.gauge("updates_in_flight", "Апдейты в обработке")
+updates_dropped_on_shutdown = registry.counter("updates_dropped_on_shutdown_total", "Апдейты, отклоненные во время остановки")
+
+class LifecycleManager(BaseMiddleware):
+    """Запуск и корректная остановка: учет апдейтов в обработке, ожидание и сброс буферов"""
+
+    def __init__(self, shutdown_timeout: float = DEFAULT_SHUTDOWN_TIMEOUT, marker_path: str = CLEAN_SHUTDOWN_MARKER):
+        self.shutdown_timeout = shutdown_timeout
+        self.marker_path = marker_path
+        self.stopping = False
+        self.started_at: Optional[float] = None
+        self.previous_shutdown: Optional[Dict] = None
+        self._in_flight = 0
+        self._idle: Optional[asyncio.Event] = None
+        self._shutdown_task: Optional[asyncio.Task] = None
+        # (название, функция) в порядке регистрации
+        self._flushers: List[Tuple[str, Callable[[], Awaitable[Any]]]] = []
+
+    @property
+    def in_flight(self) -> int:
+        """Количество апдейтов в обработке"""
+        return self._in_flight
+
+    def add_flusher(self, name: str, func: Callable[[], Awaitable[Any]]):
+        """Регистрация сброса буфера, выполняемого при остановке"""
+        self._flushers.append((name, func))
+
+    def startup(self) -> bool:
+        """Отметка запуска; возвращает True, если прошлая остановка была корректной"""
+        self.started_at = time.time()
+        self.previous_shutdown = None
+        try:
+            with open(self.marker_path, 'r', encoding='utf-8') as f:
+                self.previous_shutdown = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.error(f"Не удалось прочитать маркер остановки: {e}")
+
+        if self.previous_shutdown is not None:
+            try:
+                os.remove(self.marker_path)
+            except OSError as e:
+                logger.error(f"Не удалось удалить маркер остановки: {e}")
+            logger.info(f"Предыдущая остановка была корректной ({self.previous_shutdown.get('time')})")
+            return True
+
+        logger.warning("Маркер корректной остановки не найден: предыдущий запуск мог завершиться аварийно")
+        return False
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        if self.stopping:
+            updates_dropped_on_shutdown.inc()
+            logger.warning(f"Апдейт {event.update_id} отклонен: бот останавливается")
+            return None
+
+        if self._idle is None:
+            self._idle = asyncio.Event()
+        self._in_flight += 1
+        self._idle.clear()
+        updates_in_flight.inc()
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight -= 1
+            updates_in_flight.dec()
+            if self._in_flight == 0:
+                self._idle.set()
+
+    async def drain(self, timeout: float) -> bool:
+        """Ожидание завершения апдейтов в обработке; False, если истек срок"""
+        if self._in_flight == 0:
+            return True
+        logger.info(f"Ожидание завершения {self._in_flight} апдейтов (до {timeout:.0f} с)...")
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            logger.error(f"Не дождались завершения {self._in_flight} апдейтов за {timeout:.0f} с")
+            return False
+
+    async def shutdown(self):
+        """Остановка: прекращение приема, ожидание обработки, сброс буферов, маркер"""
+        # Повторные вызовы (хук диспетчера и finally в main) ждут одну и ту же остановку
+        if self._shutdown_task is None:
+            self._shutdown_task = asyncio.ensure_future(self._shutdown())
+        await asyncio.shield(self._shutdown_task)
+
+    async def _shutdown(self):
+        self.stopping = True
+        started = time.perf_counter()
+        logger.info("Остановка: новые апдейты не принимаются")
+
+        drained = await self.drain(self.shutdown_timeout)
+        abandoned = self._in_flight
+
+        flushed = True
+        for name, func in self._flushers:
+            try:
+                await func()
+                logger.info(f"Буфер сброшен: {name}")
+            except Exception as e:
+                flushed = False
+                logger.error(f"Ошибка сброса буфера {name}: {e}")
+
+        duration = time.perf_counter() - started
+        if drained and flushed:
+            self._write_marker(duration)
+            logger.info(f"Бот остановлен корректно за {duration:.1f} с")
+        else:
+            logger.error(f"Остановка с потерями: не завершено апдейтов {abandoned}, буферы сброшены: {flushed}")
+
+    def _write_marker(self, duration: float):
+        marker = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started_at, 1) if self.started_at else None,
+            "shutdown_seconds": round(duration, 3)
+        }
+        try:
+            with open(self.marker_path, 'w', encoding='utf-8') as f:
+                json.dump(marker, f, ensure_ascii=False)
+        except OSError as e:
+            logger.error(f"Не удалось записать маркер остановки: {e}")
+
+def setup_lifecycle(dp, config) -> LifecycleManager:
+    """Подключение учета апдейтов и хука остановки к диспетчеру"""
+    lifecycle = LifecycleManager(
+        shutdown_timeout=config.SHUTDOWN_TIMEOUT,
+        marker_path=bot_file(CLEAN_SHUTDOWN_MARKER, config.NAME)
+    )
+    # Первый внешний middleware: апдейты учитываются, пока ждут в очередях контроля нагрузки
+    dp.update.outer_middleware(lifecycle)
+    # aiogram вызывает хук после остановки поллинга, но до закрытия сессии бота
+    dp.shutdown.register(lifecycle.shutdown)
+    dp["lifecycle"] = lifecycle
+    return lifecycle
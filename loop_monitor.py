@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from alerts import alert_manager
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Период замера задержки планирования и порог «медленного» участка кода, секунды
+LAG_INTERVAL = 0.5
+SLOW_THRESHOLD = 0.1
+# Окно скользящей статистики и сколько последних зависаний хранить
+ROLLING_WINDOW = 300.0
+MAX_SLOW_EVENTS = 20
+STACK_DEPTH = 12
+
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+loop_lag = registry.histogram("event_loop_lag_seconds", "Задержка планирования цикла событий", buckets=LAG_BUCKETS)
+loop_stall_seconds = registry.histogram("event_loop_stall_seconds", "Длительность блокировок цикла событий по обработчикам", buckets=LAG_BUCKETS)
+loop_stalls = registry.counter("event_loop_stalls_total", "Блокировки цикла событий дольше порога по обработчикам")
+slow_callbacks = registry.counter("asyncio_slow_callbacks_total", "Медленные колбэки по отчетам asyncio (режим отладки)")
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Модули проекта между циклом событий и хендлером (запуск, middleware, роутер):
+# при разборе стека они не считаются обработчиками
+_NOT_HANDLERS = {
+    os.path.join(PROJECT_DIR, name)
+    for name in ("main.py", "loop_monitor.py", "lifecycle.py", "admission.py", "startup.py", "callbacks.py", "recorder.py")
+}
+
+def _handler_name(frames: List[traceback.FrameSummary]) -> str:
+    """Внешний кадр кода бота в стеке - обычно это хендлер"""
+    for frame in frames:
+        if frame.filename.startswith(PROJECT_DIR) and frame.filename not in _NOT_HANDLERS:
+            return f"{os.path.basename(frame.filename)[:-3]}.{frame.name}"
+    return "unknown"
+
+class SlowEvent:
+    """Зафиксированная блокировка цикла событий"""
+
+    def __init__(self, started: float, handler: str, stack: List[str], source: str = "watchdog"):
+        self.started = started
+        self.handler = handler
+        self.stack = stack
+        self.source = source
+        self.duration = 0.0
+
+class LoopMonitor:
+    """Сторож цикла событий: задержка планирования и стек кода, блокирующего цикл"""
+
+    def __init__(self, interval: float = LAG_INTERVAL, slow_threshold: float = SLOW_THRESHOLD):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.events: Deque[SlowEvent] = deque(maxlen=MAX_SLOW_EVENTS)
+        # (время, задержка) за последние ROLLING_WINDOW секунд
+        self._samples: Deque[Tuple[float, float]] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = 0.0
+        self._current: Optional[SlowEvent] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._debug_handler: Optional[logging.Handler] = None
+
+    def start(self, debug: bool = False):
+        """Запуск замеров в цикле и сторожевого потока"""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._lag_loop())
+        self._thread = threading.Thread(target=self._watchdog, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        if debug:
+            self.enable_debug()
+
+    async def stop(self):
+        """Остановка замеров"""
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self._debug_handler is not None:
+            logging.getLogger("asyncio").removeHandler(self._debug_handler)
+            self._debug_handler = None
+
+    def enable_debug(self):
+        """Режим отладки asyncio: цикл сам сообщает о колбэках дольше порога (заметно медленнее)"""
+        self._loop.set_debug(True)
+        self._loop.slow_callback_duration = self.slow_threshold
+        self._debug_handler = _SlowCallbackHandler(self)
+        logging.getLogger("asyncio").addHandler(self._debug_handler)
+        logger.warning("Включен режим отладки asyncio: используйте только для поиска блокировок")
+
+    async def _lag_loop(self):
+        loop = self._loop
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self._heartbeat = time.monotonic()
+            self._record_lag(lag)
+
+    def _record_lag(self, lag: float):
+        now = time.monotonic()
+        loop_lag.observe(lag)
+        self._samples.append((now, lag))
+        while self._samples and now - self._samples[0][0] > ROLLING_WINDOW:
+            self._samples.popleft()
+
+        event = self._current
+        if event is not None:
+            # Цикл снова работает: фиксируем полную длительность блокировки
+            self._current = None
+            event.duration = lag
+            loop_stall_seconds.observe(lag, handler=event.handler)
+            logger.warning(
+                f"Цикл событий заблокирован на {lag * 1000:.0f} мс в {event.handler}:\n" + "".join(event.stack)
+            )
+            alert_manager.report(
+                f"loop_stall:{event.handler}",
+                f"Блокировка цикла событий в {event.handler}",
+                f"{lag * 1000:.0f} мс"
+            )
+
+    def _watchdog(self):
+        """Поток-сторож: если цикл не отметился вовремя, снимает стек его потока"""
+        check_every = max(0.01, self.slow_threshold / 2)
+        while not self._stopped.wait(check_every):
+            overdue = time.monotonic() - self._heartbeat - self.interval
+            if overdue < self.slow_threshold or self._current is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            # Стек в порядке вызова: поиск хендлера идет от внешних кадров к внутренним
+            frames = traceback.extract_stack(frame)
+            event = SlowEvent(time.time() - overdue, _handler_name(frames), traceback.format_list(frames[-STACK_DEPTH:]))
+            self._current = event
+            self.events.append(event)
+            loop_stalls.inc(handler=event.handler)
+
+    def rolling_stats(self) -> Dict[str, float]:
+        """Задержка за последние ROLLING_WINDOW секунд: p50, p95, максимум"""
+        lags = sorted(lag for _, lag in self._samples)
+        if not lags:
+            return {'count': 0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+        return {
+            'count': len(lags),
+            'p50': lags[int(0.5 * (len(lags) - 1))],
+            'p95': lags[int(0.95 * (len(lags) - 1))],
+            'max': lags[-1]
+        }
+
+class _SlowCallbackHandler(logging.Handler):
+    """Перехват сообщений asyncio «Executing ... took N seconds» в режиме отладки"""
+
+    def __init__(self, monitor: LoopMonitor):
+        super().__init__(logging.WARNING)
+        self.monitor = monitor
+
+    def emit(self, record: logging.LogRecord):
+        if not isinstance(record.msg, str) or not record.msg.startswith("Executing") or len(record.args or ()) != 2:
+            return
+        handle, duration = record.args
+        slow_callbacks.inc()
+        event = SlowEvent(time.time() - duration, str(handle)[:200], [], source="asyncio")
+        event.duration = duration
+        self.monitor.events.append(event)
+
+def format_loop_stats(monitor: LoopMonitor) -> str:
+    """Сводка по циклу событий для админ-панели"""
+    stats = monitor.rolling_stats()
+    total = loop_lag.stats()
+    lines = [
+        f"Задержка за {ROLLING_WINDOW / 60:.0f} мин: p50 {stats['p50'] * 1000:.1f} мс, "
+        f"p95 {stats['p95'] * 1000:.1f} мс, макс. {stats['max'] * 1000:.0f} мс "
+        f"(с запуска макс. {total['max'] * 1000:.0f} мс)",
+        f"Блокировок дольше {monitor.slow_threshold * 1000:.0f} мс: {int(sum(loop_stalls.values().values()))}"
+    ]
+    for event in list(monitor.events)[-5:][::-1]:
+        where = event.stack[-1].strip().splitlines()[0] if event.stack else event.source
+        lines.append(f"• {event.handler}: {event.duration * 1000:.0f} мс ({where})")
+    return "\n".join(lines)
@@ -1,14 +1,15 @@
 import asyncio
+import importlib
 import logging
-import os
+import signal
 import sys
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from contextlib import suppress
 
-from config import Config
-from database import init_db
-from handlers import register_user_handlers
-from admin_handlers import register_admin_handlers
+# Профилировщик создается до тяжелых импортов, чтобы учесть их в профиле запуска
+from startup import StartupProfiler, FirstUpdateMiddleware
+
+profiler = StartupProfiler()
+PROFILE_STARTUP = "--profile-startup" in sys.argv
 
 # Настройка логирования
 logging.basicConfig(
@@ -22,41 +23,283 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-# Глобальный экземпляр бота
-bot = None
+# Боты процесса: имя -> (бот, диспетчер); сессия Bot API общая для всех ботов
+bots = {}
+session = None
+# Самодиагностика ботов по именам: HTTP-эндпоинт основного бота отдает и отчеты остальных
+health_monitors = {}
+# Остановка по SIGTERM/SIGINT для всех диспетчеров сразу (создается в main)
+stop_event = None
+
+async def warm_up(label: str = ""):
+    """Прогрев после старта поллинга: пока он идет, бот отвечает по снимку каталога"""
+    from catalog import catalog
+    with profiler.phase(f"прогрев каталога из базы{label}"):
+        try:
+            await catalog.reload()
+            logger.info(f"Каталог{label} загружен из базы: {len(await catalog.get_all_services())} услуг")
+        except Exception as e:
+            logger.error(f"Ошибка загрузки каталога{label}: {e}")
+
+def bot_health_endpoint(name: str):
+    """Отчет самодиагностики бота name для HTTP-эндпоинта основного бота"""
+    async def report():
+        monitor = health_monitors.get(name)
+        return monitor.report() if monitor else {"status": "warn", "sampled_at": None, "checks": []}
+    return report
+
+def stop_bots(sig):
+    """Обработчик SIGTERM/SIGINT: остановка поллинга всех ботов процесса"""
+    logger.warning(f"Получен сигнал {sig.name}: остановка ботов")
+    stop_event.set()
+
+async def run_bot(config, primary: bool, loop_monitor, memory_profiler, names):
+    """Запуск одного бота: свой диспетчер, база, каталог и фоновые задачи в контексте бота"""
+    from aiogram import Bot, Dispatcher
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from bot_context import current_bot
+    from admission import setup_admission
+    from lifecycle import setup_lifecycle
+    from database import db, init_db, create_backend
+    from catalog import catalog
+    from giveaway import giveaway_manager
+    from analytics import analytics
+    from alerts import alert_manager
+    from media import album_collector
+    from scheduled_posts import post_scheduler
+    from handlers import register_user_handlers
+    from admin_handlers import register_admin_handlers
+    
+    # Задача бота и все, что она создает, работают с объектами этого бота
+    name = config.NAME
+    current_bot.set(name)
+    label = f" [{name}]" if name else ""
+    lifecycle = None
+    warmup_task = None
+    
+    try:
+        logger.info(f"Бот{label}: токен {'*' * 10 + config.BOT_TOKEN[-4:]}, Admin ID: {config.ADMIN_ID}")
+        
+        # Создание бота и диспетчера; HTTP-сессия и ее пул соединений общие
+        with profiler.phase(f"создание бота и диспетчера{label}"):
+            bot = Bot(token=config.BOT_TOKEN, session=session)
+            storage = MemoryStorage()
+            dp = Dispatcher(storage=storage)
+            bots[name] = (bot, dp)
+        
+        # Учет апдейтов в обработке и корректная остановка по SIGTERM/SIGINT
+        lifecycle = setup_lifecycle(dp, config)
+        lifecycle.startup()
+        
+        # Запись апдейтов для воспроизведения (включается RECORD_UPDATES)
+        if config.RECORD_UPDATES:
+            from recorder import setup_recorder
+            recorder = setup_recorder(dp, config)
+            lifecycle.add_flusher("запись апдейтов", recorder.stop)
+        
+        # Инициализация базы данных
+        logger.info(f"Инициализация базы данных{label}...")
+        with profiler.phase(f"схема базы данных{label}"):
+            db.use(create_backend(config))
+            await init_db()
+        logger.info(f"База данных{label} инициализирована")
+        
+        # Снимок каталога позволяет отвечать до загрузки каталога из базы
+        with profiler.phase(f"снимок каталога{label}"):
+            catalog.load_snapshot()
+        
+        dp["loop_monitor"] = loop_monitor
+        
+        # Альбомы, еще ждущие остальных сообщений, публикуются до остановки сессии бота
+        lifecycle.add_flusher("альбомы", album_collector.stop)
+        giveaway_manager.start()
+        lifecycle.add_flusher("участники розыгрышей", giveaway_manager.stop)
+        analytics.start()
+        lifecycle.add_flusher("аналитика", analytics.stop)
+        alert_manager.start(bot, config.ADMIN_ID)
+        lifecycle.add_flusher("оповещения админа", alert_manager.stop)
+        
+        # Отложенные посты: очередь восстанавливается из базы после перезапуска
+        with profiler.phase(f"отложенные посты{label}"):
+            post_scheduler.min_interval = config.POST_MIN_INTERVAL
+            post_scheduler.retry_attempts = config.POST_RETRY_ATTEMPTS
+            post_scheduler.retry_delay = config.POST_RETRY_DELAY
+            await post_scheduler.start(bot)
+            lifecycle.add_flusher("отложенные посты", post_scheduler.stop)
+        
+        # Резервные копии базы по расписанию (без расписания модуль грузит /backup); только для SQLite
+        if config.BACKUP_INTERVAL_HOURS > 0 and db.db_path:
+            with profiler.phase(f"резервное копирование{label}"):
+                from backup import BackupManager
+                backup_manager = BackupManager(db.db_path, config.BACKUP_DIR, config.BACKUP_KEEP, config.BACKUP_INTERVAL_HOURS)
+                dp["backup_manager"] = backup_manager
+                backup_manager.start()
+                lifecycle.add_flusher("резервное копирование", backup_manager.stop)
+        
+        # Регистрация хендлеров
+        logger.info(f"Регистрация хендлеров{label}...")
+        with profiler.phase(f"регистрация хендлеров{label}"):
+            dp.update.outer_middleware(FirstUpdateMiddleware(profiler))
+            register_user_handlers(dp, config)
+            register_admin_handlers(dp, config)
+            admission = setup_admission(dp, config)
+        logger.info(f"Хендлеры{label} зарегистрированы")
+        
+        # Размеры структур бота в отчете о памяти. Отчет строится в потоке, куда контекст
+        # бота не передается, поэтому берутся экземпляры этого бота
+        with profiler.phase(f"профилирование памяти{label}"):
+            from admin_handlers import admin_states
+            from handlers import channel_admin_cache
+            from orders import order_history_cache
+            from media import media_cache
+            bot_catalog = catalog.for_bot(name)
+            bot_alerts = alert_manager.for_bot(name)
+            bot_giveaways = giveaway_manager.for_bot(name)
+            bot_analytics = analytics.for_bot(name)
+            bot_admin_states = admin_states.for_bot(name)
+            bot_order_history = order_history_cache.for_bot(name)
+            bot_channel_admins = channel_admin_cache.for_bot(name)
+            bot_media = media_cache.for_bot(name)
+            memory_profiler.add_size(f"состояния админа (admin_states){label}", lambda: len(bot_admin_states))
+            memory_profiler.add_size(f"FSM MemoryStorage{label}", lambda: len(dp.storage.storage))
+            memory_profiler.add_size(f"кэш истории заказов{label}", lambda: len(bot_order_history))
+            memory_profiler.add_size(f"кэш админов канала{label}", lambda: len(bot_channel_admins))
+            memory_profiler.add_size(f"кэш file_id изображений{label}", lambda: len(bot_media._file_ids))
+            memory_profiler.add_size(f"каталог услуг{label}", lambda: len(bot_catalog._services))
+            memory_profiler.add_size(f"оповещения админа{label}", lambda: len(bot_alerts.alerts))
+            memory_profiler.add_size(f"буфер участников розыгрышей{label}", lambda: bot_giveaways.pending_count)
+            memory_profiler.add_size(f"буфер аналитики{label}", lambda: bot_analytics.pending_count)
+            dp["memory_profiler"] = memory_profiler
+        
+        # Самодиагностика: проверки в фоне, /health и HTTP-эндпоинт (один на процесс, у основного бота)
+        with profiler.phase(f"самодиагностика{label}"):
+            from health import HealthMonitor
+            health_monitor = HealthMonitor(db.for_bot(name), config.HEALTH_INTERVAL, name)
+            health_monitor.add_queue("апдейты в обработке", lambda: lifecycle.in_flight)
+            health_monitor.add_queue("ожидают допуска", lambda: sum(c.waiting for c in admission.classes.values()))
+            health_monitor.add_queue("участники розыгрышей", lambda: bot_giveaways.pending_count)
+            health_monitor.add_queue("аналитика", lambda: bot_analytics.pending_count)
+            health_monitor.add_queue("оповещения админа", lambda: sum(1 for a in bot_alerts.alerts.values() if a.unsent))
+            dp["health_monitor"] = health_monitor
+            health_monitors[name] = health_monitor
+            health_monitor.start(bot)
+            if primary and config.HEALTH_PORT:
+                health_monitor.add_endpoint(
+                    "/memory", lambda: asyncio.get_running_loop().run_in_executor(None, memory_profiler.report)
+                )
+                for other in names[1:]:
+                    health_monitor.add_endpoint(f"/health/{other}", bot_health_endpoint(other))
+                await health_monitor.start_http(config.HEALTH_HOST, config.HEALTH_PORT)
+            lifecycle.add_flusher("самодиагностика", health_monitor.stop)
+        
+        logger.info(f"🚀 Бот{label} запущен и готов к работе!")
+        logger.info(f"📢 Канал для заявок{label}: {config.CHANNEL_ID}")
+        
+        # Каталог из базы догружается уже во время поллинга
+        warmup_task = asyncio.create_task(warm_up(label))
+        
+        if stop_event.is_set():
+            return
+        # Сигналы обрабатывает main: aiogram ставит свой обработчик на каждый диспетчер,
+        # и последний запущенный заменил бы остальные. Задача поллинга создана раньше ожидания
+        # сигнала, поэтому к остановке диспетчер уже занял блокировку и stop_polling не падает
+        polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, close_bot_session=False))
+        stop_waiter = asyncio.create_task(stop_event.wait())
+        try:
+            await asyncio.wait((polling, stop_waiter), return_when=asyncio.FIRST_COMPLETED)
+            if not polling.done():
+                await dp.stop_polling()
+            await polling
+        finally:
+            stop_waiter.cancel()
+            if not polling.done():
+                polling.cancel()
+    
+    except Exception as e:
+        logger.error(f"Критическая ошибка бота{label}: {e}")
+        print(f"❌ КРИТИЧЕСКАЯ ОШИБКА{label}: {e}")
+        raise
+    
+    finally:
+        # При штатной остановке поллинга уже выполнено хуком диспетчера
+        if warmup_task and not warmup_task.done():
+            warmup_task.cancel()
+        if lifecycle:
+            await lifecycle.shutdown()
+        else:
+            await giveaway_manager.stop()
+        # Хранилище закрывается после сброса буферов записи
+        await db.close()
 
 async def main():
-    """Основная функция запуска бота"""
+    """Основная функция запуска: все боты из BOT_CONFIGS (или один бот из .env) в одном цикле событий"""
+    global session, stop_event
+    loop_monitor = None
+    memory_profiler = None
     
     try:
+        # Ядро aiogram нужно сразу; админские и редкие модули грузятся по требованию.
+        # Модули, которые использует run_bot, импортируются здесь только ради замера
+        # фаз профиля запуска, поэтому через import_module, без имен в main()
+        with profiler.phase("импорт aiogram"):
+            importlib.import_module("aiogram")
+            importlib.import_module("aiogram.fsm.storage.memory")
+        with profiler.phase("импорт модулей бота"):
+            from config import load_bot_configs
+            from bot_context import current_bot
+            from bot_session import create_session
+            for module in ("admission", "lifecycle", "database", "catalog", "giveaway", "analytics", "alerts", "scheduled_posts"):
+                importlib.import_module(module)
+        with profiler.phase("импорт хендлеров"):
+            importlib.import_module("handlers")
+            importlib.import_module("admin_handlers")
+        
         # Инициализация конфигурации
         logger.info("Загрузка конфигурации...")
-        config = Config()
-        logger.info(f"Бот токен загружен: {'*' * 10 + config.BOT_TOKEN[-4:] if config.BOT_TOKEN else 'НЕ УСТАНОВЛЕН'}")
-        logger.info(f"Admin ID: {config.ADMIN_ID}")
+        with profiler.phase("конфигурация"):
+            configs = load_bot_configs()
+        primary = configs[0]
+        names = [config.NAME for config in configs]
+        if len(configs) > 1:
+            logger.info(f"Ботов в процессе: {len(configs)} ({', '.join(names)})")
         
-        # Создание бота и диспетчера (глобальный экземпляр)
-        global bot
-        bot = Bot(token=config.BOT_TOKEN)
-        storage = MemoryStorage()
-        dp = Dispatcher(storage=storage)
+        # Общие для процесса части работают в контексте основного (первого) бота:
+        # ему уходят оповещения сторожа цикла событий
+        current_bot.set(primary.NAME)
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            with suppress(NotImplementedError):
+                loop.add_signal_handler(sig, stop_bots, sig)
         
-        # Инициализация базы данных
-        logger.info("Инициализация базы данных...")
-        await init_db()
-        logger.info("База данных инициализирована")
+        # Одна сессия Bot API на все боты: общий пул соединений, повторы и предохранитель
+        session = create_session(primary)
         
-        # Регистрация хендлеров
-        logger.info("Регистрация хендлеров...")
-        register_user_handlers(dp, config)
-        register_admin_handlers(dp, config)
-        logger.info("Хендлеры зарегистрированы")
+        # Сторож цикла событий: задержка планирования и стек блокирующего кода
+        with profiler.phase("сторож цикла событий"):
+            from loop_monitor import LoopMonitor
+            loop_monitor = LoopMonitor(primary.LOOP_LAG_INTERVAL, primary.LOOP_SLOW_THRESHOLD)
+            loop_monitor.start(debug=primary.LOOP_DEBUG)
+        
+        # Профилирование памяти: размеры структур ботов и снимки tracemalloc
+        with profiler.phase("профилирование памяти"):
+            from memory_report import MemoryProfiler
+            memory_profiler = MemoryProfiler(primary.MEMORY_SNAPSHOT_DIR, primary.MEMORY_SNAPSHOT_KEEP, primary.MEMORY_SNAPSHOT_MINUTES)
+            if primary.MEMORY_TRACE:
+                memory_profiler.start_tracing()
+            memory_profiler.start()
         
-        logger.info("🚀 Бот запущен и готов к работе!")
-        logger.info(f"📢 Канал для заявок: {config.CHANNEL_ID}")
+        profiler.mark_ready()
+        if PROFILE_STARTUP:
+            profiler.on_first_update = lambda: print(profiler.report())
         
-        # Запуск бота
-        await dp.start_polling(bot)
+        # Запуск ботов: ошибка одного бота не останавливает остальные
+        results = await asyncio.gather(
+            *(run_bot(config, config is primary, loop_monitor, memory_profiler, names) for config in configs),
+            return_exceptions=True
+        )
+        if any(isinstance(result, Exception) for result in results):
+            sys.exit(1)
         
     except ValueError as e:
         logger.error(f"Ошибка конфигурации: {e}")
@@ -73,9 +316,14 @@ async def main():
         sys.exit(1)
         
     finally:
-        if bot:
-            await bot.session.close()
-            logger.info("Сессия бота закрыта")
+        if memory_profiler:
+            await memory_profiler.stop()
+        if loop_monitor:
+            await loop_monitor.stop()
+        if session:
+            await session.outbound.stop()
+            await session.close()
+            logger.info("Сессия Bot API закрыта")
 
 if __name__ == "__main__":
     try:
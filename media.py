@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Union
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import (
+    BufferedInputFile,
+    CallbackQuery,
+    InputMediaPhoto,
+    InputMediaVideo,
+    Message
+)
+
+from bot_context import PerBot
+from database import db
+from utils import truncate_text
+
+logger = logging.getLogger(__name__)
+
+# Ограничение Telegram на длину подписи к фото
+CAPTION_LIMIT = 1024
+
+# Сколько ждать остальные сообщения альбома (media group), секунды
+ALBUM_COLLECT_DELAY = 1.0
+
+def content_hash(data: bytes) -> str:
+    """Хеш содержимого файла для дедупликации загрузок"""
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+def read_file(path: str) -> bytes:
+    """Чтение файла целиком (для вызова через asyncio.to_thread)"""
+    with open(path, 'rb') as f:
+        return f.read()
+
+def telegram_photo_key(message: Message) -> Optional[str]:
+    """Ключ для фото, уже загруженного в Telegram (по file_unique_id)"""
+    if not message.photo:
+        return None
+    return "tg:" + message.photo[-1].file_unique_id
+
+class MediaCache:
+    """Кэш file_id: каждое изображение загружается в Telegram только один раз"""
+
+    def __init__(self):
+        self._file_ids: Dict[str, str] = {}
+        # Блокировка загрузки по хешу и число ждущих ее: удаляется, когда не нужна никому
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+
+    async def get_file_id(self, key: str) -> Optional[str]:
+        """Получение file_id по ключу (память, затем база данных)"""
+        file_id = self._file_ids.get(key)
+        if file_id is None:
+            file_id = await db.get_media_file_id(key)
+            if file_id:
+                self._file_ids[key] = file_id
+        return file_id
+
+    async def remember(self, key: str, file_id: str):
+        """Сохранение file_id для ключа"""
+        self._file_ids[key] = file_id
+        await db.save_media_file_id(key, file_id)
+
+    async def remember_photo(self, message: Message) -> Optional[str]:
+        """Сохранение фото из сообщения; возвращает file_id (повторы не дублируются)"""
+        key = telegram_photo_key(message)
+        if key is None:
+            return None
+        file_id = await self.get_file_id(key)
+        if file_id is None:
+            file_id = message.photo[-1].file_id
+            await self.remember(key, file_id)
+        return file_id
+
+    async def upload_photo(self, bot, chat_id: Union[int, str], data: bytes, filename: str = "image.jpg", **kwargs) -> str:
+        """Отправка фото из байтов: загрузка только если такой файл еще не загружался"""
+        key = content_hash(data)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with lock:
+                file_id = await self.get_file_id(key)
+                if file_id:
+                    await bot.send_photo(chat_id, file_id, **kwargs)
+                else:
+                    sent = await bot.send_photo(chat_id, BufferedInputFile(data, filename=filename), **kwargs)
+                    file_id = sent.photo[-1].file_id
+                    await self.remember(key, file_id)
+                    logger.info(f"Изображение {filename} загружено в Telegram ({len(data)} байт)")
+        finally:
+            # Блокировка удаляется после последнего ждущего, в том числе при ошибке загрузки
+            self._lock_users[key] -= 1
+            if not self._lock_users[key]:
+                del self._lock_users[key]
+                del self._locks[key]
+        return file_id
+
+# Глобальный кэш медиафайлов
+media_cache = PerBot(lambda name: MediaCache())
+
+async def show_screen(
+    callback: CallbackQuery,
+    text: str,
+    reply_markup=None,
+    photo: Optional[str] = None,
+    parse_mode: Optional[str] = "Markdown"
+):
+    """Показ экрана в сообщении callback с переходами текст <-> фото"""
+    message = callback.message
+    if not message or not hasattr(message, 'edit_text'):
+        return
+
+    if photo:
+        caption = truncate_text(text, CAPTION_LIMIT)
+        if message.photo:
+            await message.edit_media(
+                InputMediaPhoto(media=photo, caption=caption, parse_mode=parse_mode),
+                reply_markup=reply_markup
+            )
+            return
+        await message.answer_photo(photo, caption=caption, reply_markup=reply_markup, parse_mode=parse_mode)
+    elif message.photo or message.video:
+        await message.answer(text, reply_markup=reply_markup, parse_mode=parse_mode)
+    else:
+        await message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+        return
+
+    # Тип сообщения сменился: старое сообщение заменено новым
+    try:
+        await message.delete()
+    except TelegramBadRequest:
+        pass
+
+def album_input_media(messages: List[Message], parse_mode: Optional[str] = "Markdown") -> List[Union[InputMediaPhoto, InputMediaVideo]]:
+    """Сборка media group из сообщений альбома по уже загруженным file_id"""
+    media = []
+    caption_used = False
+    for message in sorted(messages, key=lambda m: m.message_id):
+        caption = None
+        if message.caption and not caption_used:
+            caption = truncate_text(message.caption, CAPTION_LIMIT)
+            caption_used = True
+        if message.photo:
+            media.append(InputMediaPhoto(media=message.photo[-1].file_id, caption=caption, parse_mode=parse_mode))
+        elif message.video:
+            media.append(InputMediaVideo(media=message.video.file_id, caption=caption, parse_mode=parse_mode))
+    return media
+
+class AlbumCollector:
+    """Сборщик сообщений одного альбома (Telegram присылает их по одному)"""
+
+    def __init__(self, delay: float = ALBUM_COLLECT_DELAY):
+        self.delay = delay
+        self._albums: Dict[str, List[Message]] = {}
+        self._callbacks: Dict[str, Callable[[List[Message]], Awaitable[None]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        # Запущенные обработки альбомов: остановка ждет их завершения
+        self._tasks: Set[asyncio.Task] = set()
+
+    def add(self, message: Message, on_complete: Callable[[List[Message]], Awaitable[None]]):
+        """Добавление сообщения альбома; on_complete вызывается после последнего"""
+        group_id = message.media_group_id
+        self._albums.setdefault(group_id, []).append(message)
+        self._callbacks[group_id] = on_complete
+
+        timer = self._timers.pop(group_id, None)
+        if timer:
+            timer.cancel()
+        loop = asyncio.get_running_loop()
+        self._timers[group_id] = loop.call_later(self.delay, self._start_complete, group_id)
+
+    def _start_complete(self, group_id: str):
+        task = asyncio.ensure_future(self._complete(group_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """Обработка собранных альбомов без ожидания таймеров и ожидание начатых обработок"""
+        for timer in self._timers.values():
+            timer.cancel()
+        for group_id in list(self._timers):
+            self._start_complete(group_id)
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    async def _complete(self, group_id: str):
+        self._timers.pop(group_id, None)
+        on_complete = self._callbacks.pop(group_id, None)
+        messages = self._albums.pop(group_id, [])
+        if not messages:
+            return
+        try:
+            await on_complete(messages)
+        except Exception as e:
+            logger.error(f"Ошибка обработки альбома {group_id}: {e}")
+
+# Глобальный сборщик альбомов
+album_collector = PerBot(lambda name: AlbumCollector())
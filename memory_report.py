@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Отчет о памяти Phoenix PS Bot: снимки tracemalloc, сравнение и размеры структур бота
+"""
+
+import asyncio
+import gc
+import glob
+import logging
+import os
+import re
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Глубина стека для каждого выделения памяти: 1 кадр - минимальные накладные расходы
+TRACE_FRAMES = 1
+TOP_LIMIT = 10
+SNAPSHOT_PREFIX = "memory-"
+SNAPSHOT_SUFFIX = ".tracemalloc"
+
+# Служебные выделения самого tracemalloc и импорта модулей
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>")
+)
+
+def _format_size(size: int) -> str:
+    sign = "-" if size < 0 else ""
+    size = abs(size)
+    if size >= 1024 * 1024:
+        return f"{sign}{size / 1024 / 1024:.1f} МБ"
+    return f"{sign}{size / 1024:.1f} КБ"
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Каталоги стандартной библиотеки и пакетов: в отчете путь начинается после них
+_LIBRARY_PATH = re.compile(r".*[\\/](?:site-packages|python\d+\.\d+)[\\/]")
+
+def _short_path(filename: str) -> str:
+    """Путь относительно каталога проекта, site-packages или стандартной библиотеки"""
+    if filename.startswith(PROJECT_DIR + os.sep):
+        return filename[len(PROJECT_DIR) + 1:]
+    return _LIBRARY_PATH.sub("", filename)
+
+def top_allocations(snapshot: tracemalloc.Snapshot, key_type: str, limit: int = TOP_LIMIT) -> List[Dict]:
+    """Крупнейшие источники выделений: key_type "filename" (модуль) или "lineno" (строка)"""
+    result = []
+    for stat in snapshot.filter_traces(_FILTERS).statistics(key_type)[:limit]:
+        frame = stat.traceback[0]
+        where = _short_path(frame.filename) + (f":{frame.lineno}" if key_type == "lineno" else "")
+        result.append({"where": where, "size": stat.size, "count": stat.count})
+    return result
+
+def compare_snapshots(old: tracemalloc.Snapshot, new: tracemalloc.Snapshot, limit: int = TOP_LIMIT) -> List[Dict]:
+    """Наибольший прирост памяти по строкам между снимками"""
+    result = []
+    stats = new.filter_traces(_FILTERS).compare_to(old.filter_traces(_FILTERS), "lineno")
+    for stat in stats[:limit]:
+        frame = stat.traceback[0]
+        result.append({
+            "where": f"{_short_path(frame.filename)}:{frame.lineno}",
+            "size": stat.size,
+            "size_diff": stat.size_diff,
+            "count_diff": stat.count_diff
+        })
+    return result
+
+class MemoryProfiler:
+    """Снимки tracemalloc, сравнение с прошлым снимком и размеры структур бота"""
+
+    def __init__(self, snapshot_dir: str = "memory_snapshots", keep: int = 10, interval_minutes: float = 0.0):
+        self.snapshot_dir = snapshot_dir
+        self.keep = keep
+        self.interval_minutes = interval_minutes
+        self.previous: Optional[tracemalloc.Snapshot] = None
+        self.previous_at: Optional[float] = None
+        self._sizes: Dict[str, Callable[[], int]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def add_size(self, name: str, size: Callable[[], int]):
+        """Регистрация структуры бота (функция возвращает количество записей)"""
+        self._sizes[name] = size
+
+    def sizes(self) -> Dict[str, int]:
+        """Текущие размеры зарегистрированных структур"""
+        result = {}
+        for name, size in self._sizes.items():
+            try:
+                result[name] = int(size())
+            except Exception as e:
+                logger.error(f"Не удалось получить размер {name}: {e}")
+                result[name] = -1
+        return result
+
+    def start_tracing(self):
+        """Включение tracemalloc (замедляет выделение памяти, поэтому по требованию)"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+            logger.info("Трассировка памяти включена")
+
+    def stop_tracing(self):
+        """Выключение tracemalloc и сброс снимков"""
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            logger.info("Трассировка памяти выключена")
+        self.previous = None
+        self.previous_at = None
+
+    def report(self) -> Dict:
+        """Отчет: структуры бота, крупнейшие выделения и прирост с прошлого отчета"""
+        from health import rss_bytes
+
+        report = {
+            "time": time.time(),
+            "rss": rss_bytes(),
+            "gc_objects": len(gc.get_objects()),
+            "sizes": self.sizes(),
+            "tracing": self.tracing
+        }
+        if not self.tracing:
+            return report
+
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        report.update({
+            "traced": current,
+            "traced_peak": peak,
+            "top_modules": top_allocations(snapshot, "filename"),
+            "top_lines": top_allocations(snapshot, "lineno"),
+            "diff": compare_snapshots(self.previous, snapshot) if self.previous is not None else None,
+            "diff_seconds": time.time() - self.previous_at if self.previous_at else None
+        })
+        self.previous = snapshot
+        self.previous_at = report["time"]
+        return report
+
+    def dump_snapshot(self) -> Optional[str]:
+        """Сохранение снимка на диск для сравнения вне бота"""
+        if not self.tracing:
+            return None
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = os.path.join(
+            self.snapshot_dir,
+            f"{SNAPSHOT_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]}{SNAPSHOT_SUFFIX}"
+        )
+        tracemalloc.take_snapshot().filter_traces(_FILTERS).dump(path)
+        for old_path in list_snapshots(self.snapshot_dir)[self.keep:]:
+            os.remove(old_path)
+        logger.info(f"Снимок памяти сохранен: {path}")
+        return path
+
+    def start(self):
+        """Периодическое сохранение снимков (interval_minutes > 0)"""
+        if self._task is None and self.interval_minutes > 0:
+            self.start_tracing()
+            self._task = asyncio.create_task(self._snapshot_loop())
+
+    async def stop(self):
+        """Остановка сохранения снимков"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _snapshot_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.interval_minutes * 60)
+            try:
+                # Снимок большого процесса занимает заметное время: не блокируем цикл
+                await loop.run_in_executor(None, self.dump_snapshot)
+            except Exception as e:
+                logger.error(f"Ошибка сохранения снимка памяти: {e}")
+
+def list_snapshots(snapshot_dir: str) -> List[str]:
+    """Снимки от новых к старым"""
+    return sorted(glob.glob(os.path.join(snapshot_dir, f"{SNAPSHOT_PREFIX}*{SNAPSHOT_SUFFIX}")), reverse=True)
+
+def format_memory_report(report: Dict) -> str:
+    """Текст отчета для админ-панели"""
+    lines = ["🧠 Память"]
+    if report["rss"] is not None:
+        lines.append(f"RSS: {_format_size(report['rss'])}, объектов Python: {report['gc_objects']}")
+    lines += ["", "📦 Структуры бота (записей):"]
+    for name, size in report["sizes"].items():
+        lines.append(f"• {name}: {size}")
+
+    if not report["tracing"]:
+        lines += ["", "Трассировка выключена: /memory start включает ее, следующий /memory покажет крупнейшие выделения."]
+        return "\n".join(lines)
+
+    lines += ["", f"🔍 Отслежено: {_format_size(report['traced'])} (пик {_format_size(report['traced_peak'])})"]
+    lines += ["", "По модулям:"]
+    lines += [f"• {item['where']}: {_format_size(item['size'])} ({item['count']} блоков)" for item in report["top_modules"]]
+    lines += ["", "По строкам:"]
+    lines += [f"• {item['where']}: {_format_size(item['size'])}" for item in report["top_lines"]]
+    if report["diff"] is None:
+        lines += ["", "Прирост появится в следующем отчете (снимок сохранен для сравнения)."]
+    else:
+        lines += ["", f"📈 Прирост за {report['diff_seconds']:.0f} с:"]
+        lines += [
+            f"• {item['where']}: {_format_size(item['size_diff'])} ({item['count_diff']:+d} блоков)"
+            for item in report["diff"]
+        ]
+    return "\n".join(lines)
+
+def main():
+    """Сравнение сохраненных снимков из командной строки"""
+    print("🧠 Снимки памяти Phoenix PS Bot")
+    print("=" * 50)
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ("list", "top", "compare"):
+        print("📋 Команды:")
+        print("  list [DIR]           - список снимков")
+        print("  top FILE             - крупнейшие выделения в снимке")
+        print("  compare OLD NEW      - прирост памяти между снимками")
+        return 1
+
+    command = sys.argv[1]
+    if command == "list":
+        snapshot_dir = sys.argv[2] if len(sys.argv) > 2 else "memory_snapshots"
+        snapshots = list_snapshots(snapshot_dir)
+        if not snapshots:
+            print(f"📭 Снимков нет в {snapshot_dir}")
+        for path in snapshots:
+            print(f"• {path} ({_format_size(os.path.getsize(path))})")
+        return 0
+
+    if command == "top" and len(sys.argv) == 3:
+        snapshot = tracemalloc.Snapshot.load(sys.argv[2])
+        for item in top_allocations(snapshot, "lineno", limit=25):
+            print(f"{_format_size(item['size']):>12}  {item['count']:>8}  {item['where']}")
+        return 0
+
+    if command == "compare" and len(sys.argv) == 4:
+        old = tracemalloc.Snapshot.load(sys.argv[2])
+        new = tracemalloc.Snapshot.load(sys.argv[3])
+        for item in compare_snapshots(old, new, limit=25):
+            print(f"{_format_size(item['size_diff']):>12}  {item['count_diff']:>+8d}  {item['where']}")
+        return 0
+
+    print("❌ Неверные аргументы")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Границы гистограмм задержек по умолчанию, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in key) + "}"
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return f"{value:.6g}"
+
+class Metric:
+    """Базовая метрика с набором меток"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        """Значения метрики: (имя, метки, значение)"""
+        raise NotImplementedError
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0.0)
+
+    def values(self) -> Dict[LabelKey, float]:
+        return dict(self._values)
+
+    def samples(self):
+        return [(self.name, key, value) for key, value in self.values().items()]
+
+class Gauge(Metric):
+    """Текущее значение (можно задать функцию, вычисляемую при чтении)"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, func: Optional[Callable[[], float]] = None):
+        super().__init__(name, description)
+        self._values: Dict[LabelKey, float] = {}
+        self.func = func
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        if self.func is not None and not labels:
+            return float(self.func())
+        return self._values.get(_label_key(labels), 0.0)
+
+    def values(self) -> Dict[LabelKey, float]:
+        if self.func is not None:
+            return {(): float(self.func())}
+        return dict(self._values)
+
+    def samples(self):
+        return [(self.name, key, value) for key, value in self.values().items()]
+
+class Histogram(Metric):
+    """Гистограмма значений с фиксированными границами корзин"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # метки -> [счетчики корзин, сумма, количество, максимум]
+        self._series: Dict[LabelKey, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * len(self.buckets), 0.0, 0, 0.0]
+                self._series[key] = series
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+            if value > series[3]:
+                series[3] = value
+
+    def label_sets(self) -> List[LabelKey]:
+        return list(self._series.keys())
+
+    def stats(self, **labels) -> Dict[str, float]:
+        """Сводка: количество, сумма, среднее, максимум, p50/p95/p99"""
+        return self._stats(_label_key(labels))
+
+    def _stats(self, key: LabelKey) -> Dict[str, float]:
+        series = self._series.get(key)
+        if not series or not series[2]:
+            return {'count': 0, 'sum': 0.0, 'avg': 0.0, 'max': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0}
+        counts, total, count, maximum = series[0], series[1], series[2], series[3]
+        return {
+            'count': count,
+            'sum': total,
+            'avg': total / count,
+            'max': maximum,
+            'p50': self._quantile(counts, count, maximum, 0.5),
+            'p95': self._quantile(counts, count, maximum, 0.95),
+            'p99': self._quantile(counts, count, maximum, 0.99)
+        }
+
+    def all_stats(self) -> Dict[LabelKey, Dict[str, float]]:
+        return {key: self._stats(key) for key in self.label_sets()}
+
+    def _quantile(self, counts: List[int], count: int, maximum: float, q: float) -> float:
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        target = q * count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return min(bound, maximum)
+        return maximum
+
+    def samples(self):
+        result = []
+        for key, series in list(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, series[0]):
+                cumulative += bucket_count
+                result.append((f"{self.name}_bucket", key + (("le", _format_value(bound)),), cumulative))
+            result.append((f"{self.name}_sum", key, series[1]))
+            result.append((f"{self.name}_count", key, series[2]))
+        return result
+
+class MetricsRegistry:
+    """Реестр метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _get_or_create(self, cls, name: str, description: str, **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = cls(name, description, **kwargs)
+            self._metrics[name] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Метрика {name} уже зарегистрирована как {metric.kind}")
+        return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._get_or_create(Counter, name, description)
+
+    def gauge(self, name: str, description: str, func: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._get_or_create(Gauge, name, description, func=func)
+
+    def histogram(self, name: str, description: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description, buckets=buckets)
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def render_prometheus(self) -> str:
+        """Экспорт в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample_name, key, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+# Глобальный реестр метрик
+registry = MetricsRegistry()
@@ -0,0 +1,83 @@
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from bot_context import PerBot
+from cache import TTLCache, MISSING
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Жизненный цикл заказа
+ORDER_STATUSES = {
+    "new": "🆕 Новый",
+    "in_progress": "🔄 В работе",
+    "done": "✅ Выполнен",
+    "cancelled": "❌ Отменен"
+}
+
+# Допустимые переходы и подписи кнопок для них
+ORDER_TRANSITIONS = {
+    "new": ("in_progress", "cancelled"),
+    "in_progress": ("done", "cancelled"),
+    "done": (),
+    "cancelled": ()
+}
+TRANSITION_BUTTONS = {
+    "in_progress": "🔄 В работу",
+    "done": "✅ Выполнен",
+    "cancelled": "❌ Отменить"
+}
+
+ORDER_HISTORY_PAGE_SIZE = 5
+
+# Страницы истории заказов: (user_id, before_id) -> (заказы, есть ли еще)
+order_history_cache = PerBot(lambda name: TTLCache(ttl=120, max_size=5000))
+
+def format_order_time(order_time: str) -> str:
+    """Форматирование времени заказа из базы"""
+    try:
+        return datetime.strptime(order_time, "%Y-%m-%d %H:%M:%S").strftime("%d.%m.%Y")
+    except (TypeError, ValueError):
+        return order_time or ""
+
+def format_status(status: str) -> str:
+    """Подпись статуса заказа"""
+    return ORDER_STATUSES.get(status, status)
+
+async def create_order(user_id: int, username: str, service_id: int, service_name: str) -> int:
+    """Создание заказа со сбросом кэша истории пользователя"""
+    order_id = await db.add_order(user_id, username, service_id, service_name)
+    order_history_cache.invalidate_group(user_id)
+    return order_id
+
+async def get_order_history_page(user_id: int, before_id: Optional[int] = None) -> Tuple[List[Dict], bool]:
+    """Страница истории заказов и признак наличия следующей страницы"""
+    key = (user_id, before_id or 0)
+    page = order_history_cache.get(key)
+    if page is not MISSING:
+        return page
+
+    # Поколение берется до чтения: если заказ создали или изменили, пока шел запрос,
+    # устаревшая страница не попадет в кэш
+    generation = order_history_cache.generation(user_id)
+    # Берем на один заказ больше, чтобы понять, есть ли следующая страница
+    orders = await db.get_user_orders(user_id, before_id, ORDER_HISTORY_PAGE_SIZE + 1)
+    page = (orders[:ORDER_HISTORY_PAGE_SIZE], len(orders) > ORDER_HISTORY_PAGE_SIZE)
+    order_history_cache.set(key, page, group=user_id, generation=generation)
+    return page
+
+async def set_order_status(order_id: int, status: str) -> Optional[Dict]:
+    """Смена статуса заказа; возвращает обновленный заказ или None при недопустимом переходе"""
+    order = await db.get_order(order_id)
+    if not order or status not in ORDER_TRANSITIONS.get(order['status'], ()):
+        return None
+
+    # Сравнение со статусом при чтении: из двух одновременных нажатий пройдет только одно
+    if not await db.update_order_status(order_id, status, expected_status=order['status']):
+        return None
+    order_history_cache.invalidate_group(order['user_id'])
+    logger.info(f"Заказ {order_id}: {order['status']} -> {status}")
+
+    order['status'] = status
+    return order
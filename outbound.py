@@ -0,0 +1,309 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Классы исходящих сообщений в порядке убывания приоритета
+INTERACTIVE = "interactive"
+ORDER = "order"
+ADMIN = "admin"
+BULK = "bulk"
+SEND_CLASSES = (INTERACTIVE, ORDER, ADMIN, BULK)
+
+# Через очередь идут только запросы, которые пишут в чат; служебные (getUpdates, getMe,
+# answerCallbackQuery, getChatMember) отправляются сразу
+SCHEDULED_PREFIXES = ("send", "edit", "copy", "forward")
+
+# Сколько запросов класса просматривается в поисках чата, в который уже можно писать
+SCAN_LIMIT = 1000
+# Корзины молчащих чатов удаляются, когда их становится больше
+CHAT_BUCKETS_LIMIT = 10_000
+
+outbound_queue_depth = registry.gauge("outbound_queue_depth", "Исходящие запросы в очереди по классам")
+outbound_sent = registry.counter("outbound_sent_total", "Отправленные исходящие запросы по классам")
+outbound_coalesced = registry.counter(
+    "outbound_coalesced_total", "Изменения сообщений, замененные более новым изменением того же сообщения"
+)
+outbound_wait = registry.histogram(
+    "outbound_queue_wait_seconds",
+    "Ожидание исходящего запроса в очереди по классам",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+
+_send_class: contextvars.ContextVar[str] = contextvars.ContextVar("send_class", default=INTERACTIVE)
+
+@contextmanager
+def send_class(name: str):
+    """Класс исходящих запросов внутри блока (по умолчанию - ответы пользователю)"""
+    token = _send_class.set(name)
+    try:
+        yield
+    finally:
+        _send_class.reset(token)
+
+class TokenBucket:
+    """Корзина токенов: rate запросов в секунду с запасом на короткий всплеск"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        """Момент, когда можно будет отправить запрос"""
+        self._refill(now)
+        ready = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(ready, self.paused_until)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until: float):
+        """Пауза после ответа 429 (retry_after)"""
+        self.paused_until = max(self.paused_until, until)
+
+    def idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now
+
+class _Outbound:
+    """Запрос в очереди; futures - вызывающие, ждущие результата (несколько после объединения изменений)"""
+
+    __slots__ = ("make_request", "bot", "method", "send_class", "chat_key", "edit_key", "futures", "context", "enqueued")
+
+    def __init__(self, make_request, bot, method, send_class: str, chat_key, edit_key, future: asyncio.Future):
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.send_class = send_class
+        self.chat_key = chat_key
+        self.edit_key = edit_key
+        self.futures: List[asyncio.Future] = [future]
+        # Запрос выполняется в контексте вызывающего (текущий бот и т. п.)
+        self.context = contextvars.copy_context()
+        self.enqueued = time.monotonic()
+
+class OutboundScheduler(BaseRequestMiddleware):
+    """Единая очередь исходящих сообщений сессии Bot API.
+    Запросы ждут токенов общей корзины бота и корзины чата; свободный токен получает
+    запрос самого приоритетного класса. Изменение сообщения, еще ждущее в очереди,
+    заменяется более новым изменением того же сообщения"""
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        chat_burst: float = 3.0
+    ):
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self._queues: Dict[str, Deque[_Outbound]] = {name: deque() for name in SEND_CLASSES}
+        self._edits: Dict[tuple, _Outbound] = {}
+        self._global: Dict[int, TokenBucket] = {}
+        self._chats: Dict[tuple, TokenBucket] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, config) -> "OutboundScheduler":
+        return cls(
+            global_rate=config.OUTBOUND_GLOBAL_RATE,
+            chat_rate=config.OUTBOUND_CHAT_RATE,
+            group_rate=config.OUTBOUND_GROUP_RATE / 60,
+            chat_burst=config.OUTBOUND_CHAT_BURST
+        )
+
+    def queued(self, name: str) -> int:
+        """Запросы класса в очереди"""
+        return len(self._queues[name])
+
+    async def __call__(self, make_request, bot, method):
+        api_method = method.__api_method__
+        if not api_method.startswith(SCHEDULED_PREFIXES):
+            return await make_request(bot, method)
+
+        name = _send_class.get()
+        chat_id = getattr(method, "chat_id", None)
+        chat_key = (bot.id, chat_id) if chat_id is not None else None
+        edit_key = None
+        if api_method.startswith("edit"):
+            edit_key = (bot.id, api_method, chat_id, getattr(method, "message_id", None), getattr(method, "inline_message_id", None))
+
+        future = asyncio.get_running_loop().create_future()
+        queued = self._edits.get(edit_key) if edit_key else None
+        if queued is not None:
+            # Прежнее изменение еще не отправлено: отправится только новое, оба вызова получат его результат
+            queued.method = method
+            queued.make_request = make_request
+            queued.futures.append(future)
+            outbound_coalesced.inc(send_class=queued.send_class)
+        else:
+            item = _Outbound(make_request, bot, method, name, chat_key, edit_key, future)
+            self._queues[name].append(item)
+            if edit_key:
+                self._edits[edit_key] = item
+            outbound_queue_depth.inc(send_class=name)
+            self._start()
+            self._wakeup.set()
+        return await future
+
+    def _start(self):
+        # Событие и задача создаются внутри работающего цикла событий
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    def _global_bucket(self, bot, now: float) -> TokenBucket:
+        bucket = self._global.get(bot.id)
+        if bucket is None:
+            bucket = self._global[bot.id] = TokenBucket(self.global_rate, self.global_rate, now)
+        return bucket
+
+    def _chat_bucket(self, chat_key: tuple, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_key)
+        if bucket is None:
+            # Личный чат - положительный id; группы и каналы (отрицательный id или @username) медленнее
+            chat_id = chat_key[1]
+            private = isinstance(chat_id, int) and chat_id > 0
+            bucket = TokenBucket(self.chat_rate if private else self.group_rate, self.chat_burst, now)
+            if len(self._chats) >= CHAT_BUCKETS_LIMIT:
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle(now)}
+            self._chats[chat_key] = bucket
+        return bucket
+
+    def _next(self, now: float) -> Tuple[Optional[_Outbound], Optional[float]]:
+        """Первый запрос самого приоритетного класса, который можно отправить сейчас,
+        иначе время до ближайшей возможности (None - очередь пуста)"""
+        earliest = None
+        for name in SEND_CLASSES:
+            queue = self._queues[name]
+            # Чаты, уже найденные занятыми: порядок запросов внутри чата сохраняется
+            blocked = set()
+            for index, item in enumerate(queue):
+                if index >= SCAN_LIMIT:
+                    break
+                if item.chat_key in blocked:
+                    continue
+                ready = self._global_bucket(item.bot, now).ready_at(now)
+                if item.chat_key is not None:
+                    ready = max(ready, self._chat_bucket(item.chat_key, now).ready_at(now))
+                if ready <= now:
+                    del queue[index]
+                    return item, None
+                blocked.add(item.chat_key)
+                earliest = ready if earliest is None else min(earliest, ready)
+        return None, (earliest - now if earliest is not None else None)
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            item, delay = self._next(now)
+            if item is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                self._dispatch(item, now)
+            except Exception as e:
+                # Сбой одного запроса получают его вызывающие, очередь продолжает работать
+                logger.error(f"Ошибка отправки из очереди исходящих ({item.method.__api_method__}): {e}")
+                self._resolve(item, error=e)
+
+    def _dispatch(self, item: _Outbound, now: float):
+        if item.edit_key:
+            self._edits.pop(item.edit_key, None)
+        outbound_queue_depth.dec(send_class=item.send_class)
+        # Все вызывающие отменили ожидание: запрос не нужен
+        if all(future.done() for future in item.futures):
+            return
+        self._global_bucket(item.bot, now).take(now)
+        if item.chat_key is not None:
+            self._chat_bucket(item.chat_key, now).take(now)
+        outbound_wait.observe(now - item.enqueued, send_class=item.send_class)
+        outbound_sent.inc(send_class=item.send_class)
+        # Запуск задачи внутри контекста вызывающего (create_task(context=...) есть только с Python 3.11)
+        item.context.run(asyncio.create_task, self._send(item))
+
+    async def _send(self, item: _Outbound):
+        try:
+            result = await item.make_request(item.bot, item.method)
+        except TelegramRetryAfter as e:
+            # Чат (или весь бот для запросов без чата) молчит, пока не истечет retry_after
+            until = time.monotonic() + e.retry_after
+            if item.chat_key is not None:
+                self._chat_bucket(item.chat_key, time.monotonic()).pause(until)
+            else:
+                self._global_bucket(item.bot, time.monotonic()).pause(until)
+            self._resolve(item, error=e)
+        except asyncio.CancelledError:
+            self._resolve(item, error=asyncio.CancelledError())
+            raise
+        except Exception as e:
+            self._resolve(item, error=e)
+        else:
+            self._resolve(item, result=result)
+
+    async def stop(self):
+        """Остановка очереди: ждущие вызовы отменяются"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for name, queue in self._queues.items():
+            while queue:
+                self._resolve(queue.popleft(), error=asyncio.CancelledError())
+                outbound_queue_depth.dec(send_class=name)
+        self._edits.clear()
+
+    @staticmethod
+    def _resolve(item: _Outbound, result=None, error: Optional[BaseException] = None):
+        for future in item.futures:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            elif isinstance(error, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(error)
+
+    def format_stats(self) -> str:
+        """Сводка по очередям исходящих для админ-панели"""
+        lines = []
+        for name in SEND_CLASSES:
+            wait = outbound_wait.stats(send_class=name)
+            lines.append(
+                f"• {name}: в очереди {self.queued(name)}, отправлено {int(outbound_sent.value(send_class=name))}, "
+                f"объединено {int(outbound_coalesced.value(send_class=name))}, ожидание p95 {wait['p95'] * 1000:.0f} мс"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,193 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 5.0
+RECORDING_PREFIX = "updates-"
+RECORDING_SUFFIX = ".jsonl.gz"
+# Псевдоним администратора в записи: воспроизведение запускается с ADMIN_ID=1
+ADMIN_PSEUDONYM = 1
+
+updates_recorded = registry.counter("updates_recorded_total", "Апдейты, записанные для воспроизведения")
+
+# Поля с идентификаторами пользователей и чатов
+_ID_OBJECTS = {
+    "from", "from_user", "chat", "user", "sender_chat", "sender_user", "forward_from", "forward_from_chat",
+    "new_chat_member", "old_chat_member"
+}
+# Персональные данные: заменяются целиком
+_NAME_FIELDS = {
+    "first_name", "last_name", "username", "title", "bio", "description",
+    "sender_user_name", "forward_sender_name", "author_signature", "forward_signature"
+}
+_DROP_FIELDS = {"contact", "location", "venue", "phone_number", "invite_link"}
+_HASH_FIELDS = {"file_id", "file_unique_id", "chat_instance", "inline_message_id"}
+_TEXT_FIELDS = {"text", "caption"}
+# Ссылки (text_link в entities, превью) маскируются как текст
+_URL_FIELDS = {"url"}
+_WORD = re.compile(r"\w")
+
+class Anonymizer:
+    """Обезличивание апдейта с сохранением структуры навигации"""
+
+    def __init__(self, admin_id: int = 0):
+        self.admin_id = admin_id
+        # Соответствие реальных id псевдонимам живет только в памяти процесса
+        self._ids: Dict[int, int] = {}
+        self._salt = os.urandom(16)
+
+    def pseudonym(self, value: int) -> int:
+        """Стабильный в пределах записи псевдоним id (отрицательные id каналов остаются отрицательными)"""
+        if value == self.admin_id:
+            return ADMIN_PSEUDONYM
+        pseudonym = self._ids.get(abs(value))
+        if pseudonym is None:
+            pseudonym = len(self._ids) + ADMIN_PSEUDONYM + 1
+            self._ids[abs(value)] = pseudonym
+        return -pseudonym if value < 0 else pseudonym
+
+    def _hash(self, value: str) -> str:
+        return hashlib.blake2b(value.encode(), key=self._salt, digest_size=12).hexdigest()
+
+    @staticmethod
+    def mask_text(text: str) -> str:
+        """Команды и их параметры из ссылок (/start channel) сохраняются, остальной текст маскируется"""
+        if text.startswith("/"):
+            command, _, args = text.partition(" ")
+            if command.split("@")[0] == "/start":
+                return text
+            return command + (" " + _WORD.sub("x", args) if args else "")
+        return _WORD.sub("x", text)
+
+    def anonymize(self, data: Any, key: Optional[str] = None) -> Any:
+        if isinstance(data, dict):
+            result = {}
+            for field, value in data.items():
+                if field in _DROP_FIELDS:
+                    continue
+                if field in _NAME_FIELDS and isinstance(value, str):
+                    result[field] = "x" * len(value)
+                elif field in _HASH_FIELDS and isinstance(value, str):
+                    result[field] = self._hash(value)
+                elif field in _TEXT_FIELDS and isinstance(value, str):
+                    result[field] = self.mask_text(value)
+                elif field in _URL_FIELDS and isinstance(value, str):
+                    result[field] = _WORD.sub("x", value)
+                elif field == "id" and key in _ID_OBJECTS and isinstance(value, int):
+                    result[field] = self.pseudonym(value)
+                elif field in ("user_id", "chat_id") and isinstance(value, int):
+                    result[field] = self.pseudonym(value)
+                else:
+                    result[field] = self.anonymize(value, field)
+            return result
+        if isinstance(data, list):
+            return [self.anonymize(item, key) for item in data]
+        return data
+
+class UpdateRecorder(BaseMiddleware):
+    """Запись входящих апдейтов (обезличенных) с интервалами между ними в сжатый JSONL"""
+
+    def __init__(self, record_dir: str = "recordings", admin_id: int = 0, flush_interval: float = FLUSH_INTERVAL):
+        self.record_dir = record_dir
+        self.flush_interval = flush_interval
+        self.anonymizer = Anonymizer(admin_id)
+        self.path = os.path.join(
+            record_dir, f"{RECORDING_PREFIX}{datetime.now().strftime('%Y%m%d-%H%M%S')}{RECORDING_SUFFIX}"
+        )
+        self.recorded = 0
+        self._last: Optional[float] = None
+        self._buffer: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any]
+    ) -> Any:
+        now = time.monotonic()
+        delay = 0.0 if self._last is None else now - self._last
+        self._last = now
+        try:
+            payload = self.anonymizer.anonymize(event.model_dump(mode="json", exclude_none=True))
+            self._buffer.append(json.dumps({"delay": round(delay, 4), "update": payload}, ensure_ascii=False))
+            self.recorded += 1
+            updates_recorded.inc()
+        except Exception as e:
+            logger.error(f"Не удалось записать апдейт {event.update_id}: {e}")
+        return await handler(event, data)
+
+    def start(self):
+        """Запуск периодической записи на диск"""
+        if self._task is None:
+            os.makedirs(self.record_dir, exist_ok=True)
+            self._task = asyncio.create_task(self._flush_loop())
+            logger.info(f"Запись апдейтов для воспроизведения: {self.path}")
+
+    async def stop(self):
+        """Остановка с записью остатка буфера"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи апдейтов: {e}")
+
+    async def flush(self):
+        """Дозапись буфера отдельным gzip-блоком (сжатие вне цикла событий)"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            lines, self._buffer = self._buffer, []
+            await asyncio.get_running_loop().run_in_executor(None, self._append, lines)
+
+    def _append(self, lines: List[str]):
+        # Склеенные gzip-блоки читаются как один поток
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+def read_recording(path: str):
+    """Чтение записи: пары (интервал до апдейта в секундах, апдейт в виде словаря)"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                yield entry["delay"], entry["update"]
+
+def setup_recorder(dp, config) -> Optional[UpdateRecorder]:
+    """Подключение записи апдейтов, если она включена в конфигурации"""
+    if not config.RECORD_UPDATES:
+        return None
+    recorder = UpdateRecorder(config.RECORD_DIR, config.ADMIN_ID)
+    dp.update.outer_middleware(recorder)
+    dp["update_recorder"] = recorder
+    recorder.start()
+    return recorder
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Воспроизведение записанных апдейтов Phoenix PS Bot на заглушке Bot API
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Воспроизведение не должно засорять вывод логами хендлеров
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+def percentile(values: List[float], q: float) -> float:
+    """Квантиль по отсортированному списку"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def update_kind(update) -> str:
+    """Тип апдейта для отчета: команда, действие кнопки или тип сообщения"""
+    from callbacks import codec
+
+    if update.callback_query:
+        decoded = codec.decode(update.callback_query.data)
+        return f"callback:{decoded[0].name}" if decoded else "callback:unknown"
+    message = update.message or update.channel_post
+    if message:
+        if message.text and message.text.startswith("/"):
+            return "command:" + message.text.split()[0].split("@")[0]
+        return "message:photo" if message.photo else "message:text"
+    return update.event_type
+
+def create_stub_session(api_latency: float = 0.0):
+    """Сессия Bot API без сети: правдоподобные ответы и подсчет вызовов"""
+    from aiogram.client.session.base import BaseSession
+    from aiogram.types import ChatMemberMember, Message, User
+
+    class StubSession(BaseSession):
+        def __init__(self):
+            super().__init__()
+            self.calls: Counter = Counter()
+            self._message_id = 0
+
+        async def close(self):
+            pass
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+        def _message(self, bot, method) -> Message:
+            self._message_id += 1
+            chat_id = getattr(method, "chat_id", None)
+            data = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id if isinstance(chat_id, int) else -100, "type": "private"},
+                "text": getattr(method, "text", None) or getattr(method, "caption", None) or "-"
+            }
+            if type(method).__name__ in ("SendPhoto", "EditMessageMedia"):
+                data["photo"] = [{"file_id": f"stub{self._message_id}", "file_unique_id": f"u{self._message_id}", "width": 1, "height": 1}]
+            return Message.model_validate(data, context={"bot": bot})
+
+        async def make_request(self, bot, method, timeout=None):
+            self.calls[method.__api_method__] += 1
+            if api_latency:
+                await asyncio.sleep(api_latency)
+            returning = method.__returning__
+            if returning is Message:
+                return self._message(bot, method)
+            if getattr(returning, "__origin__", None) is list:
+                return [self._message(bot, method) for _ in getattr(method, "media", [None])]
+            if method.__api_method__ == "getMe":
+                return User(id=42, is_bot=True, first_name="replay", username="replay_bot")
+            if method.__api_method__ == "getChatMember":
+                return ChatMemberMember(user=User(id=method.user_id, is_bot=False, first_name="x"))
+            return True
+
+    return StubSession()
+
+async def replay(path: str, speed: Optional[float], db_path: Optional[str], api_latency: float) -> Dict:
+    """Воспроизведение записи: speed None - без пауз, иначе ускорение относительно записи"""
+    from aiogram import Bot, Dispatcher
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from aiogram.types import Update
+
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    # Рабочий каталог временный: настройки, снимок каталога и база не трогают боевые файлы
+    if os.path.exists("settings.json"):
+        shutil.copy("settings.json", workdir)
+    source_dir = os.getcwd()
+    os.chdir(workdir)
+    try:
+        os.environ.setdefault("BOT_TOKEN", "123456:replay")
+        os.environ["ADMIN_ID"] = "1"
+        from config import Config
+        from database import db
+        from catalog import catalog
+        from admission import setup_admission
+        from handlers import register_user_handlers
+        from admin_handlers import register_admin_handlers
+        from recorder import read_recording
+
+        db.db_path = os.path.join(workdir, "replay.db")
+        catalog.snapshot_path = os.path.join(workdir, "catalog_snapshot.json")
+        if db_path:
+            shutil.copy(os.path.join(source_dir, db_path), db.db_path)
+            await db.init_db()
+        else:
+            from setup import setup_database
+            await setup_database()
+        await catalog.reload()
+
+        config = Config()
+        session = create_stub_session(api_latency)
+        bot = Bot(token=config.BOT_TOKEN, session=session)
+        dp = Dispatcher(storage=MemoryStorage())
+        register_user_handlers(dp, config)
+        register_admin_handlers(dp, config)
+        setup_admission(dp, config)
+
+        latencies: Dict[str, List[float]] = {}
+        errors: Counter = Counter()
+        tasks = []
+
+        async def feed(update):
+            kind = update_kind(update)
+            started = time.perf_counter()
+            try:
+                await dp.feed_update(bot, update)
+            except Exception as e:
+                errors[f"{kind}: {type(e).__name__}"] += 1
+            latencies.setdefault(kind, []).append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        schedule = 0.0
+        for delay, data in read_recording(os.path.join(source_dir, path)):
+            if speed:
+                # Паузы по расписанию записи: апдейты обрабатываются параллельно, как при поллинге
+                schedule += delay / speed
+                wait = schedule - (time.perf_counter() - started)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            tasks.append(asyncio.create_task(feed(Update.model_validate(data, context={"bot": bot}))))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        return {"latencies": latencies, "errors": errors, "calls": session.calls, "elapsed": elapsed, "count": len(tasks)}
+    finally:
+        # Фоновая запись аналитики держит свое соединение с базой
+        from database import db
+        await db.close()
+        os.chdir(source_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def print_report(result: Dict):
+    """Распределение задержек по типам апдейтов и вызовы Bot API"""
+    count = result["count"]
+    print(f"\n📼 Воспроизведено апдейтов: {count} за {result['elapsed']:.2f} с "
+          f"({count / result['elapsed'] if result['elapsed'] else 0:.0f} в секунду)")
+
+    print("\n⏱ Задержка обработки, мс")
+    print("=" * 88)
+    print(f"{'Тип апдейта':<36} | {'шт.':>6} | {'p50':>8} | {'p95':>8} | {'p99':>8} | {'макс.':>8}")
+    print("-" * 88)
+    everything = []
+    for kind, values in sorted(result["latencies"].items(), key=lambda item: -len(item[1])):
+        values.sort()
+        everything.extend(values)
+        print(f"{kind[:36]:<36} | {len(values):>6} | {percentile(values, 0.5) * 1000:>8.2f} | "
+              f"{percentile(values, 0.95) * 1000:>8.2f} | {percentile(values, 0.99) * 1000:>8.2f} | {values[-1] * 1000:>8.2f}")
+    everything.sort()
+    print("-" * 88)
+    print(f"{'Всего':<36} | {len(everything):>6} | {percentile(everything, 0.5) * 1000:>8.2f} | "
+          f"{percentile(everything, 0.95) * 1000:>8.2f} | {percentile(everything, 0.99) * 1000:>8.2f} | "
+          f"{(everything[-1] if everything else 0) * 1000:>8.2f}")
+
+    total_calls = sum(result["calls"].values())
+    print(f"\n📡 Вызовы Bot API: {total_calls} ({total_calls / count if count else 0:.2f} на апдейт)")
+    for method, calls in result["calls"].most_common():
+        print(f"  {method:<28} {calls:>8}")
+
+    if result["errors"]:
+        print("\n❌ Ошибки обработки:")
+        for error, errors in result["errors"].most_common():
+            print(f"  {error}: {errors}")
+
+def main():
+    """Главная функция"""
+    print("📼 Воспроизведение апдейтов Phoenix PS Bot")
+    print("=" * 50)
+
+    args = sys.argv[1:]
+    if not args or args[0].startswith("--"):
+        print("📋 Использование: python replay.py ЗАПИСЬ.jsonl.gz [--speed 1|N|max] [--db БАЗА] [--api-latency МС]")
+        print("   --speed        1 - темп записи, N - в N раз быстрее, max - без пауз (по умолчанию max)")
+        print("   --db           копия базы для воспроизведения (по умолчанию тестовые услуги из setup.py)")
+        print("   --api-latency  имитация задержки Bot API в миллисекундах")
+        return 1
+
+    path = args[0]
+    options = dict(zip(args[1::2], args[2::2]))
+    speed_option = options.get("--speed", "max")
+    try:
+        speed = None if speed_option == "max" else float(speed_option)
+        api_latency = float(options.get("--api-latency", "0")) / 1000
+    except ValueError:
+        print("❌ --speed и --api-latency должны быть числами")
+        return 1
+    if not os.path.exists(path):
+        print(f"❌ Файл не найден: {path}")
+        return 1
+
+    print(f"Запись: {path}, скорость: {speed_option}, начало: {datetime.now().strftime('%H:%M:%S')}")
+    result = asyncio.run(replay(path, speed, options.get("--db"), api_latency))
+    print_report(result)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+import asyncio
+import heapq
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError
+)
+
+from alerts import alert_manager
+from api_retry import request_not_sent
+from bot_context import PerBot
+from database import db
+from keyboards import get_channel_post_keyboard
+from media import CAPTION_LIMIT
+from metrics import registry
+from outbound import send_class, BULK
+from utils import truncate_text
+
+logger = logging.getLogger(__name__)
+
+# Время публикации хранится в UTC в формате CURRENT_TIMESTAMP SQLite
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DISPLAY_FORMAT = "%d.%m.%Y %H:%M"
+# Время в командах админа: "ДД.ММ ЧЧ:ММ" или "ДД.ММ.ГГГГ ЧЧ:ММ" в часовом поясе POST_TIMEZONE
+INPUT_FORMAT = "%d.%m.%Y %H:%M"
+
+# Таймер спит до ближайшего поста, но не дольше часа: asyncio считает время
+# по монотонным часам, а публикация привязана к настенным (коррекция NTP)
+MAX_SLEEP = 3600.0
+
+posts_published = registry.counter("scheduled_posts_total", "Отложенные посты по итогу публикации")
+post_delay = registry.histogram(
+    "scheduled_post_delay_seconds", "Опоздание публикации отложенного поста относительно назначенного времени"
+)
+
+async def send_channel_post(bot, channel_id: str, text: Optional[str], photo: Optional[str] = None):
+    """Публикация поста в канал (текст или фото с подписью) с кнопкой меню"""
+    if photo:
+        await bot.send_photo(
+            channel_id,
+            photo,
+            caption=truncate_text(text, CAPTION_LIMIT) if text else None,
+            reply_markup=get_channel_post_keyboard(),
+            parse_mode="Markdown"
+        )
+    else:
+        await bot.send_message(
+            channel_id,
+            text,
+            reply_markup=get_channel_post_keyboard(),
+            parse_mode="Markdown"
+        )
+
+def parse_publish_time(value: str, tz: ZoneInfo) -> Optional[str]:
+    """Время из команды админа ("ДД.ММ ЧЧ:ММ", год можно указать) -> UTC; None, если не разобрано"""
+    parts = value.split()
+    if len(parts) != 2:
+        return None
+    date_part, time_part = parts
+    now = datetime.now(tz)
+    # Без года - ближайшая такая дата: 05.01 в декабре означает следующий год
+    if date_part.count(".") == 1:
+        date_part = f"{date_part}.{now.year}"
+        guessed_year = True
+    else:
+        guessed_year = False
+    try:
+        local = datetime.strptime(f"{date_part} {time_part}", INPUT_FORMAT).replace(tzinfo=tz)
+    except ValueError:
+        return None
+    if guessed_year and local < now.replace(second=0, microsecond=0):
+        try:
+            local = local.replace(year=local.year + 1)
+        except ValueError:
+            return None
+    return local.astimezone(timezone.utc).strftime(TIME_FORMAT)
+
+def is_past(publish_at: str) -> bool:
+    """Время публикации раньше текущей минуты"""
+    return publish_at < datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:00")
+
+def format_publish_time(publish_at: str, tz: ZoneInfo) -> str:
+    """Время публикации (UTC из базы) в часовом поясе админа"""
+    return _utc(publish_at).astimezone(tz).strftime(DISPLAY_FORMAT)
+
+def _utc(value: str) -> datetime:
+    return datetime.strptime(value, TIME_FORMAT).replace(tzinfo=timezone.utc)
+
+def _timestamp(publish_at: str) -> float:
+    return _utc(publish_at).timestamp()
+
+class PostScheduler:
+    """Отложенные посты: куча по времени публикации и таймер до ближайшего поста без опроса базы"""
+
+    def __init__(self, min_interval: float = 3.0, retry_attempts: int = 5, retry_delay: float = 30.0):
+        self.min_interval = min_interval
+        self.retry_attempts = retry_attempts
+        self.retry_delay = retry_delay
+        self.last_sent = 0.0
+        # (время публикации, id поста); после изменения времени старая запись остается
+        # в куче и пропускается: актуальное время поста хранится в _due
+        self._heap: List[Tuple[float, int]] = []
+        self._due: Dict[int, float] = {}
+        # Неудачные попытки по постам, ожидающим повтора
+        self._attempts: Dict[int, int] = {}
+        self._bot = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending_count(self) -> int:
+        """Количество постов, ожидающих публикации"""
+        return len(self._due)
+
+    async def start(self, bot):
+        """Загрузка неопубликованных постов из базы и запуск таймера"""
+        self._bot = bot
+        if self._task is not None:
+            return
+        for post in await db.get_pending_posts():
+            self._push(post['id'], _timestamp(post['publish_at']))
+        if self._due:
+            logger.info(f"Отложенных постов в очереди: {len(self._due)}")
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановка таймера (посты остаются в базе до следующего запуска)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _push(self, post_id: int, due: float):
+        self._due[post_id] = due
+        heapq.heappush(self._heap, (due, post_id))
+        # Таймер пересчитывает сон, только если новый пост раньше ближайшего
+        if self._wakeup is not None and self._heap[0] == (due, post_id):
+            self._wakeup.set()
+
+    def _discard(self, post_id: int):
+        self._due.pop(post_id, None)
+        self._attempts.pop(post_id, None)
+
+    async def schedule(self, channel_id: str, text: Optional[str], photo: Optional[str], publish_at: str) -> int:
+        """Новый отложенный пост (publish_at - UTC)"""
+        post_id = await db.add_scheduled_post(channel_id, text, photo, publish_at)
+        self._push(post_id, _timestamp(publish_at))
+        return post_id
+
+    async def update(self, post_id: int, text: Optional[str], photo: Optional[str], publish_at: str) -> bool:
+        """Изменение текста или времени неопубликованного поста"""
+        updated = await db.update_scheduled_post(post_id, text, photo, publish_at)
+        if updated:
+            self._attempts.pop(post_id, None)
+            self._push(post_id, _timestamp(publish_at))
+        return updated
+
+    async def cancel(self, post_id: int) -> bool:
+        """Отмена неопубликованного поста"""
+        cancelled = await db.cancel_scheduled_post(post_id)
+        if cancelled:
+            self._discard(post_id)
+        return cancelled
+
+    def _next_due(self) -> Optional[Tuple[float, int]]:
+        # Пропуск записей отмененных и перенесенных постов
+        while self._heap:
+            due, post_id = self._heap[0]
+            if self._due.get(post_id) == due:
+                return due, post_id
+            heapq.heappop(self._heap)
+        return None
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            entry = self._next_due()
+            timeout = MAX_SLEEP if entry is None else entry[0] - time.time()
+            if timeout > 0:
+                # asyncio.wait, а не wait_for: wait_for в Python 3.11 теряет отмену при остановке,
+                # если событие сработало одновременно с ней
+                waiter = asyncio.ensure_future(self._wakeup.wait())
+                try:
+                    await asyncio.wait((waiter,), timeout=min(timeout, MAX_SLEEP))
+                finally:
+                    waiter.cancel()
+                continue
+
+            _, post_id = heapq.heappop(self._heap)
+            del self._due[post_id]
+
+            # Ограничение частоты публикаций в канал
+            delay = self.last_sent + self.min_interval - time.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                await self._publish(post_id)
+            except Exception as e:
+                # База недоступна до отправки (захват или возврат поста): пост остается в очереди.
+                # После успешной отправки _publish исключений не пропускает
+                logger.error(f"Ошибка публикации отложенного поста #{post_id}: {e}")
+                if post_id not in self._due:
+                    self._push(post_id, time.time() + self.retry_delay)
+
+    async def _publish(self, post_id: int):
+        # Пост перенесен, пока ждал своей очереди
+        if post_id in self._due:
+            return
+        # Захват строки до отправки: при общей базе пост публикует только один узел
+        post = await db.claim_scheduled_post(post_id, datetime.now(timezone.utc).strftime(TIME_FORMAT))
+        if post is None:
+            self._attempts.pop(post_id, None)
+            # Время поста могли изменить на другом узле: ждем нового времени
+            current = await db.get_scheduled_post(post_id)
+            if current and current['status'] == 'pending' and post_id not in self._due:
+                self._push(post_id, _timestamp(current['publish_at']))
+            return
+
+        attempt = self._attempts.get(post_id, 0) + 1
+        try:
+            with send_class(BULK):
+                await send_channel_post(self._bot, post['channel_id'], post['text'], post['photo'])
+        except (TelegramBadRequest, TelegramForbiddenError) as e:
+            # Ошибки самого поста или прав бота в канале повтором не исправить
+            await self._fail(post_id, attempt, e)
+            return
+        except Exception as e:
+            if attempt >= self.retry_attempts:
+                await self._fail(post_id, attempt, e)
+                return
+            if isinstance(e, (TelegramNetworkError, TelegramServerError)) and not request_not_sent(e):
+                # Запрос ушел, но ответа нет: пост мог выйти, повтор опубликовал бы дубль
+                await self._fail(post_id, attempt, e, maybe_sent=True)
+                return
+            if isinstance(e, TelegramRetryAfter):
+                retry_in = float(e.retry_after)
+            else:
+                retry_in = self.retry_delay * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
+            # Пост точно не отправлен: возвращаем его в очередь
+            await db.release_scheduled_post(post_id)
+            self._attempts[post_id] = attempt
+            self._push(post_id, time.time() + retry_in)
+            posts_published.inc(status="retry")
+            logger.warning(f"Отложенный пост #{post_id} не опубликован ({e}), попытка {attempt + 1}/{self.retry_attempts} через {retry_in:.0f} с")
+            return
+        finally:
+            self.last_sent = time.time()
+
+        # Пост уже в канале: дальше повторяется только запись статуса, но не публикация
+        self._attempts.pop(post_id, None)
+        posts_published.inc(status="sent")
+        post_delay.observe(max(0.0, time.time() - _timestamp(post['publish_at'])))
+        logger.info(f"Отложенный пост #{post_id} опубликован в {post['channel_id']}")
+        await self._mark_sent(post_id, attempt)
+
+    async def _mark_sent(self, post_id: int, attempt: int):
+        """Запись статуса sent с повторами; захваченный пост не публикуется повторно даже без нее"""
+        for write in range(1, self.retry_attempts + 1):
+            try:
+                await db.finish_scheduled_post(post_id, "sent", attempt)
+                return
+            except Exception as e:
+                logger.error(f"Не удалось записать публикацию поста #{post_id} ({write}/{self.retry_attempts}): {e}")
+                if write < self.retry_attempts:
+                    await asyncio.sleep(min(self.retry_delay, 5.0))
+        alert_manager.report(
+            f"scheduled_post_status:{post_id}",
+            f"Отложенный пост #{post_id} опубликован, но статус не записан",
+            "Пост остается в статусе sending и повторно не публикуется"
+        )
+    async def _fail(self, post_id: int, attempt: int, error: Exception, maybe_sent: bool = False):
+        self._attempts.pop(post_id, None)
+        await db.finish_scheduled_post(post_id, "failed", attempt, str(error)[:500])
+        posts_published.inc(status="failed")
+        title = (
+            f"Отложенный пост #{post_id}: нет ответа Bot API, проверьте канал"
+            if maybe_sent else f"Отложенный пост #{post_id} не опубликован"
+        )
+        alert_manager.report(f"scheduled_post:{post_id}", title, str(error))
+
+def format_scheduled_posts(posts: List[Dict], tz: ZoneInfo) -> str:
+    """Список отложенных постов для админа"""
+    if not posts:
+        return "🕒 Отложенные посты\n\nОчередь пуста."
+
+    lines = ["🕒 Отложенные посты", ""]
+    for post in posts:
+        preview = truncate_text(" ".join((post['text'] or "").split()), 80) or "без текста"
+        kind = "🖼 " if post['photo'] else ""
+        lines.append(f"#{post['id']} • {format_publish_time(post['publish_at'], tz)} • {post['channel_id']}\n  {kind}{preview}")
+    return "\n".join(lines)
+
+# Глобальный планировщик отложенных постов
+post_scheduler = PerBot(lambda name: PostScheduler())
@@ -7,7 +7,6 @@
 import asyncio
 import logging
 from database import init_db, db
-from config import CATEGORIES
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,37 +18,37 @@ TEST_SERVICES = [
         "name": "⚡ Базовая оптимизация Windows",
         "description": "Очистка системы от мусора, отключение ненужных служб, оптимизация автозагрузки. Подходит для начинающих пользователей.",
         "price": "1500 руб.",
-        "category": "📦 Услуги по оптимизации и разгону ПК"
+        "category": "optimization"
     },
     {
         "name": "🔥 Расширенная оптимизация Windows",
         "description": "Полная оптимизация системы: очистка реестра, настройка производительности, оптимизация игр, удаление вирусов.",
         "price": "2500 руб.",
-        "category": "📦 Услуги по оптимизации и разгону ПК"
+        "category": "optimization"
     },
     {
         "name": "🌐 Оптимизация сетевого контроллера",
         "description": "Настройка сетевых параметров для максимальной скорости интернета, оптимизация DNS, настройка QoS.",
         "price": "1000 руб.",
-        "category": "📦 Услуги по оптимизации и разгону ПК"
+        "category": "optimization"
     },
     {
         "name": "🚀 Разгон CPU",
         "description": "Безопасный разгон процессора с тестированием стабильности, настройка вольтажа и частот.",
         "price": "2000 руб.",
-        "category": "📦 Услуги по оптимизации и разгону ПК"
+        "category": "optimization"
     },
     {
         "name": "🎮 Разгон GPU",
         "description": "Разгон видеокарты с настройкой памяти и ядра, тестирование в играх, оптимизация драйверов.",
         "price": "1800 руб.",
-        "category": "📦 Услуги по оптимизации и разгону ПК"
+        "category": "optimization"
     },
     {
         "name": "💾 Разгон RAM",
         "description": "Настройка таймингов памяти, разгон частот, тестирование стабильности, оптимизация XMP профилей.",
         "price": "1200 руб.",
-        "category": "📦 Услуги по оптимизации и разгону ПК"
+        "category": "optimization"
     },
     
     # Комплектующие
@@ -57,13 +56,13 @@ TEST_SERVICES = [
         "name": "💻 Подбор игровой сборки",
         "description": "Консультация по выбору комплектующих для игрового ПК с учетом бюджета и требований.",
         "price": "800 руб.",
-        "category": "💻 Комплектующие"
+        "category": "components"
     },
     {
         "name": "🔧 Консультация по апгрейду",
         "description": "Анализ текущей системы и рекомендации по апгрейду для повышения производительности.",
         "price": "500 руб.",
-        "category": "💻 Комплектующие"
+        "category": "components"
     },
     
     # Девайсы
@@ -71,13 +70,13 @@ TEST_SERVICES = [
         "name": "🖱 Настройка игровой мыши",
         "description": "Настройка DPI, кнопок, макросов, профилей для игровой мыши под ваши игры.",
         "price": "400 руб.",
-        "category": "🖱 Девайсы"
+        "category": "devices"
     },
     {
         "name": "⌨️ Настройка механической клавиатуры",
         "description": "Настройка подсветки, макросов, профилей, программирование клавиш для механической клавиатуры.",
         "price": "350 руб.",
-        "category": "🖱 Девайсы"
+        "category": "devices"
     },
     
 
@@ -96,12 +95,14 @@ async def setup_database():
             return
         
         logger.info("Добавление тестовых услуг...")
+        # Категории по умолчанию создаются при инициализации базы, услуги ссылаются на них по ключу
+        category_ids = {category['key']: category['id'] for category in await db.get_categories()}
         for service in TEST_SERVICES:
             service_id = await db.add_service(
                 service["name"],
                 service["description"],
                 service["price"],
-                service["category"]
+                category_ids[service["category"]]
             )
             logger.info(f"Добавлена услуга: {service['name']} (ID: {service_id})")
         
@@ -0,0 +1,82 @@
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+startup_phase_seconds = registry.gauge("startup_phase_seconds", "Длительность фаз запуска")
+startup_first_update_seconds = registry.gauge("startup_first_update_seconds", "Время от запуска процесса до первого обработанного апдейта")
+
+class StartupProfiler:
+    """Замер фаз запуска: импорты, инициализация и время до первого апдейта"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # (фаза, длительность) в порядке выполнения
+        self.phases: List[Tuple[str, float]] = []
+        self.ready_at: Optional[float] = None
+        self.first_update_at: Optional[float] = None
+        self.on_first_update: Optional[Callable[[], Any]] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Замер фазы запуска"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            self.phases.append((name, duration))
+            startup_phase_seconds.set(duration, phase=name)
+
+    def elapsed(self) -> float:
+        """Секунд с начала запуска"""
+        return time.perf_counter() - self.started
+
+    def mark_ready(self):
+        """Отметка готовности к приему апдейтов (перед стартом поллинга)"""
+        self.ready_at = self.elapsed()
+        logger.info(f"Запуск занял {self.ready_at:.2f} с")
+
+    def mark_first_update(self):
+        """Отметка первого обработанного апдейта"""
+        if self.first_update_at is not None:
+            return
+        self.first_update_at = self.elapsed()
+        startup_first_update_seconds.set(self.first_update_at)
+        logger.info(f"Первый апдейт обработан через {self.first_update_at:.2f} с после запуска")
+        if self.on_first_update is not None:
+            self.on_first_update()
+
+    def report(self) -> str:
+        """Таблица фаз запуска"""
+        lines = ["⏱ Профиль запуска", "=" * 50]
+        for name, duration in self.phases:
+            lines.append(f"{name:<36} {duration * 1000:>10.1f} мс")
+        lines.append("-" * 50)
+        if self.ready_at is not None:
+            lines.append(f"{'Готов к приему апдейтов':<36} {self.ready_at * 1000:>10.1f} мс")
+        if self.first_update_at is not None:
+            lines.append(f"{'Первый апдейт обработан':<36} {self.first_update_at * 1000:>10.1f} мс")
+        return "\n".join(lines)
+
+class FirstUpdateMiddleware:
+    """Внешний middleware: отмечает в профиле первый обработанный апдейт"""
+
+    def __init__(self, profiler: StartupProfiler):
+        self.profiler = profiler
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any]
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            if self.profiler.first_update_at is None:
+                self.profiler.mark_first_update()
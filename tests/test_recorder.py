@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+from aiogram.types import Chat, Message, MessageEntity, MessageOriginChannel, MessageOriginHiddenUser, MessageOriginUser, Update, User
+
+from recorder import ADMIN_PSEUDONYM, Anonymizer
+
+ADMIN_ID = 1000
+USER_ID = 555001
+FORWARDED_USER_ID = 777002
+CHANNEL_ID = -1001234567890
+DATE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def _forwarded_update(origin) -> dict:
+    user = User(id=USER_ID, is_bot=False, first_name="Иван", last_name="Петров", username="ivan_p")
+    message = Message(
+        message_id=10,
+        date=DATE,
+        chat=Chat(id=USER_ID, type="private", first_name="Иван", username="ivan_p"),
+        from_user=user,
+        forward_origin=origin,
+        text="Пишите на сайт example.org",
+        entities=[MessageEntity(type="text_link", offset=0, length=6, url="https://example.org/u/ivan_p?phone=79001234567")]
+    )
+    update = Update(update_id=1, message=message)
+    return update.model_dump(mode="json", exclude_none=True)
+
+def test_forwarded_from_user_is_anonymized():
+    origin = MessageOriginUser(
+        date=DATE,
+        sender_user=User(id=FORWARDED_USER_ID, is_bot=False, first_name="Мария", username="maria_k")
+    )
+    anonymizer = Anonymizer(ADMIN_ID)
+    data = _forwarded_update(origin)
+    result = anonymizer.anonymize(data)["message"]
+
+    sender = result["forward_origin"]["sender_user"]
+    assert sender["id"] == anonymizer.pseudonym(FORWARDED_USER_ID)
+    assert sender["id"] not in (FORWARDED_USER_ID, ADMIN_PSEUDONYM)
+    assert sender["first_name"] == "xxxxx"
+    assert sender["username"] == "xxxxxxx"
+    assert result["from_user"]["id"] == result["chat"]["id"] == anonymizer.pseudonym(USER_ID)
+
+    # Ссылка в entities маскируется как текст, длина и тип сущности сохраняются
+    entity = result["entities"][0]
+    assert entity["type"] == "text_link"
+    assert (entity["offset"], entity["length"]) == (0, 6)
+    assert "ivan_p" not in entity["url"] and "79001234567" not in entity["url"]
+    assert len(entity["url"]) == len(data["message"]["entities"][0]["url"])
+
+    serialized = repr(result)
+    for secret in ("Мария", "maria_k", "Иван", "Петров", "ivan_p", str(FORWARDED_USER_ID), str(USER_ID), "example"):
+        assert secret not in serialized
+
+def test_forwarded_from_hidden_user_and_channel_are_anonymized():
+    anonymizer = Anonymizer(ADMIN_ID)
+    hidden = anonymizer.anonymize(_forwarded_update(MessageOriginHiddenUser(date=DATE, sender_user_name="Мария К")))
+    assert hidden["message"]["forward_origin"]["sender_user_name"] == "xxxxxxx"
+
+    channel = MessageOriginChannel(
+        date=DATE,
+        chat=Chat(id=CHANNEL_ID, type="channel", title="Канал Марии", username="maria_channel"),
+        message_id=42,
+        author_signature="Мария"
+    )
+    origin = anonymizer.anonymize(_forwarded_update(channel))["message"]["forward_origin"]
+    assert origin["chat"]["id"] == anonymizer.pseudonym(CHANNEL_ID) < 0
+    assert origin["chat"]["title"] == "x" * len("Канал Марии")
+    assert origin["author_signature"] == "xxxxx"
+    assert origin["message_id"] == 42
+
+def test_admin_keeps_replay_pseudonym():
+    anonymizer = Anonymizer(ADMIN_ID)
+    assert anonymizer.pseudonym(ADMIN_ID) == ADMIN_PSEUDONYM
+    assert anonymizer.pseudonym(USER_ID) == anonymizer.pseudonym(USER_ID) != ADMIN_PSEUDONYM
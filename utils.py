@@ -1,12 +1,4 @@
 from typing import Optional
-from config import CATEGORIES
-
-def get_category_by_name(category_name: str) -> Optional[str]:
-    """Получение ключа категории по названию"""
-    for key, name in CATEGORIES.items():
-        if name == category_name:
-            return key
-    return None
 
 def format_service_message(service: dict) -> str:
     """Форматирование сообщения об услуге"""